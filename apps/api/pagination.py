@@ -0,0 +1,41 @@
+from http import HTTPStatus
+
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class ApiCursorPagination(CursorPagination):
+    """
+    Keyset pagination: ?cursor= pages cost the same wherever they are, and rows
+    inserted while a client pages through do not shift the next page.
+    Responses keep the {'data', 'success'} envelope of the other endpoints.
+    """
+
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        # Views pick their keyset with `cursor_ordering`, ideally backed by an index
+        ordering = getattr(view, 'cursor_ordering', None) or self.ordering
+        return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'data': data,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'success': True
+        }, status=HTTPStatus.OK)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'data': schema,
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'success': {'type': 'boolean'},
+            },
+        }
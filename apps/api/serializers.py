@@ -1,5 +1,8 @@
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import serializers
 
+from apps.common.models import NewsPortal, NewsArticle, CrawlerTask, CrawlerTaskStatusChoices
+
 
 try:
 
@@ -17,3 +20,161 @@ class SalesSerializer(serializers.ModelSerializer):
             pass    
         fields = '__all__'
 
+
+
+class DateOrDateTimeField(serializers.Field):
+    """Accepts an ISO date (whole day) or an ISO datetime"""
+
+    def to_internal_value(self, data):
+        try:
+            value = parse_date(data) or parse_datetime(data)
+        except (TypeError, ValueError):
+            value = None
+        if value is None:
+            raise serializers.ValidationError("Expected an ISO date or datetime.")
+        return value
+
+    def to_representation(self, value):
+        return value.isoformat()
+
+
+class PortalIdListField(serializers.Field):
+    """Comma separated portal ids"""
+
+    def to_internal_value(self, data):
+        try:
+            return [int(pk) for pk in str(data).split(',') if pk.strip()]
+        except ValueError:
+            raise serializers.ValidationError("Expected comma separated portal ids.")
+
+    def to_representation(self, value):
+        return ','.join(str(pk) for pk in value)
+
+
+class TimeSeriesQuerySerializer(serializers.Serializer):
+    interval = serializers.ChoiceField(choices=['hour', 'day', 'week'], default='day')
+    start = DateOrDateTimeField(required=False)
+    end = DateOrDateTimeField(required=False)
+    portal = PortalIdListField(required=False)
+
+
+class ArticleTimeSeriesQuerySerializer(TimeSeriesQuerySerializer):
+    scope = serializers.CharField(required=False)
+    country = serializers.CharField(required=False, max_length=2)
+    date_field = serializers.ChoiceField(choices=['published_at', 'created_at'], default='published_at')
+    by = serializers.ChoiceField(choices=['total', 'portal'], default='total')
+
+
+class TaskTimeSeriesQuerySerializer(TimeSeriesQuerySerializer):
+    kind = serializers.ChoiceField(choices=['crawler', 'celery'], default='crawler')
+    task_name = serializers.CharField(required=False)
+
+
+class ArticleListQuerySerializer(serializers.Serializer):
+    portal = PortalIdListField(required=False)
+    start = DateOrDateTimeField(required=False)
+    end = DateOrDateTimeField(required=False)
+
+
+class TaskListQuerySerializer(serializers.Serializer):
+    portal = PortalIdListField(required=False)
+    status = serializers.ChoiceField(choices=CrawlerTaskStatusChoices.choices, required=False)
+
+
+class ArticleIngestItemSerializer(serializers.Serializer):
+    """One pushed article; validation only, portals and URLs are resolved in bulk by apps.common.ingest"""
+
+    url = serializers.URLField(max_length=200)
+    portal = serializers.CharField(max_length=255, required=False, help_text="Portal domain, defaults to the URL host")
+    title = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    body = serializers.CharField(required=False, allow_blank=True, allow_null=True, trim_whitespace=False)
+    published_at = serializers.DateTimeField()
+    language = serializers.CharField(max_length=2, required=False, allow_blank=True, allow_null=True)
+    authors = serializers.ListField(child=serializers.CharField(max_length=255), required=False)
+    images = serializers.ListField(child=serializers.URLField(max_length=200), required=False)
+
+
+class UrlValidatorReportSerializer(serializers.Serializer):
+    """One listing response reported by a spider, see apps.common.conditional"""
+
+    url = serializers.URLField(max_length=200)
+    status = serializers.IntegerField(min_value=100, max_value=599)
+    etag = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    last_modified = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    content_hash = serializers.RegexField(r'^[0-9a-f]{64}$', required=False, allow_null=True,
+                                          help_text="SHA-256 hex digest of the response body")
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer restricted to the fields named in ?fields= (comma separated)
+
+    Without ?fields= every field except `deferred_fields` (expensive ones,
+    such as article bodies) is returned.
+    """
+
+    deferred_fields = ()
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, request):
+        """
+        Field names selected by the request's ?fields= parameter
+
+        Raises:
+            ValidationError: On unknown field names
+        """
+        available = list(cls.Meta.fields)
+        param = request.query_params.get('fields') if request is not None else None
+        if not param:
+            return [name for name in available if name not in cls.deferred_fields]
+        names = [name.strip() for name in param.split(',') if name.strip()]
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise serializers.ValidationError({'fields': [f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(available)}."]})
+        return [name for name in available if name in names]
+
+
+class NewsPortalSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    country = serializers.CharField(source='country.code', read_only=True, allow_null=True)
+
+    class Meta:
+        model = NewsPortal
+        fields = ['id', 'domain', 'name', 'news_scope', 'country', 'city', 'created_at', 'updated_at']
+
+
+class NewsArticleSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    url = serializers.CharField(source='article_url.url', read_only=True)
+    portal = serializers.IntegerField(source='article_url.portal_id', read_only=True)
+    portal_name = serializers.CharField(source='article_url.portal.name', read_only=True)
+    body = serializers.CharField(read_only=True)
+    authors = serializers.SlugRelatedField(slug_field='name', many=True, read_only=True)
+    images = serializers.SlugRelatedField(slug_field='image_url', many=True, read_only=True)
+    cluster_id = serializers.IntegerField(read_only=True)
+
+    deferred_fields = ('body',)
+
+    class Meta:
+        model = NewsArticle
+        fields = [
+            'id', 'url', 'portal', 'portal_name', 'title', 'description', 'body', 'published_at', 'language',
+            'authors', 'images', 'cluster_id', 'created_at', 'updated_at'
+        ]
+
+
+class CrawlerTaskSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    crawler_config_name = serializers.CharField(source='crawler_config.name', read_only=True)
+    portal = serializers.IntegerField(source='crawler_config.portal_id', read_only=True)
+
+    class Meta:
+        model = CrawlerTask
+        fields = [
+            'id', 'crawler_config', 'crawler_config_name', 'portal', 'status', 'scrapyd_job_id', 'error_message',
+            'started_at', 'completed_at', 'execution_time', 'created_at', 'updated_at'
+        ]
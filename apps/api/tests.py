@@ -0,0 +1,84 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APITestCase
+
+from apps.common.models import NewsArticle, NewsArticleAuthor, NewsArticleCleanUrl, NewsArticleRawUrl, NewsPortal
+
+
+class ApiTestCase(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user('api'))
+
+
+class CursorPaginationTests(ApiTestCase):
+    def test_pages_cover_every_row_once(self):
+        portals = NewsPortal.objects.bulk_create([NewsPortal(domain=f'portal{i}.test', name=f'Portal {i}') for i in range(5)])
+
+        ids, url = [], '/api/portals/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['data']]
+            url = response.data['next']
+
+        self.assertEqual(ids, [portal.id for portal in portals])
+
+    def test_rows_inserted_before_the_cursor_do_not_shift_the_next_page(self):
+        NewsPortal.objects.bulk_create([NewsPortal(domain=f'portal{i}.test', name=f'Portal {i}') for i in range(4)])
+        first = self.client.get('/api/portals/?page_size=2')
+        NewsPortal.objects.filter(id=first.data['data'][0]['id']).delete()
+
+        second = self.client.get(first.data['next'])
+
+        self.assertEqual([row['domain'] for row in second.data['data']], ['portal2.test', 'portal3.test'])
+        self.assertIsNone(second.data['next'])
+
+
+class ConditionalGetTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.portals = NewsPortal.objects.bulk_create([NewsPortal(domain=f'portal{i}.test', name=f'Portal {i}') for i in range(3)])
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.client.get('/api/portals/')
+        self.assertIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+
+        response = self.client.get('/api/portals/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_deleted_row_changes_the_list_etag(self):
+        etag = self.client.get('/api/portals/')['ETag']
+        self.portals[1].delete()
+
+        response = self.client.get('/api/portals/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['data']), 2)
+
+    def test_detail_validators(self):
+        url = f'/api/portals/{self.portals[0].id}/'
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        NewsPortal.objects.filter(pk=self.portals[0].pk).update(updated_at=timezone.now() + timedelta(seconds=5))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_author_change_changes_the_article_etag(self):
+        portal = self.portals[0]
+        raw = NewsArticleRawUrl.objects.create(url='https://portal0.test/a', portal=portal)
+        clean = NewsArticleCleanUrl.objects.create(url='https://portal0.test/a', article_url_raw=raw, portal=portal)
+        article = NewsArticle.objects.create(article_url=clean, title='A', published_at=timezone.now())
+        NewsArticle.objects.filter(pk=article.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        etag = self.client.get('/api/articles/')['ETag']
+
+        article.authors.add(NewsArticleAuthor.objects.create(name='Reporter'))
+
+        self.assertEqual(self.client.get('/api/articles/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        detail = self.client.get(f'/api/articles/{article.pk}/')
+        self.assertEqual(detail['Last-Modified'], http_date(NewsArticle.objects.get(pk=article.pk).updated_at.timestamp()))
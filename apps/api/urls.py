@@ -1,10 +1,20 @@
-from django.urls import re_path
+from django.urls import path, re_path
 from django.views.decorators.csrf import csrf_exempt
+from rest_framework.routers import SimpleRouter
 
 from apps.api.views import *
 
 
+router = SimpleRouter()
+router.register("articles", NewsArticleViewSet, basename="articles")
+router.register("portals", NewsPortalViewSet, basename="portals")
+router.register("tasks", CrawlerTaskViewSet, basename="tasks")
+
 urlpatterns = [
 	re_path("sales/((?P<pk>\d+)/)?", csrf_exempt(SalesView.as_view())),
+	path("timeseries/articles/", ArticleTimeSeriesView.as_view(), name="timeseries_articles"),
+	path("timeseries/tasks/", TaskTimeSeriesView.as_view(), name="timeseries_tasks"),
+	path("articles/ingest/", ArticleIngestView.as_view(), name="articles_ingest"),
+	path("validators/", UrlValidatorReportView.as_view(), name="validators_report"),
 
-]
\ No newline at end of file
+] + router.urls
@@ -1,12 +1,24 @@
+import hashlib
+from datetime import timedelta
 from http import HTTPStatus
 from django.http import Http404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.parsers import JSONParser
+from django.conf import settings
 
 
 from apps.api.serializers import *
+from apps.api.pagination import ApiCursorPagination
+from apps.api.parsers import NDJSONParser
+from apps.common import conditional, ingest, timeseries
+from apps.common.models import NewsArticle, NewsArticleBody, NewsPortal, CrawlerTask
 
 
 try:
@@ -20,6 +32,7 @@ except:
 class SalesView(APIView):
 
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    cursor_ordering = ('-id',)
 
     def post(self, request):
         serializer = SalesSerializer(data=request.data)
@@ -36,10 +49,9 @@ class SalesView(APIView):
 
     def get(self, request, pk=None):
         if not pk:
-            return Response({
-                'data': [SalesSerializer(instance=obj).data for obj in Sales.objects.all()],
-                'success': True
-            }, status=HTTPStatus.OK)
+            paginator = ApiCursorPagination()
+            page = paginator.paginate_queryset(Sales.objects.all(), request, view=self)
+            return paginator.get_paginated_response([SalesSerializer(instance=obj).data for obj in page])
         try:
             obj = get_object_or_404(Sales, pk=pk)
         except Http404:
@@ -86,3 +98,344 @@ class SalesView(APIView):
             'success': True
         }, status=HTTPStatus.OK)
 
+
+
+class TimeSeriesView(APIView):
+    """Base for the DB-bucketed time-series endpoints (see apps.common.timeseries)"""
+
+    permission_classes = (IsAuthenticatedOrReadOnly,)
+    query_serializer_class = TimeSeriesQuerySerializer
+    default_days = 30
+
+    def get_series(self, params, start, end):
+        raise NotImplementedError
+
+    def get(self, request):
+        serializer = self.query_serializer_class(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(data={
+                **serializer.errors,
+                'success': False
+            }, status=HTTPStatus.BAD_REQUEST)
+        params = serializer.validated_data
+        end = params.get('end') or timezone.localdate()
+        start = params.get('start') or end - timedelta(days=self.default_days - 1)
+        try:
+            data = self.get_series(params, start, end)
+        except ValueError as e:
+            return Response(data={
+                'message': str(e),
+                'success': False
+            }, status=HTTPStatus.BAD_REQUEST)
+        return Response({
+            'data': data,
+            'success': True
+        }, status=HTTPStatus.OK)
+
+
+class ArticleTimeSeriesView(TimeSeriesView):
+
+    query_serializer_class = ArticleTimeSeriesQuerySerializer
+
+    def get_series(self, params, start, end):
+        return timeseries.article_volume(
+            params['interval'], start, end,
+            portal_ids=params.get('portal'),
+            scope=params.get('scope'),
+            country=params.get('country'),
+            date_field=params['date_field'],
+            by_portal=params['by'] == 'portal',
+        )
+
+
+class TaskTimeSeriesView(TimeSeriesView):
+
+    query_serializer_class = TaskTimeSeriesQuerySerializer
+
+    def get_series(self, params, start, end):
+        return timeseries.task_outcomes(
+            params['interval'], start, end,
+            kind=params['kind'],
+            portal_ids=params.get('portal'),
+            task_name=params.get('task_name'),
+        )
+
+
+class ArticleIngestView(APIView):
+    """
+    Bulk article push for spider pipelines (see apps.common.ingest)
+
+    Accepts a JSON array (or a single object) or NDJSON, up to
+    ARTICLE_INGEST_MAX_ITEMS items. Invalid items are reported and skipped,
+    the rest are upserted; results are returned per item, in request order.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    parser_classes = (JSONParser, NDJSONParser)
+    default_max_items = 5000
+
+    def post(self, request):
+        items = request.data
+        if isinstance(items, dict):
+            items = [items]
+        if not isinstance(items, list):
+            return Response(data={
+                'message': 'Expected an article object, an array of articles or NDJSON.',
+                'success': False
+            }, status=HTTPStatus.BAD_REQUEST)
+        max_items = getattr(settings, 'ARTICLE_INGEST_MAX_ITEMS', self.default_max_items)
+        if len(items) > max_items:
+            return Response(data={
+                'message': f'At most {max_items} articles per request.',
+                'success': False
+            }, status=HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+        valid, positions, results = [], [], [None] * len(items)
+        for index, item in enumerate(items):
+            serializer = ArticleIngestItemSerializer(data=item)
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+                positions.append(index)
+            else:
+                errors = serializer.errors if isinstance(item, dict) else {'non_field_errors': ['Expected an object.']}
+                results[index] = {
+                    'index': index, 'status': 'invalid', 'url': item.get('url') if isinstance(item, dict) else None,
+                    'id': None, 'errors': errors
+                }
+        for position, result in zip(positions, ingest.ingest_articles(valid)):
+            results[position] = dict(result, index=position)
+
+        return Response({
+            'data': {
+                'summary': ingest.summarize(results),
+                'results': results,
+            },
+            'success': True
+        }, status=HTTPStatus.OK)
+
+
+class UrlValidatorReportView(APIView):
+    """
+    Listing responses reported by spiders (see apps.common.conditional)
+
+    Accepts a JSON array (or a single object) of {url, status, etag,
+    last_modified, content_hash}. The validators are stored for the next
+    crawl's conditional requests; the response tells, per item, whether the
+    page changed since the previous report.
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        items = request.data
+        if isinstance(items, dict):
+            items = [items]
+        if not isinstance(items, list):
+            return Response(data={
+                'message': 'Expected a response object or an array of responses.',
+                'success': False
+            }, status=HTTPStatus.BAD_REQUEST)
+        serializer = UrlValidatorReportSerializer(data=items, many=True)
+        if not serializer.is_valid():
+            return Response(data={
+                'message': serializer.errors,
+                'success': False
+            }, status=HTTPStatus.BAD_REQUEST)
+
+        changed = conditional.record_responses(serializer.validated_data)
+        return Response({
+            'data': [{'url': item['url'], 'changed': result} for item, result in zip(serializer.validated_data, changed)],
+            'success': True
+        }, status=HTTPStatus.OK)
+
+
+class ReadOnlyApiViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only model endpoint with cursor pagination, ?fields= sparse fieldsets
+    and conditional GET
+
+    `related_fields` maps serializer fields to the select_related /
+    prefetch_related lookups they need, so a request only joins what it
+    returns. Lists carry an ETag and details an ETag and Last-Modified, built
+    from the ids and updated_at of the rows returned and checked before anything
+    is serialized: a list first pages through the keyset reading only those
+    columns, so an unchanged poll costs one page-sized query and returns 304.
+    """
+
+    pagination_class = ApiCursorPagination
+    lookup_value_regex = r'\d+'
+    list_query_serializer_class = None
+    related_fields = {}
+    requested_fields = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.requested_fields = self.get_serializer_class().requested_fields(request)
+
+    def get_requested_fields(self):
+        # Every field when called outside a request (schema generation)
+        return self.requested_fields if self.requested_fields is not None else self.get_serializer_class().Meta.fields
+
+    def handle_exception(self, exc):
+        response = super().handle_exception(exc)
+        if isinstance(response.data, dict):
+            response.data['success'] = False
+        return response
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_base_queryset(self):
+        return self.queryset.all()
+
+    def get_queryset(self):
+        queryset = self.get_base_queryset()
+        select, prefetch = [], []
+        for name in self.get_requested_fields():
+            lookups = self.related_fields.get(name, {})
+            select.extend(lookups.get('select', []))
+            prefetch.extend(lookups.get('prefetch', []))
+        if select:
+            queryset = queryset.select_related(*dict.fromkeys(select))
+        if prefetch:
+            queryset = queryset.prefetch_related(*dict.fromkeys(prefetch))
+        return queryset
+
+    def filter_list(self, queryset, params):
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and self.list_query_serializer_class:
+            serializer = self.list_query_serializer_class(data=self.request.query_params)
+            serializer.is_valid(raise_exception=True)
+            queryset = self.filter_list(queryset, serializer.validated_data)
+        return queryset
+
+    def _etag(self, *parts):
+        key = '|'.join(str(part) for part in (
+            self.request.get_full_path(), self.request.accepted_renderer.format, ','.join(self.get_requested_fields()), *parts
+        ))
+        return quote_etag(hashlib.md5(key.encode('utf-8')).hexdigest())
+
+    def _not_modified(self, etag, last_modified):
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None
+        )
+        return self._set_validators(response, etag, last_modified) if response is not None else None
+
+    @staticmethod
+    def _set_validators(response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
+
+    def load_page(self, ids):
+        """The page's objects with everything the requested fields need, in page order"""
+        objects = self.get_queryset().in_bulk(ids)
+        return [objects[pk] for pk in ids if pk in objects]
+
+    def list(self, request, *args, **kwargs):
+        keys = {field.lstrip('-') for field in self.paginator.get_ordering(request, None, self)}
+        rows = self.paginate_queryset(self.filter_queryset(self.get_base_queryset()).only('pk', 'updated_at', *keys))
+        # ETag only: the newest updated_at of a page does not move when one of its rows is deleted
+        etag = self._etag(self.paginator.get_next_link(), ','.join(f'{row.pk}:{row.updated_at.isoformat()}' for row in rows))
+        not_modified = self._not_modified(etag, None)
+        if not_modified is not None:
+            return not_modified
+
+        data = self.get_serializer(self.load_page([row.pk for row in rows]), many=True).data
+        return self._set_validators(self.get_paginated_response(data), etag, None)
+
+    def retrieve(self, request, *args, **kwargs):
+        last_modified = self.get_base_queryset().filter(pk=kwargs['pk']).values_list('updated_at', flat=True).first()
+        if last_modified is None:
+            return Response(data={
+                'message': 'object with given id not found.',
+                'success': False
+            }, status=HTTPStatus.NOT_FOUND)
+        etag = self._etag(last_modified)
+        not_modified = self._not_modified(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = Response({
+            'data': self.get_serializer(self.get_object()).data,
+            'success': True
+        }, status=HTTPStatus.OK)
+        return self._set_validators(response, etag, last_modified)
+
+
+class NewsArticleViewSet(ReadOnlyApiViewSet):
+    """
+    Live articles, newest published first (archived articles are not listed)
+
+    Filters: ?portal=1,2 &start= &end= (publication date, end day inclusive).
+    `body` is only returned when named in ?fields=.
+    """
+
+    queryset = NewsArticle.objects.all()
+    serializer_class = NewsArticleSerializer
+    list_query_serializer_class = ArticleListQuerySerializer
+    cursor_ordering = ('-published_at', '-id')
+    related_fields = {
+        'url': {'select': ['article_url']},
+        'portal': {'select': ['article_url']},
+        'portal_name': {'select': ['article_url__portal']},
+        'authors': {'prefetch': ['authors']},
+        'images': {'prefetch': ['images']},
+        'cluster_id': {'select': ['fingerprint']},
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if 'description' not in self.get_requested_fields():
+            queryset = queryset.defer('description')
+        return queryset
+
+    def filter_list(self, queryset, params):
+        if params.get('portal'):
+            queryset = queryset.filter(article_url__portal_id__in=params['portal'])
+        if params.get('start'):
+            queryset = queryset.filter(published_at__gte=timeseries._as_datetime(params['start']))
+        if params.get('end'):
+            queryset = queryset.filter(published_at__lt=timeseries._as_datetime(params['end'], end=True))
+        return queryset
+
+    def load_page(self, ids):
+        page = super().load_page(ids)
+        if 'body' in self.get_requested_fields():
+            # One query for the page instead of one per article
+            bodies = NewsArticleBody.load_many(article.pk for article in page)
+            for article in page:
+                article._body = bodies.get(article.pk, '')
+        return page
+
+
+class NewsPortalViewSet(ReadOnlyApiViewSet):
+
+    queryset = NewsPortal.objects.all()
+    serializer_class = NewsPortalSerializer
+    cursor_ordering = ('id',)
+
+
+class CrawlerTaskViewSet(ReadOnlyApiViewSet):
+    """Crawler tasks, newest first. Filters: ?portal=1,2 &status="""
+
+    queryset = CrawlerTask.objects.all()
+    serializer_class = CrawlerTaskSerializer
+    list_query_serializer_class = TaskListQuerySerializer
+    cursor_ordering = ('-created_at', '-id')
+    related_fields = {
+        'crawler_config_name': {'select': ['crawler_config']},
+        'portal': {'select': ['crawler_config']},
+    }
+
+    def filter_list(self, queryset, params):
+        if params.get('portal'):
+            queryset = queryset.filter(crawler_config__portal_id__in=params['portal'])
+        if params.get('status'):
+            queryset = queryset.filter(status=params['status'])
+        return queryset
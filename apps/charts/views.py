@@ -1,22 +1,27 @@
+import json
+from datetime import timedelta
+
 from django.shortcuts import render
-from apps.common.models import Sales
-from django.core import serializers
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from apps.common.timeseries import article_volume
 
 
 # Create your views here.
 
 def index(request):
-    filter_data = {}
-    if from_date := request.GET.get('from'):
-        filter_data['PurchaseDate__gte'] = from_date
-    
-    if to_date := request.GET.get('to'):
-        filter_data['PurchaseDate__lte'] = to_date
+    end = parse_date(request.GET.get('to') or '') or timezone.localdate()
+    start = parse_date(request.GET.get('from') or '') or end - timedelta(days=29)
+
+    # Bucketed per portal and day in the database (or the daily rollups)
+    try:
+        series = article_volume('day', start, end, by_portal=True)['series']
+    except ValueError:
+        series = []
 
-    sales = serializers.serialize('json', Sales.objects.filter(**filter_data))
     context = {
         'segment'  : 'apex_charts',
         'parent'   : 'apps',
-        'sales': sales
+        'series': json.dumps(series)
     }
     return render(request, 'apps/charts.html', context)
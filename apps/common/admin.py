@@ -3,13 +3,31 @@ from django.contrib import admin
 from django.apps import apps
 from django.contrib import admin
 
+from .forms import NewsArticleForm
+from .models import NewsArticle
+from .pagination import ApproximateCountPaginator
+
 # Register your models here.
 
+
+class ApproximateCountAdmin(admin.ModelAdmin):
+    """Change lists on the large crawl tables never run an unbounded COUNT(*)"""
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+
+class NewsArticleAdmin(ApproximateCountAdmin):
+    """Edits the body, which is not a model field, through NewsArticleForm"""
+    form = NewsArticleForm
+
+
+admin.site.register(NewsArticle, NewsArticleAdmin)
+
 app_models = apps.get_app_config('common').get_models()
 for model in app_models:
     try:    
  
-        admin.site.register(model)
+        admin.site.register(model, ApproximateCountAdmin)
 
     except Exception:
         pass
@@ -0,0 +1,341 @@
+"""
+Cold-article archive
+
+Articles published before a cutoff (ARTICLE_ARCHIVE_AFTER_DAYS) are moved out
+of the live tables into Parquet files, one directory per portal and month:
+
+    {ARTICLE_ARCHIVE_DIR}/portal=<id>/month=<YYYY-MM>/part-<first id>-<last id>.parquet
+
+Each archived article leaves a NewsArticleArchive stub (id, portal, url,
+title, publication date and file path), so lookups and title searches know
+which file to open without listing the archive. Reads only decode the
+columns they ask for: Parquet stores columns separately and search results
+never touch the bodies.
+
+Rows are buffered per partition across batches and written once a partition
+holds ARTICLE_ARCHIVE_FILE_ROWS rows or the run ends, so files keep a useful
+row-group size. Each write also merges the partition's files that are still
+under that size, so daily runs do not pile up small files.
+
+Files are written before anything is deleted, and stubs are created (and the
+stubs of merged files repointed) in the same transaction that deletes the
+live rows, so an interrupted run leaves the articles live and the merged
+files in use; a retried run writes the same rows again.
+"""
+
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.html import escape
+
+from .models import NewsArticle, NewsArticleArchive, NewsArticleBody
+from .export import load_related
+from .search import SearchHit, _query_terms, remove_articles
+from .signals import archiving
+from .timeseries import DateLike, _as_datetime
+
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP = pa.timestamp('us', tz='UTC')
+
+SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('portal_id', pa.int64()),
+    ('url', pa.string()),
+    ('title', pa.string()),
+    ('description', pa.string()),
+    ('body', pa.string()),
+    ('published_at', TIMESTAMP),
+    ('language', pa.string()),
+    ('created_at', TIMESTAMP),
+    ('updated_at', TIMESTAMP),
+    ('authors', pa.list_(pa.string())),
+    ('images', pa.list_(pa.string())),
+    ('cluster_id', pa.int64()),
+])
+
+# Columns needed to render an article in a list; detail pages read all of them
+SUMMARY_COLUMNS = ['id', 'description', 'language', 'created_at', 'updated_at']
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 365
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_FILE_ROWS = 20000
+DEFAULT_SEARCH_MONTHS = 12
+# Buffered rows (over all partitions) that force a flush, in files' worth
+BUFFER_FILES = 5
+COMPRESSION = 'zstd'
+
+
+def archive_dir() -> str:
+    return getattr(settings, 'ARTICLE_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'article_archive'))
+
+
+def default_cutoff() -> datetime:
+    days = getattr(settings, 'ARTICLE_ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+    return timezone.now() - timedelta(days=days)
+
+
+def _month(value: datetime) -> str:
+    return timezone.localtime(value).strftime('%Y-%m') if timezone.is_aware(value) else value.strftime('%Y-%m')
+
+
+def _partition_path(portal_id: int, month: str, first_id: int, last_id: int) -> str:
+    """File path relative to the archive directory, as stored on the stubs"""
+    return os.path.join(f'portal={portal_id}', f'month={month}', f'part-{first_id}-{last_id}.parquet')
+
+
+def _collect_rows(article_ids: List[int]) -> List[Dict]:
+    """One archive row per article, ordered by id"""
+    articles = NewsArticle.objects.filter(id__in=article_ids).order_by('id').values(
+        'id', 'article_url__portal_id', 'article_url__url', 'title', 'description', 'published_at',
+        'language', 'created_at', 'updated_at', 'fingerprint__cluster_id'
+    )
+    bodies = NewsArticleBody.load_many(article_ids)
+    authors, images = load_related(article_ids)
+
+    return [{
+        'id': article['id'],
+        'portal_id': article['article_url__portal_id'],
+        'url': article['article_url__url'],
+        'title': article['title'],
+        'description': article['description'],
+        'body': bodies.get(article['id'], ''),
+        'published_at': article['published_at'],
+        'language': article['language'],
+        'created_at': article['created_at'],
+        'updated_at': article['updated_at'],
+        'authors': authors.get(article['id'], []),
+        'images': images.get(article['id'], []),
+        'cluster_id': article['fingerprint__cluster_id'],
+    } for article in articles]
+
+
+def _write_file(path: str, rows: List[Dict]) -> None:
+    """Write rows to a Parquet file through a temporary file, so readers never see a partial file"""
+    full_path = os.path.join(archive_dir(), path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    tmp_path = f'{full_path}.tmp'
+    pq.write_table(pa.Table.from_pylist(rows, schema=SCHEMA), tmp_path, compression=COMPRESSION)
+    os.replace(tmp_path, full_path)
+
+
+def _small_files(portal_id: int, month: str, file_rows: int) -> Dict[str, int]:
+    """{path: rows} of the partition's files holding fewer than file_rows rows"""
+    prefix = os.path.dirname(_partition_path(portal_id, month, 0, 0)) + os.sep
+    files = NewsArticleArchive.objects.filter(portal_id=portal_id, path__startswith=prefix).order_by().values('path').annotate(
+        rows=Count('id')
+    ).filter(rows__lt=file_rows)
+    return dict(files.values_list('path', 'rows'))
+
+
+def _flush_partition(portal_id: int, month: str, rows: List[Dict], file_rows: int) -> int:
+    """
+    Write one file with the rows and the partition's small files, then swap the live rows for stubs
+
+    Returns:
+        Number of files merged into the new one
+    """
+    merged, merged_rows = [], []
+    total = len(rows)
+    for path, count in sorted(_small_files(portal_id, month, file_rows).items()):
+        if total + count > file_rows:
+            continue
+        try:
+            merged_rows.extend(pq.read_table(os.path.join(archive_dir(), path)).to_pylist())
+        except (FileNotFoundError, OSError) as e:
+            logger.error("Cannot read archive file %s, not merging it: %s", path, e)
+            continue
+        merged.append(path)
+        total += count
+
+    path = _partition_path(portal_id, month, min(row['id'] for row in rows + merged_rows),
+                           max(row['id'] for row in rows + merged_rows))
+    _write_file(path, sorted(rows + merged_rows, key=lambda row: row['id']))
+
+    with transaction.atomic():
+        NewsArticleArchive.objects.filter(path__in=merged).update(path=path)
+        NewsArticleArchive.objects.bulk_create(
+            [
+                NewsArticleArchive(
+                    id=row['id'], portal_id=portal_id, url=row['url'], title=row['title'],
+                    published_at=row['published_at'], created_at=row['created_at'], path=path
+                ) for row in rows
+            ],
+            update_conflicts=True, unique_fields=['id'],
+            update_fields=['url', 'title', 'published_at', 'created_at', 'path']
+        )
+        # Archived articles still count in the rollups; the index entries go in one statement
+        article_ids = [row['id'] for row in rows]
+        with archiving():
+            NewsArticle.objects.filter(id__in=article_ids).delete()
+        remove_articles(article_ids)
+
+    for merged_path in merged:
+        if merged_path != path:
+            try:
+                os.remove(os.path.join(archive_dir(), merged_path))
+            except FileNotFoundError:
+                pass
+    return len(merged)
+
+
+def archive_articles(cutoff: Optional[datetime] = None, batch_size: Optional[int] = None,
+                     portal_id: Optional[int] = None, max_batches: Optional[int] = None,
+                     should_stop: Optional[Callable[[], bool]] = None) -> Dict:
+    """
+    Move articles published before the cutoff into the Parquet archive
+
+    Args:
+        cutoff: Archive articles published before this, defaults to ARTICLE_ARCHIVE_AFTER_DAYS ago
+        batch_size: Articles read per batch
+        portal_id: Only archive this portal (optional)
+        max_batches: Stop after this many batches (optional)
+        should_stop: Checked between batches, stops the run when it returns True
+
+    Returns:
+        Dict with the cutoff and the number of archived articles, files written,
+        small files merged into them and batches
+    """
+    cutoff = cutoff or default_cutoff()
+    batch_size = batch_size or getattr(settings, 'ARTICLE_ARCHIVE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    file_rows = getattr(settings, 'ARTICLE_ARCHIVE_FILE_ROWS', DEFAULT_FILE_ROWS)
+    queryset = NewsArticle.objects.filter(published_at__lt=cutoff).order_by('id')
+    if portal_id:
+        queryset = queryset.filter(article_url__portal_id=portal_id)
+
+    result = {'cutoff': cutoff.isoformat(), 'archived': 0, 'files': 0, 'merged_files': 0, 'batches': 0}
+    pending = defaultdict(list)
+
+    def flush(keys):
+        for key in keys:
+            rows = pending.pop(key)
+            result['merged_files'] += _flush_partition(*key, rows, file_rows)
+            result['archived'] += len(rows)
+            result['files'] += 1
+
+    last_id = 0
+    while max_batches is None or result['batches'] < max_batches:
+        if should_stop and should_stop():
+            break
+        article_ids = list(queryset.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+        if not article_ids:
+            break
+        last_id = article_ids[-1]
+
+        for row in _collect_rows(article_ids):
+            pending[(row['portal_id'], _month(row['published_at']))].append(row)
+        result['batches'] += 1
+
+        flush([key for key, rows in pending.items() if len(rows) >= file_rows])
+        if sum(len(rows) for rows in pending.values()) >= file_rows * BUFFER_FILES:
+            flush(list(pending))
+
+    # Buffered rows are still live until flushed, an error above leaves them for the next run
+    flush(list(pending))
+    return result
+
+
+class ArchivedArticle:
+    """Read-only stand-in for an archived NewsArticle, with the attributes the article templates use"""
+
+    archived = True
+
+    def __init__(self, stub: NewsArticleArchive, row: Dict):
+        self.id = self.pk = stub.id
+        self.title = stub.title
+        self.published_at = stub.published_at
+        self.archived_at = stub.archived_at
+        self.portal = stub.portal
+        self.article_url = SimpleNamespace(url=stub.url, portal=stub.portal, portal_id=stub.portal_id)
+        for column in SCHEMA.names:
+            if column not in ('id', 'portal_id', 'url', 'title', 'published_at'):
+                setattr(self, column, row.get(column))
+
+    def __str__(self):
+        return self.title
+
+
+def _read_rows(stubs: Iterable[NewsArticleArchive], columns: List[str]) -> Dict[int, Dict]:
+    """Read the given columns of the stubs' rows, opening each archive file once"""
+    columns = ['id'] + [column for column in columns if column != 'id']
+    ids_by_path = defaultdict(list)
+    for stub in stubs:
+        ids_by_path[stub.path].append(stub.id)
+
+    rows = {}
+    for path, article_ids in ids_by_path.items():
+        try:
+            table = pq.read_table(
+                os.path.join(archive_dir(), path), columns=columns, filters=[('id', 'in', article_ids)]
+            )
+        except (FileNotFoundError, OSError) as e:
+            logger.error("Cannot read archive file %s: %s", path, e)
+            continue
+        for row in table.to_pylist():
+            rows[row['id']] = row
+    return rows
+
+
+def get_archived_articles(article_ids: Iterable[int], columns: Optional[List[str]] = None) -> Dict[int, ArchivedArticle]:
+    """
+    Load archived articles by id
+
+    Args:
+        article_ids: Ids of archived articles; ids without a stub are ignored
+        columns: Archive columns to read, defaults to SUMMARY_COLUMNS
+
+    Returns:
+        {article_id: ArchivedArticle}; columns that were not read are None
+    """
+    stubs = list(NewsArticleArchive.objects.select_related('portal').filter(id__in=list(article_ids)))
+    rows = _read_rows(stubs, columns or SUMMARY_COLUMNS)
+    return {stub.id: ArchivedArticle(stub, rows.get(stub.id, {})) for stub in stubs}
+
+
+def get_archived_article(article_id: int) -> Optional[ArchivedArticle]:
+    """One archived article with every column, body included"""
+    return get_archived_articles([article_id], columns=SCHEMA.names).get(article_id)
+
+
+def search_archive(query: str, limit: int = 100, portal_ids: Optional[List[int]] = None,
+                   start: Optional[DateLike] = None, end: Optional[DateLike] = None) -> List[SearchHit]:
+    """
+    Title search over the archive stubs, newest first
+
+    Archived articles are not in the full-text index: every query term must
+    appear in the title. The stubs are narrowed by portal and publication
+    date first (indexed, dates are inclusive), and without either, to the newest
+    ARTICLE_ARCHIVE_SEARCH_MONTHS months of the archive. Hits have a zero
+    rank and no snippet.
+    """
+    terms = _query_terms(query)
+    if not terms:
+        return []
+    queryset = NewsArticleArchive.objects.all()
+    if portal_ids:
+        queryset = queryset.filter(portal_id__in=portal_ids)
+    if start:
+        queryset = queryset.filter(published_at__gte=_as_datetime(start))
+    if end:
+        queryset = queryset.filter(published_at__lt=_as_datetime(end, end=True))
+    if not (portal_ids or start or end):
+        newest = queryset.aggregate(newest=Max('published_at'))['newest']
+        if newest is None:
+            return []
+        months = getattr(settings, 'ARTICLE_ARCHIVE_SEARCH_MONTHS', DEFAULT_SEARCH_MONTHS)
+        queryset = queryset.filter(published_at__gte=newest - timedelta(days=31 * months))
+    for term in terms:
+        queryset = queryset.filter(title__icontains=term)
+    rows = queryset.order_by('-published_at').values_list('id', 'title')[:limit]
+    return [SearchHit(article_id, 0.0, escape(title), '') for article_id, title in rows]
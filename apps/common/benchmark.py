@@ -0,0 +1,267 @@
+"""
+Throughput benchmarks of the hot paths
+
+run_suite() times each case (list views and search, the dashboard, spider
+payload building, article ingestion, URL canonicalization and the rollup
+reconciliation) on whatever data is in the database; use a dataset from
+apps.common.synthetic for comparable numbers. Each case runs `warmup`
+times untimed, once under a query counter and `repeat` times timed; the
+report keeps min / median / p95 milliseconds, the query count and a
+throughput where a case processes a batch.
+
+Cases that write run in a transaction that is rolled back, so the suite
+can be run against the same dataset again and again. compare() turns a
+report into pass / fail against a baseline report (a case regresses when
+its median grows by more than BENCHMARK_REGRESSION_TOLERANCE and by at
+least BENCHMARK_MIN_DELTA_MS) and against the absolute budgets of
+BENCHMARK_BUDGETS_MS.
+"""
+
+import fnmatch
+import platform
+import random
+import statistics
+import time
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django_celery_results.models import TaskResult
+
+from .canonicalize import canonicalize_batch, load_canonicalizers
+from .ingest import ingest_articles
+from .models import CrawlerConfig, NewsArticle, NewsArticleCleanUrl, NewsArticleRawUrl, NewsPortal
+from .search import search_articles
+from . import stats
+
+
+DEFAULT_REPEAT = 5
+DEFAULT_WARMUP = 1
+DEFAULT_TOLERANCE = 0.2
+DEFAULT_MIN_DELTA_MS = 2.0
+CANONICALIZE_ROWS = 10000
+INGEST_ITEMS = 500
+BENCHMARK_USERNAME = 'benchmark'
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+class Case:
+    """A named callable to time; `items` is the batch size it processes, for throughput"""
+
+    def __init__(self, name: str, func: Callable, items: int = 0, writes: bool = False):
+        self.name = name
+        self.func = func
+        self.items = items
+        self.writes = writes
+
+    def __call__(self):
+        if not self.writes:
+            return self.func()
+        with transaction.atomic():
+            result = self.func()
+            transaction.set_rollback(True)
+        return result
+
+
+def _client() -> Client:
+    user, _ = get_user_model().objects.get_or_create(username=BENCHMARK_USERNAME, defaults={'is_active': True})
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def _get(client: Client, url: str) -> Callable:
+    def request():
+        response = client.get(url)
+        if response.status_code != 200:
+            raise AssertionError(f"GET {url} returned {response.status_code}")
+        # Streaming and lazy responses are only done once consumed
+        return b''.join(response) if response.streaming else response.content
+    return request
+
+
+def _ajax(client: Client, url: str, data: Dict) -> Callable:
+    def request():
+        response = client.post(url, data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        if response.status_code != 200:
+            raise AssertionError(f"POST {url} returned {response.status_code}")
+        return response.content
+    return request
+
+
+def _ingest_items(portal: NewsPortal, count: int) -> Callable:
+    sequence = iter(range(10 ** 9))
+    published = timezone.now() - timedelta(hours=1)
+
+    def items():
+        run = next(sequence)
+        return [
+            {
+                'url': f'https://{portal.domain}/benchmark/ingest-{run}-{index}?utm_source=bench',
+                'portal': portal.domain, 'title': f'Benchmark ingest {run} {index}',
+                'description': 'Benchmark article', 'body': 'Benchmark body paragraph. ' * 40,
+                'published_at': published, 'language': 'id',
+                'authors': [f'Benchmark Author {index % 7}'], 'images': [f'https://cdn.bench.test/ingest/{run}-{index}.jpg'],
+            }
+            for index in range(count)
+        ]
+    return lambda: ingest_articles(items())
+
+
+def build_cases(search_term: str = 'election') -> List[Case]:
+    """The suite, against the current data; cases without the data they need are left out"""
+    client = _client()
+    cases = [
+        # home.urls is not namespaced and apps.users.urls also names a route 'index'
+        Case('view:dashboard', _get(client, '/')),
+        Case('view:tasks', _get(client, reverse('tasks:tasks'))),
+    ]
+    for name in ('news_portals_list', 'news_article_raw_urls_list', 'news_article_clean_urls_list', 'news_articles_list',
+                 'selectors_list', 'crawler_configs_list', 'scraper_configs_list', 'seed_urls_list'):
+        cases.append(Case(f'view:{name}', _get(client, reverse(f'common:{name}'))))
+    cases.append(Case('view:news_articles_list:search', _get(client, f"{reverse('common:news_articles_list')}?search={search_term}")))
+    cases.append(Case('search:articles', lambda: search_articles(search_term, limit=100)))
+
+    # The portal of the newest raw URL, so the lookups and ingestion hit a populated portal
+    portal_id = NewsArticleRawUrl.objects.order_by('-id').values_list('portal_id', flat=True).first()
+    portal = NewsPortal.objects.filter(id=portal_id).first() if portal_id else None
+    if portal:
+        for name in ('get_portal_selectors', 'get_portal_raw_urls'):
+            cases.append(Case(f'ajax:{name}', _ajax(client, reverse(f'common:{name}'), {'portal_id': portal.id})))
+        cases.append(Case('ingest:articles', _ingest_items(portal, INGEST_ITEMS), items=INGEST_ITEMS, writes=True))
+
+    crawler_config = CrawlerConfig.objects.select_related('portal').order_by('id').first()
+    if crawler_config:
+        from apps.tasks.tasks import _build_generic_spider_payload
+        cases.append(Case('payload:generic_spider', lambda: _build_generic_spider_payload(crawler_config)))
+
+    rows = list(NewsArticleRawUrl.objects.order_by('-id').values_list('id', 'url', 'portal_id')[:CANONICALIZE_ROWS])
+    if rows:
+        canonicalizers = load_canonicalizers({row[2] for row in rows})
+        cases.append(Case('canonicalize:batch', lambda: canonicalize_batch(rows, canonicalizers), items=len(rows)))
+
+    cases.append(Case('stats:reconcile', lambda: stats.reconcile(days=30), writes=True))
+    return cases
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def run_case(case: Case, repeat: int = DEFAULT_REPEAT, warmup: int = DEFAULT_WARMUP) -> Dict:
+    """Time one case; errors are reported instead of raised"""
+    try:
+        for _ in range(warmup):
+            case()
+        with CaptureQueriesContext(connection) as queries:
+            case()
+        # captured_queries slices connection.queries, a bounded deque the timed runs below keep rotating
+        query_count = len(queries.captured_queries)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            case()
+            timings.append((time.perf_counter() - started) * 1000)
+    except Exception as e:
+        return {'error': f"{type(e).__name__}: {e}"}
+
+    median = statistics.median(timings)
+    result = {
+        'runs': repeat,
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(median, 3),
+        'p95_ms': round(_percentile(timings, 0.95), 3),
+        'queries': query_count,
+    }
+    if case.items:
+        result['items'] = case.items
+        result['items_per_second'] = round(case.items / (median / 1000), 1) if median else None
+    return result
+
+
+def dataset_counts() -> Dict:
+    return {
+        'portals': NewsPortal.objects.count(),
+        'raw_urls': NewsArticleRawUrl.objects.count(),
+        'clean_urls': NewsArticleCleanUrl.objects.count(),
+        'articles': NewsArticle.objects.count(),
+        'task_results': TaskResult.objects.count(),
+    }
+
+
+def run_suite(repeat: int = DEFAULT_REPEAT, warmup: int = DEFAULT_WARMUP, only: Optional[List[str]] = None,
+              search_term: str = 'election', seed: int = 42, progress=None) -> Dict:
+    """
+    Run the benchmark cases and return the report
+
+    Args:
+        repeat: Timed runs per case
+        warmup: Untimed runs per case first
+        only: fnmatch patterns of the case names to run (all by default)
+        search_term: Query of the search cases
+        seed: Seeds `random` so cases that sample are repeatable
+        progress: Optional callable(name, result) called after each case
+    """
+    random.seed(seed)
+    report = {
+        'created_at': timezone.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'repeat': repeat,
+            'warmup': warmup,
+        },
+        'dataset': dataset_counts(),
+        'cases': {},
+    }
+    for case in build_cases(search_term=search_term):
+        if only and not any(fnmatch.fnmatch(case.name, pattern) for pattern in only):
+            continue
+        result = run_case(case, repeat=repeat, warmup=warmup)
+        report['cases'][case.name] = result
+        if progress:
+            progress(case.name, result)
+    return report
+
+
+def compare(report: Dict, baseline: Optional[Dict] = None, tolerance: Optional[float] = None,
+            budgets: Optional[Dict[str, float]] = None) -> List[Dict]:
+    """
+    Regressions of a report against a baseline report and per-case budgets
+
+    Returns:
+        One dict per failing case: {'case', 'reason', 'median_ms', 'limit_ms'},
+        reason 'error', 'baseline' or 'budget'
+    """
+    tolerance = _setting('BENCHMARK_REGRESSION_TOLERANCE', DEFAULT_TOLERANCE) if tolerance is None else tolerance
+    budgets = _setting('BENCHMARK_BUDGETS_MS', {}) if budgets is None else budgets
+    min_delta = _setting('BENCHMARK_MIN_DELTA_MS', DEFAULT_MIN_DELTA_MS)
+    baseline_cases = (baseline or {}).get('cases', {})
+
+    regressions = []
+    for name, result in report['cases'].items():
+        if 'error' in result:
+            regressions.append({'case': name, 'reason': 'error', 'median_ms': None, 'limit_ms': None, 'error': result['error']})
+            continue
+        median = result['median_ms']
+        previous = baseline_cases.get(name, {}).get('median_ms')
+        if previous is not None:
+            limit = previous * (1 + tolerance)
+            if median > limit and median - previous >= min_delta:
+                regressions.append({'case': name, 'reason': 'baseline', 'median_ms': median, 'limit_ms': round(limit, 3)})
+                continue
+        budget = next((limit for pattern, limit in budgets.items() if fnmatch.fnmatch(name, pattern)), None)
+        if budget is not None and median > budget:
+            regressions.append({'case': name, 'reason': 'budget', 'median_ms': median, 'limit_ms': budget})
+    return regressions
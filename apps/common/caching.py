@@ -0,0 +1,137 @@
+"""
+Cached lookups for the CRUD pages and AJAX endpoints
+
+The selector, crawler config and scraper config pages fill their form
+dropdowns with every portal, selector and seed URL, and the portal AJAX
+endpoints list a portal's selectors and raw URLs; these rarely change
+between requests and are served from the cache here.
+
+Keys are versioned by namespace ('portals', 'selectors', 'seed_urls' and
+'raw_urls:<portal_id>'): a lookup's key embeds the current version of every
+namespace it reads, and invalidate() bumps versions once the transaction
+commits, so entries computed before an edit are never read again and simply
+expire. Model saves and deletes invalidate through apps.common.signals;
+bulk writes, which bypass signals, call invalidate() themselves.
+
+A version that is not in the cache (never set, or evicted) starts from the
+current time in microseconds, past any version used before, so an evicted
+counter cannot bring old entries back.
+
+With Redis (CACHE_REDIS_URL) every process shares the versions. With the
+per-process memory fallback, an edit only invalidates the process that made
+it, so entries there live LOOKUP_CACHE_LOCAL_TIMEOUT seconds at most.
+"""
+
+import hashlib
+import time
+from typing import Callable, Dict, Iterable, List
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from .models import ItemSelector, NewsArticleRawUrl, NewsPortal, NewsPortalSeedUrl
+from . import metrics
+
+
+DEFAULT_TIMEOUT = 10 * 60
+DEFAULT_LOCAL_TIMEOUT = 10
+DEFAULT_MAX_ROWS = 5000
+KEY_PREFIX = 'lookup'
+
+MODEL_NAMESPACES = {NewsPortal: 'portals', ItemSelector: 'selectors', NewsPortalSeedUrl: 'seed_urls'}
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def raw_urls_namespace(portal_id) -> str:
+    return f'raw_urls:{portal_id}'
+
+
+def _version_key(namespace: str) -> str:
+    return f'{KEY_PREFIX}:version:{namespace}'
+
+
+def versions(namespaces: Iterable[str]) -> Dict[str, int]:
+    """Current version of each namespace, starting the missing ones"""
+    keys = {namespace: _version_key(namespace) for namespace in namespaces}
+    found = cache.get_many(list(keys.values()))
+    for key in keys.values():
+        if key not in found:
+            cache.add(key, time.time_ns() // 1000, None)
+            found[key] = cache.get(key)
+    return {namespace: found[key] for namespace, key in keys.items()}
+
+
+def invalidate(*namespaces: str) -> None:
+    """Bump the namespaces once the current transaction commits (at once outside of one)"""
+    def bump():
+        for namespace in set(namespaces):
+            try:
+                cache.incr(_version_key(namespace))
+            except ValueError:
+                # No version yet: nothing is cached under it, and the next one starts past it
+                pass
+    transaction.on_commit(bump)
+
+
+def invalidate_raw_urls(portal_ids: Iterable[int]) -> None:
+    invalidate(*(raw_urls_namespace(portal_id) for portal_id in set(portal_ids)))
+
+
+def _timeout() -> int:
+    if isinstance(caches['default'], LocMemCache):
+        return _setting('LOOKUP_CACHE_LOCAL_TIMEOUT', DEFAULT_LOCAL_TIMEOUT)
+    return _setting('LOOKUP_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def cached(name: str, namespaces: Iterable[str], compute: Callable[[], List], *params) -> List:
+    """
+    The cached result of compute(), a list, under the current versions of `namespaces`
+
+    Results longer than LOOKUP_CACHE_MAX_ROWS are computed on every call.
+    """
+    current = versions(namespaces)
+    tag = ','.join(f'{namespace}={version}' for namespace, version in sorted(current.items()))
+    digest = hashlib.md5(f"{tag}|{'|'.join(map(str, params))}".encode()).hexdigest()
+    key = f'{KEY_PREFIX}:{name}:{digest}'
+    result = cache.get(key)
+    metrics.record_cache('lookup', result is not None)
+    if result is None:
+        result = compute()
+        if len(result) <= _setting('LOOKUP_CACHE_MAX_ROWS', DEFAULT_MAX_ROWS):
+            cache.set(key, result, _timeout())
+    return result
+
+
+def portals() -> List[NewsPortal]:
+    return cached('portals', ['portals'], lambda: list(NewsPortal.objects.all()))
+
+
+def selectors() -> List[ItemSelector]:
+    return cached('selectors', ['selectors'], lambda: list(ItemSelector.objects.all()))
+
+
+def seed_urls() -> List[NewsPortalSeedUrl]:
+    return cached(
+        'seed_urls', ['seed_urls', 'portals'], lambda: list(NewsPortalSeedUrl.objects.select_related('portal').all())
+    )
+
+
+def portal_selectors(portal_id) -> List[Dict]:
+    """The get_portal_selectors payload of a portal"""
+    return cached('portal_selectors', ['selectors'], lambda: [
+        {'id': pk, 'query': query, 'item': item, 'method': method}
+        for pk, query, item, method in ItemSelector.objects.filter(portal_id=portal_id).values_list('id', 'query', 'item', 'method')
+    ], portal_id)
+
+
+def portal_raw_urls(portal_id) -> List[Dict]:
+    """The get_portal_raw_urls payload of a portal"""
+    return cached('portal_raw_urls', [raw_urls_namespace(portal_id)], lambda: [
+        {'id': pk, 'url': url, 'status': status}
+        for pk, url, status in NewsArticleRawUrl.objects.filter(portal_id=portal_id).values_list('id', 'url', 'status')
+    ], portal_id)
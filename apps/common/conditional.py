@@ -0,0 +1,150 @@
+"""
+Conditional GET for listing pages
+
+Seed/listing pages, sitemaps and feeds are fetched again on every crawl,
+usually to find that nothing changed. UrlValidator keeps, per URL, the ETag
+and Last-Modified of the last response and a SHA-256 hash of its body:
+
+- the next request sends them back as If-None-Match / If-Modified-Since, so
+  servers that support it answer 304 Not Modified without a body
+- servers that do not are caught by the content hash: an identical body is
+  treated like a 304
+
+Either way link extraction is skipped for that URL. ValidatorStore loads the
+validators of a batch with one query and saves them with one upsert, so it
+can be used from an event loop between the two. Spiders get the same
+validators in their Scrapyd config (see apps.tasks.tasks) and report
+responses back through /api/validators/.
+"""
+
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+from django.utils import timezone
+
+from .models import UrlValidator
+
+
+UPDATE_FIELDS = ['etag', 'last_modified', 'content_hash', 'checked_at', 'changed_at', 'unchanged_count']
+HEADER_MAX_LENGTH = {'etag': 255, 'last_modified': 64}
+URL_MAX_LENGTH = UrlValidator._meta.get_field('url').max_length
+
+
+def content_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+def request_headers(validator: Optional[UrlValidator]) -> Dict[str, str]:
+    """If-None-Match / If-Modified-Since for the next request of a URL"""
+    headers = {}
+    if validator is not None:
+        if validator.etag:
+            headers['If-None-Match'] = validator.etag
+        if validator.last_modified:
+            headers['If-Modified-Since'] = validator.last_modified
+    return headers
+
+
+def _header(name: str, value: Optional[str]) -> Optional[str]:
+    # Validators that do not fit are dropped; the content hash still applies
+    if not value or len(value) > HEADER_MAX_LENGTH[name]:
+        return None
+    return value
+
+
+class ValidatorStore:
+    """The validators of a batch of URLs, loaded with one query and saved with one upsert"""
+
+    def __init__(self, urls: Iterable[str]):
+        self.validators = {validator.url: validator for validator in UrlValidator.objects.filter(url__in=list(urls))}
+        self._updated = set()
+
+    def headers(self, url: str) -> Dict[str, str]:
+        return request_headers(self.validators.get(url))
+
+    def update(self, url: str, status_code: int, etag: Optional[str] = None, last_modified: Optional[str] = None,
+               body: Optional[bytes] = None, digest: Optional[str] = None) -> bool:
+        """
+        Record a response to a (conditional) request
+
+        Args:
+            url: Requested URL
+            status_code: 304, or the status of a full response
+            etag: ETag response header
+            last_modified: Last-Modified response header
+            body: Response body, hashed to detect unchanged pages served without validators
+            digest: content_hash() of the body, when the caller hashed it already
+
+        Returns:
+            True when the page changed (or is new) and its links should be extracted
+        """
+        if len(url) > URL_MAX_LENGTH:
+            # Not stored, always crawled in full
+            return True
+        now = timezone.now()
+        validator = self.validators.get(url)
+        if validator is None:
+            validator = self.validators[url] = UrlValidator(url=url, checked_at=now)
+
+        if status_code == 304:
+            changed = False
+        else:
+            if digest is None and body is not None:
+                digest = content_hash(body)
+            changed = digest is None or digest != validator.content_hash
+            validator.content_hash = digest
+            validator.etag = _header('etag', etag)
+            validator.last_modified = _header('last_modified', last_modified)
+
+        validator.checked_at = now
+        if changed:
+            validator.changed_at = now
+            validator.unchanged_count = 0
+        else:
+            validator.unchanged_count += 1
+        self._updated.add(url)
+        return changed
+
+    def discard(self, url: str) -> None:
+        """Drop the update of a URL: the validators stored before stay, so the next request is not skipped"""
+        self._updated.discard(url)
+
+    def save(self) -> int:
+        """Upsert the validators updated since loading; returns their number"""
+        rows = [self.validators[url] for url in self._updated]
+        UrlValidator.objects.bulk_create(
+            rows, batch_size=1000, update_conflicts=True, unique_fields=['url'], update_fields=UPDATE_FIELDS
+        )
+        self._updated.clear()
+        return len(rows)
+
+
+def spider_validators(urls: Iterable[str]) -> Dict[str, Dict]:
+    """{url: {'headers', 'content_hash'}} of the URLs crawled before, for a spider config"""
+    return {
+        validator.url: {'headers': request_headers(validator), 'content_hash': validator.content_hash}
+        for validator in UrlValidator.objects.filter(url__in=list(urls))
+    }
+
+
+def record_responses(responses: List[Dict]) -> List[bool]:
+    """
+    Record responses reported by a spider
+
+    Args:
+        responses: Dicts with url and status, and optionally etag,
+            last_modified and content_hash (SHA-256 hex of the body)
+
+    Returns:
+        Whether each page changed, in order
+    """
+    store = ValidatorStore(response['url'] for response in responses)
+    changed = [
+        store.update(
+            response['url'], response['status'], etag=response.get('etag'),
+            last_modified=response.get('last_modified'), digest=response.get('content_hash')
+        )
+        for response in responses
+    ]
+    store.save()
+    return changed
@@ -0,0 +1,205 @@
+"""
+Near-duplicate article detection
+
+Each article body gets a 64-bit SimHash over word 3-shingles. The hash is
+split into four 16-bit bands stored in indexed columns of
+NewsArticleFingerprint, so two articles within Hamming distance 3 always share
+at least one band (pigeonhole). Looking up a new article is four index seeks
+plus a Hamming check on the few candidates, independent of table size.
+
+Articles that match an existing fingerprint join its cluster; otherwise the
+article starts a new cluster whose id is its own primary key.
+"""
+
+import hashlib
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+from .models import NewsArticle, NewsArticleBody, NewsArticleFingerprint
+
+
+NUM_BANDS = 4
+BAND_BITS = 16
+BAND_MASK = (1 << BAND_BITS) - 1
+SHINGLE_SIZE = 3
+DEFAULT_MAX_DISTANCE = 3  # must stay below NUM_BANDS to keep the band guarantee
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+def _max_distance() -> int:
+    return min(getattr(settings, 'NEAR_DUPLICATE_MAX_DISTANCE', DEFAULT_MAX_DISTANCE), NUM_BANDS - 1)
+
+
+def simhash(text: str) -> Optional[int]:
+    """
+    Compute the unsigned 64-bit SimHash of a text
+
+    Returns None when the text has no tokens to fingerprint.
+    """
+    tokens = TOKEN_RE.findall(TAG_RE.sub(' ', text or '').lower())
+    if not tokens:
+        return None
+    if len(tokens) >= SHINGLE_SIZE:
+        features = {' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+    else:
+        features = set(tokens)
+
+    digests = b''.join(hashlib.blake2b(f.encode('utf-8'), digest_size=8).digest() for f in features)
+    # One row of 64 bits per feature; a bit is set in the result when most features set it
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(-1, 64)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(features)
+    return int.from_bytes(np.packbits(votes).tobytes(), 'big')
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def split_bands(value: int) -> Tuple[int, ...]:
+    return tuple((value >> (i * BAND_BITS)) & BAND_MASK for i in range(NUM_BANDS))
+
+
+def to_signed(value: int) -> int:
+    """Map an unsigned 64-bit hash onto the signed range of BigIntegerField"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def find_candidates(hashes: Sequence[int], exclude_ids: Iterable[int] = ()) -> List[Tuple[int, int, int]]:
+    """
+    Fetch stored fingerprints sharing a band with any of the hashes
+
+    Returns:
+        List of (article_id, unsigned simhash, cluster_id)
+    """
+    if not hashes:
+        return []
+    band_values = [set() for _ in range(NUM_BANDS)]
+    for value in hashes:
+        for i, band in enumerate(split_bands(value)):
+            band_values[i].add(band)
+
+    condition = Q()
+    for i, values in enumerate(band_values):
+        condition |= Q(**{f'band_{i}__in': list(values)})
+
+    rows = NewsArticleFingerprint.objects.filter(condition)
+    exclude_ids = list(exclude_ids)
+    if exclude_ids:
+        rows = rows.exclude(article_id__in=exclude_ids)
+    return [(pk, to_unsigned(h), cluster) for pk, h, cluster in rows.values_list('article_id', 'simhash', 'cluster_id')]
+
+
+def find_near_duplicates(text: str, max_distance: Optional[int] = None,
+                         exclude_id: Optional[int] = None) -> List[Tuple[int, int, int]]:
+    """
+    Find stored articles whose body is within max_distance of the text
+
+    Returns:
+        List of (article_id, cluster_id, distance) sorted by distance
+    """
+    value = simhash(text)
+    if value is None:
+        return []
+    max_distance = _max_distance() if max_distance is None else max_distance
+    matches = []
+    for article_id, other, cluster_id in find_candidates([value], [exclude_id] if exclude_id else []):
+        distance = hamming(value, other)
+        if distance <= max_distance:
+            matches.append((article_id, cluster_id, distance))
+    return sorted(matches, key=lambda m: (m[2], m[0]))
+
+
+def fingerprint_articles(articles: Iterable[Tuple[int, str]]) -> Dict[int, int]:
+    """
+    Fingerprint a batch of (article_id, body) pairs and assign clusters
+
+    Candidate lookup is one query for the whole batch; matches inside the
+    batch are resolved in memory. Existing fingerprints for these articles
+    are replaced.
+
+    Returns:
+        Dict of article_id -> cluster_id for fingerprinted articles
+    """
+    max_distance = _max_distance()
+    hashed = []
+    for article_id, body in articles:
+        value = simhash(body)
+        if value is not None:
+            hashed.append((article_id, value))
+    if not hashed:
+        return {}
+
+    batch_ids = [article_id for article_id, _ in hashed]
+    candidates = find_candidates([value for _, value in hashed], exclude_ids=batch_ids)
+
+    # band -> [(simhash, cluster_id)] over stored candidates and already assigned batch rows
+    buckets = {}
+    for _, value, cluster_id in candidates:
+        for i, band in enumerate(split_bands(value)):
+            buckets.setdefault((i, band), []).append((value, cluster_id))
+
+    clusters = {}
+    fingerprints = []
+    for article_id, value in sorted(hashed):
+        bands = split_bands(value)
+        best = None
+        for i, band in enumerate(bands):
+            for other, cluster_id in buckets.get((i, band), ()):
+                distance = hamming(value, other)
+                if distance <= max_distance and (best is None or (distance, cluster_id) < best):
+                    best = (distance, cluster_id)
+        cluster_id = best[1] if best else article_id
+        clusters[article_id] = cluster_id
+        for i, band in enumerate(bands):
+            buckets.setdefault((i, band), []).append((value, cluster_id))
+        fingerprints.append(NewsArticleFingerprint(
+            article_id=article_id,
+            simhash=to_signed(value),
+            band_0=bands[0], band_1=bands[1], band_2=bands[2], band_3=bands[3],
+            cluster_id=cluster_id,
+        ))
+
+    NewsArticleFingerprint.objects.bulk_create(
+        fingerprints,
+        update_conflicts=True,
+        unique_fields=['article'],
+        update_fields=['simhash', 'band_0', 'band_1', 'band_2', 'band_3', 'cluster_id'],
+    )
+    return clusters
+
+
+def fingerprint_article(article: NewsArticle) -> Optional[int]:
+    """Fingerprint one article and return its cluster id"""
+    return fingerprint_articles([(article.pk, article.body)]).get(article.pk)
+
+
+def backfill_fingerprints(batch_size: int = 500, should_stop=None) -> int:
+    """
+    Fingerprint every article that has none yet, oldest first
+
+    Returns:
+        Number of articles fingerprinted
+    """
+    total = 0
+    last_id = 0
+    while not (should_stop and should_stop()):
+        batch = list(
+            NewsArticle.objects.filter(id__gt=last_id, fingerprint__isnull=True)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1]
+        bodies = NewsArticleBody.load_many(batch)
+        total += len(fingerprint_articles((pk, bodies.get(pk, '')) for pk in batch))
+    return total
@@ -0,0 +1,434 @@
+"""
+Sitemap and feed discovery
+
+Portals list their new articles in sitemaps (including Google News
+sitemaps) and RSS/Atom feeds. Reading those costs a fraction of the
+bandwidth and CPU of fetching and parsing HTML listing pages, so they are a
+cheap source of raw URLs next to the seed pages:
+
+1. detect_feeds() looks for the feeds of portals that have none yet: the
+   Sitemap: lines of robots.txt, the RSS/Atom <link rel="alternate"> of the
+   home page and, failing those, /sitemap.xml. Candidates are stored as
+   NewsPortalFeed rows; the first read confirms them or deactivates them
+2. discover_urls() reads the active feeds concurrently with the fetcher's
+   per-portal clients and conditional requests (apps.common.conditional).
+   Bodies (gzipped or not) are parsed while they stream in with an lxml pull
+   parser that drops every entry once it has been read, so large sitemaps
+   never sit in memory. Entries dated before the feed's lastmod high-water
+   mark, or older than DISCOVERY_MAX_AGE_DAYS, are skipped; child sitemaps
+   of a sitemap index are only read when their own lastmod is newer. The
+   mark only advances from entries actually read: when a child sitemap
+   fails, the mark and the index validators are left as they were, so the
+   next run reads the index and that child again
+3. The entry URLs on the portal's domain are queued as pending raw URLs in
+   bulk through the seen-URL filter
+"""
+
+import asyncio
+import hashlib
+import re
+import time
+import zlib
+from collections import Counter, defaultdict
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import httpx
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from lxml import etree, html as lxml_html
+
+from .models import FeedKindChoices, NewsArticleRawUrl, NewsPortal, NewsPortalFeed
+from . import conditional, fetcher, seen_filter
+from .extract import parse_published_at
+
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024  # sitemap protocol limit, uncompressed
+DEFAULT_MAX_AGE_DAYS = 2
+# Sitemap indexes are followed this many levels down
+MAX_SITEMAP_DEPTH = 2
+INFLATE_CHUNK = 64 * 1024
+
+# Root element -> feed kind
+ROOT_KINDS = {
+    'urlset': FeedKindChoices.SITEMAP,
+    'sitemapindex': FeedKindChoices.SITEMAP_INDEX,
+    'rss': FeedKindChoices.RSS,
+    'RDF': FeedKindChoices.RSS,
+    'feed': FeedKindChoices.ATOM,
+}
+# Feed kind -> entry element
+ENTRY_TAGS = {
+    FeedKindChoices.SITEMAP: 'url',
+    FeedKindChoices.SITEMAP_INDEX: 'sitemap',
+    FeedKindChoices.RSS: 'item',
+    FeedKindChoices.ATOM: 'entry',
+}
+# Entry date elements, most specific first
+DATE_TAGS = {
+    FeedKindChoices.SITEMAP: ('publication_date', 'lastmod'),
+    FeedKindChoices.SITEMAP_INDEX: ('lastmod',),
+    FeedKindChoices.RSS: ('pubDate', 'date', 'updated'),
+    FeedKindChoices.ATOM: ('published', 'updated'),
+}
+FEED_LINK_TYPES = {
+    'application/rss+xml': FeedKindChoices.RSS,
+    'application/atom+xml': FeedKindChoices.ATOM,
+}
+FALLBACK_SITEMAP = '/sitemap.xml'
+# Feeds answering these are deactivated
+GONE_STATUSES = {404, 410}
+# read_feed() results of documents that could not be read
+FAILED_RESULTS = {'http_error', 'error', 'too_large', 'not_feed'}
+
+URL_MAX_LENGTH = NewsArticleRawUrl._meta.get_field('url').max_length
+FEED_URL_MAX_LENGTH = NewsPortalFeed._meta.get_field('url').max_length
+
+_robots_sitemap = re.compile(r'^\s*sitemap\s*:\s*(\S+)', re.IGNORECASE | re.MULTILINE)
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _local(tag) -> str:
+    # Comments and processing instructions have no string tag
+    return etree.QName(tag).localname if isinstance(tag, str) else ''
+
+
+def _absolute(base_url: str, value: Optional[str], max_length: int = URL_MAX_LENGTH) -> Optional[str]:
+    """An http(s) URL resolved against the feed URL, or None when unusable"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    url = urljoin(base_url, value)
+    if not url.startswith(('http://', 'https://')) or len(url) > max_length:
+        return None
+    return url
+
+
+class FeedParser:
+    """
+    Incremental parser of sitemaps, sitemap indexes and RSS/Atom feeds
+
+    Bytes are fed as they arrive; every entry is read and removed from the tree
+    at its end tag. Entries dated before `since` are dropped on the spot.
+    """
+
+    def __init__(self, base_url: str, since: Optional[datetime] = None):
+        self.base_url = base_url
+        self.since = since
+        self.kind = None
+        self.entries = []  # (url, date or None) of the entries kept
+        self.total = 0
+        self.newest = None
+        self._parser = etree.XMLPullParser(events=('start', 'end'), recover=True, resolve_entities=False, huge_tree=True)
+
+    def feed(self, data: bytes) -> None:
+        self._parser.feed(data)
+        self._read()
+
+    def close(self) -> None:
+        try:
+            self._parser.close()
+        except etree.XMLSyntaxError:
+            # Truncated or not XML at all; whatever was read is kept
+            pass
+        self._read()
+
+    def _read(self) -> None:
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                if self.kind is None:
+                    self.kind = ROOT_KINDS.get(_local(element.tag), '')
+                continue
+            if not self.kind or _local(element.tag) != ENTRY_TAGS[self.kind]:
+                continue
+            self._entry(element)
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+    def _entry(self, element) -> None:
+        url = _absolute(self.base_url, self._link(element), FEED_URL_MAX_LENGTH)
+        if url is None:
+            return
+        self.total += 1
+        date = self._date(element)
+        if date is not None:
+            if self.newest is None or date > self.newest:
+                self.newest = date
+            if self.since is not None and date < self.since:
+                return
+        self.entries.append((url, date))
+
+    def _link(self, element) -> Optional[str]:
+        children = {}
+        for child in element:
+            name = _local(child.tag)
+            if self.kind == FeedKindChoices.ATOM and name == 'link':
+                # rel defaults to alternate
+                if child.get('rel', 'alternate') == 'alternate' and child.get('href'):
+                    return child.get('href')
+            else:
+                children.setdefault(name, child)
+        if self.kind in (FeedKindChoices.SITEMAP, FeedKindChoices.SITEMAP_INDEX):
+            return children['loc'].text if 'loc' in children else None
+        if self.kind == FeedKindChoices.RSS:
+            if 'link' in children and (children['link'].text or '').strip():
+                return children['link'].text
+            guid = children.get('guid')
+            if guid is not None and guid.get('isPermaLink', 'true').lower() != 'false':
+                return guid.text
+        return None
+
+    def _date(self, element) -> Optional[datetime]:
+        # News sitemaps nest publication_date in <news:news>
+        found = {_local(child.tag): child.text for child in element.iter() if child is not element}
+        for name in DATE_TAGS[self.kind]:
+            if found.get(name):
+                return parse_published_at(found[name].strip())
+        return None
+
+
+def _inflate(inflater, data: bytes):
+    """Decompress gzip data in bounded pieces, so a small body cannot expand unchecked"""
+    while data:
+        yield inflater.decompress(data, INFLATE_CHUNK)
+        data = inflater.unconsumed_tail
+
+
+async def read_feed(client: httpx.AsyncClient, semaphores: Tuple[asyncio.Semaphore, asyncio.Semaphore], url: str,
+                    since: Optional[datetime], store: conditional.ValidatorStore, max_bytes: int) -> Dict:
+    """
+    Conditionally fetch one sitemap or feed and parse it while it streams in; never raises
+
+    Returns:
+        {'result', 'error', 'status', 'parser'} with result 'changed',
+        'unchanged' (same content hash), 'not_modified' (304), 'not_feed',
+        'http_error', 'too_large' or 'error'. parser is the FeedParser of a
+        changed feed, else None
+    """
+    read = {'result': 'changed', 'error': None, 'status': None, 'parser': None}
+    portal_slot, process_slot = semaphores
+    parser = FeedParser(url, since)
+    digest = hashlib.sha256()
+    async with portal_slot, process_slot:
+        try:
+            async with client.stream('GET', url, headers=store.headers(url)) as response:
+                read['status'] = response.status_code
+                if response.status_code not in (200, 304):
+                    return dict(read, result='http_error', error=f"HTTP {response.status_code}")
+                if response.status_code == 200:
+                    inflater, size = None, 0
+                    async for chunk in response.aiter_bytes():
+                        digest.update(chunk)
+                        if inflater is None and size == 0 and chunk[:2] == b'\x1f\x8b':
+                            # .xml.gz files, as opposed to Content-Encoding handled by httpx
+                            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                        for data in (_inflate(inflater, chunk) if inflater else (chunk,)):
+                            size += len(data)
+                            if size > max_bytes:
+                                return dict(read, result='too_large', error=f"Body larger than {max_bytes} bytes")
+                            parser.feed(data)
+                    parser.close()
+                headers = response.headers
+        except (httpx.HTTPError, zlib.error, etree.LxmlError) as e:
+            return dict(read, result='error', error=f"{type(e).__name__}: {e}")
+
+    if read['status'] == 200 and not parser.kind:
+        return dict(read, result='not_feed', error="Not a sitemap or feed")
+    changed = store.update(
+        url, read['status'], etag=headers.get('etag'), last_modified=headers.get('last-modified'),
+        digest=digest.hexdigest()
+    )
+    if not changed:
+        return dict(read, result='not_modified' if read['status'] == 304 else 'unchanged')
+    return dict(read, parser=parser)
+
+
+async def read_feeds(rows: List[Tuple[str, int, Optional[datetime]]], concurrency: Dict[int, int],
+                     store: conditional.ValidatorStore) -> List[Dict]:
+    """Read (url, portal_id, since) feeds concurrently; one read_feed() result per row, in order"""
+    max_bytes = _setting('DISCOVERY_MAX_BYTES', DEFAULT_MAX_BYTES)
+    process_slot = asyncio.Semaphore(_setting('FETCHER_MAX_CONNECTIONS', fetcher.DEFAULT_MAX_CONNECTIONS))
+    semaphores = {portal_id: (asyncio.Semaphore(limit), process_slot) for portal_id, limit in concurrency.items()}
+
+    async with AsyncExitStack() as stack:
+        clients = {
+            portal_id: await stack.enter_async_context(fetcher.portal_client(limit))
+            for portal_id, limit in concurrency.items()
+        }
+        return await asyncio.gather(*(
+            read_feed(clients[portal_id], semaphores[portal_id], url, since, store, max_bytes)
+            for url, portal_id, since in rows
+        ))
+
+
+def discover_urls(portal_id: Optional[int] = None) -> Dict:
+    """
+    Read the active feeds of every portal, or of one, and queue their new entries as pending raw URLs
+
+    Returns:
+        Dict with the number of feeds and child sitemaps read, results by
+        kind, entries kept after date filtering and raw URLs queued
+    """
+    feeds = NewsPortalFeed.objects.filter(is_active=True).order_by('id')
+    if portal_id:
+        feeds = feeds.filter(portal_id=portal_id)
+    feeds = list(feeds)
+    if not feeds:
+        return {'feeds': 0, 'sitemaps': 0, 'entries': 0, 'queued': 0, 'seconds': 0.0, 'results': {}}
+
+    now = timezone.now()
+    oldest = now - timedelta(days=_setting('DISCOVERY_MAX_AGE_DAYS', DEFAULT_MAX_AGE_DAYS))
+    domains, concurrency = fetcher.portal_limits({feed.portal_id for feed in feeds})
+
+    # (url, portal_id, since, root feed) of the documents to read this round
+    rows = [(feed.url, feed.portal_id, max(feed.lastmod or oldest, oldest), feed) for feed in feeds]
+    links = defaultdict(list)
+    results = Counter()
+    newest = {}
+    # Feeds with a document that failed, and the sitemap indexes read for each feed
+    failed, indexes = set(), defaultdict(list)
+    stores = []
+    started = time.perf_counter()
+    for depth in range(MAX_SITEMAP_DEPTH + 1):
+        store = conditional.ValidatorStore(row[0] for row in rows)
+        read = asyncio.run(read_feeds([row[:3] for row in rows], concurrency, store))
+        stores.append(store)
+
+        children = []
+        for (url, row_portal_id, since, feed), result in zip(rows, read):
+            results[result['result']] += 1
+            parser = result['parser']
+            if result['result'] in FAILED_RESULTS:
+                failed.add(feed.pk)
+            if depth == 0:
+                if result['status'] in GONE_STATUSES or result['result'] == 'not_feed':
+                    feed.is_active = False
+                elif parser is not None:
+                    feed.kind = parser.kind
+            if parser is None:
+                continue
+            if parser.kind == FeedKindChoices.SITEMAP_INDEX:
+                # Index dates are the children's lastmod, not entries read
+                indexes[feed.pk].append((store, url))
+                if depth < MAX_SITEMAP_DEPTH:
+                    children.extend((child, row_portal_id, since, feed) for child, _ in parser.entries)
+            else:
+                if parser.newest is not None:
+                    newest[feed.pk] = max(newest.get(feed.pk, parser.newest), parser.newest)
+                links[row_portal_id].extend(
+                    entry for entry, _ in parser.entries
+                    if len(entry) <= URL_MAX_LENGTH and fetcher.on_portal(entry, domains[row_portal_id])
+                )
+        if not children:
+            break
+        rows = children
+    seconds = time.perf_counter() - started
+
+    for feed_pk in failed:
+        for store, url in indexes[feed_pk]:
+            store.discard(url)
+    for store in stores:
+        store.save()
+
+    for feed in feeds:
+        feed.checked_at = now
+        feed.updated_at = now
+        if feed.pk in newest and feed.pk not in failed:
+            # Future dates would hold back every later entry
+            feed.lastmod = max(filter(None, (feed.lastmod, min(newest[feed.pk], now))))
+    NewsPortalFeed.objects.bulk_update(feeds, ['kind', 'is_active', 'lastmod', 'checked_at', 'updated_at'])
+
+    queued = sum(seen_filter.insert_unseen_urls('raw', pk, urls) for pk, urls in links.items() if urls)
+    return {
+        'feeds': len(feeds),
+        'sitemaps': sum(results.values()) - len(feeds),
+        'entries': sum(len(urls) for urls in links.values()),
+        'queued': queued,
+        'seconds': seconds,
+        'results': dict(results),
+    }
+
+
+async def _get_text(client: httpx.AsyncClient, url: str, max_bytes: int) -> Optional[bytes]:
+    """The body of a 200 response, or None"""
+    try:
+        async with client.stream('GET', url) as response:
+            if response.status_code != 200:
+                return None
+            return await fetcher.read_body(response, max_bytes)
+    except httpx.HTTPError:
+        return None
+
+
+def _feed_links(base_url: str, body: bytes) -> List[Tuple[str, str]]:
+    """(url, kind) of the RSS/Atom feeds a page advertises"""
+    try:
+        tree = lxml_html.document_fromstring(body)
+    except (ValueError, etree.ParserError):
+        return []
+    feeds = []
+    for link in tree.xpath('//link[@href][@type]'):
+        kind = FEED_LINK_TYPES.get(link.get('type', '').split(';')[0].strip().lower())
+        rel = (link.get('rel') or '').lower().split()
+        url = _absolute(base_url, link.get('href'), FEED_URL_MAX_LENGTH)
+        if kind and 'alternate' in rel and url:
+            feeds.append((url, kind))
+    return feeds
+
+
+async def _detect(client: httpx.AsyncClient, domain: str, max_bytes: int) -> List[Tuple[str, str]]:
+    """(url, kind) candidates of one portal"""
+    home = f"https://{domain}/"
+    robots, page = await asyncio.gather(
+        _get_text(client, urljoin(home, '/robots.txt'), max_bytes), _get_text(client, home, max_bytes)
+    )
+    sitemaps = [
+        (url, FeedKindChoices.SITEMAP)
+        for url in (_absolute(home, match, FEED_URL_MAX_LENGTH) for match in _robots_sitemap.findall(
+            robots.decode('utf-8', 'replace') if robots else ''
+        )) if url
+    ]
+    if not sitemaps:
+        sitemaps = [(urljoin(home, FALLBACK_SITEMAP), FeedKindChoices.SITEMAP)]
+    return sitemaps + (_feed_links(home, page) if page else [])
+
+
+async def _detect_all(portals: List[Tuple[int, str]], max_bytes: int) -> List[List[Tuple[str, str]]]:
+    async with fetcher.portal_client(_setting('FETCHER_PORTAL_CONCURRENCY', fetcher.DEFAULT_PORTAL_CONCURRENCY)) as client:
+        return await asyncio.gather(*(_detect(client, domain, max_bytes) for _, domain in portals))
+
+
+def detect_feeds(portal_ids: Optional[Iterable[int]] = None, force: bool = False) -> int:
+    """
+    Look for the sitemaps and feeds of portals and store them as NewsPortalFeed rows
+
+    Args:
+        portal_ids: Portals to look at (optional, defaults to all)
+        force: Also look at portals that already have feeds
+
+    Returns:
+        Number of feed rows submitted
+    """
+    portals = NewsPortal.objects.order_by('id')
+    if portal_ids is not None:
+        portals = portals.filter(id__in=list(portal_ids))
+    if not force:
+        portals = portals.filter(~Exists(NewsPortalFeed.objects.filter(portal_id=OuterRef('pk'))))
+    portals = list(portals.values_list('id', 'domain'))
+    if not portals:
+        return 0
+
+    found = asyncio.run(_detect_all(portals, _setting('FETCHER_MAX_BYTES', fetcher.DEFAULT_MAX_BYTES)))
+    rows = {
+        url: NewsPortalFeed(url=url, portal_id=portal_id, kind=kind)
+        for (portal_id, _), candidates in zip(portals, found) for url, kind in candidates
+    }
+    NewsPortalFeed.objects.bulk_create(list(rows.values()), ignore_conflicts=True)
+    return len(rows)
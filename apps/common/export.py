@@ -0,0 +1,229 @@
+"""
+Bulk article export
+
+Streams NewsArticle rows, flattened with their portal, authors, images and
+body, as CSV, JSON Lines or Parquet. Articles are read with
+QuerySet.iterator(chunk_size) (a server-side cursor on PostgreSQL) and the
+related rows are loaded once per chunk, so memory stays bounded by the chunk
+size whatever the size of the export.
+
+Parquet output writes one row group per chunk to a forward-only sink, so it
+can be streamed over HTTP like the text formats.
+
+Used by the news_articles_export view and the export_articles management
+command.
+"""
+
+import csv
+import json
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .models import NewsArticle, NewsArticleBody
+from .timeseries import _as_datetime
+
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+TIMESTAMP = pa.timestamp('us', tz='UTC')
+
+SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('portal_id', pa.int64()),
+    ('portal_name', pa.string()),
+    ('portal_domain', pa.string()),
+    ('url', pa.string()),
+    ('title', pa.string()),
+    ('description', pa.string()),
+    ('body', pa.string()),
+    ('published_at', TIMESTAMP),
+    ('language', pa.string()),
+    ('created_at', TIMESTAMP),
+    ('updated_at', TIMESTAMP),
+    ('authors', pa.list_(pa.string())),
+    ('images', pa.list_(pa.string())),
+    ('cluster_id', pa.int64()),
+])
+
+COLUMNS = SCHEMA.names
+
+# Queryset values() field -> export column
+FIELDS = {
+    'id': 'id',
+    'article_url__portal_id': 'portal_id',
+    'article_url__portal__name': 'portal_name',
+    'article_url__portal__domain': 'portal_domain',
+    'article_url__url': 'url',
+    'title': 'title',
+    'description': 'description',
+    'published_at': 'published_at',
+    'language': 'language',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'fingerprint__cluster_id': 'cluster_id',
+}
+
+# Separator of the authors and images lists in CSV cells
+CSV_LIST_SEPARATOR = '|'
+
+DEFAULT_CHUNK_SIZE = 2000
+
+DateLike = Union[date, datetime]
+
+
+def article_queryset(portal_ids: Optional[List[int]] = None, start: Optional[DateLike] = None,
+                     end: Optional[DateLike] = None):
+    """
+    Articles to export, ordered by id
+
+    Args:
+        portal_ids: Restrict to these portals (optional)
+        start: Published at or after (dates start at midnight, optional)
+        end: Published before the end (dates are inclusive, optional)
+    """
+    queryset = NewsArticle.objects.order_by('id')
+    if portal_ids:
+        queryset = queryset.filter(article_url__portal_id__in=portal_ids)
+    if start:
+        queryset = queryset.filter(published_at__gte=_as_datetime(start))
+    if end:
+        queryset = queryset.filter(published_at__lt=_as_datetime(end, end=True))
+    return queryset
+
+
+def load_related(article_ids: List[int]) -> Tuple[Dict[int, List[str]], Dict[int, List[str]]]:
+    """Return ({article_id: [author names]}, {article_id: [image urls]}) for a batch of articles"""
+    authors = defaultdict(list)
+    for article_id, name in NewsArticle.authors.through.objects.filter(newsarticle_id__in=article_ids).values_list(
+        'newsarticle_id', 'newsarticleauthor__name'
+    ):
+        authors[article_id].append(name)
+    images = defaultdict(list)
+    for article_id, image_url in NewsArticle.images.through.objects.filter(newsarticle_id__in=article_ids).values_list(
+        'newsarticle_id', 'newsarticleimage__image_url'
+    ):
+        images[article_id].append(image_url)
+    return authors, images
+
+
+def _complete_chunk(chunk: List[Dict]) -> List[Dict]:
+    article_ids = [row['id'] for row in chunk]
+    bodies = NewsArticleBody.load_many(article_ids)
+    authors, images = load_related(article_ids)
+    for row in chunk:
+        row['body'] = bodies.get(row['id'], '')
+        row['authors'] = authors.get(row['id'], [])
+        row['images'] = images.get(row['id'], [])
+    return chunk
+
+
+def iter_chunks(queryset, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[Dict]]:
+    """Yield lists of up to chunk_size flattened article rows"""
+    chunk = []
+    for values in queryset.values(*FIELDS).iterator(chunk_size=chunk_size):
+        chunk.append({column: values[field] for field, column in FIELDS.items()})
+        if len(chunk) >= chunk_size:
+            yield _complete_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield _complete_chunk(chunk)
+
+
+def _text_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class _Echo:
+    """File-like object whose write() returns the data, so csv.writer output can be yielded"""
+
+    def write(self, value):
+        return value
+
+
+def _stream_csv(chunks: Iterable[List[Dict]]) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for chunk in chunks:
+        for row in chunk:
+            row = dict(row, authors=CSV_LIST_SEPARATOR.join(row['authors']), images=CSV_LIST_SEPARATOR.join(row['images']))
+            yield writer.writerow([_text_value(row[column]) for column in COLUMNS])
+
+
+def _stream_jsonl(chunks: Iterable[List[Dict]]) -> Iterator[str]:
+    for chunk in chunks:
+        yield ''.join(
+            json.dumps({column: _text_value(row[column]) for column in COLUMNS}, ensure_ascii=False) + '\n'
+            for row in chunk
+        )
+
+
+class _ChunkSink:
+    """Forward-only file-like sink for ParquetWriter; drain() hands over what was written so far"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _stream_parquet(chunks: Iterable[List[Dict]]) -> Iterator[bytes]:
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, SCHEMA, compression='zstd')
+    try:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=SCHEMA))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream_articles(queryset, export_format: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Union[str, bytes]]:
+    """
+    Serialize the articles of a queryset
+
+    Args:
+        queryset: NewsArticle queryset, see article_queryset()
+        export_format: 'csv', 'jsonl' or 'parquet'
+        chunk_size: Rows fetched per database round trip (and per Parquet row group)
+
+    Returns:
+        Iterator of str (CSV, JSON Lines) or bytes (Parquet) pieces
+
+    Raises:
+        ValueError: On an unknown format
+    """
+    streams = {'csv': _stream_csv, 'jsonl': _stream_jsonl, 'parquet': _stream_parquet}
+    if export_format not in streams:
+        raise ValueError(f"Unknown export format: {export_format}")
+    return streams[export_format](iter_chunks(queryset, chunk_size))
@@ -0,0 +1,317 @@
+"""
+In-process article extraction
+
+Runs a portal's ItemSelector rules (title, description, body, authors,
+images, published_at, language and url_list) against fetched HTML, so
+article pages can be scraped without a remote spider.
+
+Selectors are loaded once per portal and compiled up front: CSS is
+translated to XPath with cssselect (Scrapy-style ::text and ::attr(name)
+pseudo-elements included), XPath is compiled with lxml and regex with re.
+Each document is parsed a single time and every field is read from that
+tree; regex selectors run on the raw HTML.
+
+When a portal has several selectors for a field they are tried oldest
+first and the first one with a result wins. Fields without a portal
+selector fall back to the usual metadata (og: tags, <title>, <html lang>).
+
+Extractor.extract() returns the raw fields of one page; ingest_extracted()
+turns them into apps.common.ingest items and ingests a batch, and
+scrape_pages() does both.
+"""
+
+import re
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urljoin
+
+from cssselect import GenericTranslator, SelectorError, parse as parse_css
+from dateutil import parser as date_parser
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from lxml import etree, html as lxml_html
+
+from .models import ItemSelector, ItemChoices, SelectorMethodChoices
+from . import ingest
+
+
+# Article fields with one value; the others are lists. url_list is only read
+# from listing pages (Extractor.extract_links)
+SINGLE_FIELDS = {ItemChoices.TITLE, ItemChoices.DESCRIPTION, ItemChoices.PUBLISHED_AT, ItemChoices.LANGUAGE}
+LIST_FIELDS = {ItemChoices.AUTHORS, ItemChoices.IMAGES}
+URL_FIELDS = {ItemChoices.IMAGES, ItemChoices.URL_LIST}
+
+# Used for fields the portal has no selector for
+DEFAULT_XPATHS = {
+    ItemChoices.TITLE: ['//meta[@property="og:title"]/@content', '//title/text()'],
+    ItemChoices.DESCRIPTION: ['//meta[@property="og:description"]/@content', '//meta[@name="description"]/@content'],
+    ItemChoices.PUBLISHED_AT: [
+        '//meta[@property="article:published_time"]/@content', '//meta[@itemprop="datePublished"]/@content',
+        '//time/@datetime',
+    ],
+    ItemChoices.LANGUAGE: ['/html/@lang', '//meta[@property="og:locale"]/@content'],
+    ItemChoices.IMAGES: ['//meta[@property="og:image"]/@content'],
+    ItemChoices.AUTHORS: ['//meta[@name="author"]/@content'],
+    ItemChoices.BODY: ['//article//p'],
+}
+
+BODY_SEPARATOR = '\n\n'
+
+_whitespace = re.compile(r'\s+')
+_translator = GenericTranslator()
+_attr_pseudo = re.compile(r'^attr\((?P<name>[^)]+)\)$')
+
+
+class SelectorCompileError(ValueError):
+    pass
+
+
+def css_to_xpath(query: str) -> str:
+    """
+    Translate a CSS selector to XPath
+
+    Supports the Scrapy pseudo-elements ::text (direct text nodes, or the
+    text of the element and all its descendants after a space, "div ::text")
+    and ::attr(name), translated the way parsel does.
+
+    Raises:
+        SelectorCompileError: On invalid CSS
+    """
+    try:
+        selectors = parse_css(query)
+    except SelectorError as e:
+        raise SelectorCompileError(f"Invalid CSS selector '{query}': {e}")
+    paths = []
+    for selector in selectors:
+        pseudo = selector.pseudo_element
+        if hasattr(pseudo, 'name'):
+            # Functional pseudo-element, e.g. ::attr(href)
+            pseudo = f"{pseudo.name}({''.join(token.value for token in pseudo.arguments)})"
+        try:
+            path = _translator.selector_to_xpath(selector, translate_pseudo_elements=False)
+        except SelectorError as e:
+            raise SelectorCompileError(f"Invalid CSS selector '{query}': {e}")
+        if pseudo == 'text':
+            node = 'text()'
+        elif pseudo:
+            match = _attr_pseudo.match(pseudo)
+            if not match:
+                raise SelectorCompileError(f"Unsupported pseudo-element '::{pseudo}' in '{query}'")
+            node = f"@{match.group('name').strip()}"
+        else:
+            paths.append(path)
+            continue
+        # "div ::text" is div/descendant-or-self::*/* in cssselect, which would
+        # skip the nodes of the div itself
+        if path.endswith('::*/*'):
+            paths.append(path[:-1] + node)
+        else:
+            paths.append(f'{path}/{node}')
+    return ' | '.join(paths)
+
+
+def _normalize(value: str) -> str:
+    return _whitespace.sub(' ', value).strip()
+
+
+def parse_document(page_html):
+    """Parse a document with lxml; unparseable or empty documents give an empty tree"""
+    try:
+        return lxml_html.document_fromstring(page_html)
+    except ValueError:
+        # str input with an XML encoding declaration
+        return parse_document(page_html.encode('utf-8')) if isinstance(page_html, str) else parse_document('<html></html>')
+    except etree.ParserError:
+        return lxml_html.document_fromstring('<html></html>')
+
+
+class CompiledSelector:
+    """One ItemSelector compiled to an lxml XPath or a regex"""
+
+    def __init__(self, method: str, query: str):
+        self.method = method
+        self.query = query
+        self.pattern = None
+        self.xpath = None
+        try:
+            if method == SelectorMethodChoices.REGEX:
+                self.pattern = re.compile(query, re.IGNORECASE | re.DOTALL)
+            else:
+                self.xpath = etree.XPath(css_to_xpath(query) if method == SelectorMethodChoices.CSS else query)
+        except (re.error, etree.XPathSyntaxError) as e:
+            raise SelectorCompileError(f"Invalid {method} selector '{query}': {e}")
+
+    def values(self, tree, text: str) -> List[str]:
+        """Non-empty string results: text nodes and attributes as is, elements as their text content"""
+        if self.pattern is not None:
+            matches = (match.group(1) if match.groups() else match.group(0) for match in self.pattern.finditer(text))
+        else:
+            try:
+                result = self.xpath(tree)
+            except etree.XPathEvalError:
+                return []
+            if not isinstance(result, list):
+                result = [result]
+            matches = (item.text_content() if isinstance(item, etree._Element) else str(item) for item in result)
+        return [value for value in matches if value and not value.isspace()]
+
+
+class Extractor:
+    """A portal's compiled selectors, grouped by field"""
+
+    def __init__(self, portal_id: int, selectors: Iterable[Tuple[str, str, str]]):
+        self.portal_id = portal_id
+        self.fields = defaultdict(list)
+        self.errors = []
+        for item, method, query in selectors:
+            try:
+                selector = CompiledSelector(method, query)
+            except SelectorCompileError as e:
+                self.errors.append(str(e))
+                continue
+            self.fields[item].append(selector)
+        for item, paths in DEFAULT_XPATHS.items():
+            if not self.fields.get(item):
+                self.fields[item] = [CompiledSelector(SelectorMethodChoices.XPATH, path) for path in paths]
+
+    def _first(self, item: str, tree, text: str) -> List[str]:
+        for selector in self.fields.get(item, []):
+            values = selector.values(tree, text)
+            if values:
+                return values
+        return []
+
+    def _values(self, item: str, tree, text: str, url: str) -> List[str]:
+        values = [_normalize(value) for value in self._first(item, tree, text)]
+        if item in URL_FIELDS:
+            values = [urljoin(url, value) for value in values]
+        return list(dict.fromkeys(value for value in values if value))
+
+    def extract_links(self, page_html: str, url: str) -> List[str]:
+        """Only the url_list field, for listing pages"""
+        text = page_html if isinstance(page_html, str) else page_html.decode('utf-8', 'replace')
+        return self._values(ItemChoices.URL_LIST, parse_document(page_html), text, url)
+
+    def extract(self, page_html: str, url: str) -> Dict:
+        """
+        Apply every article field selector to one document
+
+        Returns:
+            Dict with url and the extracted fields (missing single fields are None)
+        """
+        text = page_html if isinstance(page_html, str) else page_html.decode('utf-8', 'replace')
+        tree = parse_document(page_html)
+
+        item = {'url': url}
+        for field in SINGLE_FIELDS:
+            values = self._first(field, tree, text)
+            item[field] = _normalize(values[0]) if values else None
+        for field in LIST_FIELDS:
+            item[field] = self._values(field, tree, text, url)
+        paragraphs = [_normalize(value) for value in self._first(ItemChoices.BODY, tree, text)]
+        item[ItemChoices.BODY] = BODY_SEPARATOR.join(paragraph for paragraph in paragraphs if paragraph)
+        return item
+
+
+def load_extractors(portal_ids: Iterable[int]) -> Dict[int, Extractor]:
+    """Compile the selectors of several portals with a single query"""
+    selectors = defaultdict(list)
+    portal_ids = list(portal_ids)
+    rows = ItemSelector.objects.filter(portal_id__in=portal_ids).order_by('id').values_list(
+        'portal_id', 'item', 'method', 'query'
+    )
+    for portal_id, item, method, query in rows:
+        selectors[portal_id].append((item, method, query))
+    return {portal_id: Extractor(portal_id, selectors[portal_id]) for portal_id in portal_ids}
+
+
+def parse_published_at(value: Optional[str]) -> Optional[datetime]:
+    """ISO 8601 first, then a lenient parse of common date formats; naive dates use TIME_ZONE"""
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        try:
+            parsed = date_parser.parse(value)
+        except (ValueError, OverflowError):
+            return None
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def _to_ingest_item(extracted: Dict, portal_domain: Optional[str]) -> Tuple[Dict, Dict]:
+    """Shape an extraction result for ingest.ingest_articles(); returns (item, field errors)"""
+    errors = {}
+    published_at = parse_published_at(extracted[ItemChoices.PUBLISHED_AT])
+    if not extracted[ItemChoices.TITLE]:
+        errors['title'] = ["No title found"]
+    if published_at is None:
+        errors['published_at'] = [f"No publication date found ({extracted[ItemChoices.PUBLISHED_AT]!r})"]
+    language = (extracted[ItemChoices.LANGUAGE] or '')[:2].lower() or None
+    item = {
+        'url': extracted['url'],
+        'title': (extracted[ItemChoices.TITLE] or '')[:255],
+        'description': extracted[ItemChoices.DESCRIPTION],
+        'body': extracted[ItemChoices.BODY],
+        'published_at': published_at,
+        'language': language,
+        'authors': [author[:255] for author in extracted[ItemChoices.AUTHORS]],
+        'images': [image for image in extracted[ItemChoices.IMAGES] if len(image) <= 200],
+    }
+    if portal_domain:
+        item['portal'] = portal_domain
+    return item, errors
+
+
+def ingest_extracted(rows: Iterable[Tuple[int, Dict]], portal_domains: Optional[Dict[int, str]] = None) -> List[Dict]:
+    """
+    Ingest Extractor.extract() results
+
+    Args:
+        rows: (portal_id, extracted fields) per page
+        portal_domains: {portal_id: domain}, so articles are filed under their
+            portal whatever the URL host
+
+    Returns:
+        One ingest result per row, in order (see ingest.ingest_articles), with
+        status 'invalid' and field errors for pages missing a title or date
+    """
+    rows = list(rows)
+    portal_domains = portal_domains or {}
+
+    results, items, positions = [None] * len(rows), [], []
+    for index, (portal_id, extracted) in enumerate(rows):
+        item, errors = _to_ingest_item(extracted, portal_domains.get(portal_id))
+        if errors:
+            results[index] = {'index': index, 'status': 'invalid', 'url': extracted['url'], 'id': None, 'errors': errors}
+        else:
+            items.append(item)
+            positions.append(index)
+    for position, result in zip(positions, ingest.ingest_articles(items)):
+        results[position] = dict(result, index=position)
+    return results
+
+
+def scrape_pages(pages: Iterable[Tuple[int, str, str]], extractors: Optional[Dict[int, Extractor]] = None,
+                 portal_domains: Optional[Dict[int, str]] = None) -> List[Dict]:
+    """
+    Extract articles from fetched pages and ingest them
+
+    Args:
+        pages: (portal_id, url, html) per page
+        extractors: Preloaded extractors, loaded with load_extractors() when missing
+        portal_domains: See ingest_extracted()
+
+    Returns:
+        One ingest result per page, see ingest_extracted()
+    """
+    pages = list(pages)
+    if extractors is None:
+        extractors = load_extractors({portal_id for portal_id, _, _ in pages})
+    return ingest_extracted(
+        ((portal_id, extractors[portal_id].extract(page_html, url)) for portal_id, url, page_html in pages),
+        portal_domains
+    )
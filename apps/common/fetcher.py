@@ -0,0 +1,418 @@
+"""
+Asynchronous article fetcher
+
+Downloads pending clean URLs (NewsArticleCleanUrl) and hands the pages to
+the extraction stage (apps.common.extract):
+
+1. A batch of pending URLs is claimed: selected with SKIP LOCKED where the
+   database supports it and marked running with one UPDATE, so several
+   fetchers can share the queue
+2. Pages are fetched concurrently on one asyncio event loop, with an httpx
+   client per portal whose connections are kept alive (HTTP/1.1, or HTTP/2
+   with FETCHER_HTTP2 when the server offers it). A portal has at most
+   NewsPortal.fetch_concurrency (else FETCHER_PORTAL_CONCURRENCY) requests in
+   flight, and the process at most FETCHER_MAX_CONNECTIONS
+3. Bodies are streamed and dropped past FETCHER_MAX_BYTES. Each page is
+   extracted as soon as it arrives, so only its fields stay in memory
+4. Articles are ingested in bulk (apps.common.ingest) and the URL statuses
+   written back with one UPDATE per batch
+
+The database is only used before and after the event loop. URLs left running
+by a fetcher that died are claimed again after FETCHER_STALE_AFTER seconds.
+Transient failures (timeouts, connection errors, 429 and 5xx) put the URL
+back to pending with an exponential backoff, up to FETCHER_MAX_ATTEMPTS
+fetches; other failures are final.
+
+crawl_seed_urls() fetches the seed (listing) pages of the portals the same
+way, with conditional requests: unchanged pages cost a 304 or a hash
+comparison, and only the links of changed pages are extracted and queued as
+raw URLs.
+"""
+
+import asyncio
+import time
+from collections import Counter, defaultdict
+from contextlib import AsyncExitStack
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
+
+from .importer import normalize_domain
+from .models import NewsPortal, NewsPortalSeedUrl, NewsArticleCleanUrl, NewsArticleUrlStatusChoices
+from . import conditional, extract, metrics, seen_filter
+
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_PORTAL_CONCURRENCY = 8
+DEFAULT_MAX_CONNECTIONS = 500
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_TIMEOUT = 30
+DEFAULT_STALE_AFTER = 15 * 60
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BACKOFF = 5 * 60
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (compatible; ONCS-Fetcher/1.0)'
+
+# Ingest results that leave the clean URL completed
+INGESTED = {'created', 'updated', 'duplicate'}
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def claim_pending(batch_size: int = DEFAULT_BATCH_SIZE, portal_id: Optional[int] = None) -> List[Tuple[int, str, int]]:
+    """
+    Mark a batch of pending (or stale running) clean URLs as running
+
+    Returns:
+        The claimed (clean_url_id, url, portal_id) rows
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=_setting('FETCHER_STALE_AFTER', DEFAULT_STALE_AFTER))
+    pending = NewsArticleCleanUrl.objects.filter(
+        Q(status=NewsArticleUrlStatusChoices.PENDING) & (Q(next_fetch_at__isnull=True) | Q(next_fetch_at__lte=now))
+        | Q(status=NewsArticleUrlStatusChoices.RUNNING, updated_at__lt=stale)
+    )
+    if portal_id:
+        pending = pending.filter(portal_id=portal_id)
+
+    with transaction.atomic():
+        rows = list(
+            pending.select_for_update(skip_locked=True).order_by('id').values_list('id', 'url', 'portal_id')[:batch_size]
+        )
+        if rows:
+            NewsArticleCleanUrl.objects.filter(id__in=[row[0] for row in rows]).update(
+                status=NewsArticleUrlStatusChoices.RUNNING, updated_at=now
+            )
+    return rows
+
+
+def _failure(reason: str, error: str, transient: bool = False) -> Dict:
+    return {'result': reason, 'error': error, 'extracted': None, 'bytes': 0, 'transient': transient}
+
+
+def is_transient(status_code: int) -> bool:
+    """HTTP statuses worth retrying later: rate limiting and server errors"""
+    return status_code == 429 or status_code >= 500
+
+
+async def read_body(response: httpx.Response, max_bytes: int) -> Optional[bytes]:
+    """The streamed body, or None once it grows past max_bytes"""
+    declared = response.headers.get('content-length')
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        return None
+    chunks, size = [], 0
+    async for chunk in response.aiter_bytes():
+        size += len(chunk)
+        if size > max_bytes:
+            return None
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+async def _download(client: httpx.AsyncClient, semaphores: Tuple[asyncio.Semaphore, asyncio.Semaphore], url: str,
+                    max_bytes: int, headers: Optional[Dict[str, str]] = None) -> Dict:
+    """
+    GET one HTML page; never raises
+
+    Returns:
+        {'result', 'error', 'transient', 'headers', 'body', 'html'} with result
+        'ok', 'not_modified' (304 to a conditional request), 'http_error',
+        'not_html', 'too_large' or 'error'; transient marks failures worth
+        retrying. body holds the raw bytes and html the decoded page (bytes
+        when the charset is left to lxml).
+    """
+    download = {'result': 'ok', 'error': None, 'transient': False, 'headers': {}, 'body': None, 'html': None}
+    portal_slot, process_slot = semaphores
+    async with portal_slot, process_slot:
+        try:
+            async with client.stream('GET', url, headers=headers) as response:
+                download['headers'] = response.headers
+                if response.status_code == 304:
+                    return dict(download, result='not_modified')
+                if response.status_code != 200:
+                    return dict(download, result='http_error', error=f"HTTP {response.status_code}",
+                                transient=is_transient(response.status_code))
+                content_type = response.headers.get('content-type', '').lower()
+                if content_type and 'html' not in content_type and 'xml' not in content_type:
+                    return dict(download, result='not_html', error=f"Content type {content_type}")
+                body = await read_body(response, max_bytes)
+                encoding = response.charset_encoding
+        except httpx.HTTPError as e:
+            return dict(download, result='error', error=f"{type(e).__name__}: {e}", transient=True)
+    if body is None:
+        return dict(download, result='too_large', error=f"Body larger than {max_bytes} bytes")
+
+    # Without a charset header lxml reads the <meta charset> of the raw bytes
+    try:
+        page_html = body.decode(encoding, 'replace') if encoding else body
+    except LookupError as e:
+        # Unknown charset name
+        return dict(download, result='error', error=str(e))
+    return dict(download, body=body, html=page_html)
+
+
+async def _fetch(client: httpx.AsyncClient, semaphores: Tuple[asyncio.Semaphore, asyncio.Semaphore], url: str,
+                 extractor: extract.Extractor, max_bytes: int) -> Dict:
+    """Fetch and extract one article page; never raises"""
+    download = await _download(client, semaphores, url, max_bytes)
+    if download['result'] != 'ok':
+        return _failure(download['result'], download['error'], download['transient'])
+    extracted = extractor.extract(download['html'], url)
+    return {'result': 'ok', 'error': None, 'extracted': extracted, 'bytes': len(download['body']), 'transient': False}
+
+
+def portal_client(limit: int) -> httpx.AsyncClient:
+    # httpcore scans every connection of a pool per request, so small pools
+    # per portal scale where one large shared pool does not
+    limits = httpx.Limits(max_connections=limit, max_keepalive_connections=limit, keepalive_expiry=30)
+    return httpx.AsyncClient(
+        http2=_setting('FETCHER_HTTP2', False), limits=limits, follow_redirects=True,
+        # Requests waiting for a free connection are throttled, not failed
+        timeout=httpx.Timeout(_setting('FETCHER_TIMEOUT', DEFAULT_TIMEOUT), pool=None),
+        headers={'User-Agent': _setting('FETCHER_USER_AGENT', DEFAULT_USER_AGENT)},
+    )
+
+
+async def _fetch_listing(client: httpx.AsyncClient, semaphores: Tuple[asyncio.Semaphore, asyncio.Semaphore], url: str,
+                         extractor: extract.Extractor, store: conditional.ValidatorStore, max_bytes: int) -> Dict:
+    """Conditionally fetch one listing page and extract its links when it changed; never raises"""
+    download = await _download(client, semaphores, url, max_bytes, headers=store.headers(url))
+    if download['result'] not in ('ok', 'not_modified'):
+        return {'result': download['result'], 'error': download['error'], 'links': []}
+    changed = store.update(
+        url, 304 if download['result'] == 'not_modified' else 200, etag=download['headers'].get('etag'),
+        last_modified=download['headers'].get('last-modified'), body=download['body']
+    )
+    if not changed:
+        return {'result': download['result'] if download['result'] == 'not_modified' else 'unchanged', 'error': None, 'links': []}
+    return {'result': 'changed', 'error': None, 'links': extractor.extract_links(download['html'], url)}
+
+
+async def fetch_listings(rows: List[Tuple[str, int]], extractors: Dict[int, extract.Extractor],
+                         concurrency: Dict[int, int], store: conditional.ValidatorStore) -> List[Dict]:
+    """
+    Conditionally fetch (url, portal_id) listing pages concurrently
+
+    Returns:
+        One dict per row, in order: {'result', 'error', 'links'} with result
+        'changed', 'unchanged' (same content hash), 'not_modified' (304) or a
+        download failure (see _download)
+    """
+    max_bytes = _setting('FETCHER_MAX_BYTES', DEFAULT_MAX_BYTES)
+    process_slot = asyncio.Semaphore(_setting('FETCHER_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS))
+    semaphores = {portal_id: (asyncio.Semaphore(limit), process_slot) for portal_id, limit in concurrency.items()}
+
+    async with AsyncExitStack() as stack:
+        clients = {
+            portal_id: await stack.enter_async_context(portal_client(limit)) for portal_id, limit in concurrency.items()
+        }
+        return await asyncio.gather(*(
+            _fetch_listing(clients[portal_id], semaphores[portal_id], url, extractors[portal_id], store, max_bytes)
+            for url, portal_id in rows
+        ))
+
+
+async def fetch_pages(rows: List[Tuple[int, str, int]], extractors: Dict[int, extract.Extractor],
+                      concurrency: Dict[int, int]) -> List[Dict]:
+    """
+    Fetch and extract the pages of (clean_url_id, url, portal_id) rows concurrently
+
+    Args:
+        rows: URLs to fetch
+        extractors: Compiled selectors per portal id
+        concurrency: Maximum requests in flight per portal id
+
+    Returns:
+        One dict per row, in order: {'result', 'error', 'extracted', 'bytes', 'transient'}
+        with result 'ok', 'http_error', 'not_html', 'too_large' or 'error'
+    """
+    max_bytes = _setting('FETCHER_MAX_BYTES', DEFAULT_MAX_BYTES)
+    process_slot = asyncio.Semaphore(_setting('FETCHER_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS))
+    semaphores = {portal_id: (asyncio.Semaphore(limit), process_slot) for portal_id, limit in concurrency.items()}
+
+    async with AsyncExitStack() as stack:
+        clients = {
+            portal_id: await stack.enter_async_context(portal_client(limit)) for portal_id, limit in concurrency.items()
+        }
+        return await asyncio.gather(*(
+            _fetch(clients[portal_id], semaphores[portal_id], url, extractors[portal_id], max_bytes)
+            for _, url, portal_id in rows
+        ))
+
+
+def portal_limits(portal_ids) -> Tuple[Dict[int, str], Dict[int, int]]:
+    """({portal_id: domain}, {portal_id: requests in flight})"""
+    default_limit = _setting('FETCHER_PORTAL_CONCURRENCY', DEFAULT_PORTAL_CONCURRENCY)
+    domains, concurrency = {}, {}
+    for pk, domain, limit in NewsPortal.objects.filter(id__in=portal_ids).values_list('id', 'domain', 'fetch_concurrency'):
+        domains[pk] = domain
+        concurrency[pk] = limit or default_limit
+    return domains, concurrency
+
+
+def _retry_later(clean_url_ids: List[int]) -> List[int]:
+    """
+    Put URLs that failed transiently back to pending with an exponential backoff
+
+    Returns:
+        The ids that ran out of attempts, to be marked failed
+    """
+    max_attempts = _setting('FETCHER_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    backoff = _setting('FETCHER_RETRY_BACKOFF', DEFAULT_RETRY_BACKOFF)
+    by_attempts = defaultdict(list)
+    for pk, attempts in NewsArticleCleanUrl.objects.filter(id__in=clean_url_ids).values_list('id', 'fetch_attempts'):
+        by_attempts[attempts + 1].append(pk)
+
+    now = timezone.now()
+    exhausted = []
+    for attempts, ids in by_attempts.items():
+        if attempts >= max_attempts:
+            exhausted.extend(ids)
+            continue
+        NewsArticleCleanUrl.objects.filter(id__in=ids).update(
+            status=NewsArticleUrlStatusChoices.PENDING, fetch_attempts=attempts,
+            next_fetch_at=now + timedelta(seconds=backoff * 2 ** (attempts - 1)), updated_at=now,
+        )
+    return exhausted
+
+
+def fetch_pending_articles(batch_size: int = DEFAULT_BATCH_SIZE, portal_id: Optional[int] = None) -> Dict:
+    """
+    Fetch, extract and ingest one batch of pending clean URLs
+
+    Args:
+        batch_size: Maximum number of URLs in flight for this batch
+        portal_id: Restrict the batch to one portal (optional)
+
+    Returns:
+        Dict with processed/completed/retried/failed counters, fetched bytes,
+        fetch seconds and the fetch results by kind
+    """
+    rows = claim_pending(batch_size=batch_size, portal_id=portal_id)
+    if not rows:
+        return {'processed': 0, 'completed': 0, 'retried': 0, 'failed': 0, 'bytes': 0, 'seconds': 0.0, 'results': {}}
+
+    portal_ids = {row[2] for row in rows}
+    extractors = extract.load_extractors(portal_ids)
+    domains, concurrency = portal_limits(portal_ids)
+
+    started = time.perf_counter()
+    fetched = asyncio.run(fetch_pages(rows, extractors, concurrency))
+    seconds = time.perf_counter() - started
+
+    results = Counter(page['result'] for page in fetched)
+    metrics.record_fetches(results)
+    ok = [(row, page) for row, page in zip(rows, fetched) if page['result'] == 'ok']
+    ingested = extract.ingest_extracted(((row[2], page['extracted']) for row, page in ok), domains)
+    completed = [row[0] for (row, _), result in zip(ok, ingested) if result['status'] in INGESTED]
+    results['invalid'] = len(ok) - len(completed)
+
+    transient = [row[0] for row, page in zip(rows, fetched) if page['transient']]
+    exhausted = set(_retry_later(transient)) if transient else set()
+    retried = [pk for pk in transient if pk not in exhausted]
+    final = [row[0] for row in rows if row[0] not in set(retried)]
+
+    NewsArticleCleanUrl.objects.filter(id__in=final).update(
+        status=Case(
+            When(id__in=completed, then=Value(NewsArticleUrlStatusChoices.COMPLETED)),
+            default=Value(NewsArticleUrlStatusChoices.FAILED),
+        ) if completed else Value(NewsArticleUrlStatusChoices.FAILED),
+        updated_at=timezone.now(),
+    )
+
+    return {
+        'processed': len(rows),
+        'completed': len(completed),
+        'retried': len(retried),
+        'failed': len(final) - len(completed),
+        'bytes': sum(page['bytes'] for page in fetched),
+        'seconds': seconds,
+        'results': dict(results),
+    }
+
+
+def run_fetcher(batch_size: int = DEFAULT_BATCH_SIZE, portal_id: Optional[int] = None,
+                max_batches: Optional[int] = None, should_stop: Optional[Callable[[], bool]] = None) -> Dict:
+    """
+    Drain pending clean URLs batch by batch
+
+    Args:
+        batch_size: URLs per batch, fetched concurrently
+        portal_id: Restrict processing to one portal (optional)
+        max_batches: Stop after this many batches (optional)
+        should_stop: Callable checked between batches, e.g. AbortableTask.is_aborted
+
+    Returns:
+        Dict with aggregated counters and the number of batches run
+    """
+    totals = {'processed': 0, 'completed': 0, 'retried': 0, 'failed': 0, 'bytes': 0, 'seconds': 0.0, 'batches': 0}
+    results = Counter()
+    while max_batches is None or totals['batches'] < max_batches:
+        if should_stop and should_stop():
+            break
+        batch = fetch_pending_articles(batch_size=batch_size, portal_id=portal_id)
+        if not batch['processed']:
+            break
+        totals['batches'] += 1
+        results.update(batch.pop('results'))
+        for key, value in batch.items():
+            totals[key] += value
+    totals['results'] = dict(results)
+    return totals
+
+
+def on_portal(url: str, domain: str) -> bool:
+    """Whether the URL is on the portal domain or a subdomain; both sides are normalized (no www.)"""
+    host, domain = normalize_domain(url), normalize_domain(domain)
+    return host == domain or host.endswith(f'.{domain}')
+
+
+def crawl_seed_urls(portal_id: Optional[int] = None) -> Dict:
+    """
+    Fetch the seed (listing) pages of every portal, or of one, and queue the
+    new article links they list as pending raw URLs
+
+    Pages are requested with their stored validators (apps.common.conditional);
+    links are only extracted from pages that changed since the last crawl.
+
+    Returns:
+        Dict with the number of seeds, fetch results by kind, links found
+        and raw URLs queued
+    """
+    seeds = NewsPortalSeedUrl.objects.order_by('id')
+    if portal_id:
+        seeds = seeds.filter(portal_id=portal_id)
+    rows = list(seeds.values_list('url', 'portal_id'))
+    if not rows:
+        return {'seeds': 0, 'links': 0, 'queued': 0, 'seconds': 0.0, 'results': {}}
+
+    portal_ids = {row[1] for row in rows}
+    extractors = extract.load_extractors(portal_ids)
+    domains, concurrency = portal_limits(portal_ids)
+    store = conditional.ValidatorStore(url for url, _ in rows)
+
+    started = time.perf_counter()
+    fetched = asyncio.run(fetch_listings(rows, extractors, concurrency, store))
+    seconds = time.perf_counter() - started
+    store.save()
+
+    links = {}
+    for (_, seed_portal_id), page in zip(rows, fetched):
+        links.setdefault(seed_portal_id, []).extend(
+            link for link in page['links'] if on_portal(link, domains[seed_portal_id])
+        )
+    queued = sum(seen_filter.insert_unseen_urls('raw', pk, urls) for pk, urls in links.items() if urls)
+
+    return {
+        'seeds': len(rows),
+        'links': sum(len(urls) for urls in links.values()),
+        'queued': queued,
+        'seconds': seconds,
+        'results': dict(Counter(page['result'] for page in fetched)),
+    }
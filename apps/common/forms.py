@@ -4,7 +4,7 @@ from django_countries.widgets import CountrySelectWidget
 from .models import (
     NewsPortal, NewsArticleRawUrl, NewsArticleCleanUrl, NewsArticle,
     NewsArticleAuthor, NewsArticleImage, NewsPortalSeedUrl,
-    ItemSelector, CrawlerConfig, ScraperConfig, CrawlerTask, CrawlerScheduledTask
+    ItemSelector, CrawlerConfig, ScraperConfig, CrawlerTask, CrawlerScheduledTask, ScheduleModeChoices
 )
 
 class NewsPortalForm(forms.ModelForm):
@@ -82,6 +82,13 @@ class NewsArticleCleanUrlForm(forms.ModelForm):
 
 class NewsArticleForm(forms.ModelForm):
     """Form for NewsArticle model"""
+
+    # Not a model field: the body is stored compressed in NewsArticleBody
+    body = forms.CharField(widget=forms.Textarea(attrs={
+        'class': 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-500 focus:border-primary-500 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400 dark:text-white dark:focus:ring-primary-500 dark:focus:border-primary-500',
+        'rows': 10,
+        'placeholder': 'Article content...'
+    }))
     
     class Meta:
         model = NewsArticle
@@ -94,11 +101,6 @@ class NewsArticleForm(forms.ModelForm):
                 'class': 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-500 focus:border-primary-500 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400 dark:text-white dark:focus:ring-primary-500 dark:focus:border-primary-500',
                 'placeholder': 'Article Title'
             }),
-            'body': forms.Textarea(attrs={
-                'class': 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-500 focus:border-primary-500 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400 dark:text-white dark:focus:ring-primary-500 dark:focus:border-primary-500',
-                'rows': 10,
-                'placeholder': 'Article content...'
-            }),
             'description': forms.Textarea(attrs={
                 'class': 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-500 focus:border-primary-500 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400 dark:text-white dark:focus:ring-primary-500 dark:focus:border-primary-500',
                 'rows': 3,
@@ -121,6 +123,17 @@ class NewsArticleForm(forms.ModelForm):
             })
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial.setdefault('body', self.instance.body)
+
+    def save(self, commit=True):
+        # Untouched bodies are neither rewritten nor fingerprinted again
+        if not self.instance.pk or 'body' in self.changed_data:
+            self.instance.body = self.cleaned_data['body']
+        return super().save(commit)
+
 class NewsArticleAuthorForm(forms.ModelForm):
     """Form for NewsArticleAuthor model"""
     
@@ -288,7 +301,10 @@ class CrawlerScheduledTaskForm(forms.ModelForm):
     
     class Meta:
         model = CrawlerScheduledTask
-        fields = ['crawler_config', 'name', 'description', 'cron_expression', 'is_active']
+        fields = [
+            'crawler_config', 'name', 'description', 'schedule_mode', 'cron_expression',
+            'min_interval', 'max_interval', 'target_new_urls', 'is_active'
+        ]
         widgets = {
             'crawler_config': forms.Select(attrs={
                 'class': 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-500 focus:border-primary-500 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400 dark:text-white dark:focus:ring-primary-500 dark:focus:border-primary-500'
@@ -302,6 +318,18 @@ class CrawlerScheduledTaskForm(forms.ModelForm):
                 'rows': 3,
                 'placeholder': 'Description of the scheduled task'
             }),
+            'schedule_mode': forms.Select(attrs={
+                'class': 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-500 focus:border-primary-500 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400 dark:text-white dark:focus:ring-primary-500 dark:focus:border-primary-500'
+            }),
+            'min_interval': forms.NumberInput(attrs={
+                'class': 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-500 focus:border-primary-500 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400 dark:text-white dark:focus:ring-primary-500 dark:focus:border-primary-500'
+            }),
+            'max_interval': forms.NumberInput(attrs={
+                'class': 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-500 focus:border-primary-500 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400 dark:text-white dark:focus:ring-primary-500 dark:focus:border-primary-500'
+            }),
+            'target_new_urls': forms.NumberInput(attrs={
+                'class': 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-500 focus:border-primary-500 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400 dark:text-white dark:focus:ring-primary-500 dark:focus:border-primary-500'
+            }),
             'cron_expression': forms.TextInput(attrs={
                 'class': 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-500 focus:border-primary-500 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400 dark:text-white dark:focus:ring-primary-500 dark:focus:border-primary-500',
                 'placeholder': '0 0 * * * (daily at midnight)'
@@ -320,4 +348,54 @@ class CrawlerScheduledTaskForm(forms.ModelForm):
             cron_pattern = r'^(\*|[0-9,\-*/]+)\s+(\*|[0-9,\-*/]+)\s+(\*|[0-9,\-*/]+)\s+(\*|[0-9,\-*/]+)\s+(\*|[0-9,\-*/]+)(\s+(\*|[0-9,\-*/]+))?$'
             if not re.match(cron_pattern, cron_expression):
                 raise forms.ValidationError("Please enter a valid cron expression (e.g., '0 0 * * *' for daily at midnight)")
-        return cron_expression 
\ No newline at end of file
+        return cron_expression
+
+    def clean(self):
+        """Cron tasks need an expression, adaptive tasks consistent interval bounds"""
+        cleaned_data = super().clean()
+        if cleaned_data.get('schedule_mode') == ScheduleModeChoices.ADAPTIVE:
+            min_interval = cleaned_data.get('min_interval')
+            max_interval = cleaned_data.get('max_interval')
+            if min_interval and max_interval and min_interval > max_interval:
+                self.add_error('max_interval', "The maximum interval must not be shorter than the minimum interval")
+        elif not cleaned_data.get('cron_expression') and 'cron_expression' not in self.errors:
+            self.add_error('cron_expression', "A cron expression is required for cron schedules")
+        return cleaned_data
+
+class BulkImportForm(forms.Form):
+    """Upload form for apps.common.importer"""
+    
+    KIND_CHOICES = [
+        ('portals', 'News Portals'),
+        ('seed_urls', 'Seed URLs'),
+        ('selectors', 'Item Selectors'),
+    ]
+
+    kind = forms.ChoiceField(choices=KIND_CHOICES, widget=forms.Select(attrs={
+        'class': 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-500 focus:border-primary-500 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400 dark:text-white dark:focus:ring-primary-500 dark:focus:border-primary-500'
+    }))
+    file = forms.FileField(
+        help_text="CSV with a header row, JSON Lines (.jsonl) or a JSON array (.json)",
+        widget=forms.ClearableFileInput(attrs={
+            'class': 'block w-full text-sm text-gray-900 border border-gray-300 rounded-lg cursor-pointer bg-gray-50 dark:text-gray-400 focus:outline-none dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400',
+            'accept': '.csv,.json,.jsonl,.ndjson'
+        })
+    )
+    dry_run = forms.BooleanField(required=False, help_text="Validate only, write nothing", widget=forms.CheckboxInput(attrs={
+        'class': 'w-4 h-4 text-primary-600 bg-gray-100 border-gray-300 rounded focus:ring-primary-500 dark:focus:ring-primary-600 dark:ring-offset-gray-800 focus:ring-2 dark:bg-gray-700 dark:border-gray-600'
+    }))
+
+
+class SelectorBenchmarkForm(forms.Form):
+    """Options of a selector benchmark run (apps.common.selector_bench)"""
+
+    portal = forms.ModelChoiceField(queryset=NewsPortal.objects.all(), widget=forms.Select(attrs={
+        'class': 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-500 focus:border-primary-500 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400 dark:text-white dark:focus:ring-primary-500 dark:focus:border-primary-500'
+    }))
+    budget_ms = forms.FloatField(required=False, min_value=0, help_text="Time budget per fixture in milliseconds", widget=forms.NumberInput(attrs={
+        'class': 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-500 focus:border-primary-500 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400 dark:text-white dark:focus:ring-primary-500 dark:focus:border-primary-500',
+        'step': 'any'
+    }))
+    capture = forms.IntegerField(required=False, min_value=1, max_value=50, help_text="First download this many article and seed pages as fixtures", widget=forms.NumberInput(attrs={
+        'class': 'bg-gray-50 border border-gray-300 text-gray-900 text-sm rounded-lg focus:ring-primary-500 focus:border-primary-500 block w-full p-2.5 dark:bg-gray-700 dark:border-gray-600 dark:placeholder-gray-400 dark:text-white dark:focus:ring-primary-500 dark:focus:border-primary-500'
+    }))
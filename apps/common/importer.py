@@ -0,0 +1,363 @@
+"""
+Bulk import of news portals, seed URLs and item selectors
+
+Reads CSV, JSON Lines or JSON array files and validates them in one
+streaming pass. Valid rows are upserted in chunks, and invalid rows are
+reported with their row number instead of aborting the import.
+
+- portals: domain, name, news_scope, country, city (upserted on the domain
+  without www., which also matches a portal stored as www.<domain>)
+- seed_urls: url, portal (upserted on url; a seed filed under another portal moves)
+- selectors: portal, query, item, method (upserted on portal + item + query)
+
+`portal` columns hold the portal domain. Domains are resolved with one query
+per chunk and cached for the rest of the import.
+
+Bulk writes bypass model signals, so the importer updates the dashboard
+counters (apps.common.stats), the seen-URL filters and the search index of
+renamed portals itself.
+"""
+
+import csv
+import io
+import json
+from collections import Counter, defaultdict
+from itertools import islice
+from typing import Callable, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import transaction
+from django.utils import timezone
+from django_countries import countries
+
+from .models import (
+    NewsPortal, NewsPortalSeedUrl, ItemSelector, NewsScopeChoices, ItemChoices, SelectorMethodChoices
+)
+from . import caching, search, seen_filter, stats
+
+
+KINDS = ('portals', 'seed_urls', 'selectors')
+FORMATS = ('csv', 'jsonl', 'json')
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+URL_MAX_LENGTH = NewsPortalSeedUrl._meta.get_field('url').max_length
+CHAR_MAX_LENGTH = 255
+
+_validate_url = URLValidator()
+
+
+def detect_format(filename: str) -> str:
+    """Format from a file name extension, CSV when unknown"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'json':
+        return 'json'
+    return 'csv'
+
+
+def read_records(stream: IO[bytes], file_format: str) -> Iterator[Dict]:
+    """
+    Yield one dict per record of a binary file object
+
+    CSV and JSON Lines are read incrementally; a JSON document must be an
+    array of objects and is parsed whole.
+
+    Raises:
+        ValueError: On an unknown format or a JSON document that is not an array
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        yield from csv.DictReader(text)
+    elif file_format == 'jsonl':
+        for line in text:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield {'__error__': f"Invalid JSON: {e}"}
+    elif file_format == 'json':
+        records = json.load(text)
+        if not isinstance(records, list):
+            raise ValueError("A JSON import must be an array of objects")
+        yield from records
+    else:
+        raise ValueError(f"Unknown import format: {file_format}")
+
+
+def normalize_domain(value: str) -> str:
+    """Lowercase a domain and drop any scheme, www. prefix, path or port"""
+    value = (value or '').strip().lower()
+    if '://' in value:
+        value = value.split('://', 1)[1]
+    value = value.split('/', 1)[0].split(':', 1)[0]
+    return value[4:] if value.startswith('www.') else value
+
+
+def _text(record: Dict, field: str) -> str:
+    value = record.get(field)
+    return '' if value is None else str(value).strip()
+
+
+def _choice(record: Dict, field: str, choices, default: str, errors: List[str]) -> str:
+    value = _text(record, field).lower() or default
+    if value not in choices.values:
+        errors.append(f"{field}: '{value}' is not one of {', '.join(choices.values)}")
+    return value
+
+
+def _clean_portal(record: Dict) -> Tuple[Dict, List[str]]:
+    errors = []
+    domain = normalize_domain(_text(record, 'domain'))
+    name = _text(record, 'name')
+    if not domain:
+        errors.append("domain: required")
+    if not name:
+        errors.append("name: required")
+    if len(domain) > CHAR_MAX_LENGTH or len(name) > CHAR_MAX_LENGTH:
+        errors.append(f"domain and name are limited to {CHAR_MAX_LENGTH} characters")
+    news_scope = _choice(record, 'news_scope', NewsScopeChoices, NewsScopeChoices.NATIONAL, errors)
+    country = _text(record, 'country').upper() or 'ID'
+    if country not in countries:
+        errors.append(f"country: '{country}' is not a country code")
+    city = _text(record, 'city')[:CHAR_MAX_LENGTH] or None
+    row = {'domain': domain, 'name': name, 'news_scope': news_scope, 'country': country, 'city': city}
+    return row, errors
+
+
+def _clean_seed_url(record: Dict) -> Tuple[Dict, List[str]]:
+    errors = []
+    url = _text(record, 'url')
+    try:
+        _validate_url(url)
+    except ValidationError:
+        errors.append(f"url: '{url}' is not a valid URL")
+    if len(url) > URL_MAX_LENGTH:
+        errors.append(f"url: longer than {URL_MAX_LENGTH} characters")
+    portal = normalize_domain(_text(record, 'portal'))
+    if not portal:
+        errors.append("portal: required")
+    return {'url': url, 'portal': portal}, errors
+
+
+def _clean_selector(record: Dict) -> Tuple[Dict, List[str]]:
+    errors = []
+    query = _text(record, 'query')
+    if not query:
+        errors.append("query: required")
+    if len(query) > CHAR_MAX_LENGTH:
+        errors.append(f"query: longer than {CHAR_MAX_LENGTH} characters")
+    item = _choice(record, 'item', ItemChoices, ItemChoices.URL_LIST, errors)
+    method = _choice(record, 'method', SelectorMethodChoices, SelectorMethodChoices.CSS, errors)
+    portal = normalize_domain(_text(record, 'portal'))
+    if not portal:
+        errors.append("portal: required")
+    return {'query': query, 'item': item, 'method': method, 'portal': portal}, errors
+
+
+def parent_domains(domain: str) -> List[str]:
+    """The domain and its parent domains of two labels or more, closest first"""
+    labels = domain.split('.')
+    return ['.'.join(labels[index:]) for index in range(len(labels) - 1)] or [domain]
+
+
+class PortalResolver:
+    """
+    Domain -> portal id, one query per batch of unknown domains
+
+    A domain without a portal of its own resolves to the portal of its
+    closest parent domain (news.example.com -> example.com), as
+    apps.common.fetcher.on_portal matches links. Stored domains are
+    compared normalized, so a portal saved as www.example.com matches too.
+    """
+
+    def __init__(self):
+        self._ids = {}
+
+    def resolve(self, domains: Iterable[str]) -> Dict[str, Optional[int]]:
+        domains = set(domains)
+        missing = domains - set(self._ids)
+        if missing:
+            candidates = {parent for domain in missing for parent in parent_domains(domain)}
+            found = {
+                normalize_domain(domain): pk for domain, pk in
+                NewsPortal.objects.filter(domain__in=candidates | {f'www.{domain}' for domain in candidates}).values_list('domain', 'id')
+            }
+            for domain in missing:
+                self._ids[domain] = next((found[parent] for parent in parent_domains(domain) if parent in found), None)
+        return {domain: self._ids[domain] for domain in domains}
+
+
+def _upsert_portals(rows: List[Dict]) -> Tuple[int, int]:
+    rows = list({row['domain']: row for row in rows}.values())
+    domains = [row['domain'] for row in rows]
+    # Stored domains compare normalized, as in PortalResolver; an exact match wins over www.
+    existing = {}
+    for domain, pk, name in sorted(
+        NewsPortal.objects.filter(domain__in=domains + [f'www.{domain}' for domain in domains]).values_list('domain', 'id', 'name'),
+        key=lambda portal: not portal[0].startswith('www.')
+    ):
+        existing[normalize_domain(domain)] = (pk, name)
+
+    now = timezone.now()
+    to_create, to_update = [], []
+    for row in rows:
+        if row['domain'] not in existing:
+            to_create.append(NewsPortal(**row))
+            continue
+        # The stored domain is kept, only the other fields are updated
+        portal = NewsPortal(id=existing[row['domain']][0], **row)
+        portal.updated_at = now
+        to_update.append(portal)
+    NewsPortal.objects.bulk_create(
+        to_create,
+        update_conflicts=True, unique_fields=['domain'],
+        update_fields=['name', 'news_scope', 'country', 'city', 'updated_at']
+    )
+    NewsPortal.objects.bulk_update(to_update, ['name', 'news_scope', 'country', 'city', 'updated_at'])
+    stats.increment_counter('news_portals', len(to_create))
+    caching.invalidate('portals')
+    for row in rows:
+        if row['domain'] in existing and existing[row['domain']][1] != row['name']:
+            search.reindex_portal(existing[row['domain']][0])
+    return len(to_create), len(to_update)
+
+
+def _upsert_seed_urls(rows: List[Dict]) -> Tuple[int, int]:
+    rows = list({row['url']: row for row in rows}.values())
+    existing = dict(NewsPortalSeedUrl.objects.filter(url__in=[row['url'] for row in rows]).values_list('url', 'portal_id'))
+    NewsPortalSeedUrl.objects.bulk_create(
+        [NewsPortalSeedUrl(url=row['url'], portal_id=row['portal_id']) for row in rows],
+        update_conflicts=True, unique_fields=['url'], update_fields=['portal', 'updated_at']
+    )
+    # Seeds filed under another portal move there, with their share of the portal totals
+    added, moved = defaultdict(list), Counter()
+    for row in rows:
+        previous = existing.get(row['url'])
+        if previous == row['portal_id']:
+            continue
+        added[row['portal_id']].append(row['url'])
+        if previous is not None:
+            moved[(previous, row['portal_id'])] += 1
+    for portal_id, urls in added.items():
+        seen_filter.mark_seen('seed', portal_id, urls)
+        stats.record_urls('seed', portal_id, sum(url not in existing for url in urls))
+    for (from_portal_id, to_portal_id), count in moved.items():
+        stats.move_urls('seed', from_portal_id, to_portal_id, count)
+    caching.invalidate('seed_urls')
+    return len(rows) - len(existing), len(existing)
+
+
+def _upsert_selectors(rows: List[Dict]) -> Tuple[int, int]:
+    # ItemSelector has no unique key to upsert on: match (portal, item, query) and update the method
+    rows = list({(row['portal_id'], row['item'], row['query']): row for row in rows}.values())
+    existing = {}
+    for selector in ItemSelector.objects.filter(
+        portal_id__in={row['portal_id'] for row in rows}, query__in={row['query'] for row in rows}
+    ):
+        existing[(selector.portal_id, selector.item, selector.query)] = selector
+
+    now = timezone.now()
+    to_create, to_update = [], []
+    for row in rows:
+        selector = existing.get((row['portal_id'], row['item'], row['query']))
+        if selector is None:
+            to_create.append(ItemSelector(portal_id=row['portal_id'], query=row['query'], item=row['item'], method=row['method']))
+        elif selector.method != row['method']:
+            selector.method = row['method']
+            selector.updated_at = now
+            to_update.append(selector)
+    ItemSelector.objects.bulk_create(to_create)
+    ItemSelector.objects.bulk_update(to_update, ['method', 'updated_at'])
+    stats.increment_counter('selectors', len(to_create))
+    caching.invalidate('selectors')
+    return len(to_create), len(rows) - len(to_create)
+
+
+IMPORTERS: Dict[str, Tuple[Callable, Callable]] = {
+    'portals': (_clean_portal, _upsert_portals),
+    'seed_urls': (_clean_seed_url, _upsert_seed_urls),
+    'selectors': (_clean_selector, _upsert_selectors),
+}
+
+
+def import_records(kind: str, records: Iterable[Dict], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   dry_run: bool = False) -> Dict:
+    """
+    Validate and upsert records
+
+    Args:
+        kind: 'portals', 'seed_urls' or 'selectors'
+        records: Dicts as produced by read_records()
+        chunk_size: Rows per upsert (one transaction each)
+        dry_run: Validate and resolve portals without writing
+
+    Returns:
+        Dict with the row, created, updated and invalid counts and 'errors', a
+        list of {'row', 'errors'} (row numbers start at 1, at most
+        MAX_REPORTED_ERRORS entries)
+
+    Raises:
+        ValueError: On an unknown kind
+    """
+    if kind not in IMPORTERS:
+        raise ValueError(f"Unknown import kind: {kind}")
+    clean, upsert = IMPORTERS[kind]
+    resolver = PortalResolver()
+    result = {'kind': kind, 'rows': 0, 'created': 0, 'updated': 0, 'invalid': 0, 'errors': [], 'dry_run': dry_run}
+
+    def report(number, errors):
+        result['invalid'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'row': number, 'errors': errors})
+
+    numbered = enumerate(records, start=1)
+    while True:
+        batch = list(islice(numbered, chunk_size))
+        if not batch:
+            break
+        result['rows'] += len(batch)
+
+        cleaned = []
+        for number, record in batch:
+            if not isinstance(record, dict):
+                report(number, ["Expected an object"])
+                continue
+            if '__error__' in record:
+                report(number, [record['__error__']])
+                continue
+            row, errors = clean(record)
+            if errors:
+                report(number, errors)
+            else:
+                cleaned.append((number, row))
+
+        if kind != 'portals':
+            portal_ids = resolver.resolve(row['portal'] for _, row in cleaned)
+            valid = []
+            for number, row in cleaned:
+                portal_id = portal_ids[row.pop('portal')]
+                if portal_id is None:
+                    report(number, ["portal: no portal with this domain"])
+                else:
+                    row['portal_id'] = portal_id
+                    valid.append((number, row))
+            cleaned = valid
+
+        if cleaned and not dry_run:
+            with transaction.atomic():
+                created, updated = upsert([row for _, row in cleaned])
+            result['created'] += created
+            result['updated'] += updated
+
+    result['errors'].sort(key=lambda error: error['row'])
+    return result
+
+
+def import_file(kind: str, stream: IO[bytes], file_format: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                dry_run: bool = False) -> Dict:
+    """Import a CSV, JSON Lines or JSON file, see import_records()"""
+    return import_records(kind, read_records(stream, file_format), chunk_size=chunk_size, dry_run=dry_run)
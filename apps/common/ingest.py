@@ -0,0 +1,220 @@
+"""
+Bulk article ingestion
+
+Writes batches of scraped articles pushed by spiders (see the
+/api/articles/ingest/ endpoint) with a fixed number of set-based queries per
+batch, whatever its size:
+
+1. Portals are resolved by domain (given, or taken from the URL host) and
+   URLs are canonicalized in memory with the portal rules
+2. Raw and clean URLs are inserted when missing
+3. Articles are upserted on their clean URL
+4. Bodies, authors and images are written in bulk
+
+Bulk writes bypass model signals, so the dashboard counters, seen-URL
+filters, search index and near-duplicate fingerprints are updated here.
+"""
+
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+from django.db import transaction
+
+from .canonicalize import load_canonicalizers
+from .importer import PortalResolver, normalize_domain
+from .models import (
+    NewsArticle, NewsArticleRawUrl, NewsArticleCleanUrl, NewsArticleBody, NewsArticleAuthor,
+    NewsArticleImage, NewsArticleUrlStatusChoices
+)
+from . import caching, dedup, search, seen_filter, stats
+
+
+ARTICLE_FIELDS = ['title', 'description', 'published_at', 'language']
+# Fields an item may leave out: an update then keeps the stored value
+OPTIONAL_FIELDS = ['description', 'language']
+
+
+def _resolve(items: List[Dict], results: List[Dict]) -> Dict[str, Dict]:
+    """
+    Resolve portals and canonical URLs
+
+    Returns:
+        {canonical_url: item} for the items that resolved; when several items
+        share a canonical URL the last one wins and the others are marked duplicate
+    """
+    resolver = PortalResolver()
+    domains = {index: normalize_domain(item.get('portal') or item['url']) for index, item in enumerate(items)}
+    portal_ids = resolver.resolve(domains.values())
+    canonicalizers = load_canonicalizers({pk for pk in portal_ids.values() if pk})
+
+    resolved = {}
+    for index, item in enumerate(items):
+        result = results[index]
+        portal_id = portal_ids[domains[index]]
+        if portal_id is None:
+            result.update(status='invalid', errors={'portal': [f"No portal with domain '{domains[index]}'"]})
+            continue
+        try:
+            url = canonicalizers[portal_id].canonicalize(item['url'])
+        except ValueError as e:
+            result.update(status='invalid', errors={'url': [str(e)]})
+            continue
+        result['url'] = url
+        if url in resolved:
+            results[resolved[url]['index']].update(status='duplicate')
+        resolved[url] = dict(item, index=index, portal_id=portal_id)
+    return resolved
+
+
+def _ensure_urls(resolved: Dict[str, Dict]) -> Dict[str, int]:
+    """Insert missing raw and clean URLs; returns {canonical_url: clean url id}"""
+    clean_ids = dict(NewsArticleCleanUrl.objects.filter(url__in=list(resolved)).values_list('url', 'id'))
+    # Articles of known clean URLs (e.g. fetched by apps.common.fetcher) need no raw row
+    missing = {url: item for url, item in resolved.items() if url not in clean_ids}
+    raw_urls = {item['url']: item['portal_id'] for item in missing.values()}
+    existing_raw = set(NewsArticleRawUrl.objects.filter(url__in=list(raw_urls)).values_list('url', flat=True)) if raw_urls else set()
+    new_raw = [
+        NewsArticleRawUrl(url=url, portal_id=portal_id, status=NewsArticleUrlStatusChoices.COMPLETED)
+        for url, portal_id in raw_urls.items() if url not in existing_raw
+    ]
+    NewsArticleRawUrl.objects.bulk_create(new_raw, ignore_conflicts=True)
+    raw_ids = dict(NewsArticleRawUrl.objects.filter(url__in=list(raw_urls)).values_list('url', 'id')) if raw_urls else {}
+
+    new_clean = [
+        NewsArticleCleanUrl(
+            url=url, article_url_raw_id=raw_ids[item['url']], portal_id=item['portal_id'],
+            status=NewsArticleUrlStatusChoices.COMPLETED
+        )
+        for url, item in missing.items() if item['url'] in raw_ids
+    ]
+    # A raw URL that already owns another clean URL conflicts and is reported by the caller
+    NewsArticleCleanUrl.objects.bulk_create(new_clean, ignore_conflicts=True)
+    if new_clean:
+        clean_ids.update(NewsArticleCleanUrl.objects.filter(url__in=[row.url for row in new_clean]).values_list('url', 'id'))
+
+    for kind, rows in (('raw', new_raw), ('clean', [row for row in new_clean if row.url in clean_ids])):
+        by_portal = defaultdict(list)
+        for row in rows:
+            by_portal[row.portal_id].append(row.url)
+        for portal_id, urls in by_portal.items():
+            seen_filter.mark_seen(kind, portal_id, urls)
+            stats.record_urls(kind, portal_id, len(urls))
+    caching.invalidate_raw_urls(row.portal_id for row in new_raw)
+    return clean_ids
+
+
+def _ensure_names(model, field: str, values) -> Dict[str, int]:
+    """{value: id} for author names or image URLs, creating the missing rows"""
+    values = set(values)
+    if not values:
+        return {}
+    ids = dict(model.objects.filter(**{f'{field}__in': values}).values_list(field, 'id'))
+    missing = values - set(ids)
+    if missing:
+        # A concurrent batch may insert the same names: the unique column keeps one row, re-selected below
+        model.objects.bulk_create([model(**{field: value}) for value in missing], ignore_conflicts=True)
+        ids.update(model.objects.filter(**{f'{field}__in': missing}).values_list(field, 'id'))
+    return ids
+
+
+def _replace_relations(relation, model, field: str, values_by_article: Dict[int, List[str]]) -> None:
+    """Replace the M2M rows of the given articles with the listed values"""
+    if not values_by_article:
+        return
+    through = relation.through
+    article_column = 'newsarticle_id'
+    target_column = f'{model._meta.model_name}_id'
+    ids = _ensure_names(model, field, (value for values in values_by_article.values() for value in values))
+    through.objects.filter(**{f'{article_column}__in': list(values_by_article)}).delete()
+    through.objects.bulk_create([
+        through(**{article_column: article_id, target_column: ids[value]})
+        for article_id, values in values_by_article.items()
+        for value in dict.fromkeys(values)
+    ], ignore_conflicts=True)
+
+
+def _article_values(item: Dict, stored: Dict) -> Dict:
+    """Article field values of an item, keeping the stored value of the optional fields it leaves out"""
+    return {
+        field: stored.get(field) if field in OPTIONAL_FIELDS and field not in item else item.get(field)
+        for field in ARTICLE_FIELDS
+    }
+
+
+def ingest_articles(items: List[Dict]) -> List[Dict]:
+    """
+    Upsert a batch of validated article items
+
+    Args:
+        items: Dicts with url, title and published_at, and optionally portal
+            (domain), description, body, language, authors and images. On
+            update, description, language, body, authors and images are only
+            replaced when present.
+
+    Returns:
+        One result per item, in order: {'index', 'status', 'url', 'id', 'errors'}
+        with status 'created', 'updated', 'duplicate' (a later item has the same
+        canonical URL) or 'invalid'
+    """
+    results = [{'index': index, 'status': None, 'url': item.get('url'), 'id': None, 'errors': None}
+               for index, item in enumerate(items)]
+    resolved = _resolve(items, results)
+    if not resolved:
+        return results
+
+    with transaction.atomic():
+        clean_ids = _ensure_urls(resolved)
+        for url, item in list(resolved.items()):
+            if url not in clean_ids:
+                results[item['index']].update(status='invalid', errors={'url': ["URL conflicts with an existing clean URL"]})
+                del resolved[url]
+
+        existing = {
+            row['article_url_id']: row for row in
+            NewsArticle.objects.filter(article_url_id__in=[clean_ids[url] for url in resolved]).values('article_url_id', *OPTIONAL_FIELDS)
+        }
+        NewsArticle.objects.bulk_create(
+            [
+                NewsArticle(article_url_id=clean_ids[url], **_article_values(item, existing.get(clean_ids[url], {})))
+                for url, item in resolved.items()
+            ],
+            update_conflicts=True, unique_fields=['article_url'],
+            update_fields=ARTICLE_FIELDS + ['updated_at'],
+        )
+        articles = {
+            clean_id: (pk, created_at) for clean_id, pk, created_at in
+            NewsArticle.objects.filter(article_url_id__in=[clean_ids[url] for url in resolved]).values_list(
+                'article_url_id', 'id', 'created_at'
+            )
+        }
+
+        bodies, authors, images, created_rows = {}, {}, {}, []
+        for url, item in resolved.items():
+            clean_id = clean_ids[url]
+            article_id, created_at = articles[clean_id]
+            created = clean_id not in existing
+            results[item['index']].update(status='created' if created else 'updated', id=article_id)
+            if created:
+                created_rows.append((item['portal_id'], created_at, item['published_at']))
+            if 'body' in item:
+                bodies[article_id] = item['body'] or ''
+            if 'authors' in item:
+                authors[article_id] = item['authors'] or []
+            if 'images' in item:
+                images[article_id] = item['images'] or []
+
+        NewsArticleBody.store(bodies)
+        _replace_relations(NewsArticle.authors, NewsArticleAuthor, 'name', authors)
+        _replace_relations(NewsArticle.images, NewsArticleImage, 'image_url', images)
+
+        stats.record_articles(created_rows)
+        article_ids = [pk for pk, _ in articles.values()]
+        search.index_articles(article_ids)
+        dedup.fingerprint_articles(bodies.items())
+
+    return results
+
+
+def summarize(results: List[Dict]) -> Dict:
+    """Counts per status, e.g. {'created': 10, 'updated': 2, 'invalid': 1}"""
+    return dict(Counter(result['status'] for result in results))
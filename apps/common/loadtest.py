@@ -0,0 +1,237 @@
+"""
+HTTP load test of the dashboard, CRUD and task views
+
+run_load() drives a running server (runserver, gunicorn, ...) over HTTP:
+`concurrency` virtual users, each with its own authenticated session, send
+requests to the routes of ROUTES (picked at random by weight) for
+`duration` seconds, closed-loop. Given several concurrency levels, they are
+run one after the other, which shows where throughput stops growing and
+which views collapse first, e.g. to size gunicorn workers.
+
+The report gives per level and route the request count, errors, throughput
+and p50 / p95 / p99 / max latency, and the first level at which each route
+breaks LOADTEST_SLO_MS (p95) or LOADTEST_MAX_ERROR_RATE.
+
+Sessions are created directly in the session store for the load test
+user, so the server must share this settings' database (or session cache).
+mock_scrapyd() makes an apps.tasks.mock_scrapyd server the active
+ScrapydServer for the duration of a run, so the Scrapyd views are measured
+against a tunable latency and failure rate instead of a real crawl node.
+"""
+
+import asyncio
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from .models import NewsArticleRawUrl
+
+
+DEFAULT_DURATION = 30
+DEFAULT_TIMEOUT = 30
+DEFAULT_SLO_MS = 1000
+DEFAULT_MAX_ERROR_RATE = 0.01
+LOADTEST_USERNAME = 'loadtest'
+
+# name: (method, URL name or path, query string, weight, XHR); POST routes send the sample portal id.
+# The dashboard is a path: home.urls is not namespaced and apps.users.urls also names a route 'index'
+ROUTES = {
+    'dashboard': ('GET', '/', '', 3, False),
+    'news_articles': ('GET', 'common:news_articles_list', '', 3, False),
+    'news_articles_search': ('GET', 'common:news_articles_list', '?search=election', 1, False),
+    'news_portals': ('GET', 'common:news_portals_list', '', 1, False),
+    'raw_urls': ('GET', 'common:news_article_raw_urls_list', '', 1, False),
+    'clean_urls': ('GET', 'common:news_article_clean_urls_list', '', 1, False),
+    'selectors': ('GET', 'common:selectors_list', '', 1, False),
+    'crawler_configs': ('GET', 'common:crawler_configs_list', '', 1, False),
+    'scraper_configs': ('GET', 'common:scraper_configs_list', '', 1, False),
+    'seed_urls': ('GET', 'common:seed_urls_list', '', 1, False),
+    'tasks': ('GET', 'tasks:tasks', '', 2, False),
+    'tasks_crawler': ('GET', 'tasks:crawler', '', 1, False),
+    'scrapyd_status': ('GET', 'tasks:scrapyd-server-status', '', 1, True),
+    'scrapyd_jobs': ('GET', 'tasks:scrapyd-list-jobs', '', 1, True),
+    'ajax_portal_selectors': ('POST', 'common:get_portal_selectors', '', 2, True),
+    'ajax_portal_raw_urls': ('POST', 'common:get_portal_raw_urls', '', 1, True),
+}
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def create_sessions(count: int) -> List[str]:
+    """Session keys of `count` logged-in sessions of the load test user"""
+    engine = import_string(f'{settings.SESSION_ENGINE}.SessionStore')
+    user, _ = get_user_model().objects.get_or_create(username=LOADTEST_USERNAME, defaults={'is_active': True})
+    keys = []
+    for _ in range(count):
+        session = engine()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        keys.append(session.session_key)
+    return keys
+
+
+def delete_sessions(keys: Iterable[str]) -> None:
+    engine = import_string(f'{settings.SESSION_ENGINE}.SessionStore')
+    for key in keys:
+        engine(session_key=key).delete()
+
+
+@contextmanager
+def mock_scrapyd(**options):
+    """Serve a MockScrapyd and make it the only active ScrapydServer until the block exits"""
+    from apps.tasks.mock_scrapyd import MockScrapyd
+    from apps.tasks.models import ScrapydServer
+
+    mock = MockScrapyd(**options).start()
+    active = list(ScrapydServer.objects.filter(is_active=True).values_list('id', flat=True))
+    ScrapydServer.objects.filter(id__in=active).update(is_active=False)
+    server = ScrapydServer.objects.create(name='Mock Scrapyd (load test)', host=mock.httpd.server_address[0], port=mock.port)
+    try:
+        yield mock
+    finally:
+        server.delete()
+        ScrapydServer.objects.filter(id__in=active).update(is_active=True)
+        mock.stop()
+
+
+def plan_routes(names: Optional[Iterable[str]] = None) -> List[Dict]:
+    """Resolve the routes to request; POST routes get the portal of the newest raw URL"""
+    portal_id = NewsArticleRawUrl.objects.order_by('-id').values_list('portal_id', flat=True).first()
+    plan = []
+    for name in names or ROUTES:
+        method, url_name, query, weight, xhr = ROUTES[name]
+        headers = {'X-Requested-With': 'XMLHttpRequest'} if xhr else {}
+        data = {'portal_id': str(portal_id or '')} if method == 'POST' else None
+        path = url_name if url_name.startswith('/') else reverse(url_name)
+        plan.append({'name': name, 'method': method, 'path': path + query, 'weight': weight,
+                     'headers': headers, 'data': data})
+    return plan
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    return values[min(max(int(fraction * len(values) + 0.5) - 1, 0), len(values) - 1)]
+
+
+def _summary(samples: List, seconds: float) -> Dict:
+    latencies = sorted(latency for latency, _ in samples)
+    statuses = Counter(str(status) for _, status in samples)
+    errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 400)
+    if not latencies:
+        return {'requests': 0, 'errors': 0}
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4),
+        'rps': round(len(samples) / seconds, 2),
+        'p50_ms': round(_percentile(latencies, 0.50), 1),
+        'p95_ms': round(_percentile(latencies, 0.95), 1),
+        'p99_ms': round(_percentile(latencies, 0.99), 1),
+        'max_ms': round(latencies[-1], 1),
+        'statuses': dict(statuses),
+    }
+
+
+async def _user(client: httpx.AsyncClient, plan: List[Dict], session_key: str, deadline: float,
+                rng: random.Random, samples: Dict[str, List]) -> None:
+    weights = [route['weight'] for route in plan]
+    cookie = f'{settings.SESSION_COOKIE_NAME}={session_key}'
+    while time.perf_counter() < deadline:
+        route = rng.choices(plan, weights)[0]
+        started = time.perf_counter()
+        try:
+            response = await client.request(route['method'], route['path'], data=route['data'],
+                                            headers={**route['headers'], 'Cookie': cookie})
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        samples[route['name']].append(((time.perf_counter() - started) * 1000, status))
+
+
+async def run_level(base_url: str, plan: List[Dict], session_keys: List[str], concurrency: int,
+                    duration: float, timeout: float = DEFAULT_TIMEOUT, seed: int = 42) -> Dict:
+    """One closed-loop run at a fixed concurrency; returns the per-route and total summaries"""
+    samples = {route['name']: [] for route in plan}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits, follow_redirects=False) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(
+            _user(client, plan, session_keys[index % len(session_keys)], deadline, random.Random(seed + index), samples)
+            for index in range(concurrency)
+        ))
+        seconds = time.perf_counter() - started
+    routes = {name: _summary(route_samples, seconds) for name, route_samples in samples.items()}
+    total = _summary([sample for route_samples in samples.values() for sample in route_samples], seconds)
+    return {'concurrency': concurrency, 'seconds': round(seconds, 2), 'total': total, 'routes': routes}
+
+
+def breaking_points(levels: List[Dict], slo_ms: float, max_error_rate: float) -> Dict[str, Optional[int]]:
+    """First concurrency at which each route's p95 exceeds the SLO or its error rate the limit (None: never)"""
+    points = {}
+    for level in levels:
+        for name, summary in level['routes'].items():
+            points.setdefault(name, None)
+            if points[name] is None and summary['requests'] and (
+                    summary['p95_ms'] > slo_ms or summary['error_rate'] > max_error_rate):
+                points[name] = level['concurrency']
+    return points
+
+
+def run_load(base_url: str, concurrency: Iterable[int], duration: float = DEFAULT_DURATION,
+             routes: Optional[Iterable[str]] = None, timeout: float = DEFAULT_TIMEOUT, seed: int = 42,
+             progress=None) -> Dict:
+    """
+    Load test the routes at each concurrency level in turn
+
+    Args:
+        base_url: Server under test, e.g. http://127.0.0.1:8000
+        concurrency: Virtual users per level
+        duration: Seconds per level
+        routes: ROUTES names (all by default)
+        timeout: Request timeout in seconds, slower requests count as errors
+        seed: Seed of the route choices
+        progress: Optional callable(level summary) called after each level
+
+    Returns:
+        Report dict with the levels, the best total throughput and the
+        breaking point of each route
+    """
+    concurrency = list(concurrency)
+    plan = plan_routes(routes)
+    session_keys = create_sessions(max(concurrency))
+    slo_ms = _setting('LOADTEST_SLO_MS', DEFAULT_SLO_MS)
+    max_error_rate = _setting('LOADTEST_MAX_ERROR_RATE', DEFAULT_MAX_ERROR_RATE)
+    levels = []
+    try:
+        for users in concurrency:
+            level = asyncio.run(run_level(base_url, plan, session_keys, users, duration, timeout=timeout, seed=seed))
+            levels.append(level)
+            if progress:
+                progress(level)
+    finally:
+        delete_sessions(session_keys)
+
+    best = max(levels, key=lambda level: level['total'].get('rps', 0))
+    return {
+        'base_url': base_url,
+        'duration': duration,
+        'slo_ms': slo_ms,
+        'max_error_rate': max_error_rate,
+        'routes': [{key: route[key] for key in ('name', 'method', 'path', 'weight')} for route in plan],
+        'levels': levels,
+        'peak': {'concurrency': best['concurrency'], 'rps': best['total'].get('rps', 0)},
+        'breaking_points': breaking_points(levels, slo_ms, max_error_rate),
+    }
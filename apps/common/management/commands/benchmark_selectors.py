@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.common.models import NewsPortal, SelectorBenchmarkStatusChoices
+from apps.common.selector_bench import benchmark_portal, capture_fixtures, fixtures_dir
+
+
+class Command(BaseCommand):
+    help = "Time every item selector of a portal against its saved HTML fixtures and flag slow or broken ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument('portal', help="Portal id or domain")
+        parser.add_argument('--capture', type=int, metavar='N', help="First download up to N article and N seed pages as fixtures")
+        parser.add_argument('--budget-ms', type=float, help="Time budget per fixture (SELECTOR_TIME_BUDGET_MS)")
+        parser.add_argument('--repeat', type=int, help="Runs per fixture, the fastest counts")
+        parser.add_argument('--regex-timeout', type=float, help="Seconds a regex may take over all fixtures")
+        parser.add_argument('--no-save', action='store_true', help="Do not store this run for later diffs")
+        parser.add_argument('--strict', action='store_true', help="Exit with an error when a selector is flagged")
+
+    def handle(self, *args, **options):
+        portal = NewsPortal.objects.filter(domain=options['portal']).first()
+        if portal is None and options['portal'].isdigit():
+            portal = NewsPortal.objects.filter(id=int(options['portal'])).first()
+        if portal is None:
+            raise CommandError(f"Portal {options['portal']} not found")
+
+        if options['capture']:
+            paths = capture_fixtures(portal.id, limit=options['capture'])
+            self.stdout.write(f"Captured {len(paths)} fixtures in {fixtures_dir(portal.domain)}")
+
+        report = benchmark_portal(
+            portal.id, budget_ms=options['budget_ms'], repeat=options['repeat'],
+            regex_timeout=options['regex_timeout'], save=not options['no_save']
+        )
+        if not report['fixtures']:
+            raise CommandError(f"No fixtures in {fixtures_dir(portal.domain)}; run with --capture N first")
+
+        self.stdout.write(f"{len(report['rows'])} selectors x {len(report['fixtures'])} fixtures, budget {report['budget_ms']:g}ms")
+        for row in report['rows']:
+            selector, benchmark = row['selector'], row['benchmark']
+            line = (
+                f"[{benchmark.status:>12}] {selector.item:<12} {selector.method:<5} {benchmark.mean_ms:8.2f}ms avg "
+                f"{benchmark.max_ms:8.2f}ms max {benchmark.matches:6d} matches  {selector.query}"
+            )
+            style = self.style.SUCCESS if benchmark.status == SelectorBenchmarkStatusChoices.OK else self.style.WARNING
+            self.stdout.write(style(line))
+            if benchmark.message:
+                self.stdout.write(f"    {benchmark.message}")
+            for change in row['changes']:
+                self.stdout.write(f"    {change['fixture']}: {change['before']} -> {change['after']} matches")
+
+        if report['flagged'] and options['strict']:
+            raise CommandError(f"{report['flagged']} selectors flagged")
+        self.stdout.write(self.style.SUCCESS(f"{report['flagged']} of {len(report['rows'])} selectors flagged"))
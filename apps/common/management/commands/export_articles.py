@@ -0,0 +1,53 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+
+from apps.common.export import DEFAULT_CHUNK_SIZE, FORMATS, article_queryset, stream_articles
+
+
+class Command(BaseCommand):
+    help = "Export news articles as CSV, JSON Lines or Parquet in constant memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', '-o', help="Output file (defaults to stdout)")
+        parser.add_argument('--portal', type=int, action='append', dest='portal_ids', help="Portal id, repeatable")
+        parser.add_argument('--start', help="Published at or after this ISO date/datetime")
+        parser.add_argument('--end', help="Published up to this ISO date (inclusive) or before this datetime")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def _parse_date(self, name, value):
+        if not value:
+            return None
+        try:
+            parsed = parse_date(value) or parse_datetime(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise CommandError(f"Invalid --{name}: {value}")
+        return parsed
+
+    def handle(self, *args, **options):
+        export_format = options['format']
+        queryset = article_queryset(
+            portal_ids=options['portal_ids'],
+            start=self._parse_date('start', options['start']),
+            end=self._parse_date('end', options['end']),
+        )
+        binary = export_format == 'parquet'
+        output = options['output']
+        if output:
+            stream = open(output, 'wb' if binary else 'w', encoding=None if binary else 'utf-8', newline=None if binary else '')
+        else:
+            stream = sys.stdout.buffer if binary else sys.stdout
+
+        try:
+            for piece in stream_articles(queryset, export_format, chunk_size=options['chunk_size']):
+                stream.write(piece)
+        finally:
+            if output:
+                stream.close()
+
+        if output:
+            self.stderr.write(self.style.SUCCESS(f"Exported articles to {output}"))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.common.fetcher import DEFAULT_BATCH_SIZE, run_fetcher
+
+
+class Command(BaseCommand):
+    help = "Fetch pending clean URLs concurrently, extract their articles and ingest them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="URLs in flight per batch")
+        parser.add_argument('--portal', type=int, dest='portal_id', help="Only fetch this portal id")
+        parser.add_argument('--max-batches', type=int)
+        parser.add_argument('--forever', action='store_true', help="Keep polling for new URLs (run as a service)")
+        parser.add_argument('--idle-sleep', type=float, default=10, help="Seconds to wait when the queue is empty")
+
+    def handle(self, *args, **options):
+        while True:
+            totals = run_fetcher(
+                batch_size=options['batch_size'], portal_id=options['portal_id'], max_batches=options['max_batches']
+            )
+            if totals['processed']:
+                rate = totals['processed'] / totals['seconds'] if totals['seconds'] else 0
+                self.stdout.write(self.style.SUCCESS(
+                    f"Fetched {totals['processed']} URLs in {totals['batches']} batches ({rate:.0f} pages/sec): "
+                    f"{totals['completed']} completed, {totals['retried']} retried later, {totals['failed']} failed {totals['results']}"
+                ))
+            if not options['forever']:
+                break
+            if not totals['processed']:
+                time.sleep(options['idle_sleep'])
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.common.synthetic import DEFAULT_BATCH_SIZE, clear, generate
+
+
+class Command(BaseCommand):
+    help = "Fill the database with a seeded synthetic dataset for the benchmarks (run_benchmarks)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--portals', type=int, default=50)
+        parser.add_argument('--raw-urls', type=int, default=100000, help="Raw URLs over all portals")
+        parser.add_argument('--clean-ratio', type=float, default=0.8, help="Share of raw URLs with a clean URL")
+        parser.add_argument('--article-ratio', type=float, default=0.9, help="Share of clean URLs with an article")
+        parser.add_argument('--authors', type=int, default=2000, help="Author pool size")
+        parser.add_argument('--task-results', type=int, default=10000, help="Celery TaskResult rows")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--no-index', action='store_true', help="Do not index the articles for search")
+        parser.add_argument('--clear', action='store_true', help="Delete the synthetic data first (and only that, without sizes)")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            cleared = clear()
+            self.stdout.write(f"Deleted {cleared['articles']} synthetic articles and {cleared['task_results']} task results")
+        try:
+            counts = generate(
+                portals=options['portals'], raw_urls=options['raw_urls'], clean_ratio=options['clean_ratio'],
+                article_ratio=options['article_ratio'], authors=options['authors'],
+                task_results=options['task_results'], seed=options['seed'], batch_size=options['batch_size'],
+                index=not options['no_index'], progress=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(f"{e} (--clear)")
+        self.stdout.write(self.style.SUCCESS(', '.join(f"{kind}: {count}" for kind, count in counts.items())))
@@ -0,0 +1,38 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.common.importer import DEFAULT_CHUNK_SIZE, FORMATS, KINDS, detect_format, import_file
+
+
+class Command(BaseCommand):
+    help = "Bulk import news portals, seed URLs or item selectors from a CSV, JSON Lines or JSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=KINDS)
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Validate only, write nothing")
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or detect_format(options['path'])
+        try:
+            with open(options['path'], 'rb') as stream:
+                result = import_file(
+                    options['kind'], stream, file_format,
+                    chunk_size=options['chunk_size'], dry_run=options['dry_run']
+                )
+        except (OSError, ValueError, csv.Error) as e:
+            raise CommandError(f"Could not import {options['path']}: {e}")
+
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']}: {'; '.join(error['errors'])}")
+        if result['invalid'] > len(result['errors']):
+            self.stderr.write(f"... {result['invalid'] - len(result['errors'])} more invalid rows")
+
+        verb = 'Validated' if result['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result['rows']} rows: {result['created']} created, "
+            f"{result['updated']} updated, {result['invalid']} invalid"
+        ))
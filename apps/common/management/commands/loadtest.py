@@ -0,0 +1,82 @@
+import fnmatch
+import json
+import os
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.common.loadtest import DEFAULT_DURATION, DEFAULT_TIMEOUT, ROUTES, mock_scrapyd, run_load
+
+
+class Command(BaseCommand):
+    help = "Load test the dashboard, CRUD and task views of a running server over HTTP"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help="Server under test")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help="Virtual users, one level each")
+        parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help="Seconds per level")
+        parser.add_argument('--routes', nargs='+', metavar='PATTERN', help=f"Route name patterns among: {', '.join(ROUTES)}")
+        parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help="Request timeout in seconds")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help="Report path (default BENCHMARK_REPORT_DIR/loadtest-<timestamp>.json)")
+        parser.add_argument('--mock-scrapyd', action='store_true', help="Serve a mock Scrapyd as the active server during the run")
+        parser.add_argument('--scrapyd-port', type=int, default=0, help="Mock Scrapyd port (default: any free port)")
+        parser.add_argument('--scrapyd-latency-ms', type=float, default=0, help="Mock Scrapyd latency per request")
+        parser.add_argument('--scrapyd-jitter-ms', type=float, default=0, help="Random extra mock Scrapyd latency, up to this")
+        parser.add_argument('--scrapyd-failure-rate', type=float, default=0, help="Share of mock Scrapyd requests failing with a 500")
+
+    def handle(self, *args, **options):
+        routes = list(ROUTES)
+        if options['routes']:
+            routes = [name for name in ROUTES if any(fnmatch.fnmatch(name, pattern) for pattern in options['routes'])]
+            if not routes:
+                raise CommandError(f"No route matches {' '.join(options['routes'])}")
+
+        mock = nullcontext()
+        if options['mock_scrapyd']:
+            if getattr(settings, 'SCRAPYD_BACKEND', 'http') != 'http':
+                self.stdout.write(self.style.WARNING("SCRAPYD_BACKEND is not 'http', the Scrapyd views will not use the mock"))
+            mock = mock_scrapyd(
+                port=options['scrapyd_port'], latency=options['scrapyd_latency_ms'] / 1000,
+                jitter=options['scrapyd_jitter_ms'] / 1000, failure_rate=options['scrapyd_failure_rate'], seed=options['seed'],
+            )
+
+        def progress(level):
+            total = level['total']
+            self.stdout.write(
+                f"{level['concurrency']:4} users: {total.get('rps', 0):8.1f} req/s  p50 {total.get('p50_ms', 0):7.0f}ms  "
+                f"p95 {total.get('p95_ms', 0):7.0f}ms  p99 {total.get('p99_ms', 0):7.0f}ms  errors {total['errors']}"
+            )
+            for name, summary in sorted(level['routes'].items(), key=lambda item: -item[1].get('p95_ms', 0)):
+                if summary['requests']:
+                    self.stdout.write(
+                        f"      {name:24} {summary['requests']:6}  p50 {summary['p50_ms']:7.0f}ms  "
+                        f"p95 {summary['p95_ms']:7.0f}ms  p99 {summary['p99_ms']:7.0f}ms  errors {summary['errors']}"
+                    )
+
+        with mock as server:
+            if server:
+                self.stdout.write(f"Mock Scrapyd on {server.base_url}")
+            report = run_load(
+                options['base_url'], options['concurrency'], duration=options['duration'], routes=routes,
+                timeout=options['timeout'], seed=options['seed'], progress=progress,
+            )
+            if server:
+                report['mock_scrapyd'] = {
+                    'latency_ms': options['scrapyd_latency_ms'], 'jitter_ms': options['scrapyd_jitter_ms'],
+                    'failure_rate': options['scrapyd_failure_rate'], 'requests': server.requests, 'failures': server.failures,
+                }
+
+        report_dir = getattr(settings, 'BENCHMARK_REPORT_DIR', os.path.join(settings.BASE_DIR, 'benchmark_reports'))
+        output = options['output'] or os.path.join(report_dir, f"loadtest-{timezone.now():%Y%m%d-%H%M%S}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+        self.stdout.write(f"Peak {report['peak']['rps']} req/s at {report['peak']['concurrency']} users")
+        for name, users in report['breaking_points'].items():
+            if users is not None:
+                self.stdout.write(self.style.WARNING(f"{name} breaks the SLO at {users} users"))
+        self.stdout.write(f"Report written to {output}")
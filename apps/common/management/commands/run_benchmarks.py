@@ -0,0 +1,66 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.common.benchmark import DEFAULT_REPEAT, DEFAULT_WARMUP, compare, dataset_counts, run_suite
+
+
+class Command(BaseCommand):
+    help = "Time the hot paths, write a JSON report and check it against the baseline and budgets"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="Timed runs per case")
+        parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP, help="Untimed runs per case first")
+        parser.add_argument('--only', nargs='+', metavar='PATTERN', help="Case name patterns, e.g. 'view:*'")
+        parser.add_argument('--search', default='election', help="Query of the search cases")
+        parser.add_argument('--output', help="Report path (default BENCHMARK_REPORT_DIR/<timestamp>.json)")
+        parser.add_argument('--baseline', help="Report to compare with (default BENCHMARK_REPORT_DIR/baseline.json)")
+        parser.add_argument('--tolerance', type=float, help="Allowed median slowdown (BENCHMARK_REGRESSION_TOLERANCE)")
+        parser.add_argument('--save-baseline', action='store_true', help="Make this report the baseline")
+        parser.add_argument('--strict', action='store_true', help="Exit with an error on a regression")
+
+    def handle(self, *args, **options):
+        report_dir = getattr(settings, 'BENCHMARK_REPORT_DIR', os.path.join(settings.BASE_DIR, 'benchmark_reports'))
+        baseline_path = options['baseline'] or os.path.join(report_dir, 'baseline.json')
+        baseline = None
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+        elif options['baseline']:
+            raise CommandError(f"Baseline {baseline_path} not found")
+
+        def progress(name, result):
+            if 'error' in result:
+                self.stdout.write(self.style.ERROR(f"{name:40} {result['error']}"))
+                return
+            line = f"{name:40} median {result['median_ms']:9.1f}ms  p95 {result['p95_ms']:9.1f}ms  {result['queries']:4} queries"
+            if 'items_per_second' in result:
+                line += f"  {result['items_per_second']:,.0f} items/s"
+            self.stdout.write(line)
+
+        self.stdout.write(f"Benchmarking on {', '.join(f'{count} {kind}' for kind, count in dataset_counts().items())}")
+        report = run_suite(repeat=options['repeat'], warmup=options['warmup'], only=options['only'],
+                           search_term=options['search'], progress=progress)
+        report['baseline'] = baseline_path if baseline else None
+        report['regressions'] = compare(report, baseline, tolerance=options['tolerance'])
+
+        output = options['output'] or os.path.join(report_dir, f"{timezone.now():%Y%m%d-%H%M%S}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Report written to {output}")
+        if options['save_baseline']:
+            with open(baseline_path, 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Baseline saved to {baseline_path}")
+
+        for regression in report['regressions']:
+            self.stdout.write(self.style.WARNING(
+                f"REGRESSION {regression['case']} ({regression['reason']}): "
+                + (regression.get('error') or f"{regression['median_ms']}ms > {regression['limit_ms']}ms")
+            ))
+        if report['regressions'] and options['strict']:
+            raise CommandError(f"{len(report['regressions'])} benchmark regressions")
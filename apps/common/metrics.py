@@ -0,0 +1,280 @@
+"""
+Prometheus metrics
+
+- MetricsMiddleware: per-route request latency, and the number and time of
+  the SQL queries each request runs (counted with connection.execute_wrapper,
+  so it works with DEBUG off)
+- record_cache(): cache hits and misses, reported by the code that owns the cache
+- Celery signal hooks: task runtime and queue wait (publish, or ETA, to start)
+- Crawl pipeline: URLs and articles per portal, publication-to-ingestion lag
+  and Scrapyd job timings (reported by apps.common.stats as rows are
+  recorded), article fetch results (apps.common.fetcher), plus per-portal
+  freshness read from the PortalStats rollup at scrape time
+- metrics_view: everything above at /metrics in the Prometheus text format
+
+Several gunicorn workers or Celery pool processes each keep their own
+counters. Set PROMETHEUS_MULTIPROC_DIR (an empty directory, shared by the
+processes of one host) before they start: values are then written to
+memory-mapped files and /metrics adds them up across processes. gunicorn-cfg.py
+sets it for the web workers. A Celery worker in its own container exposes its
+metrics on METRICS_CELERY_PORT instead.
+"""
+
+import os
+import time
+from contextlib import ExitStack
+from datetime import datetime
+
+from celery.signals import before_task_publish, task_prerun, task_postrun, worker_ready, worker_process_shutdown
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+    start_http_server
+)
+from prometheus_client.core import GaugeMetricFamily
+
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+TASK_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+LAG_BUCKETS = (60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400, 3 * 86400, 7 * 86400, 30 * 86400)
+ITEM_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000)
+
+REQUEST_LATENCY = Histogram(
+    'django_request_duration_seconds', 'Request latency by route',
+    ['route', 'method', 'status']
+)
+REQUEST_QUERIES = Histogram(
+    'django_request_db_queries', 'SQL queries per request by route',
+    ['route'], buckets=QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_TIME = Histogram(
+    'django_request_db_duration_seconds', 'Time spent in SQL queries per request by route',
+    ['route']
+)
+CACHE_REQUESTS = Counter(
+    'app_cache_requests_total', 'Cache lookups by cache and result (hit or miss)',
+    ['cache', 'result']
+)
+TASK_RUNTIME = Histogram(
+    'celery_task_duration_seconds', 'Celery task runtime by task and final state',
+    ['task', 'state'], buckets=TASK_BUCKETS
+)
+TASK_QUEUE_WAIT = Histogram(
+    'celery_task_queue_wait_seconds', 'Time between a task being published (or its ETA) and its start',
+    ['task'], buckets=TASK_BUCKETS
+)
+CRAWL_URLS = Counter(
+    'crawl_urls_total', 'URLs stored by kind (seed, raw or clean) and portal id',
+    ['kind', 'portal']
+)
+CRAWL_ARTICLES = Counter(
+    'crawl_articles_total', 'Articles stored by portal id',
+    ['portal']
+)
+CRAWL_PUBLISH_LAG = Histogram(
+    'crawl_publish_lag_seconds', 'Delay between an article publication and its ingestion',
+    buckets=LAG_BUCKETS
+)
+CRAWL_FETCHES = Counter(
+    'crawl_fetches_total', 'Article pages fetched by result (ok, http_error, not_html, too_large or error)',
+    ['result']
+)
+CRAWL_JOB_WAIT = Histogram(
+    'crawl_job_wait_seconds', 'Crawler task creation to Scrapyd spider start, by portal id',
+    ['portal'], buckets=TASK_BUCKETS
+)
+CRAWL_JOB_RUN = Histogram(
+    'crawl_job_run_seconds', 'Scrapyd spider runtime by portal id',
+    ['portal'], buckets=TASK_BUCKETS
+)
+CRAWL_JOB_ITEMS = Histogram(
+    'crawl_job_items', 'Items scraped per Scrapyd job, by portal id',
+    ['portal'], buckets=ITEM_BUCKETS
+)
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+# Header added to published task messages, available as task.request.published_at in the worker
+PUBLISHED_AT_HEADER = 'published_at'
+
+
+def enabled() -> bool:
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+class FreshnessCollector:
+    """Seconds since each portal's newest article was ingested, read from PortalStats at scrape time"""
+
+    def collect(self):
+        from .models import PortalStats
+
+        gauge = GaugeMetricFamily(
+            'crawl_portal_last_article_age_seconds', 'Seconds since the newest article of a portal was ingested',
+            labels=['portal']
+        )
+        now = time.time()
+        for portal_id, last_article_at in PortalStats.objects.filter(last_article_at__isnull=False).values_list(
+            'portal_id', 'last_article_at'
+        ):
+            gauge.add_metric([str(portal_id)], max(now - last_article_at.timestamp(), 0))
+        yield gauge
+
+
+_freshness_collector = FreshnessCollector()
+
+
+def registry() -> CollectorRegistry:
+    """The registry to expose: every process' values in multiprocess mode, this process' otherwise"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        collector_registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collector_registry)
+    else:
+        collector_registry = CollectorRegistry()
+        collector_registry.register(REGISTRY)
+    collector_registry.register(_freshness_collector)
+    return collector_registry
+
+
+def record_cache(cache_name: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache_name, 'hit' if hit else 'miss').inc()
+
+
+def record_urls(kind: str, portal_id: int, count: int) -> None:
+    CRAWL_URLS.labels(kind, str(portal_id)).inc(count)
+
+
+def record_article(portal_id: int, lag_seconds: float) -> None:
+    CRAWL_ARTICLES.labels(str(portal_id)).inc()
+    CRAWL_PUBLISH_LAG.observe(lag_seconds)
+
+
+def record_fetches(results) -> None:
+    for result, count in results.items():
+        CRAWL_FETCHES.labels(result).inc(count)
+
+
+def record_job(portal_id: int, items, wait_seconds: float, run_seconds: float) -> None:
+    portal = str(portal_id)
+    CRAWL_JOB_WAIT.labels(portal).observe(wait_seconds)
+    CRAWL_JOB_RUN.labels(portal).observe(run_seconds)
+    if items is not None:
+        CRAWL_JOB_ITEMS.labels(portal).observe(items)
+
+
+class _QueryTimer:
+    """execute_wrapper counting the queries of one request and their total time"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def _route(request) -> str:
+    # The URL pattern rather than the path, so ids do not create a series each
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNMATCHED_ROUTE
+    return match.route or match.view_name or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Record latency and SQL usage of every request, labelled by URL pattern"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not enabled():
+            return self.get_response(request)
+
+        timer = _QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        route = _route(request)
+        REQUEST_LATENCY.labels(route, request.method, str(response.status_code)).observe(duration)
+        REQUEST_QUERIES.labels(route).observe(timer.count)
+        REQUEST_DB_TIME.labels(route).observe(timer.duration)
+        return response
+
+
+def _allowed(request) -> bool:
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') == f'Bearer {token}':
+        return True
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1'])
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint (bearer METRICS_TOKEN, staff users or METRICS_ALLOWED_IPS)"""
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+# ### Celery hooks ###
+
+_task_starts = {}
+
+
+def _due_at(published_at: float, eta) -> float:
+    """Delayed tasks only start waiting once they are due"""
+    if isinstance(eta, str):
+        try:
+            eta = datetime.fromisoformat(eta)
+        except ValueError:
+            eta = None
+    return max(published_at, eta.timestamp()) if isinstance(eta, datetime) else published_at
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    if headers is not None and enabled():
+        headers.setdefault(PUBLISHED_AT_HEADER, time.time())
+
+
+@task_prerun.connect
+def task_started(task_id=None, task=None, **kwargs):
+    if not enabled():
+        return
+    now = time.time()
+    _task_starts[task_id] = time.perf_counter()
+    published_at = getattr(task.request, PUBLISHED_AT_HEADER, None)
+    if published_at:
+        TASK_QUEUE_WAIT.labels(task.name).observe(max(now - _due_at(published_at, task.request.eta), 0))
+
+
+@task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    start = _task_starts.pop(task_id, None)
+    if start is not None:
+        TASK_RUNTIME.labels(task.name, state or 'UNKNOWN').observe(time.perf_counter() - start)
+
+
+@worker_ready.connect
+def start_worker_metrics_server(**kwargs):
+    port = getattr(settings, 'METRICS_CELERY_PORT', None)
+    if port and enabled():
+        start_http_server(int(port), registry=registry())
+
+
+@worker_process_shutdown.connect
+def mark_worker_process_dead(pid=None, **kwargs):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid or os.getpid())
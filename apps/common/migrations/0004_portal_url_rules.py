@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-19 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0003_alter_newsportal_country_crawlertask_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsportal',
+            name='url_rules',
+            field=models.JSONField(blank=True, default=dict, help_text='Per-portal URL canonicalization rules (see apps.common.canonicalize)'),
+        ),
+    ]
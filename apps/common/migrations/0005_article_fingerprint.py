@@ -0,0 +1,29 @@
+# Generated by Django 4.2.9 on 2026-10-19 02:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0004_portal_url_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsArticleFingerprint',
+            fields=[
+                ('article', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='common.newsarticle')),
+                ('simhash', models.BigIntegerField()),
+                ('band_0', models.IntegerField(db_index=True)),
+                ('band_1', models.IntegerField(db_index=True)),
+                ('band_2', models.IntegerField(db_index=True)),
+                ('band_3', models.IntegerField(db_index=True)),
+                ('cluster_id', models.BigIntegerField(db_index=True)),
+            ],
+            options={
+                'db_table': 'news_article_fingerprint',
+            },
+        ),
+    ]
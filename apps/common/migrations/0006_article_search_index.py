@@ -0,0 +1,68 @@
+# Full-text search index for news articles (see apps.common.search)
+
+from django.db import migrations
+
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS news_article_fts USING fts5("
+    "title, description, portal, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "INSERT INTO news_article_fts (rowid, title, description, portal) "
+    "SELECT a.id, a.title, COALESCE(a.description, ''), p.name "
+    "FROM news_article a "
+    "JOIN news_article_url_clean c ON c.id = a.article_url_id "
+    "JOIN news_portal p ON p.id = c.portal_id",
+]
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE IF NOT EXISTS news_article_search (
+        article_id bigint PRIMARY KEY REFERENCES news_article (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        title text NOT NULL DEFAULT '',
+        description text NOT NULL DEFAULT '',
+        portal text NOT NULL DEFAULT '',
+        document tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', title), 'A') ||
+            setweight(to_tsvector('simple', portal), 'B') ||
+            setweight(to_tsvector('simple', description), 'C')
+        ) STORED
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS news_article_search_document_gin ON news_article_search USING gin (document)",
+    "INSERT INTO news_article_search (article_id, title, description, portal) "
+    "SELECT a.id, a.title, COALESCE(a.description, ''), p.name "
+    "FROM news_article a "
+    "JOIN news_article_url_clean c ON c.id = a.article_url_id "
+    "JOIN news_portal p ON p.id = c.portal_id "
+    "ON CONFLICT (article_id) DO NOTHING",
+]
+
+DROP = {
+    'sqlite': ["DROP TABLE IF EXISTS news_article_fts"],
+    'postgresql': ["DROP TABLE IF EXISTS news_article_search"],
+}
+
+CREATE = {
+    'sqlite': SQLITE_CREATE,
+    'postgresql': POSTGRES_CREATE,
+}
+
+
+def create_search_index(apps, schema_editor):
+    for sql in CREATE.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    for sql in DROP.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0005_article_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.9 on 2026-10-19 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0006_article_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='newsarticle',
+            index=models.Index(fields=['published_at', 'id'], name='article_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newsarticlecleanurl',
+            index=models.Index(fields=['created_at', 'id'], name='clean_url_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newsarticlerawurl',
+            index=models.Index(fields=['created_at', 'id'], name='raw_url_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newsportalseedurl',
+            index=models.Index(fields=['created_at', 'id'], name='seed_url_keyset_idx'),
+        ),
+    ]
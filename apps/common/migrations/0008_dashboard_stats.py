@@ -0,0 +1,61 @@
+# Generated by Django 4.2.9 on 2026-10-19 02:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0007_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortalDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('articles', models.BigIntegerField(default=0)),
+                ('published', models.BigIntegerField(default=0)),
+                ('raw_urls', models.BigIntegerField(default=0)),
+                ('clean_urls', models.BigIntegerField(default=0)),
+                ('portal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='common.newsportal')),
+            ],
+            options={
+                'db_table': 'stats_portal_daily',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PortalStats',
+            fields=[
+                ('portal', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='common.newsportal')),
+                ('articles', models.BigIntegerField(default=0)),
+                ('raw_urls', models.BigIntegerField(default=0)),
+                ('clean_urls', models.BigIntegerField(default=0)),
+                ('seed_urls', models.BigIntegerField(default=0)),
+                ('last_article_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'stats_portal',
+                'ordering': ['-articles'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StatsCounter',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'stats_counter',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='portaldailystats',
+            constraint=models.UniqueConstraint(fields=('portal', 'date'), name='stats_portal_daily_unique'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Moves NewsArticle.body into the compressed news_article_body side table
+
+from django.db import migrations, models
+import django.db.models.deletion
+import zlib
+
+
+BATCH_SIZE = 500
+
+
+def encode(text):
+    raw = (text or '').encode('utf-8')
+    compressed = zlib.compress(raw, 6)
+    return ('zlib', compressed) if len(compressed) < len(raw) else ('raw', raw)
+
+
+def copy_bodies(apps, schema_editor):
+    NewsArticle = apps.get_model('common', 'NewsArticle')
+    NewsArticleBody = apps.get_model('common', 'NewsArticleBody')
+    last_id = 0
+    while True:
+        rows = list(NewsArticle.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'body')[:BATCH_SIZE])
+        if not rows:
+            break
+        bodies = []
+        for pk, text in rows:
+            codec, data = encode(text)
+            bodies.append(NewsArticleBody(article_id=pk, codec=codec, data=data))
+        NewsArticleBody.objects.bulk_create(bodies, ignore_conflicts=True)
+        last_id = rows[-1][0]
+
+
+def restore_bodies(apps, schema_editor):
+    NewsArticle = apps.get_model('common', 'NewsArticle')
+    NewsArticleBody = apps.get_model('common', 'NewsArticleBody')
+    for pk, codec, data in NewsArticleBody.objects.values_list('article_id', 'codec', 'data').iterator(chunk_size=BATCH_SIZE):
+        data = bytes(data)
+        text = (zlib.decompress(data) if codec == 'zlib' else data).decode('utf-8')
+        NewsArticle.objects.filter(pk=pk).update(body=text)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0008_dashboard_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsArticleBody',
+            fields=[
+                ('article', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='body_record', serialize=False, to='common.newsarticle')),
+                ('codec', models.CharField(choices=[('zlib', 'zlib'), ('raw', 'Uncompressed')], default='zlib', max_length=8)),
+                ('data', models.BinaryField()),
+            ],
+            options={
+                'db_table': 'news_article_body',
+            },
+        ),
+        migrations.AlterField(
+            model_name='newsarticle',
+            name='body',
+            field=models.TextField(default=''),
+        ),
+        migrations.RunPython(copy_bodies, restore_bodies),
+        migrations.RemoveField(
+            model_name='newsarticle',
+            name='body',
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.9 on 2026-10-19 02:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0009_article_body_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsArticleArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('url', models.URLField()),
+                ('title', models.CharField(db_index=True, max_length=255)),
+                ('published_at', models.DateTimeField(db_index=True)),
+                ('path', models.CharField(max_length=255)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('portal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_articles', to='common.newsportal')),
+            ],
+            options={
+                'db_table': 'news_article_archive',
+                'ordering': ['-published_at'],
+            },
+        ),
+    ]
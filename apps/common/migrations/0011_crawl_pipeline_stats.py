@@ -0,0 +1,60 @@
+# Generated by Django 4.2.9 on 2026-10-19 03:11
+
+from django.db import migrations, models
+
+
+def forget_reconcile(apps, schema_editor):
+    # The new rollup columns start at zero: the next reconcile_dashboard_stats run rebuilds them
+    StatsCounter = apps.get_model('common', 'StatsCounter')
+    StatsCounter.objects.filter(name='reconciled_at').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0010_article_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawlertask',
+            name='items_scraped',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='crawlertask',
+            name='scrapyd_finished_at',
+            field=models.DateTimeField(blank=True, help_text='Spider end reported by Scrapyd', null=True),
+        ),
+        migrations.AddField(
+            model_name='crawlertask',
+            name='scrapyd_started_at',
+            field=models.DateTimeField(blank=True, help_text='Spider start reported by Scrapyd', null=True),
+        ),
+        migrations.AddField(
+            model_name='portaldailystats',
+            name='job_items',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='portaldailystats',
+            name='job_run_seconds',
+            field=models.BigIntegerField(default=0, help_text='Spider start to end'),
+        ),
+        migrations.AddField(
+            model_name='portaldailystats',
+            name='job_wait_seconds',
+            field=models.BigIntegerField(default=0, help_text='Task creation to spider start'),
+        ),
+        migrations.AddField(
+            model_name='portaldailystats',
+            name='jobs',
+            field=models.BigIntegerField(default=0, help_text='Scrapyd jobs finished that day'),
+        ),
+        migrations.AddField(
+            model_name='portaldailystats',
+            name='lag_seconds',
+            field=models.BigIntegerField(default=0, help_text="Sum of the publication to ingestion delays of the day's articles"),
+        ),
+        migrations.RunPython(forget_reconcile, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-19 03:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0011_crawl_pipeline_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsportal',
+            name='fetch_concurrency',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Requests in flight to this portal from the article fetcher (FETCHER_PORTAL_CONCURRENCY when empty)', null=True),
+        ),
+    ]
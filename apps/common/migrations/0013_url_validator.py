@@ -0,0 +1,29 @@
+# Generated by Django 4.2.9 on 2026-10-19 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0012_portal_fetch_concurrency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UrlValidator',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(unique=True)),
+                ('etag', models.CharField(blank=True, max_length=255, null=True)),
+                ('last_modified', models.CharField(blank=True, max_length=64, null=True)),
+                ('content_hash', models.CharField(blank=True, max_length=64, null=True)),
+                ('checked_at', models.DateTimeField()),
+                ('changed_at', models.DateTimeField(blank=True, null=True)),
+                ('unchanged_count', models.PositiveIntegerField(default=0, help_text='Checks in a row without a change')),
+            ],
+            options={
+                'db_table': 'url_validator',
+            },
+        ),
+    ]
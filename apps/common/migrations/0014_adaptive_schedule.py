@@ -0,0 +1,48 @@
+# Generated by Django 4.2.9 on 2026-10-19 03:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0013_url_validator'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawlerscheduledtask',
+            name='estimated_rate',
+            field=models.FloatField(blank=True, help_text='Adaptive mode: new URLs per hour at the last planning', null=True),
+        ),
+        migrations.AddField(
+            model_name='crawlerscheduledtask',
+            name='max_interval',
+            field=models.PositiveIntegerField(default=1440, help_text='Adaptive mode: minutes between crawls, at most'),
+        ),
+        migrations.AddField(
+            model_name='crawlerscheduledtask',
+            name='min_interval',
+            field=models.PositiveIntegerField(default=15, help_text='Adaptive mode: minutes between crawls, at least'),
+        ),
+        migrations.AddField(
+            model_name='crawlerscheduledtask',
+            name='schedule_mode',
+            field=models.CharField(choices=[('cron', 'Cron'), ('adaptive', 'Adaptive')], default='cron', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='crawlerscheduledtask',
+            name='target_new_urls',
+            field=models.PositiveIntegerField(default=20, help_text='Adaptive mode: new URLs a crawl should find on average'),
+        ),
+        migrations.AlterField(
+            model_name='crawlerscheduledtask',
+            name='cron_expression',
+            field=models.CharField(blank=True, help_text="Cron expression (e.g., '0 0 * * *' for daily at midnight)", max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='crawlerscheduledtask',
+            name='next_run',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.9 on 2026-10-19 04:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0014_adaptive_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsPortalFeed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('url', models.URLField(unique=True)),
+                ('kind', models.CharField(choices=[('sitemap', 'Sitemap'), ('sitemap_index', 'Sitemap Index'), ('rss', 'RSS'), ('atom', 'Atom')], default='sitemap', max_length=20)),
+                ('is_active', models.BooleanField(default=True)),
+                ('lastmod', models.DateTimeField(blank=True, help_text='Newest entry date seen; older entries are skipped', null=True)),
+                ('checked_at', models.DateTimeField(blank=True, null=True)),
+                ('portal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feeds', to='common.newsportal')),
+            ],
+            options={
+                'db_table': 'news_portal_feed',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.9 on 2026-10-19 04:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0015_portal_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SelectorBenchmark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('ok', 'OK'), ('empty', 'No Matches'), ('slow', 'Over Budget'), ('backtracking', 'Backtracking Risk'), ('timeout', 'Timed Out'), ('error', 'Error')], default='ok', max_length=20)),
+                ('fixtures', models.PositiveIntegerField(default=0)),
+                ('matches', models.PositiveIntegerField(default=0, help_text='Values found over all fixtures')),
+                ('mean_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('message', models.TextField(blank=True, default='')),
+                ('results', models.JSONField(blank=True, default=dict, help_text='{fixture: [match count, digest of the values]}')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('selector', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='benchmarks', to='common.itemselector')),
+            ],
+            options={
+                'db_table': 'news_article_selector_benchmark',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['selector', '-created_at'], name='selector_benchmark_latest_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.9 on 2026-10-19 05:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0016_selector_benchmark'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='newsarticlearchive',
+            index=models.Index(fields=['portal', 'published_at'], name='archive_portal_published_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.9 on 2026-10-19 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0017_archive_portal_published_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsarticlecleanurl',
+            name='fetch_attempts',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Fetches that failed with a transient error'),
+        ),
+        migrations.AddField(
+            model_name='newsarticlecleanurl',
+            name='next_fetch_at',
+            field=models.DateTimeField(blank=True, help_text='Not fetched again before this (retry backoff)', null=True),
+        ),
+    ]
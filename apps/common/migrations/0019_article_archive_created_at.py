@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-19 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0018_clean_url_fetch_retry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsarticlearchive',
+            name='created_at',
+            field=models.DateTimeField(blank=True, help_text='Ingestion time of the article, for the rollups', null=True),
+        ),
+    ]
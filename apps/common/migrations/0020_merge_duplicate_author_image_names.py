@@ -0,0 +1,32 @@
+# Merges duplicate author names and image URLs before 0021 makes them unique
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    NewsArticle = apps.get_model('common', 'NewsArticle')
+    for relation, model_name, field in (('authors', 'NewsArticleAuthor', 'name'), ('images', 'NewsArticleImage', 'image_url')):
+        model = apps.get_model('common', model_name)
+        through = getattr(NewsArticle, relation).through
+        target_column = f'{model._meta.model_name}_id'
+        duplicates = model.objects.values(field).annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1)
+        for row in duplicates.values_list(field, 'keep'):
+            value, keep = row
+            others = list(model.objects.filter(**{field: value}).exclude(id=keep).values_list('id', flat=True))
+            article_ids = through.objects.filter(**{f'{target_column}__in': others}).values_list('newsarticle_id', flat=True)
+            through.objects.bulk_create([
+                through(**{'newsarticle_id': article_id, target_column: keep}) for article_id in set(article_ids)
+            ], ignore_conflicts=True)
+            model.objects.filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0019_article_archive_created_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
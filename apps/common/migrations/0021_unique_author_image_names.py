@@ -0,0 +1,24 @@
+# Makes author names and image URLs unique so concurrent ingest batches cannot insert duplicates
+# (separate from 0020 so the merge deletes commit before the tables are altered)
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0020_merge_duplicate_author_image_names'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='newsarticleauthor',
+            name='name',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='newsarticleimage',
+            name='image_url',
+            field=models.URLField(unique=True),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import zlib
+
 from django.core.validators import URLValidator
 from django.db import models
 
@@ -25,6 +27,11 @@ class NewsPortal(TimestampModel):
 	)
 	country = CountryField(blank_label='Select country', default='ID', null=True, blank=True)
 	city = models.CharField(max_length=255, blank=True, null=True)
+	url_rules = models.JSONField(default=dict, blank=True, help_text="Per-portal URL canonicalization rules (see apps.common.canonicalize)")
+	fetch_concurrency = models.PositiveSmallIntegerField(
+		null=True, blank=True,
+		help_text="Requests in flight to this portal from the article fetcher (FETCHER_PORTAL_CONCURRENCY when empty)"
+	)
 
 	class Meta:
 		db_table = 'news_portal'
@@ -54,6 +61,7 @@ class NewsArticleRawUrl(TimestampModel):
 	class Meta:
 		db_table = 'news_article_url_raw'
 		ordering = ['-created_at']
+		indexes = [models.Index(fields=['created_at', 'id'], name='raw_url_keyset_idx')]
 
 	def __str__(self):
 		return self.url
@@ -68,16 +76,19 @@ class NewsArticleCleanUrl(TimestampModel):
 		default=NewsArticleUrlStatusChoices.PENDING,
 		db_index=True
 	)
+	fetch_attempts = models.PositiveSmallIntegerField(default=0, help_text="Fetches that failed with a transient error")
+	next_fetch_at = models.DateTimeField(null=True, blank=True, help_text="Not fetched again before this (retry backoff)")
 
 	class Meta:
 		db_table = 'news_article_url_clean'
 		ordering = ['-created_at']
+		indexes = [models.Index(fields=['created_at', 'id'], name='clean_url_keyset_idx')]
 
 	def __str__(self):
 		return self.url
 
 class NewsArticleAuthor(models.Model):
-	name = models.CharField(max_length=255, db_index=True)
+	name = models.CharField(max_length=255, unique=True)
 
 	class Meta:
 		db_table = 'news_article_author'
@@ -87,7 +98,7 @@ class NewsArticleAuthor(models.Model):
 		return self.name
 
 class NewsArticleImage(models.Model):
-	image_url = models.URLField(db_index=True)
+	image_url = models.URLField(unique=True)
 
 	class Meta:
 		db_table = 'news_article_image'
@@ -99,7 +110,6 @@ class NewsArticleImage(models.Model):
 class NewsArticle(TimestampModel):
 	article_url = models.OneToOneField(NewsArticleCleanUrl, on_delete=models.CASCADE)
 	title = models.CharField(max_length=255, blank=False, null=False, db_index=True)
-	body = models.TextField(blank=False, null=False)
 	description = models.TextField(blank=True, null=True)
 	images = models.ManyToManyField(NewsArticleImage, blank=True)
 	authors = models.ManyToManyField(NewsArticleAuthor, blank=True)
@@ -109,10 +119,130 @@ class NewsArticle(TimestampModel):
 	class Meta:
 		db_table = 'news_article'
 		ordering = ['-published_at']
+		indexes = [models.Index(fields=['published_at', 'id'], name='article_keyset_idx')]
 
 	def __str__(self):
 		return self.title
+
+	def _get_body(self):
+		if not hasattr(self, '_body'):
+			self._body = NewsArticleBody.load(self.pk) if self.pk else ''
+		return self._body
+
+	def _set_body(self, value):
+		self._body = value
+		self._body_changed = True
+
+	# The text lives compressed in NewsArticleBody and is only fetched on first access
+	body = property(_get_body, _set_body)
+
+	def save(self, *args, **kwargs):
+		super().save(*args, **kwargs)
+		if getattr(self, '_body_changed', False):
+			NewsArticleBody.store({self.pk: self._body})
+			self._body_changed = False
+
+	@property
+	def cluster_id(self):
+		"""Near-duplicate cluster id (see apps.common.dedup), None until fingerprinted"""
+		fingerprint = getattr(self, 'fingerprint', None)
+		return fingerprint.cluster_id if fingerprint else None
+
+class BodyCodecChoices(models.TextChoices):
+	ZLIB = 'zlib', 'zlib'
+	RAW = 'raw', 'Uncompressed'
+
+class NewsArticleBody(models.Model):
+	"""Article text kept out of the hot news_article table, zlib-compressed when that saves space"""
+	article = models.OneToOneField(NewsArticle, on_delete=models.CASCADE, primary_key=True, related_name='body_record')
+	codec = models.CharField(max_length=8, choices=BodyCodecChoices.choices, default=BodyCodecChoices.ZLIB)
+	data = models.BinaryField()
+
+	COMPRESSION_LEVEL = 6
+
+	class Meta:
+		db_table = 'news_article_body'
+
+	def __str__(self):
+		return f"{self.article_id} ({self.codec}, {len(self.data)} bytes)"
+
+	@property
+	def text(self):
+		return self.decode(self.codec, self.data)
+
+	@classmethod
+	def encode(cls, text):
+		"""Return (codec, data) for a body, keeping it raw when compression does not help"""
+		raw = (text or '').encode('utf-8')
+		compressed = zlib.compress(raw, cls.COMPRESSION_LEVEL)
+		if len(compressed) < len(raw):
+			return BodyCodecChoices.ZLIB, compressed
+		return BodyCodecChoices.RAW, raw
+
+	@staticmethod
+	def decode(codec, data):
+		data = bytes(data)
+		if codec == BodyCodecChoices.ZLIB:
+			data = zlib.decompress(data)
+		return data.decode('utf-8')
+
+	@classmethod
+	def load(cls, article_id):
+		row = cls.objects.filter(article_id=article_id).values_list('codec', 'data').first()
+		return cls.decode(*row) if row else ''
+
+	@classmethod
+	def load_many(cls, article_ids):
+		"""Return {article_id: text} for the articles that have a body"""
+		rows = cls.objects.filter(article_id__in=list(article_ids)).values_list('article_id', 'codec', 'data')
+		return {pk: cls.decode(codec, data) for pk, codec, data in rows}
+
+	@classmethod
+	def store(cls, bodies, batch_size=500):
+		"""Insert or replace the bodies of {article_id: text}"""
+		rows = []
+		for article_id, text in bodies.items():
+			codec, data = cls.encode(text)
+			rows.append(cls(article_id=article_id, codec=codec, data=data))
+		cls.objects.bulk_create(
+			rows, batch_size=batch_size,
+			update_conflicts=True, unique_fields=['article'], update_fields=['codec', 'data']
+		)
+
+class NewsArticleFingerprint(models.Model):
+	article = models.OneToOneField(NewsArticle, on_delete=models.CASCADE, primary_key=True, related_name='fingerprint')
+	simhash = models.BigIntegerField()
+	band_0 = models.IntegerField(db_index=True)
+	band_1 = models.IntegerField(db_index=True)
+	band_2 = models.IntegerField(db_index=True)
+	band_3 = models.IntegerField(db_index=True)
+	cluster_id = models.BigIntegerField(db_index=True)
+
+	class Meta:
+		db_table = 'news_article_fingerprint'
+
+	def __str__(self):
+		return f"{self.article_id} -> {self.cluster_id}"
 	
+class NewsArticleArchive(models.Model):
+	"""Index stub of an article moved to the Parquet archive (see apps.common.archive)"""
+	id = models.BigIntegerField(primary_key=True)
+	portal = models.ForeignKey(NewsPortal, on_delete=models.CASCADE, related_name='archived_articles')
+	url = models.URLField()
+	title = models.CharField(max_length=255, db_index=True)
+	published_at = models.DateTimeField(db_index=True)
+	created_at = models.DateTimeField(blank=True, null=True, help_text="Ingestion time of the article, for the rollups")
+	path = models.CharField(max_length=255)
+	archived_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		db_table = 'news_article_archive'
+		ordering = ['-published_at']
+		indexes = [models.Index(fields=['portal', 'published_at'], name='archive_portal_published_idx')]
+
+	def __str__(self):
+		return self.title
+
 class NewsPortalSeedUrl(TimestampModel):
 	url = models.URLField(unique=True)
 	portal = models.ForeignKey(NewsPortal, on_delete=models.CASCADE, related_name='seed_urls')
@@ -120,6 +250,45 @@ class NewsPortalSeedUrl(TimestampModel):
 	class Meta:
 		db_table = 'news_portal_seed_url'
 		ordering = ['-created_at']
+		indexes = [models.Index(fields=['created_at', 'id'], name='seed_url_keyset_idx')]
+
+	def __str__(self):
+		return self.url
+
+class UrlValidator(models.Model):
+	"""HTTP cache validators of a crawled listing, sitemap or feed URL (see apps.common.conditional)"""
+	url = models.URLField(unique=True)
+	etag = models.CharField(max_length=255, null=True, blank=True)
+	last_modified = models.CharField(max_length=64, null=True, blank=True)
+	content_hash = models.CharField(max_length=64, null=True, blank=True)
+	checked_at = models.DateTimeField()
+	changed_at = models.DateTimeField(null=True, blank=True)
+	unchanged_count = models.PositiveIntegerField(default=0, help_text="Checks in a row without a change")
+
+	class Meta:
+		db_table = 'url_validator'
+
+	def __str__(self):
+		return self.url
+
+class FeedKindChoices(models.TextChoices):
+	SITEMAP = 'sitemap', 'Sitemap'
+	SITEMAP_INDEX = 'sitemap_index', 'Sitemap Index'
+	RSS = 'rss', 'RSS'
+	ATOM = 'atom', 'Atom'
+
+class NewsPortalFeed(TimestampModel):
+	"""Sitemap or RSS/Atom feed of a portal, read by apps.common.discovery"""
+	url = models.URLField(unique=True)
+	portal = models.ForeignKey(NewsPortal, on_delete=models.CASCADE, related_name='feeds')
+	kind = models.CharField(max_length=20, choices=FeedKindChoices.choices, default=FeedKindChoices.SITEMAP)
+	is_active = models.BooleanField(default=True)
+	lastmod = models.DateTimeField(null=True, blank=True, help_text="Newest entry date seen; older entries are skipped")
+	checked_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		db_table = 'news_portal_feed'
+		ordering = ['-created_at']
 
 	def __str__(self):
 		return self.url
@@ -154,6 +323,35 @@ class ItemSelector(TimestampModel):
 		return self.query
 
 
+class SelectorBenchmarkStatusChoices(models.TextChoices):
+	OK = 'ok', 'OK'
+	EMPTY = 'empty', 'No Matches'
+	SLOW = 'slow', 'Over Budget'
+	BACKTRACKING = 'backtracking', 'Backtracking Risk'
+	TIMEOUT = 'timeout', 'Timed Out'
+	ERROR = 'error', 'Error'
+
+
+class SelectorBenchmark(models.Model):
+	"""One run of an ItemSelector over the stored HTML fixtures of its portal (see apps.common.selector_bench)"""
+	selector = models.ForeignKey(ItemSelector, on_delete=models.CASCADE, related_name='benchmarks')
+	status = models.CharField(max_length=20, choices=SelectorBenchmarkStatusChoices.choices, default=SelectorBenchmarkStatusChoices.OK)
+	fixtures = models.PositiveIntegerField(default=0)
+	matches = models.PositiveIntegerField(default=0, help_text="Values found over all fixtures")
+	mean_ms = models.FloatField(default=0)
+	max_ms = models.FloatField(default=0)
+	message = models.TextField(blank=True, default='')
+	results = models.JSONField(default=dict, blank=True, help_text="{fixture: [match count, digest of the values]}")
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		db_table = 'news_article_selector_benchmark'
+		ordering = ['-created_at']
+		indexes = [models.Index(fields=['selector', '-created_at'], name='selector_benchmark_latest_idx')]
+
+	def __str__(self):
+		return f"{self.selector_id} {self.created_at}: {self.status}"
+
 class CrawlerConfig(TimestampModel):
 	name = models.CharField(max_length=255, db_index=True)
 	portal = models.ForeignKey(NewsPortal, on_delete=models.CASCADE, related_name='crawler_configs')
@@ -184,6 +382,9 @@ class CrawlerTask(TimestampModel):
 	started_at = models.DateTimeField(blank=True, null=True)
 	completed_at = models.DateTimeField(blank=True, null=True)
 	execution_time = models.DurationField(blank=True, null=True)
+	scrapyd_started_at = models.DateTimeField(blank=True, null=True, help_text="Spider start reported by Scrapyd")
+	scrapyd_finished_at = models.DateTimeField(blank=True, null=True, help_text="Spider end reported by Scrapyd")
+	items_scraped = models.PositiveIntegerField(blank=True, null=True)
 	
 	class Meta:
 		db_table = 'news_crawler_task'
@@ -193,14 +394,24 @@ class CrawlerTask(TimestampModel):
 		return f"{self.crawler_config.name} - {self.status}"
 
 
+class ScheduleModeChoices(models.TextChoices):
+	CRON = 'cron', 'Cron'
+	ADAPTIVE = 'adaptive', 'Adaptive'
+
+
 class CrawlerScheduledTask(TimestampModel):
 	crawler_config = models.ForeignKey(CrawlerConfig, on_delete=models.CASCADE, related_name='scheduled_tasks')
 	name = models.CharField(max_length=255, db_index=True)
 	description = models.TextField(blank=True, null=True)
-	cron_expression = models.CharField(max_length=255, help_text="Cron expression (e.g., '0 0 * * *' for daily at midnight)")
+	schedule_mode = models.CharField(max_length=20, choices=ScheduleModeChoices.choices, default=ScheduleModeChoices.CRON)
+	cron_expression = models.CharField(max_length=255, blank=True, help_text="Cron expression (e.g., '0 0 * * *' for daily at midnight)")
+	min_interval = models.PositiveIntegerField(default=15, help_text="Adaptive mode: minutes between crawls, at least")
+	max_interval = models.PositiveIntegerField(default=24 * 60, help_text="Adaptive mode: minutes between crawls, at most")
+	target_new_urls = models.PositiveIntegerField(default=20, help_text="Adaptive mode: new URLs a crawl should find on average")
+	estimated_rate = models.FloatField(blank=True, null=True, help_text="Adaptive mode: new URLs per hour at the last planning")
 	is_active = models.BooleanField(default=True)
 	last_run = models.DateTimeField(blank=True, null=True)
-	next_run = models.DateTimeField(blank=True, null=True)
+	next_run = models.DateTimeField(blank=True, null=True, db_index=True)
 	
 	class Meta:
 		db_table = 'news_crawler_scheduled_task'
@@ -240,6 +451,53 @@ class ScraperConfig(TimestampModel):
 	
 
 
+class StatsCounter(models.Model):
+	"""Global row counts maintained by apps.common.stats"""
+	name = models.CharField(max_length=64, primary_key=True)
+	value = models.BigIntegerField(default=0)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		db_table = 'stats_counter'
+
+	def __str__(self):
+		return f"{self.name}: {self.value}"
+
+class PortalStats(models.Model):
+	"""Per-portal totals maintained by apps.common.stats"""
+	portal = models.OneToOneField(NewsPortal, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+	articles = models.BigIntegerField(default=0)
+	raw_urls = models.BigIntegerField(default=0)
+	clean_urls = models.BigIntegerField(default=0)
+	seed_urls = models.BigIntegerField(default=0)
+	last_article_at = models.DateTimeField(blank=True, null=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		db_table = 'stats_portal'
+		ordering = ['-articles']
 
+	def __str__(self):
+		return f"{self.portal_id}: {self.articles} articles"
+
+class PortalDailyStats(models.Model):
+	"""Per-portal, per-day rollup; articles/raw_urls/clean_urls/lag by ingest day, published by publication day, jobs by end day"""
+	portal = models.ForeignKey(NewsPortal, on_delete=models.CASCADE, related_name='daily_stats')
+	date = models.DateField(db_index=True)
+	articles = models.BigIntegerField(default=0)
+	published = models.BigIntegerField(default=0)
+	raw_urls = models.BigIntegerField(default=0)
+	clean_urls = models.BigIntegerField(default=0)
+	lag_seconds = models.BigIntegerField(default=0, help_text="Sum of the publication to ingestion delays of the day's articles")
+	jobs = models.BigIntegerField(default=0, help_text="Scrapyd jobs finished that day")
+	job_items = models.BigIntegerField(default=0)
+	job_wait_seconds = models.BigIntegerField(default=0, help_text="Task creation to spider start")
+	job_run_seconds = models.BigIntegerField(default=0, help_text="Spider start to end")
 
+	class Meta:
+		db_table = 'stats_portal_daily'
+		ordering = ['-date']
+		constraints = [models.UniqueConstraint(fields=['portal', 'date'], name='stats_portal_daily_unique')]
 
+	def __str__(self):
+		return f"{self.portal_id} {self.date}: {self.articles} articles"
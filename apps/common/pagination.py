@@ -0,0 +1,262 @@
+"""
+Keyset (cursor) pagination
+
+CursorPaginator pages a queryset by the values of its ordering columns plus
+a primary key tie-breaker instead of OFFSET, so every page costs one index
+range scan no matter how deep it is. Totals come from approximate_count(),
+which never runs an unbounded COUNT(*).
+
+Cursors are opaque URL-safe strings holding the direction and the ordering
+values of the boundary row. Ordering columns must be local, non-null fields.
+"""
+
+import base64
+import json
+from collections.abc import Sequence
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+DEFAULT_COUNT_CAP = 10000
+
+
+def _count_cap() -> int:
+    return getattr(settings, 'PAGINATION_COUNT_CAP', DEFAULT_COUNT_CAP)
+
+
+def _table_estimate(queryset) -> Optional[int]:
+    """Planner row estimate for the whole table (PostgreSQL only)"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row and row[0] >= 0 else None
+
+
+def approximate_count(queryset, cap: Optional[int] = None) -> Tuple[int, str]:
+    """
+    Count rows without scanning more than cap of them
+
+    Returns:
+        Tuple of (count, kind) where kind is 'exact', 'capped' (at least count
+        rows) or 'estimate' (planner statistics for an unfiltered table)
+    """
+    cap = _count_cap() if cap is None else cap
+    if not queryset.query.where:
+        estimate = _table_estimate(queryset)
+        if estimate is not None and estimate > cap:
+            return estimate, 'estimate'
+    count = queryset.order_by()[:cap + 1].count()
+    if count > cap:
+        return cap, 'capped'
+    return count, 'exact'
+
+
+def format_count(count: int, kind: str) -> str:
+    if kind == 'capped':
+        return f"{count:,}+"
+    if kind == 'estimate':
+        return f"~{count:,}"
+    return f"{count:,}"
+
+
+def encode_cursor(direction: str, values: List) -> str:
+    payload = json.dumps([direction, values], separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, List]:
+    """
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, json.JSONDecodeError, UnicodeDecodeError, base64.binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return direction, values
+
+
+class CursorPage(Sequence):
+    """One page of results, usable in templates like a Django Page"""
+
+    def __init__(self, object_list, paginator, has_next, has_previous, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self.object_list)} items>"
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def count(self):
+        return self.paginator.count
+
+    @property
+    def count_display(self):
+        return self.paginator.count_display
+
+
+class CursorPaginator:
+    """
+    Keyset paginator over a queryset ordering with a primary key tie-breaker
+
+    Args:
+        queryset: Queryset to paginate
+        per_page: Rows per page
+        ordering: Ordering fields, defaults to the queryset / model ordering
+    """
+
+    def __init__(self, queryset, per_page: int = 10, ordering: Optional[List[str]] = None):
+        model = queryset.model
+        ordering = list(ordering or queryset.query.order_by or model._meta.ordering or ['-pk'])
+
+        self.fields = []
+        for name in ordering:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            self.fields.append((field, descending))
+        if not any(field.primary_key for field, _ in self.fields):
+            self.fields.append((model._meta.pk, self.fields[-1][1] if self.fields else True))
+
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def _order_by(self, reverse: bool = False) -> List[str]:
+        return [('-' if descending != reverse else '') + field.attname for field, descending in self.fields]
+
+    def _values(self, obj) -> List:
+        values = []
+        for field, _ in self.fields:
+            value = getattr(obj, field.attname)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return values
+
+    def _after(self, values: List, forward: bool) -> Q:
+        """Rows strictly after the boundary row in the requested direction"""
+        condition = Q()
+        for i, (field, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending == forward else 'gt'
+            prefix = {prefix_field.attname: values[j] for j, (prefix_field, _) in enumerate(self.fields[:i])}
+            condition |= Q(**prefix, **{f'{field.attname}__{lookup}': values[i]})
+        return condition
+
+    @cached_property
+    def _count(self) -> Tuple[int, str]:
+        return approximate_count(self.queryset)
+
+    @property
+    def count(self) -> int:
+        return self._count[0]
+
+    @property
+    def count_display(self) -> str:
+        return format_count(*self._count)
+
+    def get_page(self, cursor: Optional[str] = None) -> CursorPage:
+        """Return the page for a cursor; a missing or malformed cursor gives the first page"""
+        direction, values = 'next', None
+        if cursor:
+            try:
+                direction, values = decode_cursor(cursor)
+                if len(values) != len(self.fields):
+                    raise ValueError(f"Invalid cursor: {cursor}")
+                values = [field.to_python(value) for (field, _), value in zip(self.fields, values)]
+            except (ValueError, TypeError, ValidationError):
+                direction, values = 'next', None
+
+        forward = direction == 'next'
+        queryset = self.queryset.order_by(*self._order_by(reverse=not forward))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, forward))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if forward:
+            has_next, has_previous = has_more, values is not None
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+
+        return CursorPage(
+            rows,
+            self,
+            has_next=has_next and bool(rows),
+            has_previous=has_previous and bool(rows),
+            next_cursor=encode_cursor('next', self._values(rows[-1])) if rows else None,
+            previous_cursor=encode_cursor('prev', self._values(rows[0])) if rows else None,
+        )
+
+
+class ListCursorPaginator:
+    """
+    CursorPaginator counterpart for an already materialized, bounded list
+    (e.g. ranked search hits); the cursor is an offset into the list
+    """
+
+    def __init__(self, items: List, per_page: int = 10):
+        self.items = items
+        self.per_page = per_page
+
+    @property
+    def count(self) -> int:
+        return len(self.items)
+
+    @property
+    def count_display(self) -> str:
+        return format_count(len(self.items), 'exact')
+
+    def get_page(self, cursor: Optional[str] = None) -> CursorPage:
+        offset = 0
+        if cursor:
+            try:
+                _, values = decode_cursor(cursor)
+                offset = max(int(values[0]), 0)
+            except (ValueError, TypeError, IndexError):
+                offset = 0
+        rows = self.items[offset:offset + self.per_page]
+        return CursorPage(
+            rows,
+            self,
+            has_next=offset + self.per_page < len(self.items),
+            has_previous=offset > 0,
+            next_cursor=encode_cursor('next', [offset + self.per_page]),
+            previous_cursor=encode_cursor('prev', [max(offset - self.per_page, 0)]),
+        )
+
+
+class ApproximateCountPaginator(Paginator):
+    """Page-number paginator whose count never runs an unbounded COUNT(*), for the admin"""
+
+    @cached_property
+    def count(self):
+        if hasattr(self.object_list, 'query'):
+            return approximate_count(self.object_list)[0]
+        return super().count
@@ -0,0 +1,121 @@
+"""
+Adaptive recrawl scheduling
+
+Cron schedules crawl a portal at the same pace whether it publishes hundreds
+of articles a day or a few a week. A CrawlerScheduledTask in adaptive mode
+instead plans its next crawl from the portal's observed discovery rate:
+
+- the rate is the number of raw URLs (NewsArticleRawUrl) the portal gained
+  per hour over the last RECRAWL_RATE_WINDOW_HOURS, counted from the first
+  raw URL when the portal is younger than the window, and smoothed with the
+  previous estimate (RECRAWL_RATE_SMOOTHING is the weight of the new one)
+- the next crawl is due once target_new_urls new URLs are expected, i.e.
+  after target_new_urls / rate hours, kept between min_interval and
+  max_interval minutes. A portal without new URLs waits max_interval
+
+Fast portals are thus crawled often enough to pick up their articles while
+they are fresh, and slow ones stop costing a crawl every cron tick. Due
+tasks are claimed with SKIP LOCKED and their next_run is moved before they
+are dispatched (dispatch_adaptive_schedules task), so overlapping
+dispatchers do not start the same crawl twice.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import CrawlerScheduledTask, NewsArticleRawUrl, ScheduleModeChoices
+
+
+DEFAULT_RATE_WINDOW_HOURS = 7 * 24
+DEFAULT_RATE_SMOOTHING = 0.5
+# Rates observed over less than this are not trusted on their own
+MIN_OBSERVED_HOURS = 1
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def discovery_rates(portal_ids: Iterable[int], now: Optional[datetime] = None) -> Dict[int, float]:
+    """
+    New raw URLs per hour of each portal over the rate window (one query)
+
+    Returns:
+        {portal_id: rate}, portals without raw URLs in the window are 0.0
+    """
+    portal_ids = set(portal_ids)
+    now = now or timezone.now()
+    window = timedelta(hours=_setting('RECRAWL_RATE_WINDOW_HOURS', DEFAULT_RATE_WINDOW_HOURS))
+    rows = (
+        NewsArticleRawUrl.objects.filter(portal_id__in=portal_ids, created_at__gte=now - window)
+        .order_by().values('portal_id').annotate(count=Count('id'), first=Min('created_at'))
+    )
+    rates = dict.fromkeys(portal_ids, 0.0)
+    for row in rows:
+        hours = max((now - row['first']).total_seconds() / 3600, MIN_OBSERVED_HOURS)
+        rates[row['portal_id']] = row['count'] / hours
+    return rates
+
+
+def smooth_rate(observed: float, previous: Optional[float]) -> float:
+    if previous is None:
+        return observed
+    weight = _setting('RECRAWL_RATE_SMOOTHING', DEFAULT_RATE_SMOOTHING)
+    return weight * observed + (1 - weight) * previous
+
+
+def next_interval(scheduled_task: CrawlerScheduledTask, rate: float) -> timedelta:
+    """Time until the next crawl: long enough to expect target_new_urls new URLs, within the task bounds"""
+    low = min(scheduled_task.min_interval, scheduled_task.max_interval)
+    high = max(scheduled_task.min_interval, scheduled_task.max_interval)
+    if rate <= 0:
+        return timedelta(minutes=high)
+    minutes = scheduled_task.target_new_urls / rate * 60
+    return timedelta(minutes=min(max(minutes, low), high))
+
+
+def plan(scheduled_tasks: List[CrawlerScheduledTask], now: Optional[datetime] = None, ran: bool = True) -> None:
+    """
+    Update estimated_rate and next_run of adaptive tasks in place (not saved)
+
+    Args:
+        scheduled_tasks: Adaptive scheduled tasks
+        now: Planning time, defaults to now
+        ran: The tasks are being run now, so last_run is set as well
+    """
+    now = now or timezone.now()
+    rates = discovery_rates({task.crawler_config.portal_id for task in scheduled_tasks}, now=now)
+    for scheduled_task in scheduled_tasks:
+        rate = smooth_rate(rates[scheduled_task.crawler_config.portal_id], scheduled_task.estimated_rate)
+        scheduled_task.estimated_rate = rate
+        scheduled_task.next_run = now + next_interval(scheduled_task, rate)
+        scheduled_task.updated_at = now
+        if ran:
+            scheduled_task.last_run = now
+
+
+def claim_due(limit: int = 100, now: Optional[datetime] = None) -> List[CrawlerScheduledTask]:
+    """
+    Claim the active adaptive tasks that are due and plan their next run
+
+    Tasks that never ran are due at once. Returns the claimed tasks, already
+    saved with their new last_run, next_run and estimated_rate.
+    """
+    now = now or timezone.now()
+    due = CrawlerScheduledTask.objects.filter(
+        Q(next_run__isnull=True) | Q(next_run__lte=now),
+        schedule_mode=ScheduleModeChoices.ADAPTIVE, is_active=True,
+    )
+    with transaction.atomic():
+        claimed = list(
+            due.select_for_update(skip_locked=True, of=('self',)).select_related('crawler_config').order_by('next_run', 'id')[:limit]
+        )
+        if claimed:
+            plan(claimed, now=now)
+            CrawlerScheduledTask.objects.bulk_update(claimed, ['estimated_rate', 'next_run', 'last_run', 'updated_at'])
+    return claimed
@@ -0,0 +1,244 @@
+"""
+Article full-text search
+
+Keeps a side search index of (title, description, portal name) per article
+and queries it with ranking, prefix matching and highlighted snippets. The
+backend is picked from the database engine:
+
+- SQLite: FTS5 virtual table `news_article_fts` (rowid = article id), bm25 ranking
+- PostgreSQL: `news_article_search` table with a generated, weighted tsvector
+  column behind a GIN index, ts_rank ranking and ts_headline snippets
+- Anything else: falls back to the previous icontains filter
+
+The tables are created by migration 0006_article_search_index.
+
+The index is kept in sync incrementally by the post_save/post_delete signals
+in apps.common.signals and by index_articles() for bulk ingestion paths.
+"""
+
+import re
+from collections import namedtuple
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import NewsArticle
+
+
+SearchHit = namedtuple('SearchHit', ['article_id', 'rank', 'title_html', 'snippet_html'])
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_QUERY_TERMS = 8
+MARK_START, MARK_END = '\x02', '\x03'
+
+DEFAULT_MAX_RESULTS = 1000
+
+
+def _query_terms(query: str) -> List[str]:
+    return TOKEN_RE.findall((query or '').lower())[:MAX_QUERY_TERMS]
+
+
+def _marked_html(text: Optional[str]) -> str:
+    """Escape indexed text and turn the backend match markers into <mark> tags"""
+    if not text:
+        return ''
+    return mark_safe(escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def _values_chunks(rows: List[tuple], chunk_size: int = 200):
+    """Yield (VALUES placeholders, flat params) for multi-row inserts of up to chunk_size rows"""
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        row_placeholders = '(' + ', '.join(['%s'] * len(chunk[0])) + ')'
+        yield ', '.join([row_placeholders] * len(chunk)), [value for row in chunk for value in row]
+
+
+def _article_rows(article_ids: Iterable[int]):
+    return NewsArticle.objects.filter(id__in=list(article_ids)).order_by().values_list(
+        'id', 'title', 'description', 'article_url__portal__name'
+    )
+
+
+class SqliteSearchBackend:
+    """FTS5 virtual table keyed by article id"""
+
+    table = 'news_article_fts'
+
+    def index(self, cursor, rows) -> None:
+        rows = [(pk, title or '', description or '', portal or '') for pk, title, description, portal in rows]
+        if not rows:
+            return
+        self.remove(cursor, [row[0] for row in rows])
+        for values, params in _values_chunks(rows):
+            cursor.execute(f"INSERT INTO {self.table} (rowid, title, description, portal) VALUES {values}", params)
+
+    def remove(self, cursor, article_ids) -> None:
+        article_ids = list(article_ids)
+        for start in range(0, len(article_ids), 500):
+            chunk = article_ids[start:start + 500]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN ({placeholders})", chunk)
+
+    def clear(self, cursor) -> None:
+        cursor.execute(f"DELETE FROM {self.table}")
+
+    def search(self, cursor, terms, limit, offset) -> List[SearchHit]:
+        match = ' '.join(f'"{term}"*' for term in terms)
+        cursor.execute(
+            f"SELECT rowid, bm25({self.table}, 10.0, 1.0, 2.0) AS rank, "
+            f"highlight({self.table}, 0, char(2), char(3)), "
+            f"snippet({self.table}, 1, char(2), char(3), '…', 24) "
+            f"FROM {self.table} WHERE {self.table} MATCH %s ORDER BY rank LIMIT %s OFFSET %s",
+            [match, limit, offset]
+        )
+        return [SearchHit(pk, -rank, _marked_html(title), _marked_html(snippet))
+                for pk, rank, title, snippet in cursor.fetchall()]
+
+
+class PostgresSearchBackend:
+    """Side table with a generated weighted tsvector and a GIN index"""
+
+    table = 'news_article_search'
+    config = 'simple'
+
+    def index(self, cursor, rows) -> None:
+        rows = [(pk, title or '', description or '', portal or '') for pk, title, description, portal in rows]
+        if not rows:
+            return
+        for values, params in _values_chunks(rows):
+            cursor.execute(
+                f"INSERT INTO {self.table} (article_id, title, description, portal) VALUES {values} "
+                "ON CONFLICT (article_id) DO UPDATE SET "
+                "title = EXCLUDED.title, description = EXCLUDED.description, portal = EXCLUDED.portal",
+                params
+            )
+
+    def remove(self, cursor, article_ids) -> None:
+        cursor.execute(f"DELETE FROM {self.table} WHERE article_id = ANY(%s)", [list(article_ids)])
+
+    def clear(self, cursor) -> None:
+        cursor.execute(f"TRUNCATE {self.table}")
+
+    def search(self, cursor, terms, limit, offset) -> List[SearchHit]:
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        markers = f'StartSel={MARK_START}, StopSel={MARK_END}'
+        # Headlines are only computed for the page of ranked rows, not every match
+        cursor.execute(
+            f"""
+            SELECT hit.article_id, hit.rank,
+                   ts_headline('{self.config}', hit.title, hit.q, %s),
+                   ts_headline('{self.config}', hit.description, hit.q, %s)
+            FROM (
+                SELECT s.article_id, s.title, s.description, q, ts_rank(s.document, q) AS rank
+                FROM {self.table} s, to_tsquery('{self.config}', %s) q
+                WHERE s.document @@ q
+                ORDER BY rank DESC, s.article_id DESC
+                LIMIT %s OFFSET %s
+            ) hit
+            ORDER BY hit.rank DESC, hit.article_id DESC
+            """,
+            [f'HighlightAll=true, {markers}', f'MaxWords=35, MinWords=15, {markers}', tsquery, limit, offset]
+        )
+        return [SearchHit(pk, rank, _marked_html(title), _marked_html(snippet))
+                for pk, rank, title, snippet in cursor.fetchall()]
+
+
+class FallbackSearchBackend:
+    """icontains filtering for engines without a native full-text index"""
+
+    def index(self, cursor, rows) -> None:
+        pass
+
+    def remove(self, cursor, article_ids) -> None:
+        pass
+
+    def clear(self, cursor) -> None:
+        pass
+
+    def search(self, cursor, terms, limit, offset) -> List[SearchHit]:
+        query = ' '.join(terms)
+        rows = NewsArticle.objects.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query) |
+            Q(article_url__portal__name__icontains=query)
+        ).values_list('id', 'title', 'description')[offset:offset + limit]
+        return [SearchHit(pk, 0.0, escape(title), escape((description or '')[:200])) for pk, title, description in rows]
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(vendor: Optional[str] = None):
+    return BACKENDS.get(vendor or connection.vendor, FallbackSearchBackend)()
+
+
+def index_articles(article_ids: Iterable[int], batch_size: int = 1000) -> int:
+    """
+    Add or refresh index entries for articles, e.g. after a bulk ingest
+
+    Returns:
+        Number of articles indexed
+    """
+    backend = get_backend()
+    article_ids = list(article_ids)
+    total = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(article_ids), batch_size):
+            rows = list(_article_rows(article_ids[start:start + batch_size]))
+            backend.index(cursor, rows)
+            total += len(rows)
+    return total
+
+
+def remove_articles(article_ids: Iterable[int]) -> None:
+    article_ids = list(article_ids)
+    if article_ids:
+        with connection.cursor() as cursor:
+            get_backend().remove(cursor, article_ids)
+
+
+def reindex_portal(portal_id: int) -> int:
+    """Refresh the entries of a portal's articles, e.g. after a rename"""
+    ids = NewsArticle.objects.filter(article_url__portal_id=portal_id).values_list('id', flat=True)
+    return index_articles(ids.iterator(chunk_size=5000))
+
+
+def rebuild_index(batch_size: int = 1000) -> int:
+    """Drop every index entry and re-index all articles in id order"""
+    backend = get_backend()
+    total = 0
+    last_id = 0
+    with connection.cursor() as cursor:
+        backend.clear(cursor)
+        while True:
+            ids = list(NewsArticle.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            rows = list(_article_rows(ids))
+            backend.index(cursor, rows)
+            last_id = ids[-1]
+            total += len(rows)
+    return total
+
+
+def search_articles(query: str, limit: Optional[int] = None, offset: int = 0) -> List[SearchHit]:
+    """
+    Ranked article search with prefix matching on every term
+
+    Returns:
+        List of SearchHit, best match first. Empty for a query without terms.
+    """
+    terms = _query_terms(query)
+    if not terms:
+        return []
+    if limit is None:
+        limit = getattr(settings, 'ARTICLE_SEARCH_MAX_RESULTS', DEFAULT_MAX_RESULTS)
+    with connection.cursor() as cursor:
+        return get_backend().search(cursor, terms, limit, offset)
@@ -0,0 +1,274 @@
+"""
+Seen-URL filters
+
+Per-portal Bloom filters that sit in front of the unique URL tables
+(NewsArticleRawUrl, NewsArticleCleanUrl, NewsPortalSeedUrl). Candidate URLs
+that the filter has already seen are dropped in memory and never reach the
+database; only filter misses go to a bulk insert with ignore_conflicts.
+
+Filters are built lazily per process from the table, kept up to date on
+insert, and snapshotted to settings.SEEN_URL_FILTER_DIR so a restarted worker
+does not have to rescan the table. A Bloom filter has no false negatives but a
+small false positive rate (settings.SEEN_URL_FILTER_ERROR_RATE): that fraction
+of genuinely new URLs is skipped. Filters cannot forget, so deleted URLs stay
+"seen" until the filter is rebuilt with rebuild_filters().
+"""
+
+import hashlib
+import math
+import os
+import struct
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import NewsArticleRawUrl, NewsArticleCleanUrl, NewsPortalSeedUrl
+from . import caching, stats
+
+
+FILTER_MODELS = {
+    'raw': NewsArticleRawUrl,
+    'clean': NewsArticleCleanUrl,
+    'seed': NewsPortalSeedUrl,
+}
+
+SNAPSHOT_MAGIC = b'SEENBF01'
+SNAPSHOT_HEADER = struct.Struct('<8sQQQQ')  # magic, num_bits, num_hashes, count, capacity
+
+DEFAULT_CAPACITY = 100_000
+DEFAULT_ERROR_RATE = 0.0001
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings
+
+    Uses Kirsch-Mitzenmacher double hashing on a single blake2b digest, so
+    each lookup costs one hash call regardless of the number of probes.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, error_rate: float = DEFAULT_ERROR_RATE,
+                 num_bits: Optional[int] = None, num_hashes: Optional[int] = None, bits: Optional[bytearray] = None):
+        self.capacity = max(int(capacity), 1)
+        if num_bits is None:
+            num_bits = int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        if num_hashes is None:
+            num_hashes = max(int(round(num_bits / self.capacity * math.log(2))), 1)
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, value: str) -> bool:
+        """Add a value, returning True if it was not already present"""
+        bits = self.bits
+        added = False
+        for pos in self._positions(value):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, value: str) -> bool:
+        bits = self.bits
+        for pos in self._positions(value):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    @property
+    def is_saturated(self) -> bool:
+        return self.count > self.capacity
+
+    def to_bytes(self) -> bytes:
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, self.num_bits, self.num_hashes, self.count, self.capacity)
+        return header + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BloomFilter':
+        magic, num_bits, num_hashes, count, capacity = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("Not a seen-URL filter snapshot")
+        bits = bytearray(data[SNAPSHOT_HEADER.size:])
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError("Truncated seen-URL filter snapshot")
+        bloom = cls(capacity=capacity, num_bits=num_bits, num_hashes=num_hashes, bits=bits)
+        bloom.count = count
+        return bloom
+
+
+def _snapshot_dir() -> str:
+    return getattr(settings, 'SEEN_URL_FILTER_DIR', os.path.join(settings.BASE_DIR, 'seen_filters'))
+
+
+def _snapshot_path(kind: str, portal_id: int) -> str:
+    return os.path.join(_snapshot_dir(), f"{kind}-{portal_id}.bloom")
+
+
+def _error_rate() -> float:
+    return getattr(settings, 'SEEN_URL_FILTER_ERROR_RATE', DEFAULT_ERROR_RATE)
+
+
+def _min_capacity() -> int:
+    return getattr(settings, 'SEEN_URL_FILTER_CAPACITY', DEFAULT_CAPACITY)
+
+
+# In-process registry: (kind, portal_id) -> BloomFilter
+_filters: Dict[Tuple[str, int], BloomFilter] = {}
+_dirty = set()
+_lock = threading.Lock()
+
+
+def build_filter(kind: str, portal_id: int) -> BloomFilter:
+    """Build a filter from the table, sized for twice the current row count"""
+    model = FILTER_MODELS[kind]
+    urls = model.objects.filter(portal_id=portal_id).order_by().values_list('url', flat=True)
+    bloom = BloomFilter(capacity=max(urls.count() * 2, _min_capacity()), error_rate=_error_rate())
+    for url in urls.iterator(chunk_size=10000):
+        bloom.add(url)
+    return bloom
+
+
+def load_snapshot(kind: str, portal_id: int) -> Optional[BloomFilter]:
+    """Load a snapshot from disk, or None if it is missing or unreadable"""
+    try:
+        with open(_snapshot_path(kind, portal_id), 'rb') as f:
+            return BloomFilter.from_bytes(f.read())
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def save_snapshot(kind: str, portal_id: int, bloom: BloomFilter) -> str:
+    """Atomically write a filter snapshot to disk and return its path"""
+    path = _snapshot_path(kind, portal_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(bloom.to_bytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+def get_filter(kind: str, portal_id: int) -> BloomFilter:
+    """
+    Return the filter for a table and portal
+
+    Loaded from the snapshot when available, otherwise rebuilt from the table.
+    Saturated filters are rebuilt with a larger capacity.
+    """
+    key = (kind, portal_id)
+    with _lock:
+        bloom = _filters.get(key)
+        if bloom is None:
+            bloom = load_snapshot(kind, portal_id)
+        if bloom is None or bloom.is_saturated:
+            bloom = build_filter(kind, portal_id)
+            _dirty.add(key)
+        _filters[key] = bloom
+        return bloom
+
+
+def mark_seen(kind: str, portal_id: int, urls: Iterable[str]) -> None:
+    """
+    Record URLs in an already loaded filter (no-op when the filter is not loaded)
+
+    Deferred until the current transaction commits: a filter cannot forget, so
+    URLs of a rolled back insert would otherwise be dropped until a rebuild.
+    """
+    urls = list(urls)
+
+    def add():
+        bloom = _filters.get((kind, portal_id))
+        if bloom is None:
+            return
+        for url in urls:
+            if bloom.add(url):
+                _dirty.add((kind, portal_id))
+    transaction.on_commit(add)
+
+
+def screen_urls(kind: str, portal_id: int, urls: Iterable[str]) -> List[str]:
+    """
+    Drop URLs the filter has already seen
+
+    Returns the remaining URLs in input order, deduplicated. These are
+    candidates for insertion; they may still exist in the table if another
+    process inserted them, so callers insert with ignore_conflicts.
+    """
+    bloom = get_filter(kind, portal_id)
+    unseen = []
+    batch_seen = set()
+    for url in urls:
+        if url in batch_seen or url in bloom:
+            continue
+        batch_seen.add(url)
+        unseen.append(url)
+    return unseen
+
+
+def insert_unseen_urls(kind: str, portal_id: int, urls: Iterable[str], batch_size: int = 1000, **fields) -> int:
+    """
+    Bulk insert the URLs the filter has not seen yet
+
+    Args:
+        kind: 'raw' or 'seed'
+        portal_id: Portal the URLs belong to
+        urls: Candidate URLs
+        batch_size: bulk_create batch size
+        **fields: Extra model fields for every row
+
+    Returns:
+        Number of rows submitted to the database
+    """
+    if kind == 'clean':
+        raise ValueError("Clean URLs need their raw URL; insert them through apps.common.canonicalize")
+    model = FILTER_MODELS[kind]
+    unseen = screen_urls(kind, portal_id, urls)
+    if unseen:
+        model.objects.bulk_create(
+            [model(url=url, portal_id=portal_id, **fields) for url in unseen],
+            batch_size=batch_size,
+            ignore_conflicts=True
+        )
+        mark_seen(kind, portal_id, unseen)
+        stats.record_urls(kind, portal_id, len(unseen))
+        caching.invalidate(caching.raw_urls_namespace(portal_id) if kind == 'raw' else 'seed_urls')
+    return len(unseen)
+
+
+def snapshot_filters(force: bool = False) -> List[str]:
+    """Write every loaded filter that changed since its last snapshot"""
+    with _lock:
+        keys = list(_filters) if force else list(_dirty)
+        paths = [save_snapshot(kind, portal_id, _filters[(kind, portal_id)]) for kind, portal_id in keys if (kind, portal_id) in _filters]
+        _dirty.clear()
+    return paths
+
+
+def rebuild_filters(portal_ids: Optional[Iterable[int]] = None, kinds: Iterable[str] = FILTER_MODELS) -> List[str]:
+    """Rebuild filters from the tables and snapshot them, e.g. after deletes"""
+    from .models import NewsPortal
+
+    if portal_ids is None:
+        portal_ids = NewsPortal.objects.values_list('id', flat=True)
+    paths = []
+    for portal_id in portal_ids:
+        for kind in kinds:
+            bloom = build_filter(kind, portal_id)
+            with _lock:
+                _filters[(kind, portal_id)] = bloom
+                _dirty.discard((kind, portal_id))
+            paths.append(save_snapshot(kind, portal_id, bloom))
+    return paths
@@ -0,0 +1,352 @@
+"""
+Selector benchmarks
+
+Runs every ItemSelector of a portal against a corpus of saved HTML pages
+(fixtures) so a slow regex or an overly broad XPath shows up before it
+degrades crawls:
+
+- fixtures live in SELECTOR_FIXTURES_DIR/<portal domain>/*.html, each
+  starting with a `<!-- url: ... -->` line; capture_fixtures() saves recent
+  article and seed pages of a portal there
+- each document is parsed once; every selector is then timed on every
+  fixture (best of SELECTOR_BENCHMARK_REPEAT runs) and selectors whose
+  slowest fixture exceeds SELECTOR_TIME_BUDGET_MS are flagged
+- regex selectors run in a child process that is killed after
+  SELECTOR_REGEX_TIMEOUT seconds, since a catastrophically backtracking
+  pattern cannot be interrupted in-process. Patterns with nested quantifiers
+  such as (a+)+ are flagged as a backtracking risk even when they finish
+- match counts and a digest of the matched values are stored per fixture
+  (SelectorBenchmark), and each run is diffed against the selector's
+  previous one
+
+Used by the benchmark_selectors command, the benchmark_portal_selectors task
+and the selector benchmark page, which shows the stored runs (stored_report).
+"""
+
+import hashlib
+import multiprocessing
+import os
+import re
+import signal
+import time
+from multiprocessing.connection import Connection
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from django.conf import settings
+from django.db.models import OuterRef, Q, Subquery
+
+from .models import (
+    ItemSelector, NewsArticleCleanUrl, NewsArticleUrlStatusChoices, NewsPortal, NewsPortalSeedUrl,
+    SelectorBenchmark, SelectorBenchmarkStatusChoices, SelectorMethodChoices
+)
+from . import fetcher
+from .extract import CompiledSelector, SelectorCompileError, parse_document
+
+
+DEFAULT_TIME_BUDGET_MS = 50
+DEFAULT_REGEX_TIMEOUT = 5
+DEFAULT_REPEAT = 3
+FIXTURE_SUFFIX = '.html'
+
+_url_comment = re.compile(r'^<!-- url: (\S+) -->\n')
+# A quantified group that itself contains a quantifier, e.g. (a+)+, (\w*\s?)*, (?:x|y+){2,}
+_nested_quantifier = re.compile(r'\((?:[^()\\]|\\.)*[+*}](?:[^()\\]|\\.)*\)(?:[+*]|\{\d*,\d*\})')
+
+# Statuses from best to worst; a selector gets the worst that applies
+STATUS_ORDER = [
+    SelectorBenchmarkStatusChoices.OK,
+    SelectorBenchmarkStatusChoices.EMPTY,
+    SelectorBenchmarkStatusChoices.SLOW,
+    SelectorBenchmarkStatusChoices.BACKTRACKING,
+    SelectorBenchmarkStatusChoices.TIMEOUT,
+    SelectorBenchmarkStatusChoices.ERROR,
+]
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def fixtures_dir(domain: str) -> str:
+    return os.path.join(_setting('SELECTOR_FIXTURES_DIR', os.path.join(settings.BASE_DIR, 'selector_fixtures')), domain)
+
+
+def load_fixtures(domain: str) -> List[Tuple[str, str, str]]:
+    """(name, url, html) of the saved pages of a portal, by name"""
+    directory = fixtures_dir(domain)
+    if not os.path.isdir(directory):
+        return []
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(FIXTURE_SUFFIX):
+            continue
+        with open(os.path.join(directory, name), encoding='utf-8', errors='replace') as f:
+            page_html = f.read()
+        match = _url_comment.match(page_html)
+        fixtures.append((name, match.group(1) if match else f"https://{domain}/", page_html))
+    return fixtures
+
+
+def save_fixture(domain: str, url: str, page_html: str) -> str:
+    """Store one page as a fixture named after its URL; returns the path"""
+    directory = fixtures_dir(domain)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + FIXTURE_SUFFIX)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"<!-- url: {url} -->\n{page_html}")
+    return path
+
+
+def capture_fixtures(portal_id: int, limit: int = 10) -> List[str]:
+    """
+    Download the latest completed article pages and the seed pages of a portal as fixtures
+
+    Returns:
+        Paths of the fixtures written
+    """
+    domain = NewsPortal.objects.values_list('domain', flat=True).get(id=portal_id)
+    urls = list(
+        NewsArticleCleanUrl.objects.filter(portal_id=portal_id, status=NewsArticleUrlStatusChoices.COMPLETED)
+        .order_by('-id').values_list('url', flat=True)[:limit]
+    )
+    urls += list(NewsPortalSeedUrl.objects.filter(portal_id=portal_id).order_by('id').values_list('url', flat=True)[:limit])
+
+    paths = []
+    with httpx.Client(
+        follow_redirects=True, timeout=_setting('FETCHER_TIMEOUT', fetcher.DEFAULT_TIMEOUT),
+        headers={'User-Agent': _setting('FETCHER_USER_AGENT', fetcher.DEFAULT_USER_AGENT)},
+    ) as client:
+        for url in urls:
+            try:
+                response = client.get(url)
+            except httpx.HTTPError:
+                continue
+            if response.status_code == 200 and 'html' in response.headers.get('content-type', 'html').lower():
+                paths.append(save_fixture(domain, url, response.text))
+    return paths
+
+
+def backtracking_risk(pattern: str) -> bool:
+    """Whether a regex has a nested quantifier, the usual cause of catastrophic backtracking"""
+    return bool(_nested_quantifier.search(pattern))
+
+
+def _digest(values: List[str]) -> str:
+    return hashlib.sha1('\x00'.join(values).encode('utf-8')).hexdigest()[:12]
+
+
+def _time_selector(selector: CompiledSelector, documents: List[Tuple[object, str]], repeat: int) -> List[Tuple[int, str, float]]:
+    """(match count, values digest, best milliseconds) per document"""
+    timings = []
+    for tree, text in documents:
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            values = selector.values(tree, text)
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append((len(values), _digest(values), best))
+    return timings
+
+
+def _regex_worker(query: str, texts: List[str], repeat: int, connection) -> None:
+    selector = CompiledSelector(SelectorMethodChoices.REGEX, query)
+    connection.send(_time_selector(selector, [(None, text) for text in texts], repeat))
+    connection.close()
+
+
+def _time_regex(query: str, texts: List[str], repeat: int, timeout: float) -> Optional[List[Tuple[int, str, float]]]:
+    """Time a regex selector in a child process; None when it did not finish within timeout seconds"""
+    if not hasattr(os, 'fork'):
+        return _spawn_regex(query, texts, repeat, timeout)
+    # A bare fork rather than multiprocessing.Process: Celery's prefork workers are
+    # daemonic and multiprocessing refuses to start children from them
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            _regex_worker(query, texts, repeat, Connection(write_fd, readable=False))
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    receiver = Connection(read_fd, writable=False)
+    try:
+        return receiver.recv() if receiver.poll(timeout) else None
+    except EOFError:
+        # The child died without answering
+        return None
+    finally:
+        receiver.close()
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        os.waitpid(pid, 0)
+
+
+def _spawn_regex(query: str, texts: List[str], repeat: int, timeout: float) -> Optional[List[Tuple[int, str, float]]]:
+    """_time_regex on platforms without fork"""
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_regex_worker, args=(query, texts, repeat, sender), daemon=True)
+    process.start()
+    sender.close()
+    try:
+        return receiver.recv() if receiver.poll(timeout) else None
+    except EOFError:
+        return None
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        receiver.close()
+
+
+def _diff(previous: Optional[SelectorBenchmark], results: Dict[str, List]) -> List[Dict]:
+    """Fixtures whose matches changed since the previous run"""
+    if previous is None:
+        return []
+    changes = []
+    for name in sorted(set(previous.results) | set(results)):
+        before, after = previous.results.get(name), results.get(name)
+        if before != after:
+            changes.append({
+                'fixture': name,
+                'before': before[0] if before else None,
+                'after': after[0] if after else None,
+            })
+    return changes
+
+
+def benchmark_selector(selector: ItemSelector, documents: List[Tuple[str, object, str]], budget_ms: float,
+                       repeat: int = DEFAULT_REPEAT, regex_timeout: float = DEFAULT_REGEX_TIMEOUT) -> SelectorBenchmark:
+    """
+    Run one selector over parsed (name, tree, html) fixtures
+
+    Returns:
+        An unsaved SelectorBenchmark
+    """
+    benchmark = SelectorBenchmark(selector=selector, fixtures=len(documents))
+    statuses, messages = [], []
+    try:
+        compiled = CompiledSelector(selector.method, selector.query)
+    except SelectorCompileError as e:
+        benchmark.status, benchmark.message = SelectorBenchmarkStatusChoices.ERROR, str(e)
+        return benchmark
+
+    if selector.method == SelectorMethodChoices.REGEX:
+        if backtracking_risk(selector.query):
+            statuses.append(SelectorBenchmarkStatusChoices.BACKTRACKING)
+            messages.append("Nested quantifier: can backtrack catastrophically on unlucky input")
+        timings = _time_regex(selector.query, [text for _, _, text in documents], repeat, regex_timeout)
+        if timings is None:
+            benchmark.status = SelectorBenchmarkStatusChoices.TIMEOUT
+            benchmark.message = f"Did not finish within {regex_timeout}s, likely catastrophic backtracking"
+            return benchmark
+    else:
+        timings = _time_selector(compiled, [(tree, text) for _, tree, text in documents], repeat)
+
+    benchmark.results = {name: [count, digest] for (name, _, _), (count, digest, _) in zip(documents, timings)}
+    benchmark.matches = sum(count for count, _, _ in timings)
+    milliseconds = [elapsed for _, _, elapsed in timings]
+    if milliseconds:
+        benchmark.mean_ms = sum(milliseconds) / len(milliseconds)
+        benchmark.max_ms = max(milliseconds)
+    if benchmark.max_ms > budget_ms:
+        statuses.append(SelectorBenchmarkStatusChoices.SLOW)
+        messages.append(f"Slowest fixture took {benchmark.max_ms:.1f}ms, budget is {budget_ms:g}ms")
+    if documents and not benchmark.matches:
+        statuses.append(SelectorBenchmarkStatusChoices.EMPTY)
+        messages.append("No matches in any fixture")
+    benchmark.status = max(statuses, key=STATUS_ORDER.index, default=SelectorBenchmarkStatusChoices.OK)
+    benchmark.message = '; '.join(messages)
+    return benchmark
+
+
+def benchmark_portal(portal_id: int, budget_ms: Optional[float] = None, repeat: Optional[int] = None,
+                     regex_timeout: Optional[float] = None, save: bool = True,
+                     selector_ids: Optional[Iterable[int]] = None) -> Dict:
+    """
+    Benchmark the selectors of a portal against its fixtures
+
+    Args:
+        portal_id: Portal whose selectors and fixtures are used
+        budget_ms: Per-fixture time budget (SELECTOR_TIME_BUDGET_MS by default)
+        repeat: Runs per fixture, the fastest counts (SELECTOR_BENCHMARK_REPEAT by default)
+        regex_timeout: Seconds a regex may take over all fixtures (SELECTOR_REGEX_TIMEOUT by default)
+        save: Store the runs so the next one is diffed against them
+        selector_ids: Only benchmark these selectors (optional)
+
+    Returns:
+        Dict with the portal domain, the fixture names, the budget and one
+        row per selector: {'selector', 'benchmark', 'previous', 'changes'}
+    """
+    budget_ms = budget_ms if budget_ms is not None else _setting('SELECTOR_TIME_BUDGET_MS', DEFAULT_TIME_BUDGET_MS)
+    repeat = repeat or _setting('SELECTOR_BENCHMARK_REPEAT', DEFAULT_REPEAT)
+    regex_timeout = regex_timeout or _setting('SELECTOR_REGEX_TIMEOUT', DEFAULT_REGEX_TIMEOUT)
+
+    domain = NewsPortal.objects.values_list('domain', flat=True).get(id=portal_id)
+    fixtures = load_fixtures(domain)
+    documents = [(name, parse_document(page_html), page_html) for name, _, page_html in fixtures]
+
+    selectors = ItemSelector.objects.filter(portal_id=portal_id).order_by('item', 'id')
+    if selector_ids is not None:
+        selectors = selectors.filter(id__in=list(selector_ids))
+    selectors = list(selectors)
+    latest = SelectorBenchmark.objects.filter(selector_id=OuterRef('selector_id')).order_by('-created_at', '-id').values('id')[:1]
+    previous = {
+        benchmark.selector_id: benchmark
+        for benchmark in SelectorBenchmark.objects.filter(selector__in=selectors, id=Subquery(latest))
+    }
+
+    rows = []
+    for selector in selectors:
+        benchmark = benchmark_selector(selector, documents, budget_ms, repeat=repeat, regex_timeout=regex_timeout)
+        last = previous.get(selector.id)
+        rows.append({'selector': selector, 'benchmark': benchmark, 'previous': last, 'changes': _diff(last, benchmark.results)})
+    if save:
+        SelectorBenchmark.objects.bulk_create([row['benchmark'] for row in rows])
+
+    return {
+        'domain': domain,
+        'fixtures': [name for name, _, _ in fixtures],
+        'budget_ms': budget_ms,
+        'rows': rows,
+        'flagged': sum(row['benchmark'].status != SelectorBenchmarkStatusChoices.OK for row in rows),
+    }
+
+
+def stored_report(portal_id: int) -> Dict:
+    """
+    The latest stored run of every selector of a portal, diffed against the run before it
+
+    Returns:
+        Dict with the portal domain, the fixture names, the time of the latest run
+        and one row per benchmarked selector, shaped like benchmark_portal()'s
+    """
+    domain = NewsPortal.objects.values_list('domain', flat=True).get(id=portal_id)
+    selectors = list(ItemSelector.objects.filter(portal_id=portal_id).order_by('item', 'id'))
+    runs = SelectorBenchmark.objects.filter(selector_id=OuterRef('selector_id')).order_by('-created_at', '-id').values('id')
+    last_two = SelectorBenchmark.objects.filter(selector__in=selectors).filter(
+        Q(id=Subquery(runs[:1])) | Q(id=Subquery(runs[1:2]))
+    ).order_by('-created_at', '-id')
+    by_selector = {}
+    for benchmark in last_two:
+        by_selector.setdefault(benchmark.selector_id, []).append(benchmark)
+
+    rows = []
+    for selector in selectors:
+        if selector.id not in by_selector:
+            continue
+        benchmark, *previous = by_selector[selector.id]
+        last = previous[0] if previous else None
+        rows.append({'selector': selector, 'benchmark': benchmark, 'previous': last, 'changes': _diff(last, benchmark.results)})
+
+    return {
+        'domain': domain,
+        'fixtures': sorted({name for row in rows for name in row['benchmark'].results}),
+        'ran_at': max((row['benchmark'].created_at for row in rows), default=None),
+        'rows': rows,
+        'flagged': sum(row['benchmark'].status != SelectorBenchmarkStatusChoices.OK for row in rows),
+    }
@@ -0,0 +1,134 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import NewsArticleRawUrl, NewsArticleCleanUrl, NewsPortalSeedUrl, NewsArticle, NewsPortal
+from . import caching, dedup, search, seen_filter, stats
+
+
+URL_KINDS = {NewsArticleRawUrl: 'raw', NewsArticleCleanUrl: 'clean', NewsPortalSeedUrl: 'seed'}
+COUNTER_NAMES = {model: name for name, model in stats.COUNTER_MODELS.items()}
+ARTICLE_RELATIONS = {NewsArticle.authors.through: 'authors', NewsArticle.images.through: 'images'}
+
+_archiving = ContextVar('archiving', default=False)
+
+
+@contextmanager
+def archiving():
+    """
+    Article deletes inside this block move articles to the archive: they still
+    count in the rollups, and apps.common.archive drops their index entries in bulk
+    """
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+
+@receiver(post_save, sender=NewsArticleRawUrl)
+@receiver(post_save, sender=NewsArticleCleanUrl)
+@receiver(post_save, sender=NewsPortalSeedUrl)
+def mark_url_seen(sender, instance, created, **kwargs):
+    """Keep loaded seen-URL filters in sync with rows saved one at a time"""
+    if created:
+        seen_filter.mark_seen(URL_KINDS[sender], instance.portal_id, [instance.url])
+
+
+@receiver(post_save, sender=NewsArticle)
+def fingerprint_article(sender, instance, raw=False, **kwargs):
+    """Compute the near-duplicate fingerprint and cluster of a saved article, when its body was set"""
+    # Saves that leave the body alone (title edits, status updates) keep the stored fingerprint
+    if not raw and getattr(instance, '_body_changed', False):
+        dedup.fingerprint_article(instance)
+
+
+@receiver(post_save, sender=NewsArticle)
+def index_article(sender, instance, raw=False, **kwargs):
+    """Refresh the full-text search entry of a saved article"""
+    if not raw:
+        search.index_articles([instance.pk])
+
+
+@receiver(post_delete, sender=NewsArticle)
+def unindex_article(sender, instance, **kwargs):
+    if not _archiving.get():
+        search.remove_articles([instance.pk])
+
+
+@receiver(m2m_changed, sender=NewsArticle.authors.through)
+@receiver(m2m_changed, sender=NewsArticle.images.through)
+def touch_article(sender, instance, action, reverse, pk_set, **kwargs):
+    """Author and image changes bump updated_at, which the API validators are built from"""
+    if action not in ('post_add', 'post_remove', 'pre_clear') or (action != 'pre_clear' and not pk_set):
+        return
+    if not reverse:
+        articles = NewsArticle.objects.filter(pk=instance.pk)
+    elif action == 'pre_clear':
+        # instance is an author or image; its articles are only known before the clear
+        articles = NewsArticle.objects.filter(**{ARTICLE_RELATIONS[sender]: instance})
+    else:
+        articles = NewsArticle.objects.filter(pk__in=pk_set)
+    articles.update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=NewsPortal)
+def remember_portal_name(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_name = NewsPortal.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=NewsPortal)
+def reindex_renamed_portal(sender, instance, created, raw=False, **kwargs):
+    """Portal names are part of the search index, refresh them on rename"""
+    if not created and not raw and getattr(instance, '_previous_name', instance.name) != instance.name:
+        search.reindex_portal(instance.pk)
+
+
+def _article_portal_id(article):
+    return NewsArticleCleanUrl.objects.filter(pk=article.article_url_id).values_list('portal_id', flat=True).first()
+
+
+def count_created(sender, instance, created, raw=False, **kwargs):
+    """Keep the dashboard counters and rollups in step with single-row inserts"""
+    if not created or raw:
+        return
+    if sender is NewsArticle:
+        stats.record_articles([(_article_portal_id(instance), instance.created_at, instance.published_at)])
+    elif sender in URL_KINDS:
+        stats.record_urls(URL_KINDS[sender], instance.portal_id, 1, stats.day_of(instance.created_at))
+    else:
+        stats.increment_counter(COUNTER_NAMES[sender], 1)
+
+
+def count_deleted(sender, instance, **kwargs):
+    if sender is NewsArticle:
+        if _archiving.get():
+            return
+        stats.record_articles([(_article_portal_id(instance), instance.created_at, instance.published_at)], sign=-1)
+    elif sender in URL_KINDS:
+        stats.record_urls(URL_KINDS[sender], instance.portal_id, -1, stats.day_of(instance.created_at))
+    else:
+        stats.increment_counter(COUNTER_NAMES[sender], -1)
+
+
+# Connected per model: a receiver without a sender disables fast deletes for every model
+for model in COUNTER_NAMES:
+    post_save.connect(count_created, sender=model)
+    post_delete.connect(count_deleted, sender=model)
+
+
+def invalidate_lookups(sender, instance, **kwargs):
+    """Drop the cached form and AJAX lookups (apps.common.caching) the row appears in"""
+    if sender in caching.MODEL_NAMESPACES:
+        caching.invalidate(caching.MODEL_NAMESPACES[sender])
+    elif sender is NewsArticleRawUrl:
+        caching.invalidate_raw_urls([instance.portal_id])
+
+
+for model in [*caching.MODEL_NAMESPACES, NewsArticleRawUrl]:
+    post_save.connect(invalidate_lookups, sender=model)
+    post_delete.connect(invalidate_lookups, sender=model)
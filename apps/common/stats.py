@@ -0,0 +1,426 @@
+"""
+Dashboard counters and rollups
+
+Keeps precomputed rows so the dashboard never counts the crawl tables:
+
+- StatsCounter: one row per tracked model with its total row count
+- PortalStats: per-portal totals of articles and URLs
+- PortalDailyStats: per-portal, per-day volumes (ingest day, and publication
+  day for `published`), publication-to-ingestion lag and Scrapyd job timings
+
+Rows are updated incrementally with F() expressions by the post_save /
+post_delete signals in apps.common.signals and by the bulk ingestion paths
+(record_urls / record_articles), which bypass signals. Finished Scrapyd
+jobs are recorded by the sync_crawler_job_stats task (record_jobs). Bulk inserts with
+ignore_conflicts report submitted rather than inserted rows, so counters can
+drift; reconcile() recomputes everything from the source tables and runs
+periodically from the reconcile_dashboard_stats task. Archived articles
+(apps.common.archive) still count: reconcile() adds their stubs, and moving
+them to the archive leaves the rollups alone.
+
+Rows created by the signals on a database that was never reconciled start
+from zero, so the rollups are only trusted once a full reconcile() has
+stored the RECONCILED marker (see is_reconciled()); migrations that add
+rollup columns delete the marker to force a rebuild. The rebuild never runs
+in a request: the dashboard reports the rollups as pending and queues it
+(queue_reconcile()), and the periodic task does a full rebuild while the
+marker is missing.
+"""
+
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, DurationField, F, Max, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from .models import (
+    NewsPortal, NewsArticleRawUrl, NewsArticleCleanUrl, NewsArticle, NewsPortalSeedUrl,
+    ItemSelector, CrawlerConfig, ScraperConfig, CrawlerTask, StatsCounter, PortalStats, PortalDailyStats,
+    NewsArticleArchive
+)
+from . import metrics
+
+
+COUNTER_MODELS = {
+    'news_portals': NewsPortal,
+    'selectors': ItemSelector,
+    'seed_urls': NewsPortalSeedUrl,
+    'crawler_configs': CrawlerConfig,
+    'scraper_configs': ScraperConfig,
+    'news_articles': NewsArticle,
+    'raw_urls': NewsArticleRawUrl,
+    'clean_urls': NewsArticleCleanUrl,
+}
+
+# URL kind -> (StatsCounter name, PortalStats field, PortalDailyStats field or None)
+URL_FIELDS = {
+    'raw': ('raw_urls', 'raw_urls', 'raw_urls'),
+    'clean': ('clean_urls', 'clean_urls', 'clean_urls'),
+    'seed': ('seed_urls', 'seed_urls', None),
+}
+
+# StatsCounter row holding the time (epoch seconds) of the last full reconcile
+RECONCILED = 'reconciled_at'
+# Cache key set while a full reconcile queued by the dashboard is pending
+RECONCILE_QUEUED_KEY = 'stats:reconcile-queued'
+RECONCILE_QUEUED_TIMEOUT = 10 * 60
+
+
+def elapsed_seconds(start: Optional[datetime], end: Optional[datetime]) -> int:
+    """Whole seconds from start to end, zero when either is missing or end comes first"""
+    if start is None or end is None:
+        return 0
+    return max(int((end - start).total_seconds()), 0)
+
+
+def day_of(value: Optional[datetime]) -> date:
+    if value is None:
+        return timezone.localdate()
+    return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+
+def _add(model, lookup: Dict, deltas: Dict, create: bool = True, **extra) -> None:
+    """
+    Add deltas to one rollup row, creating it first when missing
+
+    Decrements never create rows: during a cascading portal delete the rollup
+    rows may already be gone and must not be recreated for a deleted portal.
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas and not extra:
+        return
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    changes.update(extra)
+    if not model.objects.filter(**lookup).update(**changes) and create:
+        model.objects.bulk_create([model(**lookup)], ignore_conflicts=True)
+        model.objects.filter(**lookup).update(**changes)
+
+
+def increment_counter(name: str, delta: int = 1) -> None:
+    _add(StatsCounter, {'name': name}, {'value': delta})
+
+
+def is_reconciled() -> bool:
+    """Whether a full reconcile() has run, i.e. the counters and rollups cover the existing rows"""
+    return StatsCounter.objects.filter(name=RECONCILED).exists()
+
+
+def record_urls(kind: str, portal_id: int, count: int = 1, day: Optional[date] = None) -> None:
+    """
+    Record URLs inserted (positive count) or deleted (negative count)
+
+    Args:
+        kind: 'raw', 'clean' or 'seed'
+        portal_id: Portal the URLs belong to
+        count: Number of rows
+        day: Ingest day, defaults to today
+    """
+    if not count:
+        return
+    counter, total_field, daily_field = URL_FIELDS[kind]
+    create = count > 0
+    with transaction.atomic():
+        increment_counter(counter, count)
+        _add(PortalStats, {'portal_id': portal_id}, {total_field: count}, create=create)
+        if daily_field:
+            _add(PortalDailyStats, {'portal_id': portal_id, 'date': day or timezone.localdate()}, {daily_field: count}, create=create)
+    if count > 0:
+        metrics.record_urls(kind, portal_id, count)
+
+
+def move_urls(kind: str, from_portal_id: int, to_portal_id: int, count: int) -> None:
+    """Move the per-portal totals of URLs re-filed under another portal (the counters do not change)"""
+    if not count:
+        return
+    _, total_field, _ = URL_FIELDS[kind]
+    with transaction.atomic():
+        _add(PortalStats, {'portal_id': from_portal_id}, {total_field: -count}, create=False)
+        _add(PortalStats, {'portal_id': to_portal_id}, {total_field: count})
+
+
+def record_articles(rows: Iterable[Tuple[int, Optional[datetime], Optional[datetime]]], sign: int = 1) -> None:
+    """
+    Record inserted (sign=1) or deleted (sign=-1) articles
+
+    Args:
+        rows: (portal_id, created_at, published_at) per article
+        sign: 1 for inserts, -1 for deletes
+    """
+    totals = Counter()
+    ingested = Counter()
+    lags = Counter()
+    published = Counter()
+    latest = {}
+    for portal_id, created_at, published_at in rows:
+        if portal_id is None:
+            continue
+        totals[portal_id] += sign
+        ingested[(portal_id, day_of(created_at))] += sign
+        # Articles dated in the future count as no delay
+        lag = elapsed_seconds(published_at, created_at)
+        lags[(portal_id, day_of(created_at))] += sign * lag
+        if sign > 0:
+            metrics.record_article(portal_id, lag)
+        if published_at is not None:
+            published[(portal_id, day_of(published_at))] += sign
+        if sign > 0 and created_at is not None:
+            latest[portal_id] = max(latest.get(portal_id, created_at), created_at)
+    if not totals:
+        return
+
+    create = sign > 0
+    with transaction.atomic():
+        increment_counter('news_articles', sum(totals.values()))
+        for portal_id, delta in totals.items():
+            extra = {}
+            if portal_id in latest:
+                last = Value(latest[portal_id])
+                extra['last_article_at'] = Greatest(Coalesce('last_article_at', last), last)
+            _add(PortalStats, {'portal_id': portal_id}, {'articles': delta}, create=create, **extra)
+        for (portal_id, day), delta in ingested.items():
+            _add(
+                PortalDailyStats, {'portal_id': portal_id, 'date': day},
+                {'articles': delta, 'lag_seconds': lags[(portal_id, day)]}, create=create
+            )
+        for (portal_id, day), delta in published.items():
+            _add(PortalDailyStats, {'portal_id': portal_id, 'date': day}, {'published': delta}, create=create)
+
+
+def record_jobs(rows: Iterable[Tuple[int, datetime, Optional[int], int, int]]) -> None:
+    """
+    Record finished Scrapyd jobs
+
+    Args:
+        rows: (portal_id, finished_at, items scraped or None, wait seconds, run seconds) per job
+    """
+    daily = {}
+    for portal_id, finished_at, items, wait, run in rows:
+        deltas = daily.setdefault((portal_id, day_of(finished_at)), Counter())
+        deltas.update({'jobs': 1, 'job_items': items or 0, 'job_wait_seconds': wait, 'job_run_seconds': run})
+        metrics.record_job(portal_id, items, wait, run)
+    with transaction.atomic():
+        for (portal_id, day), deltas in daily.items():
+            _add(PortalDailyStats, {'portal_id': portal_id, 'date': day}, dict(deltas))
+
+
+def _seconds(expression):
+    return Sum(expression, output_field=DurationField())
+
+
+def _positive(start: str, end: str):
+    """end - start, or zero when end is not after start"""
+    return Case(
+        When(**{f'{end}__gt': F(start)}, then=F(end) - F(start)),
+        default=Value(timedelta(0)), output_field=DurationField()
+    )
+
+
+def _reconcile_daily(since: Optional[date]) -> int:
+    """Recompute PortalDailyStats rows from `since` (or all of them)"""
+    # Archived articles still count; stubs archived before they kept created_at only count as published
+    archived = NewsArticleArchive.objects.filter(created_at__isnull=False)
+    sources = [
+        ('articles', NewsArticle.objects, 'article_url__portal_id', 'created_at'),
+        ('articles', archived, 'portal_id', 'created_at'),
+        ('published', NewsArticle.objects, 'article_url__portal_id', 'published_at'),
+        ('published', NewsArticleArchive.objects, 'portal_id', 'published_at'),
+        ('raw_urls', NewsArticleRawUrl.objects, 'portal_id', 'created_at'),
+        ('clean_urls', NewsArticleCleanUrl.objects, 'portal_id', 'created_at'),
+    ]
+    rows = {}
+    for field, manager, portal_field, date_field in sources:
+        queryset = manager.order_by()
+        if since:
+            queryset = queryset.filter(**{f'{date_field}__date__gte': since})
+        grouped = queryset.annotate(day=TruncDate(date_field)).values(portal_field, 'day').annotate(n=Count('id'))
+        for row in grouped.values_list(portal_field, 'day', 'n'):
+            portal_id, day, n = row
+            if portal_id is None or day is None:
+                continue
+            counts = rows.setdefault((portal_id, day), {})
+            counts[field] = counts.get(field, 0) + n
+
+    jobs = CrawlerTask.objects.order_by().filter(scrapyd_finished_at__isnull=False, scrapyd_started_at__isnull=False)
+    if since:
+        jobs = jobs.filter(scrapyd_finished_at__date__gte=since)
+    for articles, portal_field in ((NewsArticle.objects.order_by(), 'article_url__portal_id'), (archived.order_by(), 'portal_id')):
+        if since:
+            articles = articles.filter(created_at__date__gte=since)
+        lags = articles.annotate(day=TruncDate('created_at')).values(portal_field, 'day').annotate(
+            lag=_seconds(_positive('published_at', 'created_at'))
+        )
+        for portal_id, day, lag in lags.values_list(portal_field, 'day', 'lag'):
+            if portal_id is not None and day is not None:
+                counts = rows.setdefault((portal_id, day), {})
+                counts['lag_seconds'] = counts.get('lag_seconds', 0) + (int(lag.total_seconds()) if lag else 0)
+    job_rows = jobs.annotate(day=TruncDate('scrapyd_finished_at')).values('crawler_config__portal_id', 'day').annotate(
+        n=Count('id'), items=Sum('items_scraped'),
+        wait=_seconds(_positive('created_at', 'scrapyd_started_at')),
+        run=_seconds(_positive('scrapyd_started_at', 'scrapyd_finished_at')),
+    )
+    for portal_id, day, n, items, wait, run in job_rows.values_list('crawler_config__portal_id', 'day', 'n', 'items', 'wait', 'run'):
+        rows.setdefault((portal_id, day), {}).update(
+            jobs=n, job_items=items or 0,
+            job_wait_seconds=int(wait.total_seconds()) if wait else 0,
+            job_run_seconds=int(run.total_seconds()) if run else 0,
+        )
+
+    stale = PortalDailyStats.objects.all()
+    if since:
+        stale = stale.filter(date__gte=since)
+    stale.delete()
+    PortalDailyStats.objects.bulk_create(
+        [PortalDailyStats(portal_id=portal_id, date=day, **counts) for (portal_id, day), counts in rows.items()],
+        batch_size=1000
+    )
+    return len(rows)
+
+
+def reconcile(days: Optional[int] = None) -> Dict:
+    """
+    Recompute counters and rollups from the source tables
+
+    Args:
+        days: Only rebuild the daily rollups of the last N days (totals are always rebuilt);
+            only a full rebuild stores the RECONCILED marker
+
+    Returns:
+        Dict with the counter values and the number of portal and daily rows written
+    """
+    since = timezone.localdate() - timedelta(days=days) if days else None
+    with transaction.atomic():
+        counters = {name: model.objects.count() for name, model in COUNTER_MODELS.items()}
+        counters['news_articles'] += NewsArticleArchive.objects.count()
+        StatsCounter.objects.bulk_create(
+            [StatsCounter(name=name, value=value) for name, value in counters.items()],
+            update_conflicts=True, unique_fields=['name'], update_fields=['value', 'updated_at']
+        )
+
+        portals = {pk: PortalStats(portal_id=pk) for pk in NewsPortal.objects.values_list('id', flat=True)}
+        for field, manager, portal_field in [
+            ('raw_urls', NewsArticleRawUrl.objects, 'portal_id'),
+            ('clean_urls', NewsArticleCleanUrl.objects, 'portal_id'),
+            ('seed_urls', NewsPortalSeedUrl.objects, 'portal_id'),
+        ]:
+            for portal_id, n in manager.order_by().values(portal_field).annotate(n=Count('id')).values_list(portal_field, 'n'):
+                setattr(portals[portal_id], field, n)
+        articles = NewsArticle.objects.order_by().values('article_url__portal_id').annotate(n=Count('id'), last=Max('created_at'))
+        for portal_id, n, last in articles.values_list('article_url__portal_id', 'n', 'last'):
+            portals[portal_id].articles = n
+            portals[portal_id].last_article_at = last
+        archived = NewsArticleArchive.objects.order_by().values('portal_id').annotate(n=Count('id'), last=Max('created_at'))
+        for portal_id, n, last in archived.values_list('portal_id', 'n', 'last'):
+            portal = portals[portal_id]
+            portal.articles += n
+            if last and (portal.last_article_at is None or last > portal.last_article_at):
+                portal.last_article_at = last
+        PortalStats.objects.bulk_create(
+            list(portals.values()),
+            update_conflicts=True, unique_fields=['portal'],
+            update_fields=['articles', 'raw_urls', 'clean_urls', 'seed_urls', 'last_article_at', 'updated_at'],
+            batch_size=1000
+        )
+
+        daily_rows = _reconcile_daily(since)
+
+        if since is None:
+            StatsCounter.objects.update_or_create(name=RECONCILED, defaults={'value': int(timezone.now().timestamp())})
+
+    return {'counters': counters, 'portals': len(portals), 'daily_rows': daily_rows}
+
+
+def queue_reconcile() -> bool:
+    """Queue a full reconcile unless one was queued in the last RECONCILE_QUEUED_TIMEOUT seconds"""
+    from apps.tasks.tasks import reconcile_dashboard_stats
+
+    if not cache.add(RECONCILE_QUEUED_KEY, True, RECONCILE_QUEUED_TIMEOUT):
+        return False
+    reconcile_dashboard_stats.delay()
+    return True
+
+
+def get_dashboard_stats(top_portals: int = 10, recent_days: int = 30) -> Dict:
+    """
+    Read the dashboard numbers from the rollup tables
+
+    Returns:
+        Dict with one '<name>_count' entry per counter, 'recent_articles'
+        (articles ingested in the last recent_days days), 'articles_by_portal'
+        (list of {'name', 'article_count'}, top portals first) and
+        'stats_pending', true while the rollups were never fully reconciled
+        and may undercount
+    """
+    counters = dict(StatsCounter.objects.filter(name__in=list(COUNTER_MODELS)).values_list('name', 'value'))
+
+    since = timezone.localdate() - timedelta(days=recent_days - 1)
+    recent = PortalDailyStats.objects.filter(date__gte=since).aggregate(total=Sum('articles'))['total'] or 0
+
+    by_portal = PortalStats.objects.order_by('-articles').values_list('portal__name', 'articles')[:top_portals]
+
+    stats = {f'{name}_count': max(counters.get(name, 0), 0) for name in COUNTER_MODELS}
+    stats['recent_articles'] = max(recent, 0)
+    stats['articles_by_portal'] = [{'name': name, 'article_count': count} for name, count in by_portal]
+    stats['stats_pending'] = not is_reconciled()
+    return stats
+
+
+def _ratio(part, whole) -> Optional[float]:
+    return round(part / whole, 3) if whole else None
+
+
+def get_pipeline_stats(days: int = 7, limit: int = 50) -> Dict:
+    """
+    Crawl throughput, funnel and freshness per portal, from the rollup tables
+
+    Args:
+        days: Window ending today
+        limit: Portals listed, busiest first
+
+    Returns:
+        Dict with 'days', 'totals' and 'portals', each portal (and the totals)
+        with raw_urls / clean_urls / articles volumes, urls_per_hour,
+        clean_rate (clean / raw), article_rate (articles / clean), avg_lag
+        (seconds from publication to ingestion), jobs, items_per_job,
+        avg_job_wait / avg_job_run (seconds) and, per portal, last_article_at.
+        Rates are None when their base is zero.
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    fields = ['raw_urls', 'clean_urls', 'articles', 'lag_seconds', 'jobs', 'job_items', 'job_wait_seconds', 'job_run_seconds']
+    rows = PortalDailyStats.objects.filter(date__gte=since).values('portal_id').annotate(
+        **{field: Sum(field) for field in fields}
+    )
+    portals = {row['portal_id']: row for row in rows}
+    names = dict(NewsPortal.objects.filter(id__in=list(portals)).values_list('id', 'name'))
+    last_articles = dict(PortalStats.objects.filter(portal_id__in=list(portals)).values_list('portal_id', 'last_article_at'))
+
+    def derive(row):
+        hours = days * 24
+        return dict(
+            row,
+            urls_per_hour=round(row['raw_urls'] / hours, 2),
+            clean_rate=_ratio(row['clean_urls'], row['raw_urls']),
+            article_rate=_ratio(row['articles'], row['clean_urls']),
+            avg_lag=_ratio(row['lag_seconds'], row['articles']),
+            items_per_job=_ratio(row['job_items'], row['jobs']),
+            avg_job_wait=_ratio(row['job_wait_seconds'], row['jobs']),
+            avg_job_run=_ratio(row['job_run_seconds'], row['jobs']),
+        )
+
+    totals = derive({field: sum(row[field] or 0 for row in portals.values()) for field in fields})
+    ordered = sorted(portals.values(), key=lambda row: (row['raw_urls'] or 0) + (row['articles'] or 0), reverse=True)[:limit]
+    return {
+        'days': days,
+        'totals': totals,
+        'portals': [
+            dict(
+                derive({field: row[field] or 0 for field in fields}),
+                portal_id=row['portal_id'], name=names.get(row['portal_id'], ''),
+                last_article_at=last_articles.get(row['portal_id'])
+            )
+            for row in ordered
+        ],
+    }
@@ -0,0 +1,266 @@
+"""
+Seeded synthetic data for benchmarks
+
+generate() fills the database with a reproducible, realistically shaped
+dataset so the hot paths (apps.common.benchmark) can be timed at production
+volumes: portals with seed URLs, selectors and crawler/scraper configs, raw
+and clean URLs spread over the portals with a long-tail (Zipf) skew,
+articles with bodies, authors and images, and Celery TaskResult history.
+
+The same seed gives the same rows. Everything is written with bulk inserts
+in batches of `batch_size`, so millions of URLs fit in bounded memory; the
+dashboard rollups and the search index, which bulk writes bypass, are
+rebuilt at the end. Synthetic portals use the SYNTHETIC_DOMAIN_SUFFIX
+domain and task results the SYNTHETIC_TASK_PREFIX id, so clear() removes
+them without touching real data.
+"""
+
+import json
+import random
+import uuid
+from datetime import timedelta
+from typing import Dict, List
+
+from django.db import transaction
+from django.utils import timezone
+from django_celery_results.models import TaskResult
+
+from .models import (
+    CrawlerConfig, ItemChoices, ItemSelector, NewsArticle, NewsArticleAuthor, NewsArticleBody,
+    NewsArticleCleanUrl, NewsArticleImage, NewsArticleRawUrl, NewsArticleUrlStatusChoices,
+    NewsPortal, NewsPortalSeedUrl, NewsScopeChoices, ScraperConfig, SelectorMethodChoices
+)
+from . import caching, search, stats
+
+
+SYNTHETIC_DOMAIN_SUFFIX = '.bench.test'
+SYNTHETIC_TASK_PREFIX = 'bench-'
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_HISTORY_DAYS = 365
+
+SECTIONS = ['news', 'politics', 'economy', 'sport', 'tech', 'health', 'culture', 'world', 'regional', 'opinion']
+TRACKING_PARAMS = ['utm_source=twitter', 'utm_medium=social', 'fbclid=IwAR0bench', 'ref=home', 'amp=1']
+WORDS = (
+    'government minister election market growth inflation budget court police city province flood '
+    'earthquake football league match player coach health hospital vaccine school student teacher '
+    'technology startup digital internet phone energy oil price export import bank rupiah village '
+    'festival music film culture tourism island bridge road traffic airport port president parliament '
+    'policy reform tax trade investment climate forest river coast fishermen farmers harvest rice'
+).split()
+CITIES = ['Jakarta', 'Surabaya', 'Bandung', 'Medan', 'Makassar', 'Denpasar', 'Semarang', 'Palembang', None]
+TASK_NAMES = [
+    'apps.tasks.tasks.execute_crawler_task', 'apps.tasks.tasks.canonicalize_raw_urls',
+    'apps.tasks.tasks.fetch_pending_articles', 'apps.tasks.tasks.sync_crawler_job_stats',
+    'apps.tasks.tasks.reconcile_dashboard_stats', 'apps.tasks.tasks.discover_feed_urls',
+    'apps.tasks.tasks.dispatch_adaptive_schedules', 'apps.tasks.tasks.archive_cold_articles',
+]
+LIST_SELECTORS = [
+    (ItemChoices.URL_LIST, SelectorMethodChoices.CSS, 'article h2 a::attr(href)'),
+    (ItemChoices.TITLE, SelectorMethodChoices.CSS, 'h1.headline::text'),
+    (ItemChoices.BODY, SelectorMethodChoices.XPATH, '//div[@class="article-body"]//p//text()'),
+    (ItemChoices.PUBLISHED_AT, SelectorMethodChoices.CSS, 'time::attr(datetime)'),
+    (ItemChoices.AUTHORS, SelectorMethodChoices.CSS, '.byline a::text'),
+]
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def _portal_weights(count: int) -> List[float]:
+    """Zipf-like share of the URLs per portal: a few large portals and a long tail"""
+    weights = [1 / (rank + 1) for rank in range(count)]
+    total = sum(weights)
+    return [weight / total for weight in weights]
+
+
+def _ids_by(model, field: str, values: List) -> Dict:
+    return dict(model.objects.filter(**{f'{field}__in': values}).values_list(field, 'id'))
+
+
+def _create_portals(rng: random.Random, count: int) -> List[NewsPortal]:
+    NewsPortal.objects.bulk_create([
+        NewsPortal(
+            domain=f'portal-{index:04d}{SYNTHETIC_DOMAIN_SUFFIX}', name=f'Portal {index:04d}',
+            news_scope=rng.choice(NewsScopeChoices.values), city=rng.choice(CITIES),
+            url_rules={'strip_params': ['ref', 'amp'], 'force_https': True},
+        )
+        for index in range(count)
+    ])
+    portals = list(NewsPortal.objects.filter(domain__endswith=SYNTHETIC_DOMAIN_SUFFIX).order_by('id'))
+
+    NewsPortalSeedUrl.objects.bulk_create([
+        NewsPortalSeedUrl(url=f'https://{portal.domain}/{section}/', portal=portal)
+        for portal in portals for section in SECTIONS[:3]
+    ])
+    ItemSelector.objects.bulk_create([
+        ItemSelector(portal=portal, item=item, method=method, query=query)
+        for portal in portals for item, method, query in LIST_SELECTORS
+    ])
+    url_list_selectors = dict(
+        ItemSelector.objects.filter(portal__in=portals, item=ItemChoices.URL_LIST).values_list('portal_id', 'id')
+    )
+    CrawlerConfig.objects.bulk_create([
+        CrawlerConfig(name=f'{portal.name} crawler', portal=portal, item_selector_id=url_list_selectors[portal.id],
+                      custom_settings={'DOWNLOAD_DELAY': 0.5})
+        for portal in portals
+    ])
+    ScraperConfig.objects.bulk_create([
+        ScraperConfig(name=f'{portal.name} scraper', portal=portal, item_selector_id=url_list_selectors[portal.id],
+                      custom_settings={})
+        for portal in portals
+    ])
+    return portals
+
+
+def _create_batch(rng: random.Random, portals: List[NewsPortal], weights: List[float], start: int, size: int,
+                  clean_ratio: float, article_ratio: float, author_ids: List[int], now, history_days: int) -> Dict:
+    """One batch of raw URLs, with their clean URLs, articles, bodies, authors and images"""
+    counts = {'raw_urls': 0, 'clean_urls': 0, 'articles': 0}
+    raw_rows, clean_plan = [], []
+    for index in range(start, start + size):
+        portal = rng.choices(portals, weights)[0]
+        published = now - timedelta(seconds=rng.randrange(history_days * 86400))
+        path = f'{rng.choice(SECTIONS)}/{published:%Y/%m/%d}/{"-".join(_words(rng, 5).split())}-{index}'
+        query = f'?{rng.choice(TRACKING_PARAMS)}' if rng.random() < 0.3 else ''
+        url = f'https://{portal.domain}/{path}{query}'
+        has_clean = rng.random() < clean_ratio
+        status = NewsArticleUrlStatusChoices.COMPLETED if has_clean else rng.choice(
+            [NewsArticleUrlStatusChoices.PENDING] * 8 + [NewsArticleUrlStatusChoices.FAILED]
+        )
+        raw_rows.append(NewsArticleRawUrl(url=url, portal=portal, status=status))
+        if has_clean:
+            clean_plan.append((url, f'https://{portal.domain}/{path}', portal.id, published, rng.random() < article_ratio))
+
+    NewsArticleRawUrl.objects.bulk_create(raw_rows)
+    counts['raw_urls'] = len(raw_rows)
+    raw_ids = _ids_by(NewsArticleRawUrl, 'url', [row.url for row in raw_rows])
+
+    NewsArticleCleanUrl.objects.bulk_create([
+        NewsArticleCleanUrl(
+            url=clean_url, article_url_raw_id=raw_ids[raw_url], portal_id=portal_id,
+            status=NewsArticleUrlStatusChoices.COMPLETED if has_article else NewsArticleUrlStatusChoices.PENDING,
+        )
+        for raw_url, clean_url, portal_id, _, has_article in clean_plan
+    ])
+    counts['clean_urls'] = len(clean_plan)
+    clean_ids = _ids_by(NewsArticleCleanUrl, 'url', [row[1] for row in clean_plan])
+
+    articles = [
+        NewsArticle(
+            article_url_id=clean_ids[clean_url], title=_words(rng, rng.randint(6, 12)).capitalize(),
+            description=_words(rng, rng.randint(20, 40)).capitalize() + '.', published_at=published,
+            language=rng.choice(['id', 'id', 'id', 'en']),
+        )
+        for _, clean_url, _, published, has_article in clean_plan if has_article
+    ]
+    NewsArticle.objects.bulk_create(articles)
+    counts['articles'] = len(articles)
+    article_ids = list(_ids_by(NewsArticle, 'article_url_id', [article.article_url_id for article in articles]).values())
+
+    NewsArticleBody.store({
+        article_id: '\n\n'.join(_words(rng, rng.randint(40, 80)).capitalize() + '.' for _ in range(rng.randint(4, 12)))
+        for article_id in article_ids
+    })
+    NewsArticle.authors.through.objects.bulk_create([
+        NewsArticle.authors.through(newsarticle_id=article_id, newsarticleauthor_id=author_id)
+        for article_id in article_ids for author_id in set(rng.sample(author_ids, rng.choice([1, 1, 1, 2])))
+    ])
+    image_articles = {
+        f'https://cdn.bench.test/img/{article_id}-{position}.jpg': article_id
+        for article_id in article_ids for position in range(rng.choice([0, 1, 1, 2]))
+    }
+    NewsArticleImage.objects.bulk_create([NewsArticleImage(image_url=image_url) for image_url in image_articles])
+    NewsArticle.images.through.objects.bulk_create([
+        NewsArticle.images.through(newsarticle_id=image_articles[image_url], newsarticleimage_id=pk)
+        for image_url, pk in _ids_by(NewsArticleImage, 'image_url', list(image_articles)).items()
+    ])
+    counts['article_ids'] = article_ids
+    return counts
+
+
+def _create_task_results(rng: random.Random, count: int, now, history_days: int) -> None:
+    rows = []
+    for _ in range(count):
+        name = rng.choice(TASK_NAMES)
+        done = now - timedelta(seconds=rng.randrange(history_days * 86400))
+        failed = rng.random() < 0.05
+        rows.append(TaskResult(
+            task_id=f'{SYNTHETIC_TASK_PREFIX}{uuid.UUID(int=rng.getrandbits(128))}', task_name=name,
+            status='FAILURE' if failed else 'SUCCESS', content_type='application/json', content_encoding='utf-8',
+            date_created=done - timedelta(seconds=rng.randint(1, 600)), date_done=done,
+            result=json.dumps({'logs': '', 'input': name.rsplit('.', 1)[1], 'error': failed, 'output': '',
+                               'status': 'FAILURE' if failed else 'SUCCESS', 'log_file': ''}),
+        ))
+    TaskResult.objects.bulk_create(rows, batch_size=DEFAULT_BATCH_SIZE)
+
+
+def generate(portals: int = 50, raw_urls: int = 100000, clean_ratio: float = 0.8, article_ratio: float = 0.9,
+             authors: int = 2000, task_results: int = 10000, seed: int = 42, batch_size: int = DEFAULT_BATCH_SIZE,
+             history_days: int = DEFAULT_HISTORY_DAYS, index: bool = True, progress=None) -> Dict:
+    """
+    Write a synthetic dataset
+
+    Args:
+        portals: Number of portals
+        raw_urls: Number of raw URLs over all portals
+        clean_ratio: Share of raw URLs with a clean URL
+        article_ratio: Share of clean URLs with an article
+        authors: Size of the author pool articles draw from
+        task_results: Number of Celery TaskResult rows
+        seed: Random seed, the same seed gives the same dataset
+        batch_size: Raw URLs per insert batch (and transaction)
+        history_days: Dates are spread over this many past days
+        index: Index the articles for full-text search
+        progress: Optional callable(message) called after each batch
+
+    Returns:
+        Dict with the number of rows written per kind
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    if NewsPortal.objects.filter(domain__endswith=SYNTHETIC_DOMAIN_SUFFIX).exists():
+        raise ValueError("Synthetic data already exists, clear it first")
+
+    with transaction.atomic():
+        portal_rows = _create_portals(rng, portals)
+        NewsArticleAuthor.objects.bulk_create([
+            NewsArticleAuthor(name=f'{_words(rng, 2).title()} {index}') for index in range(authors)
+        ])
+        author_ids = list(NewsArticleAuthor.objects.order_by('-id').values_list('id', flat=True)[:authors])
+
+    weights = _portal_weights(len(portal_rows))
+    counts = {'portals': len(portal_rows), 'raw_urls': 0, 'clean_urls': 0, 'articles': 0, 'task_results': task_results}
+    article_ids = []
+    for start in range(0, raw_urls, batch_size):
+        with transaction.atomic():
+            batch = _create_batch(rng, portal_rows, weights, start, min(batch_size, raw_urls - start),
+                                  clean_ratio, article_ratio, author_ids, now, history_days)
+        article_ids.extend(batch.pop('article_ids'))
+        for kind, count in batch.items():
+            counts[kind] += count
+        if progress:
+            progress(f"{counts['raw_urls']}/{raw_urls} raw URLs, {counts['articles']} articles")
+
+    _create_task_results(rng, task_results, now, history_days)
+    caching.invalidate(*caching.MODEL_NAMESPACES.values())
+    caching.invalidate_raw_urls(portal.id for portal in portal_rows)
+    stats.reconcile()
+    if index:
+        counts['indexed'] = search.index_articles(article_ids, batch_size=batch_size)
+    return counts
+
+
+def clear() -> Dict:
+    """Delete the synthetic portals (and everything hanging off them) and task results"""
+    articles = NewsArticle.objects.filter(article_url__portal__domain__endswith=SYNTHETIC_DOMAIN_SUFFIX)
+    article_ids = list(articles.values_list('id', flat=True))
+    for start in range(0, len(article_ids), DEFAULT_BATCH_SIZE):
+        chunk = article_ids[start:start + DEFAULT_BATCH_SIZE]
+        search.remove_articles(chunk)
+        # Images are not owned by a portal, so the cascade below would leave them behind
+        NewsArticleImage.objects.filter(newsarticle__id__in=chunk).delete()
+    deleted, by_model = NewsPortal.objects.filter(domain__endswith=SYNTHETIC_DOMAIN_SUFFIX).delete()
+    tasks, _ = TaskResult.objects.filter(task_id__startswith=SYNTHETIC_TASK_PREFIX).delete()
+    stats.reconcile()
+    return {'rows': deleted + tasks, 'articles': len(article_ids), 'task_results': tasks}
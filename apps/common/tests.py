@@ -1,3 +1,724 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import pyarrow.parquet as pq
+from django.core.cache import cache
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from apps.tasks.tasks import reconcile_dashboard_stats
+from .models import (
+    BodyCodecChoices, CrawlerConfig, CrawlerScheduledTask, ItemSelector, NewsArticle, NewsArticleArchive,
+    NewsArticleAuthor, NewsArticleBody, NewsArticleCleanUrl, NewsArticleImage, NewsArticleRawUrl,
+    NewsArticleUrlStatusChoices, NewsPortal, NewsPortalFeed, NewsPortalSeedUrl, PortalStats, ScheduleModeChoices,
+    UrlValidator
+)
+from . import (
+    archive, caching, canonicalize, conditional, dedup, discovery, export, extract, fetcher, importer, ingest, pagination,
+    schedule, search, seen_filter, stats
+)
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.delete(stats.RECONCILE_QUEUED_KEY)
+
+    def test_counts_rows_from_before_the_counters(self):
+        portals = NewsPortal.objects.bulk_create([NewsPortal(domain=f'portal{i}.test', name=f'Portal {i}') for i in range(3)])
+        NewsArticleRawUrl.objects.bulk_create([
+            NewsArticleRawUrl(url=f'https://portal0.test/article-{i}', portal=portals[0]) for i in range(5)
+        ])
+
+        # Signal-driven inserts on a database that was never reconciled
+        portal = NewsPortal.objects.create(domain='portal3.test', name='Portal 3')
+        NewsArticleRawUrl.objects.create(url='https://portal3.test/article', portal=portal)
+
+        # Served from the rollups, without scanning the tables
+        dashboard = stats.get_dashboard_stats()
+        self.assertTrue(dashboard['stats_pending'])
+        self.assertEqual(dashboard['news_portals_count'], 1)
+
+        reconcile_dashboard_stats.apply(kwargs={'days': 7})
+        dashboard = stats.get_dashboard_stats()
+        self.assertFalse(dashboard['stats_pending'])
+        self.assertEqual(dashboard['news_portals_count'], 4)
+        self.assertEqual(dashboard['raw_urls_count'], 6)
+
+        NewsPortal.objects.create(domain='portal4.test', name='Portal 4')
+        self.assertEqual(stats.get_dashboard_stats()['news_portals_count'], 5)
+
+    def test_dashboard_queues_one_reconcile(self):
+        with mock.patch('apps.tasks.tasks.reconcile_dashboard_stats.delay') as delay:
+            self.assertTrue(stats.queue_reconcile())
+            self.assertFalse(stats.queue_reconcile())
+        delay.assert_called_once_with()
+
+    def test_partial_reconcile_does_not_mark_reconciled(self):
+        stats.reconcile(days=1)
+        self.assertFalse(stats.is_reconciled())
+        stats.reconcile()
+        self.assertTrue(stats.is_reconciled())
+
+
+class DiscoveryTests(TestCase):
+    def setUp(self):
+        self.portal = NewsPortal.objects.create(domain='example.test', name='Example')
+        self.feed = NewsPortalFeed.objects.create(url='https://example.test/index.xml', portal=self.portal)
+        self.failures = {'https://example.test/a.xml': 1}
+
+    def respond(self, request):
+        url = str(request.url)
+        now = timezone.now()
+        if url == self.feed.url:
+            return httpx.Response(200, content=(
+                '<?xml version="1.0"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                f'<sitemap><loc>https://example.test/a.xml</loc><lastmod>{(now - timedelta(hours=2)).isoformat()}</lastmod></sitemap>'
+                f'<sitemap><loc>https://example.test/b.xml</loc><lastmod>{(now - timedelta(hours=1)).isoformat()}</lastmod></sitemap>'
+                '</sitemapindex>'
+            ).encode(), headers={'content-type': 'application/xml'})
+        if self.failures.get(url):
+            self.failures[url] -= 1
+            return httpx.Response(503)
+        name = url.rsplit('/', 1)[-1][0]
+        published = now - timedelta(hours=3 if name == 'a' else 1)
+        return httpx.Response(200, content=(
+            '<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            f'<url><loc>https://example.test/{name}1</loc><lastmod>{published.isoformat()}</lastmod></url>'
+            '</urlset>'
+        ).encode(), headers={'content-type': 'application/xml'})
+
+    def discover(self):
+        transport = httpx.MockTransport(self.respond)
+        with mock.patch('apps.common.fetcher.portal_client', lambda limit: httpx.AsyncClient(transport=transport)):
+            return discovery.discover_urls()
+
+    def test_failed_child_sitemap_is_read_again(self):
+        self.discover()
+        self.assertTrue(NewsArticleRawUrl.objects.filter(url='https://example.test/b1').exists())
+        self.assertFalse(NewsArticleRawUrl.objects.filter(url='https://example.test/a1').exists())
+        self.feed.refresh_from_db()
+        self.assertIsNone(self.feed.lastmod)
+
+        self.discover()
+        self.assertTrue(NewsArticleRawUrl.objects.filter(url='https://example.test/a1').exists())
+        self.feed.refresh_from_db()
+        self.assertIsNotNone(self.feed.lastmod)
+
+
+class ExtractTests(SimpleTestCase):
+    PAGE = (
+        '<html lang="en"><head><title>Fallback</title></head><body>'
+        '<h1>Hello <b>world</b></h1>'
+        '<div class="body">First paragraph <a href="/related">related</a> after the link</div>'
+        '</body></html>'
+    )
+
+    def extractor(self, *selectors):
+        return extract.Extractor(1, selectors)
+
+    def test_descendant_text_includes_the_element_text(self):
+        tree = extract.parse_document(self.PAGE)
+        self.assertEqual(extract.CompiledSelector('css', 'h1 ::text').values(tree, self.PAGE), ['Hello ', 'world'])
+        self.assertEqual(extract.CompiledSelector('css', 'h1::text').values(tree, self.PAGE), ['Hello '])
+
+    def test_body_selector_keeps_direct_text(self):
+        extracted = self.extractor(('body', 'css', 'div.body ::text')).extract(self.PAGE, 'https://example.test/a')
+        self.assertEqual(extracted['body'], 'First paragraph\n\nrelated\n\nafter the link')
+
+    def test_url_list_only_read_from_listing_pages(self):
+        extractor = self.extractor(('url_list', 'css', 'a::attr(href)'))
+        self.assertNotIn('url_list', extractor.extract(self.PAGE, 'https://example.test/a'))
+        self.assertEqual(extractor.extract_links(self.PAGE, 'https://example.test/a'), ['https://example.test/related'])
+
+
+def create_clean_url(portal, path):
+    raw = NewsArticleRawUrl.objects.create(url=f'https://{portal.domain}/{path}', portal=portal)
+    return NewsArticleCleanUrl.objects.create(url=raw.url, article_url_raw=raw, portal=portal)
+
+
+def isolate_seen_filters(test):
+    """Keep the test's seen-URL filters out of the process registry and the snapshot directory"""
+    settings = override_settings(SEEN_URL_FILTER_DIR=tempfile.mkdtemp())
+    settings.enable()
+    test.addCleanup(settings.disable)
+    test.addCleanup(seen_filter._filters.clear)
+
+
+class SeenFilterTests(TestCase):
+    def setUp(self):
+        isolate_seen_filters(self)
+        self.portal = NewsPortal.objects.create(domain='example.test', name='Example')
+        seen_filter.get_filter('raw', self.portal.id)
+
+    def test_committed_insert_is_seen(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            seen_filter.insert_unseen_urls('raw', self.portal.id, ['https://example.test/a'])
+        self.assertEqual(seen_filter.screen_urls('raw', self.portal.id, ['https://example.test/a']), [])
+
+    def test_rolled_back_insert_is_not_seen(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    seen_filter.insert_unseen_urls('raw', self.portal.id, ['https://example.test/a'])
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertFalse(NewsArticleRawUrl.objects.exists())
+        self.assertEqual(seen_filter.screen_urls('raw', self.portal.id, ['https://example.test/a']), ['https://example.test/a'])
+
+
+class CanonicalizeTests(SimpleTestCase):
+    def canonical(self, url, domain='example.com', **rules):
+        return canonicalize.UrlCanonicalizer(domain, rules).canonicalize(url)
+
+    def test_normalizes_scheme_host_port_and_fragment(self):
+        self.assertEqual(self.canonical('HTTP://Example.COM:80//news//a?b=2&a=1#top'), 'http://example.com/news/a?a=1&b=2')
+        self.assertEqual(self.canonical('http://example.com/a', force_https=True), 'https://example.com/a')
+
+    def test_drops_tracking_params(self):
+        self.assertEqual(
+            self.canonical('https://example.com/a?utm_source=x&fbclid=y&id=3&ref=z', strip_params=['ref']),
+            'https://example.com/a?id=3'
+        )
+        self.assertEqual(self.canonical('https://example.com/a?id=3&page=2&x=1', keep_params=['id']), 'https://example.com/a?id=3')
+
+    def test_amp_variants(self):
+        self.assertEqual(self.canonical('https://example.com/news/x.amp.html'), 'https://example.com/news/x.html')
+        self.assertEqual(self.canonical('https://example.com/news/x.amp'), 'https://example.com/news/x')
+        self.assertEqual(self.canonical('https://example.com/news/x/amp/'), 'https://example.com/news/x')
+        self.assertEqual(self.canonical('https://example.com/news/x/amp.html'), 'https://example.com/news/x')
+        self.assertEqual(self.canonical('https://example.com/amp/news/x'), 'https://example.com/news/x')
+
+    def test_mobile_hosts_collapse_onto_the_portal(self):
+        self.assertEqual(self.canonical('https://m.example.com/a'), 'https://example.com/a')
+        self.assertEqual(self.canonical('https://www.example.com/a'), 'https://www.example.com/a')
+        self.assertEqual(self.canonical('https://www.example.com/a', host='example.com'), 'https://example.com/a')
+        self.assertEqual(self.canonical('https://other.test/a'), 'https://other.test/a')
+
+    def test_rejects_non_http_urls(self):
+        with self.assertRaises(ValueError):
+            self.canonical('ftp://example.com/a')
+
+
+class CanonicalizeBatchTests(TestCase):
+    def setUp(self):
+        isolate_seen_filters(self)
+
+    def test_duplicates_and_failures(self):
+        portal = NewsPortal.objects.create(domain='example.com', name='Example')
+        NewsArticleRawUrl.objects.bulk_create([
+            NewsArticleRawUrl(url=url, portal=portal)
+            for url in ('https://example.com/a?utm_source=x', 'https://m.example.com/a', 'mailto:news@example.com')
+        ])
+
+        result = canonicalize.run_canonicalization(batch_size=2)
+
+        self.assertEqual(result, {'processed': 3, 'created': 1, 'duplicates': 1, 'failed': 1, 'batches': 2})
+        self.assertEqual(list(NewsArticleCleanUrl.objects.values_list('url', flat=True)), ['https://example.com/a'])
+        self.assertEqual(NewsArticleRawUrl.objects.filter(status=NewsArticleUrlStatusChoices.FAILED).count(), 1)
+
+
+class ImporterTests(TestCase):
+    def setUp(self):
+        isolate_seen_filters(self)
+
+    def test_portal_stored_with_www_is_updated(self):
+        portal = NewsPortal.objects.create(domain='www.example.com', name='Old name')
+
+        result = importer.import_records('portals', [{'domain': 'https://example.com/', 'name': 'New name'}])
+
+        self.assertEqual((result['created'], result['updated']), (0, 1))
+        self.assertEqual(list(NewsPortal.objects.values_list('id', 'domain', 'name')), [(portal.id, 'www.example.com', 'New name')])
+
+    def test_new_portals_are_created(self):
+        result = importer.import_records('portals', [{'domain': 'www.example.com', 'name': 'Example'}, {'domain': '', 'name': 'x'}])
+
+        self.assertEqual((result['created'], result['invalid']), (1, 1))
+        self.assertEqual(result['errors'], [{'row': 2, 'errors': ['domain: required']}])
+        self.assertTrue(NewsPortal.objects.filter(domain='example.com').exists())
+
+    def test_seed_moved_to_another_portal_moves_its_totals(self):
+        first = NewsPortal.objects.create(domain='first.test', name='First')
+        second = NewsPortal.objects.create(domain='second.test', name='Second')
+        NewsPortalSeedUrl.objects.create(url='https://first.test/news', portal=first)
+
+        result = importer.import_records('seed_urls', [
+            {'url': 'https://first.test/news', 'portal': 'second.test'},
+            {'url': 'https://second.test/latest', 'portal': 'second.test'},
+        ])
+
+        self.assertEqual((result['created'], result['updated']), (1, 1))
+        self.assertEqual(NewsPortalSeedUrl.objects.get(url='https://first.test/news').portal_id, second.id)
+        self.assertEqual(
+            dict(PortalStats.objects.values_list('portal_id', 'seed_urls')), {first.id: 0, second.id: 2}
+        )
+
+
+@override_settings(ARTICLE_ARCHIVE_DIR=tempfile.mkdtemp())
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.portal = NewsPortal.objects.create(domain='portal.test', name='Portal')
+        self.article = NewsArticle.objects.create(
+            article_url=create_clean_url(self.portal, 'old'), title='Harbour reopens', published_at=timezone.now() - timedelta(days=800)
+        )
+        stats.reconcile()
+
+    def dashboard(self):
+        dashboard = stats.get_dashboard_stats()
+        return dashboard['news_articles_count'], dashboard['recent_articles'], dashboard['articles_by_portal']
+
+    def test_archived_articles_stay_in_the_rollups(self):
+        before = self.dashboard()
+        self.assertEqual(before[0], 1)
+
+        self.assertEqual(archive.archive_articles()['archived'], 1)
+
+        self.assertFalse(NewsArticle.objects.exists())
+        self.assertEqual(NewsArticleArchive.objects.get().created_at, self.article.created_at)
+        self.assertEqual(self.dashboard(), before)
+        stats.reconcile()
+        self.assertEqual(self.dashboard(), before)
+
+    def test_archived_articles_leave_the_search_index(self):
+        self.assertEqual([hit.article_id for hit in search.search_articles('harbour')], [self.article.id])
+
+        archive.archive_articles()
+
+        self.assertEqual(search.search_articles('harbour'), [])
+        self.assertEqual([hit.article_id for hit in archive.search_archive('harbour')], [self.article.id])
+
+
+class IngestTests(TestCase):
+    def setUp(self):
+        NewsPortal.objects.create(domain='portal.test', name='Portal')
+
+    def item(self, path, authors):
+        return {'url': f'https://portal.test/{path}', 'title': path, 'published_at': timezone.now(), 'authors': authors}
+
+    def test_shared_authors_are_stored_once(self):
+        results = ingest.ingest_articles([self.item('a', ['Ann', 'Bob']), self.item('b', ['Bob'])])
+
+        self.assertEqual([result['status'] for result in results], ['created', 'created'])
+        self.assertEqual(list(NewsArticleAuthor.objects.values_list('name', flat=True)), ['Ann', 'Bob'])
+        self.assertEqual(NewsArticle.objects.get(title='b').authors.get().name, 'Bob')
+
+    def test_names_inserted_by_a_concurrent_batch_are_reused(self):
+        bulk_create = NewsArticleAuthor.objects.bulk_create
+
+        def racing_bulk_create(objs, **kwargs):
+            # Another batch commits the same name between the select and the insert
+            NewsArticleAuthor.objects.create(name='Ann')
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(NewsArticleAuthor.objects, 'bulk_create', side_effect=racing_bulk_create):
+            ids = ingest._ensure_names(NewsArticleAuthor, 'name', ['Ann', 'Bob'])
+
+        self.assertEqual(ids, dict(NewsArticleAuthor.objects.values_list('name', 'id')))
+        self.assertEqual(NewsArticleAuthor.objects.count(), 2)
+
+
+class FingerprintTests(TestCase):
+    def setUp(self):
+        portal = NewsPortal.objects.create(domain='portal.test', name='Portal')
+        self.article = NewsArticle(article_url=create_clean_url(portal, 'a'), title='A', published_at=timezone.now())
+        self.article.body = 'The harbour reopened on Monday after a week of repairs to the main pier and the ferry ramp.'
+        self.article.save()
+
+    def test_saving_a_body_fingerprints_the_article(self):
+        self.assertEqual(self.article.cluster_id, self.article.pk)
+
+    def test_saves_without_a_body_change_skip_fingerprinting(self):
+        article = NewsArticle.objects.get(pk=self.article.pk)
+        with mock.patch.object(dedup, 'fingerprint_articles') as fingerprint_articles:
+            article.title = 'B'
+            article.save()
+            fingerprint_articles.assert_not_called()
+
+            article.body = 'A different body about the ferry timetable and the new winter schedule for the island.'
+            article.save()
+            fingerprint_articles.assert_called_once()
+
+
+class CursorPaginatorTests(TestCase):
+    def setUp(self):
+        portal = NewsPortal.objects.create(domain='portal.test', name='Portal')
+        now = timezone.now().replace(microsecond=0)
+        # Three articles share a publication time, so pages split inside the tie
+        self.articles = [
+            NewsArticle.objects.create(
+                article_url=create_clean_url(portal, f'a{i}'), title=f'A{i}', published_at=now - timedelta(hours=min(i, 2))
+            ) for i in range(7)
+        ]
+        self.expected = [article.pk for article in sorted(self.articles, key=lambda a: (a.published_at, a.pk), reverse=True)]
+
+    def pages(self, cursor_attribute, first_cursor=None):
+        paginator = pagination.CursorPaginator(NewsArticle.objects.all(), per_page=3)
+        pages, cursor = [], first_cursor
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append([article.pk for article in page])
+            if not (page.has_next if cursor_attribute == 'next_cursor' else page.has_previous):
+                return pages, page
+            cursor = getattr(page, cursor_attribute)
+
+    def test_forward_pages_cover_every_row_once(self):
+        pages, last = self.pages('next_cursor')
+
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertTrue(last.has_previous)
+
+    def test_backward_pages_mirror_the_forward_ones(self):
+        forward, last = self.pages('next_cursor')
+        backward, first = self.pages('previous_cursor', first_cursor=last.previous_cursor)
+
+        self.assertEqual(backward, forward[-2::-1])
+        self.assertFalse(first.has_previous)
+        self.assertTrue(first.has_next)
+
+    def test_malformed_cursor_gives_the_first_page(self):
+        paginator = pagination.CursorPaginator(NewsArticle.objects.all(), per_page=3)
+        for cursor in ('garbage', pagination.encode_cursor('next', ['x'])):
+            page = paginator.get_page(cursor)
+            self.assertEqual([article.pk for article in page], self.expected[:3])
+            self.assertFalse(page.has_previous)
+
+    def test_count_is_capped(self):
+        paginator = pagination.CursorPaginator(NewsArticle.objects.all(), per_page=3)
+        with override_settings(PAGINATION_COUNT_CAP=5):
+            self.assertEqual(paginator.count_display, '5+')
+        self.assertEqual(pagination.approximate_count(NewsArticle.objects.filter(title='A1')), (1, 'exact'))
+
+    def test_list_paginator_offsets(self):
+        paginator = pagination.ListCursorPaginator(list(range(7)), per_page=3)
+        page = paginator.get_page(paginator.get_page().next_cursor)
+
+        self.assertEqual(list(page), [3, 4, 5])
+        self.assertTrue(page.has_next and page.has_previous)
+        self.assertEqual(list(paginator.get_page(page.previous_cursor)), [0, 1, 2])
+
+
+class ArticleBodyTests(TestCase):
+    def setUp(self):
+        portal = NewsPortal.objects.create(domain='portal.test', name='Portal')
+        self.articles = [
+            NewsArticle.objects.create(article_url=create_clean_url(portal, f'a{i}'), title=f'A{i}', published_at=timezone.now())
+            for i in range(2)
+        ]
+
+    def test_codec_round_trip(self):
+        for text, codec in (('Ferry news. ' * 50, BodyCodecChoices.ZLIB), ('Kurz, ünïcode', BodyCodecChoices.RAW), ('', BodyCodecChoices.RAW)):
+            stored_codec, data = NewsArticleBody.encode(text)
+            self.assertEqual(stored_codec, codec)
+            self.assertEqual(NewsArticleBody.decode(stored_codec, memoryview(data)), text)
+
+    def test_body_is_stored_on_save_and_loaded_lazily(self):
+        article = self.articles[0]
+        article.body = 'Ferry news. ' * 50
+        article.save()
+
+        row = NewsArticleBody.objects.get(article=article)
+        self.assertEqual(row.codec, BodyCodecChoices.ZLIB)
+        self.assertLess(len(row.data), len(article.body))
+
+        article = NewsArticle.objects.get(pk=article.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(article.body, 'Ferry news. ' * 50)
+            self.assertEqual(article.body, 'Ferry news. ' * 50)
+
+    def test_store_replaces_bodies_in_bulk(self):
+        first, second = self.articles
+        NewsArticleBody.store({first.pk: 'old', second.pk: 'other'})
+        NewsArticleBody.store({first.pk: 'new'})
+
+        self.assertEqual(NewsArticleBody.load_many([first.pk, second.pk, 0]), {first.pk: 'new', second.pk: 'other'})
+        self.assertEqual(NewsArticleBody.load(0), '')
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        portals = NewsPortal.objects.bulk_create([NewsPortal(domain=f'portal{i}.test', name=f'Portal {i}') for i in range(2)])
+        self.articles = [
+            NewsArticle.objects.create(
+                article_url=create_clean_url(portals[i % 2], f'a{i}'), title=f'A{i}',
+                published_at=datetime(2024, 3, 1 + i, 23, 30, tzinfo=dt_timezone.utc)
+            ) for i in range(3)
+        ]
+        first = self.articles[0]
+        first.body = 'Line one, "quoted"\nline two'
+        first.save()
+        first.authors.add(*NewsArticleAuthor.objects.bulk_create([NewsArticleAuthor(name='Ann'), NewsArticleAuthor(name='Bob')]))
+        first.images.add(NewsArticleImage.objects.create(image_url='https://portal0.test/a.jpg'))
+        self.portals = portals
+
+    def export(self, export_format):
+        pieces = export.stream_articles(export.article_queryset(), export_format, chunk_size=2)
+        return (b'' if export_format == 'parquet' else '').join(pieces)
+
+    def test_formats_hold_the_same_rows(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('csv'))))
+        lines = [json.loads(line) for line in self.export('jsonl').splitlines()]
+        parquet = pq.ParquetFile(io.BytesIO(self.export('parquet')))
+        table = parquet.read()
+
+        self.assertEqual([row['id'] for row in rows], [str(article.pk) for article in self.articles])
+        self.assertEqual(rows[0]['authors'], 'Ann|Bob')
+        self.assertEqual(rows[0]['body'], 'Line one, "quoted"\nline two')
+        self.assertEqual(lines[0]['images'], ['https://portal0.test/a.jpg'])
+        self.assertEqual(lines[0]['published_at'], '2024-03-01T23:30:00+00:00')
+        self.assertEqual(lines[1]['authors'], [])
+        self.assertEqual(table.column_names, export.COLUMNS)
+        self.assertEqual(table.to_pylist()[0]['authors'], ['Ann', 'Bob'])
+        self.assertEqual(parquet.num_row_groups, 2)
+
+    def test_filters(self):
+        by_portal = export.article_queryset(portal_ids=[self.portals[1].pk])
+        self.assertEqual(list(by_portal.values_list('title', flat=True)), ['A1'])
+
+        # Date bounds include the whole end day
+        by_date = export.article_queryset(start=date(2024, 3, 2), end=date(2024, 3, 2))
+        self.assertEqual(list(by_date.values_list('title', flat=True)), ['A1'])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export.stream_articles(export.article_queryset(), 'xml')
+
+
+@override_settings(FETCHER_RETRY_BACKOFF=60, FETCHER_MAX_ATTEMPTS=3)
+class FetcherTests(TestCase):
+    def setUp(self):
+        portal = NewsPortal.objects.create(domain='portal.test', name='Portal')
+        ItemSelector.objects.bulk_create([
+            ItemSelector(portal=portal, item='title', method='css', query='h1::text'),
+            ItemSelector(portal=portal, item='published_at', method='css', query='time::attr(datetime)'),
+        ])
+        self.urls = {path: create_clean_url(portal, path) for path in ('ok', 'flaky', 'gone', 'down')}
+        # 503 responses left per path
+        self.failures = {'flaky': 1, 'down': 10}
+
+    def respond(self, request):
+        path = request.url.path.strip('/')
+        if path == 'gone':
+            return httpx.Response(404)
+        if self.failures.get(path):
+            self.failures[path] -= 1
+            return httpx.Response(503)
+        return httpx.Response(200, html=f'<h1>{path}</h1><time datetime="2024-03-01T10:00:00Z"></time>')
+
+    def fetch(self):
+        transport = httpx.MockTransport(self.respond)
+        with mock.patch('apps.common.fetcher.portal_client', lambda limit: httpx.AsyncClient(transport=transport)):
+            return fetcher.fetch_pending_articles()
+
+    def url(self, path):
+        return NewsArticleCleanUrl.objects.get(pk=self.urls[path].pk)
+
+    def make_due(self):
+        NewsArticleCleanUrl.objects.filter(next_fetch_at__isnull=False).update(next_fetch_at=timezone.now())
+
+    def test_transient_failures_back_off_until_the_last_attempt(self):
+        started = timezone.now()
+        result = self.fetch()
+        self.assertEqual((result['completed'], result['retried'], result['failed']), (1, 2, 1))
+        self.assertEqual(self.url('ok').status, NewsArticleUrlStatusChoices.COMPLETED)
+        self.assertEqual(self.url('gone').status, NewsArticleUrlStatusChoices.FAILED)
+        down = self.url('down')
+        self.assertEqual((down.status, down.fetch_attempts), (NewsArticleUrlStatusChoices.PENDING, 1))
+        self.assertGreaterEqual(down.next_fetch_at, started + timedelta(seconds=60))
+
+        # Not claimed again before the backoff runs out
+        self.assertEqual(self.fetch()['processed'], 0)
+
+        self.make_due()
+        started = timezone.now()
+        result = self.fetch()
+        self.assertEqual((result['processed'], result['completed'], result['retried']), (2, 1, 1))
+        self.assertEqual(self.url('flaky').status, NewsArticleUrlStatusChoices.COMPLETED)
+        down = self.url('down')
+        self.assertEqual(down.fetch_attempts, 2)
+        self.assertGreaterEqual(down.next_fetch_at, started + timedelta(seconds=120))
+
+        self.make_due()
+        result = self.fetch()
+        self.assertEqual((result['retried'], result['failed']), (0, 1))
+        self.assertEqual(self.url('down').status, NewsArticleUrlStatusChoices.FAILED)
+
+    def test_stale_running_urls_are_claimed_again(self):
+        NewsArticleCleanUrl.objects.filter(pk=self.urls['ok'].pk).update(
+            status=NewsArticleUrlStatusChoices.RUNNING, updated_at=timezone.now() - timedelta(hours=1)
+        )
+        NewsArticleCleanUrl.objects.exclude(pk=self.urls['ok'].pk).update(status=NewsArticleUrlStatusChoices.RUNNING)
+
+        self.assertEqual([row[0] for row in fetcher.claim_pending()], [self.urls['ok'].pk])
+
+    def test_transient_statuses(self):
+        self.assertEqual([code for code in (200, 304, 404, 410, 429, 500, 503) if fetcher.is_transient(code)], [429, 500, 503])
+
+
+class ValidatorStoreTests(TestCase):
+    URL = 'https://portal.test/news'
+
+    def respond(self, status_code, **kwargs):
+        store = conditional.ValidatorStore([self.URL])
+        changed = store.update(self.URL, status_code, **kwargs)
+        store.save()
+        return changed
+
+    def test_validators_are_sent_back_and_304_is_unchanged(self):
+        self.assertTrue(self.respond(200, etag='"v1"', last_modified='Fri, 01 Mar 2024 10:00:00 GMT', body=b'page'))
+
+        store = conditional.ValidatorStore([self.URL])
+        self.assertEqual(store.headers(self.URL), {'If-None-Match': '"v1"', 'If-Modified-Since': 'Fri, 01 Mar 2024 10:00:00 GMT'})
+        self.assertFalse(self.respond(304))
+        self.assertEqual(UrlValidator.objects.get().unchanged_count, 1)
+
+    def test_identical_body_without_validators_is_unchanged(self):
+        self.assertTrue(self.respond(200, body=b'page'))
+        self.assertFalse(self.respond(200, body=b'page'))
+        self.assertTrue(self.respond(200, body=b'new page'))
+
+        validator = UrlValidator.objects.get()
+        self.assertEqual((validator.unchanged_count, validator.content_hash), (0, conditional.content_hash(b'new page')))
+        self.assertEqual(conditional.ValidatorStore([self.URL]).headers(self.URL), {})
+
+    def test_discarded_updates_keep_the_stored_validators(self):
+        self.respond(200, etag='"v1"', body=b'page')
+        store = conditional.ValidatorStore([self.URL])
+        store.update(self.URL, 200, etag='"v2"', body=b'new page')
+        store.discard(self.URL)
+
+        self.assertEqual(store.save(), 0)
+        self.assertEqual(UrlValidator.objects.get().etag, '"v1"')
+
+    def test_oversized_values_are_not_stored(self):
+        self.respond(200, etag='x' * 300, body=b'page')
+        self.assertIsNone(UrlValidator.objects.get().etag)
+
+        long_url = 'https://portal.test/' + 'a' * conditional.URL_MAX_LENGTH
+        store = conditional.ValidatorStore([long_url])
+        self.assertTrue(store.update(long_url, 200, body=b'page'))
+        self.assertTrue(store.update(long_url, 200, body=b'page'))
+        self.assertEqual(store.save(), 0)
+
+    def test_spider_reports(self):
+        digest = conditional.content_hash(b'page')
+        self.assertEqual(conditional.record_responses([{'url': self.URL, 'status': 200, 'content_hash': digest}]), [True])
+        self.assertEqual(conditional.record_responses([{'url': self.URL, 'status': 200, 'content_hash': digest}]), [False])
+        self.assertEqual(conditional.spider_validators([self.URL])[self.URL]['content_hash'], digest)
+
+
+class ScheduleIntervalTests(SimpleTestCase):
+    def interval(self, rate, min_interval=15, max_interval=120):
+        task = CrawlerScheduledTask(min_interval=min_interval, max_interval=max_interval, target_new_urls=20)
+        return schedule.next_interval(task, rate)
+
+    def test_interval_stays_within_the_bounds(self):
+        self.assertEqual(self.interval(20), timedelta(minutes=60))
+        self.assertEqual(self.interval(1000), timedelta(minutes=15))
+        self.assertEqual(self.interval(0.5), timedelta(minutes=120))
+        self.assertEqual(self.interval(0), timedelta(minutes=120))
+        self.assertEqual(self.interval(1000, min_interval=120, max_interval=15), timedelta(minutes=15))
+
+    @override_settings(RECRAWL_RATE_SMOOTHING=0.25)
+    def test_smoothing(self):
+        self.assertEqual(schedule.smooth_rate(8, None), 8)
+        self.assertEqual(schedule.smooth_rate(8, 4), 5)
+
+
+@override_settings(RECRAWL_RATE_WINDOW_HOURS=10, RECRAWL_RATE_SMOOTHING=1)
+class AdaptiveScheduleTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.portals = NewsPortal.objects.bulk_create([NewsPortal(domain=f'portal{i}.test', name=f'Portal {i}') for i in range(2)])
+        selector = ItemSelector.objects.create(portal=self.portals[0], item='url_list', query='a::attr(href)')
+        self.tasks = [
+            CrawlerScheduledTask.objects.create(
+                crawler_config=CrawlerConfig.objects.create(name=portal.name, portal=portal, item_selector=selector),
+                name=portal.name, schedule_mode=ScheduleModeChoices.ADAPTIVE, min_interval=15, max_interval=600,
+                target_new_urls=20,
+            ) for portal in self.portals
+        ]
+
+    def add_urls(self, portal, count, hours_ago):
+        rows = NewsArticleRawUrl.objects.bulk_create([
+            NewsArticleRawUrl(url=f'https://{portal.domain}/{hours_ago}-{i}', portal=portal) for i in range(count)
+        ])
+        NewsArticleRawUrl.objects.filter(id__in=[row.id for row in rows]).update(created_at=self.now - timedelta(hours=hours_ago))
+
+    def test_rates_count_the_window_or_the_portal_age(self):
+        self.add_urls(self.portals[0], 30, hours_ago=20)
+        self.add_urls(self.portals[0], 40, hours_ago=8)
+        self.add_urls(self.portals[1], 5, hours_ago=0)
+
+        rates = schedule.discovery_rates([portal.id for portal in self.portals], now=self.now)
+
+        # 40 URLs over the 8 hours since the first one in the window; a brand new burst counts as one hour
+        self.assertEqual(rates, {self.portals[0].id: 5.0, self.portals[1].id: 5.0})
+
+    def test_due_tasks_are_claimed_once(self):
+        self.add_urls(self.portals[0], 40, hours_ago=2)
+        CrawlerScheduledTask.objects.filter(pk=self.tasks[1].pk).update(next_run=self.now + timedelta(minutes=5))
+
+        claimed = schedule.claim_due(now=self.now)
+
+        self.assertEqual([task.pk for task in claimed], [self.tasks[0].pk])
+        task = CrawlerScheduledTask.objects.get(pk=self.tasks[0].pk)
+        self.assertEqual(task.estimated_rate, 20.0)
+        self.assertEqual(task.next_run, self.now + timedelta(minutes=60))
+        self.assertEqual(task.last_run, self.now)
+        self.assertEqual(schedule.claim_due(now=self.now), [])
+
+
+class LookupCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.portal = NewsPortal.objects.create(domain='portal.test', name='Portal')
+
+    def test_lookups_are_served_from_the_cache(self):
+        self.assertEqual([portal.name for portal in caching.portals()], ['Portal'])
+        with self.assertNumQueries(0):
+            self.assertEqual([portal.name for portal in caching.portals()], ['Portal'])
+
+    def test_edits_invalidate_once_committed(self):
+        caching.portals()
+        caching.seed_urls()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.portal.name = 'Renamed'
+            self.portal.save()
+            # Other requests keep the committed data until the edit commits
+            self.assertEqual([portal.name for portal in caching.portals()], ['Portal'])
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual([portal.name for portal in caching.portals()], ['Renamed'])
+        with self.assertNumQueries(1):
+            caching.seed_urls()
+
+    def test_raw_url_lookups_are_per_portal(self):
+        other = NewsPortal.objects.create(domain='other.test', name='Other')
+        self.assertEqual(caching.portal_raw_urls(self.portal.pk), [])
+        caching.portal_raw_urls(other.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            NewsArticleRawUrl.objects.create(url='https://portal.test/a', portal=self.portal)
+
+        self.assertEqual([row['url'] for row in caching.portal_raw_urls(self.portal.pk)], ['https://portal.test/a'])
+        with self.assertNumQueries(0):
+            caching.portal_raw_urls(other.pk)
+
+    def test_evicted_versions_start_past_the_old_ones(self):
+        before = caching.versions(['portals'])['portals']
+        cache.delete(caching._version_key('portals'))
+        self.assertGreater(caching.versions(['portals'])['portals'], before)
+
+    @override_settings(LOOKUP_CACHE_MAX_ROWS=0)
+    def test_large_results_are_not_cached(self):
+        caching.portals()
+        with self.assertNumQueries(1):
+            caching.portals()
@@ -0,0 +1,250 @@
+"""
+Time-series aggregation
+
+Buckets article volume and task outcomes in the database (hour / day / week)
+so callers get one row per bucket and series instead of every matching row.
+
+Article volume is served from the PortalDailyStats rollups (apps.common.stats)
+when the request allows it: day or week buckets over whole days, once the
+rollups have been reconciled. Hourly buckets and the fallback path group the
+source tables directly.
+
+Results are cached per query; ranges that end before today are immutable
+apart from late ingestion and are kept longer.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Union
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncWeek
+from django.utils import timezone
+from django_celery_results.models import TaskResult
+
+from .models import NewsArticle, NewsPortal, CrawlerTask, PortalDailyStats
+from . import metrics, stats
+
+
+INTERVALS = {
+    'hour': TruncHour,
+    'day': TruncDay,
+    'week': TruncWeek,
+}
+
+# Article date field -> PortalDailyStats column counting it
+ARTICLE_DATE_FIELDS = {
+    'published_at': 'published',
+    'created_at': 'articles',
+}
+
+MAX_BUCKETS = 5000
+DEFAULT_CACHE_TTL = 60
+DEFAULT_CLOSED_RANGE_CACHE_TTL = 60 * 60
+
+DateLike = Union[date, datetime]
+
+
+def _as_datetime(value: DateLike, end: bool = False) -> datetime:
+    """Whole dates cover the full day: start at 00:00, end before the next midnight"""
+    if not isinstance(value, datetime):
+        value = datetime.combine(value + timedelta(days=1) if end else value, time.min)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def _bucket_key(value, interval: str = 'hour') -> Optional[str]:
+    """ISO bucket label; day and week buckets are labelled with their first date"""
+    if value is None:
+        return None
+    if interval != 'hour' and isinstance(value, datetime):
+        value = timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value.isoformat()
+
+
+def _check_range(interval: str, start: DateLike, end: DateLike) -> None:
+    """
+    Raises:
+        ValueError: On an unknown interval, an inverted range or too many buckets
+    """
+    if interval not in INTERVALS:
+        raise ValueError(f"Unknown interval: {interval}")
+    span = _as_datetime(end, end=True) - _as_datetime(start)
+    if span <= timedelta(0):
+        raise ValueError("Range end must be after its start")
+    step = {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}[interval]
+    if span / step > MAX_BUCKETS:
+        raise ValueError(f"Range too large for {interval} buckets (max {MAX_BUCKETS})")
+
+
+def _cache_ttl(end: DateLike) -> int:
+    end_day = end.date() if isinstance(end, datetime) else end
+    if end_day < timezone.localdate():
+        return getattr(settings, 'TIMESERIES_CLOSED_RANGE_CACHE_TTL', DEFAULT_CLOSED_RANGE_CACHE_TTL)
+    return getattr(settings, 'TIMESERIES_CACHE_TTL', DEFAULT_CACHE_TTL)
+
+
+def _cached(prefix: str, params: Dict, end: DateLike, compute):
+    digest = hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    key = f"timeseries:{prefix}:{digest}"
+    result = cache.get(key)
+    metrics.record_cache('timeseries', result is not None)
+    if result is None:
+        result = compute()
+        cache.set(key, result, _cache_ttl(end))
+    return result
+
+
+def _series(rows: Iterable, interval: str, names: Optional[Dict] = None) -> List[Dict]:
+    """Group (series key, bucket, count) rows into [{'name', 'data': [[bucket, count], ...]}]"""
+    grouped = OrderedDict()
+    for key, bucket, count in rows:
+        name = names.get(key, key) if names else key
+        grouped.setdefault(name, []).append([_bucket_key(bucket, interval), count])
+    return [{'name': str(name), 'data': sorted(data)} for name, data in grouped.items()]
+
+
+def rollups_available() -> bool:
+    return stats.is_reconciled()
+
+
+def article_volume(interval: str, start: DateLike, end: DateLike, portal_ids: Optional[List[int]] = None,
+                   scope: Optional[str] = None, country: Optional[str] = None,
+                   date_field: str = 'published_at', by_portal: bool = False,
+                   use_rollups: bool = True) -> Dict:
+    """
+    Article counts per bucket
+
+    Args:
+        interval: 'hour', 'day' or 'week'
+        start: Range start (dates start at midnight)
+        end: Range end (dates are inclusive)
+        portal_ids: Restrict to these portals (optional)
+        scope: Portal news_scope filter (optional)
+        country: Portal country code filter (optional)
+        date_field: 'published_at' or 'created_at'
+        by_portal: One series per portal instead of a single total
+        use_rollups: Allow serving from PortalDailyStats
+
+    Returns:
+        Dict with interval, start, end, source ('rollup' or 'table') and series
+
+    Raises:
+        ValueError: On invalid parameters
+    """
+    if date_field not in ARTICLE_DATE_FIELDS:
+        raise ValueError(f"Unknown date field: {date_field}")
+    _check_range(interval, start, end)
+
+    params = {
+        'interval': interval, 'start': start, 'end': end, 'portal_ids': sorted(portal_ids or []),
+        'scope': scope, 'country': country, 'date_field': date_field, 'by_portal': by_portal,
+        'use_rollups': use_rollups,
+    }
+
+    def compute():
+        whole_days = not isinstance(start, datetime) and not isinstance(end, datetime)
+        if use_rollups and interval != 'hour' and whole_days and rollups_available():
+            source = 'rollup'
+            queryset = PortalDailyStats.objects.filter(date__gte=start, date__lte=end)
+            portal_prefix = 'portal'
+            bucket = TruncWeek('date') if interval == 'week' else F('date')
+            value = Sum(ARTICLE_DATE_FIELDS[date_field])
+        else:
+            source = 'table'
+            queryset = NewsArticle.objects.filter(**{
+                f'{date_field}__gte': _as_datetime(start),
+                f'{date_field}__lt': _as_datetime(end, end=True),
+            })
+            portal_prefix = 'article_url__portal'
+            bucket = INTERVALS[interval](date_field)
+            value = Count('id')
+
+        if portal_ids:
+            queryset = queryset.filter(**{f'{portal_prefix}_id__in': portal_ids})
+        if scope:
+            queryset = queryset.filter(**{f'{portal_prefix}__news_scope': scope})
+        if country:
+            queryset = queryset.filter(**{f'{portal_prefix}__country': country})
+
+        queryset = queryset.order_by().annotate(bucket=bucket)
+        key_field = f'{portal_prefix}_id' if by_portal else None
+        group = [key_field, 'bucket'] if key_field else ['bucket']
+        rows = queryset.values(*group).annotate(n=value).values_list(*group, 'n')
+
+        if by_portal:
+            rows = list(rows)
+            names = dict(NewsPortal.objects.filter(id__in={row[0] for row in rows}).values_list('id', 'name'))
+            series = _series(rows, interval, names)
+        else:
+            series = _series((('total', bucket_value, n) for bucket_value, n in rows), interval)
+
+        return {
+            'interval': interval,
+            'start': _bucket_key(start),
+            'end': _bucket_key(end),
+            'source': source,
+            'series': series,
+        }
+
+    return _cached('articles', params, end, compute)
+
+
+def task_outcomes(interval: str, start: DateLike, end: DateLike, kind: str = 'crawler',
+                  portal_ids: Optional[List[int]] = None, task_name: Optional[str] = None) -> Dict:
+    """
+    Task counts per bucket, one series per status
+
+    Args:
+        interval: 'hour', 'day' or 'week'
+        start: Range start
+        end: Range end
+        kind: 'crawler' for CrawlerTask rows, 'celery' for Celery task results
+        portal_ids: Restrict crawler tasks to these portals (optional)
+        task_name: Restrict Celery results to one task name (optional)
+
+    Raises:
+        ValueError: On invalid parameters
+    """
+    if kind not in ('crawler', 'celery'):
+        raise ValueError(f"Unknown task kind: {kind}")
+    _check_range(interval, start, end)
+
+    params = {
+        'interval': interval, 'start': start, 'end': end, 'kind': kind,
+        'portal_ids': sorted(portal_ids or []), 'task_name': task_name,
+    }
+
+    def compute():
+        if kind == 'crawler':
+            date_field = 'created_at'
+            queryset = CrawlerTask.objects.all()
+            if portal_ids:
+                queryset = queryset.filter(crawler_config__portal_id__in=portal_ids)
+        else:
+            date_field = 'date_created'
+            queryset = TaskResult.objects.all()
+            if task_name:
+                queryset = queryset.filter(task_name=task_name)
+
+        rows = queryset.filter(**{
+            f'{date_field}__gte': _as_datetime(start),
+            f'{date_field}__lt': _as_datetime(end, end=True),
+        }).order_by().annotate(bucket=INTERVALS[interval](date_field)).values('status', 'bucket').annotate(
+            n=Count('id')
+        ).values_list('status', 'bucket', 'n')
+
+        return {
+            'interval': interval,
+            'start': _bucket_key(start),
+            'end': _bucket_key(end),
+            'source': 'table',
+            'series': _series(rows, interval),
+        }
+
+    return _cached(f'tasks:{kind}', params, end, compute)
@@ -25,6 +25,8 @@ urlpatterns = [
     # News Articles
     path('news-articles/', views.news_articles_list, name='news_articles_list'),
     path('news-articles/create/', views.news_article_create, name='news_article_create'),
+    path('news-articles/export/', views.news_articles_export, name='news_articles_export'),
+    path('news-articles/<int:pk>/', views.news_article_detail, name='news_article_detail'),
     path('news-articles/<int:pk>/edit/', views.news_article_edit, name='news_article_edit'),
     path('news-articles/<int:pk>/delete/', views.news_article_delete, name='news_article_delete'),
     
@@ -33,6 +35,7 @@ urlpatterns = [
     path('selectors/create/', views.selector_create, name='selector_create'),
     path('selectors/<int:pk>/edit/', views.selector_edit, name='selector_edit'),
     path('selectors/<int:pk>/delete/', views.selector_delete, name='selector_delete'),
+    path('selectors/benchmark/', views.selector_benchmark, name='selector_benchmark'),
     
     # Crawler Configs
     path('crawler-configs/', views.crawler_configs_list, name='crawler_configs_list'),
@@ -56,4 +59,7 @@ urlpatterns = [
     # AJAX endpoints
     path('ajax/get-portal-selectors/', views.get_portal_selectors, name='get_portal_selectors'),
     path('ajax/get-portal-raw-urls/', views.get_portal_raw_urls, name='get_portal_raw_urls'),
+    
+    # Bulk import
+    path('bulk-import/', views.bulk_import, name='bulk_import'),
 ] 
\ No newline at end of file
@@ -1,15 +1,28 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib import messages
-from django.core.paginator import Paginator
 from django.db.models import Q
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse, HttpResponseBadRequest
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django_countries import countries
+import csv
 import json
 from django.utils import timezone
+from django.utils.html import escape
+from django.utils.text import Truncator
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import urlencode
+from django.http import Http404
 from core.decorators import feature_required
+from .pagination import CursorPaginator, ListCursorPaginator
+from .search import search_articles
+from .archive import get_archived_article, get_archived_articles, search_archive
+from .export import FORMATS as EXPORT_FORMATS, article_queryset, stream_articles
+from .importer import detect_format, import_file
+from .selector_bench import stored_report
+from . import caching
 
 from .models import (
     NewsPortal, NewsArticleRawUrl, NewsArticleCleanUrl, NewsArticle,
@@ -20,7 +33,7 @@ from .forms import (
     NewsPortalForm, NewsArticleRawUrlForm, NewsArticleCleanUrlForm,
     NewsArticleForm, NewsArticleAuthorForm, NewsArticleImageForm,
     NewsPortalSeedUrlForm, ItemSelectorForm, CrawlerConfigForm, ScraperConfigForm,
-    CrawlerTaskForm, CrawlerScheduledTaskForm
+    CrawlerTaskForm, CrawlerScheduledTaskForm, BulkImportForm, SelectorBenchmarkForm
 )
 
 # News Portal CRUD
@@ -38,9 +51,8 @@ def news_portals_list(request):
             Q(city__icontains=search_query)
         )
     
-    paginator = Paginator(portals, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(portals, 10)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'page_obj': page_obj,
@@ -128,9 +140,8 @@ def news_article_raw_urls_list(request):
             Q(portal__name__icontains=search_query)
         )
     
-    paginator = Paginator(raw_urls, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(raw_urls, 10)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'page_obj': page_obj,
@@ -217,9 +228,8 @@ def news_article_clean_urls_list(request):
             Q(portal__name__icontains=search_query)
         )
     
-    paginator = Paginator(clean_urls, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(clean_urls, 10)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'page_obj': page_obj,
@@ -293,6 +303,23 @@ def news_article_clean_url_delete(request, pk):
     return render(request, 'pages/CRUD/news-article-clean-url-delete.html', context)
 
 # News Articles CRUD
+def archive_search_filters(request):
+    """Portal and publication date filters (?portal=1,2, ?start=, ?end=) narrowing the archive search, invalid ones ignored"""
+    filters = {}
+    portal_ids = [pk for pk in request.GET.get('portal', '').split(',') if pk.strip().isdigit()]
+    if portal_ids:
+        filters['portal_ids'] = [int(pk) for pk in portal_ids]
+    for name in ('start', 'end'):
+        value = request.GET.get(name)
+        if value:
+            try:
+                parsed = parse_date(value) or parse_datetime(value)
+            except ValueError:
+                parsed = None
+            if parsed:
+                filters[name] = parsed
+    return filters
+
 @login_required
 @feature_required('SHOW_CRUD_NEWS_ARTICLES')
 def news_articles_list(request):
@@ -301,24 +328,92 @@ def news_articles_list(request):
     articles = NewsArticle.objects.select_related('article_url__portal').prefetch_related('authors', 'images').all()
     
     if search_query:
-        articles = articles.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(article_url__portal__name__icontains=search_query)
-        )
-    
-    paginator = Paginator(articles, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        # Ranked full-text hits, then archived title matches; only the current page of articles is loaded
+        hits = search_articles(search_query) + search_archive(search_query, **archive_search_filters(request))
+        paginator = ListCursorPaginator(hits, 10)
+        page_obj = paginator.get_page(request.GET.get('cursor'))
+        page_hits = list(page_obj)
+        articles_by_id = articles.in_bulk([hit.article_id for hit in page_hits])
+        missing = [hit.article_id for hit in page_hits if hit.article_id not in articles_by_id]
+        if missing:
+            articles_by_id.update(get_archived_articles(missing))
+        page_obj.object_list = []
+        for hit in page_hits:
+            article = articles_by_id.get(hit.article_id)
+            if article:
+                article.search_title = hit.title_html
+                article.search_snippet = hit.snippet_html or escape(Truncator(article.description or '').chars(160))
+                page_obj.object_list.append(article)
+    else:
+        paginator = CursorPaginator(articles, 10)
+        page_obj = paginator.get_page(request.GET.get('cursor'))
     
+    # Keep the archive filters on the pagination links
+    filter_query = urlencode([(name, request.GET[name]) for name in ('portal', 'start', 'end') if request.GET.get(name)])
+
     context = {
         'page_obj': page_obj,
         'search_query': search_query,
+        'filter_query': filter_query,
+        'filters': {name: request.GET.get(name, '') for name in ('portal', 'start', 'end')},
         'segment': 'news_articles',
         'parent': 'crud'
     }
     return render(request, 'pages/CRUD/news-articles.html', context)
 
+@login_required
+@feature_required('SHOW_CRUD_NEWS_ARTICLES')
+def news_articles_export(request):
+    """Stream news articles as CSV, JSON Lines or Parquet (?format=, ?portal=1,2, ?start=, ?end=)"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest(f"Unknown format: {export_format}")
+    try:
+        portal_ids = [int(pk) for pk in request.GET.get('portal', '').split(',') if pk.strip()]
+    except ValueError:
+        return HttpResponseBadRequest("Expected comma separated portal ids")
+    dates = {}
+    for name in ('start', 'end'):
+        value = request.GET.get(name)
+        if value:
+            try:
+                dates[name] = parse_date(value) or parse_datetime(value)
+            except ValueError:
+                dates[name] = None
+            if dates[name] is None:
+                return HttpResponseBadRequest(f"Invalid {name} date: {value}")
+    
+    content_type, extension = EXPORT_FORMATS[export_format]
+    queryset = article_queryset(portal_ids=portal_ids, **dates)
+    response = StreamingHttpResponse(stream_articles(queryset, export_format), content_type=content_type)
+    filename = f"news-articles-{timezone.now():%Y%m%d-%H%M%S}.{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@login_required
+@feature_required('SHOW_CRUD_NEWS_ARTICLES')
+def news_article_detail(request, pk):
+    """Show a news article, reading it from the Parquet archive once it has been archived"""
+    article = NewsArticle.objects.select_related('article_url__portal').prefetch_related('authors', 'images').filter(pk=pk).first()
+    if article:
+        authors = [author.name for author in article.authors.all()]
+        images = [image.image_url for image in article.images.all()]
+    else:
+        article = get_archived_article(pk)
+        if not article:
+            raise Http404("News article not found")
+        authors = article.authors or []
+        images = article.images or []
+    
+    context = {
+        'article': article,
+        'authors': authors,
+        'images': images,
+        'segment': 'news_articles',
+        'parent': 'crud'
+    }
+    return render(request, 'pages/CRUD/news-article-detail.html', context)
+
 @login_required
 @feature_required('SHOW_CRUD_NEWS_ARTICLES')
 def news_article_create(request):
@@ -396,13 +491,12 @@ def selectors_list(request):
             Q(portal__name__icontains=search_query)
         )
     
-    paginator = Paginator(selectors, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(selectors, 10)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
-    # Get all portals and selectors for the forms
-    portals = NewsPortal.objects.all()
-    all_selectors = ItemSelector.objects.all()
+    # Get all portals and selectors for the forms (cached until one changes)
+    portals = caching.portals()
+    all_selectors = caching.selectors()
     
     context = {
         'page_obj': page_obj,
@@ -464,6 +558,37 @@ def selector_delete(request, pk):
     # If it's a GET request, redirect to the list page
     return redirect('common:selectors_list')
 
+@login_required
+@feature_required('SHOW_CRUD_SELECTORS')
+def selector_benchmark(request):
+    """Queue a timing run of a portal's selectors and show the last stored runs"""
+    if request.method == 'POST':
+        form = SelectorBenchmarkForm(request.POST)
+        if form.is_valid():
+            from apps.tasks.tasks import benchmark_portal_selectors
+
+            portal = form.cleaned_data['portal']
+            benchmark_portal_selectors.delay(
+                portal.id, budget_ms=form.cleaned_data['budget_ms'], capture=form.cleaned_data['capture']
+            )
+            messages.success(request, f'Benchmark of {portal.domain} queued; reload this page once the task has finished.')
+            return redirect(f"{reverse('common:selector_benchmark')}?portal={portal.id}")
+    else:
+        form = SelectorBenchmarkForm(initial={'portal': request.GET.get('portal')})
+
+    report = None
+    portal_id = request.GET.get('portal')
+    if portal_id and portal_id.isdigit() and NewsPortal.objects.filter(id=portal_id).exists():
+        report = stored_report(int(portal_id))
+
+    context = {
+        'form': form,
+        'report': report,
+        'segment': 'selectors',
+        'parent': 'crud'
+    }
+    return render(request, 'pages/CRUD/selector-benchmark.html', context)
+
 # Crawler Configs CRUD
 @login_required
 @feature_required('SHOW_CRUD_CRAWLER_CONFIGS')
@@ -478,16 +603,15 @@ def crawler_configs_list(request):
             Q(portal__name__icontains=search_query)
         )
     
-    paginator = Paginator(configs, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(configs, 10)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
-    # Get all portals and selectors for the forms
-    portals = NewsPortal.objects.all()
-    selectors = ItemSelector.objects.all()
+    # Get all portals and selectors for the forms (cached until one changes)
+    portals = caching.portals()
+    selectors = caching.selectors()
     
     # Get seed URLs for each portal
-    seed_urls = NewsPortalSeedUrl.objects.select_related('portal').all()
+    seed_urls = caching.seed_urls()
     
     context = {
         'page_obj': page_obj,
@@ -660,13 +784,12 @@ def scraper_configs_list(request):
             Q(portal__name__icontains=search_query)
         )
     
-    paginator = Paginator(configs, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(configs, 10)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
-    # Get all portals and selectors for the forms
-    portals = NewsPortal.objects.all()
-    selectors = ItemSelector.objects.all()
+    # Get all portals and selectors for the forms (cached until one changes)
+    portals = caching.portals()
+    selectors = caching.selectors()
     
     context = {
         'page_obj': page_obj,
@@ -744,12 +867,11 @@ def seed_urls_list(request):
             Q(portal__domain__icontains=search_query)
         )
     
-    paginator = Paginator(seed_urls, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(seed_urls, 10)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
-    # Get all portals for the forms
-    portals = NewsPortal.objects.all()
+    # Get all portals for the forms (cached until one changes)
+    portals = caching.portals()
     
     context = {
         'page_obj': page_obj,
@@ -818,9 +940,7 @@ def get_portal_selectors(request):
     """Get selectors for a specific portal"""
     portal_id = request.POST.get('portal_id')
     if portal_id:
-        selectors = ItemSelector.objects.filter(portal_id=portal_id)
-        data = [{'id': selector.id, 'query': selector.query, 'item': selector.item, 'method': selector.method} for selector in selectors]
-        return JsonResponse({'selectors': data})
+        return JsonResponse({'selectors': caching.portal_selectors(portal_id)})
     return JsonResponse({'selectors': []})
 
 
@@ -830,7 +950,40 @@ def get_portal_raw_urls(request):
     """Get raw URLs for a specific portal"""
     portal_id = request.POST.get('portal_id')
     if portal_id:
-        raw_urls = NewsArticleRawUrl.objects.filter(portal_id=portal_id)
-        data = [{'id': url.id, 'url': url.url, 'status': url.status} for url in raw_urls]
-        return JsonResponse({'raw_urls': data})
-    return JsonResponse({'raw_urls': []}) 
\ No newline at end of file
+        return JsonResponse({'raw_urls': caching.portal_raw_urls(portal_id)})
+    return JsonResponse({'raw_urls': []}) 
+
+# Bulk import
+@login_required
+@feature_required('SHOW_CRUD_NEWS_PORTALS')
+def bulk_import(request):
+    """Upload portals, seed URLs or selectors from a CSV/JSON file"""
+    result = None
+    if request.method == 'POST':
+        form = BulkImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                result = import_file(
+                    form.cleaned_data['kind'], upload.file, detect_format(upload.name),
+                    dry_run=form.cleaned_data['dry_run']
+                )
+            except (ValueError, csv.Error) as e:
+                messages.error(request, f'Could not read {upload.name}: {e}')
+            else:
+                verb = 'Validated' if result['dry_run'] else 'Imported'
+                messages.success(
+                    request,
+                    f"{verb} {result['rows']} rows: {result['created']} created, "
+                    f"{result['updated']} updated, {result['invalid']} invalid."
+                )
+    else:
+        form = BulkImportForm()
+    
+    context = {
+        'form': form,
+        'result': result,
+        'segment': 'bulk_import',
+        'parent': 'crud'
+    }
+    return render(request, 'pages/CRUD/bulk-import.html', context)
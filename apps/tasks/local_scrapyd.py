@@ -0,0 +1,478 @@
+"""
+Local execution backend
+
+LocalScrapydAPI answers the Scrapyd calls the crawler tasks make (schedule,
+cancel, listjobs, get_log, get_items) without a Scrapyd server, so crawls
+can run on a laptop or in CI (SCRAPYD_BACKEND = 'local'):
+
+- schedule() writes the job to SCRAPYD_LOCAL_DIR/jobs/<jobid>.json and
+  starts a worker (manage.py run_local_jobs) when fewer than
+  SCRAPYD_LOCAL_WORKERS are alive. State lives on disk, under a file lock,
+  so the web process, Celery workers and the job workers see the same queue
+- a worker claims pending jobs one at a time and exits once the queue is
+  empty. With SCRAPYD_LOCAL_RUNNER = 'extractor' a job is run in-process:
+  the seed pages of config_dict are fetched and their links extracted with
+  the portal's url_list selectors (apps.common.fetcher / extract), written
+  as items and queued as raw URLs. With 'scrapy' the job's spider is run
+  with `scrapy crawl` in SCRAPYD_LOCAL_SCRAPY_DIR
+- logs and items are written where Scrapyd keeps them
+  (logs/<project>/<spider>/<job>.log, items/.../<job>.jl) and listjobs()
+  reports jobs in Scrapyd's format, so parse_job_time / count_items and the
+  job views work unchanged. Only the last SCRAPYD_LOCAL_FINISHED_TO_KEEP
+  finished jobs are kept
+
+cancel() drops a pending job, or sends SIGTERM to the process running it;
+the worker then records the job as cancelled and moves on.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from .scrapyd_api import LOG_TAIL_BYTES, BaseScrapydAPI, ScrapydAPIError
+
+
+DEFAULT_WORKERS = 2
+DEFAULT_RUNNER = 'extractor'
+DEFAULT_FINISHED_TO_KEEP = 100
+DEFAULT_POLL_INTERVAL = 5
+PROJECT = 'scrapy_crawler'
+SPIDERS = ['generic']
+# schedule() parameters that are not spider arguments
+RESERVED_ARGS = ('project', 'spider', 'jobid', '_version', 'setting', 'priority')
+
+# Child processes started by this process, reaped on the next schedule()
+_children: List[subprocess.Popen] = []
+
+
+class JobCancelled(Exception):
+    """Raised in a worker by SIGTERM while it runs a job"""
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _root() -> str:
+    return str(_setting('SCRAPYD_LOCAL_DIR', os.path.join(settings.BASE_DIR, 'scrapyd_local')))
+
+
+def _dir(*parts: str) -> str:
+    path = os.path.join(_root(), *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _path(*parts: str) -> str:
+    return os.path.join(_dir(*parts[:-1]), parts[-1])
+
+
+def log_path(project: str, spider: str, job: str) -> str:
+    return _path('logs', project, spider, f'{job}.log')
+
+
+def items_path(project: str, spider: str, job: str) -> str:
+    return _path('items', project, spider, f'{job}.jl')
+
+
+def _now() -> str:
+    """Scrapyd's naive local time format, as read back by parse_job_time()"""
+    return str(timezone.localtime().replace(tzinfo=None))
+
+
+def _alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def _locked():
+    """Exclusive lock over the job and worker files, across processes"""
+    with open(_path('lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read_job(jobid: str) -> Optional[Dict]:
+    try:
+        with open(_path('jobs', f'{jobid}.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_job(job: Dict) -> None:
+    path = _path('jobs', f"{job['id']}.json")
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(job, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def _jobs() -> List[Dict]:
+    """Every job, oldest first"""
+    jobs = []
+    for name in os.listdir(_dir('jobs')):
+        if name.endswith('.json'):
+            job = _read_job(name[:-5])
+            if job:
+                jobs.append(job)
+    return sorted(jobs, key=lambda job: job['created'])
+
+
+def _finish(job: Dict, outcome: str) -> None:
+    job.update(state='finished', outcome=outcome, end_time=_now(), pid=None)
+    job['start_time'] = job.get('start_time') or job['end_time']
+    _write_job(job)
+
+
+def _reap_jobs(jobs: List[Dict]) -> None:
+    """Finish running jobs whose worker died, drop the oldest finished jobs past the limit (lock held)"""
+    for job in jobs:
+        if job['state'] == 'running' and not _alive(job.get('worker')):
+            _finish(job, 'lost')
+    finished = [job for job in jobs if job['state'] == 'finished']
+    for job in finished[:max(len(finished) - _setting('SCRAPYD_LOCAL_FINISHED_TO_KEEP', DEFAULT_FINISHED_TO_KEEP), 0)]:
+        for path in (_path('jobs', f"{job['id']}.json"), log_path(job['project'], job['spider'], job['id']),
+                     items_path(job['project'], job['spider'], job['id'])):
+            if os.path.exists(path):
+                os.remove(path)
+        jobs.remove(job)
+
+
+def _live_workers() -> List[int]:
+    """Pids of the registered workers still alive, stale registrations removed (lock held)"""
+    pids = []
+    for name in os.listdir(_dir('workers')):
+        if _alive(int(name)):
+            pids.append(int(name))
+        else:
+            os.remove(_path('workers', name))
+    return pids
+
+
+def _spawn_worker() -> None:
+    """Start a run_local_jobs worker in its own session, so it outlives this process (lock held)"""
+    _children[:] = [child for child in _children if child.poll() is None]
+    with open(_path('workers.log'), 'a') as errors:
+        child = subprocess.Popen(
+            [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'run_local_jobs'],
+            cwd=settings.BASE_DIR, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=errors,
+            start_new_session=True,
+        )
+    _children.append(child)
+    # Registered here rather than by the worker, so the next schedule() counts it
+    open(_path('workers', str(child.pid)), 'w').close()
+
+
+class LocalScrapydAPI(BaseScrapydAPI):
+    """Scrapyd API surface over local worker processes (see module docstring)"""
+
+    base_url = 'local'
+
+    def schedule(self, project: str, spider: str, **kwargs) -> Dict:
+        """Queue a job and make sure a worker will run it; returns {'status', 'jobid'} like Scrapyd"""
+        jobid = kwargs.get('jobid') or uuid.uuid4().hex
+        job = {
+            'id': jobid,
+            'project': project,
+            'spider': spider,
+            'args': {key: value for key, value in kwargs.items() if key not in RESERVED_ARGS},
+            'settings': kwargs.get('setting') or [],
+            'state': 'pending',
+            'created': time.time(),
+            'pid': None,
+            'worker': None,
+            'start_time': None,
+            'end_time': None,
+            'outcome': None,
+        }
+        with _locked():
+            _write_job(job)
+            if len(_live_workers()) < _setting('SCRAPYD_LOCAL_WORKERS', DEFAULT_WORKERS):
+                _spawn_worker()
+        return {'status': 'ok', 'jobid': jobid}
+
+    def cancel(self, project: str, job: str) -> Dict:
+        """Drop a pending job or terminate a running one; returns {'status', 'prevstate'} like Scrapyd"""
+        with _locked():
+            state = _read_job(job)
+            if state is None or state['project'] != project:
+                raise ScrapydAPIError(f"Job {job} not found in project {project}")
+            prevstate = state['state']
+            if prevstate == 'pending':
+                _finish(state, 'cancelled')
+            elif prevstate == 'running':
+                state['cancelled'] = True
+                _write_job(state)
+                if _alive(state['pid']):
+                    os.kill(state['pid'], signal.SIGTERM)
+        return {'status': 'ok', 'prevstate': prevstate}
+
+    def listprojects(self) -> Dict:
+        return {'status': 'ok', 'projects': [PROJECT]}
+
+    def listversions(self, project: str) -> Dict:
+        return {'status': 'ok', 'versions': []}
+
+    def listspiders(self, project: str, version: Optional[str] = None) -> Dict:
+        return {'status': 'ok', 'spiders': SPIDERS if project == PROJECT else []}
+
+    def listjobs(self, project: str) -> Dict:
+        with _locked():
+            jobs = _jobs()
+            _reap_jobs(jobs)
+        result = {'status': 'ok', 'node_name': 'local', 'pending': [], 'running': [], 'finished': []}
+        for job in jobs:
+            if job['project'] != project:
+                continue
+            info = {'id': job['id'], 'project': job['project'], 'spider': job['spider']}
+            if job['state'] in ('running', 'finished'):
+                info.update(pid=job['pid'], start_time=job['start_time'])
+            if job['state'] == 'finished':
+                info.update(
+                    end_time=job['end_time'], outcome=job['outcome'],
+                    log_url=f"/logs/{job['project']}/{job['spider']}/{job['id']}.log",
+                    items_url=f"/items/{job['project']}/{job['spider']}/{job['id']}.jl",
+                )
+            result[job['state']].append(info)
+        return result
+
+    def get_log(self, project: str, spider: str, job: str) -> str:
+        try:
+            with open(log_path(project, spider, job), encoding='utf-8', errors='replace') as f:
+                return f.read()
+        except OSError as e:
+            raise ScrapydAPIError(f"Error getting log: {str(e)}")
+
+    def get_log_tail(self, project: str, spider: str, job: str, size: int = LOG_TAIL_BYTES) -> str:
+        try:
+            with open(log_path(project, spider, job), 'rb') as f:
+                f.seek(max(os.fstat(f.fileno()).st_size - size, 0))
+                return f.read().decode('utf-8', errors='replace')
+        except OSError as e:
+            raise ScrapydAPIError(f"Error getting log: {str(e)}")
+
+    def get_items(self, project: str, spider: str, job: str) -> str:
+        try:
+            with open(items_path(project, spider, job), encoding='utf-8', errors='replace') as f:
+                return f.read()
+        except OSError as e:
+            raise ScrapydAPIError(f"Error getting items: {str(e)}")
+
+    def addversion(self, project: str, version: str, egg_file: str) -> Dict:
+        raise ScrapydAPIError("The local backend runs the spiders of SCRAPYD_LOCAL_SCRAPY_DIR, eggs cannot be deployed")
+
+    def delversion(self, project: str, version: str) -> Dict:
+        raise ScrapydAPIError("The local backend has no project versions")
+
+    def delproject(self, project: str) -> Dict:
+        raise ScrapydAPIError("The local backend has no deployed projects")
+
+
+def _claim_next(worker: int) -> Optional[Dict]:
+    """
+    Mark the oldest pending job running on this worker
+
+    Returns None, and unregisters the worker, when the queue is empty: both
+    happen under the lock schedule() takes, so no job is left without a worker.
+    """
+    with _locked():
+        for job in _jobs():
+            if job['state'] == 'pending':
+                job.update(state='running', pid=worker, worker=worker, start_time=_now())
+                _write_job(job)
+                return job
+        registration = _path('workers', str(worker))
+        if os.path.exists(registration):
+            os.remove(registration)
+    return None
+
+
+def _log(log, message: str, level: str = 'INFO') -> None:
+    log.write(f"{timezone.localtime():%Y-%m-%d %H:%M:%S} [local] {level}: {message}\n")
+    log.flush()
+
+
+def run_extractor(job: Dict, log, items) -> int:
+    """
+    Run a generic spider job in-process: fetch the seed pages and queue their links
+
+    Returns:
+        Number of items (links) written
+    """
+    from apps.common import conditional, extract, fetcher, seen_filter
+    from apps.common.models import ItemChoices, NewsPortal
+
+    config = json.loads(job['args'].get('config_dict') or '{}')
+    portal = NewsPortal.objects.filter(domain=config.get('portal_domain')).first()
+    if portal is None:
+        raise ValueError(f"Unknown portal_domain {config.get('portal_domain')!r}")
+    start_urls = config.get('start_urls') or []
+    if isinstance(start_urls, str):
+        start_urls = [start_urls]
+    selectors = [
+        (ItemChoices.URL_LIST, selector['method'], selector['query'])
+        for selector in (config.get('selectors') or {}).get('url_list', [])
+    ]
+    extractor = extract.Extractor(portal.id, selectors)
+    for error in extractor.errors:
+        _log(log, error, 'WARNING')
+
+    _log(log, f"Crawling {len(start_urls)} start URLs of {portal.domain}")
+    domains, concurrency = fetcher.portal_limits([portal.id])
+    store = conditional.ValidatorStore(start_urls)
+    pages = asyncio.run(fetcher.fetch_listings(
+        [(url, portal.id) for url in start_urls], {portal.id: extractor}, concurrency, store
+    ))
+    store.save()
+
+    links = {}
+    for url, page in zip(start_urls, pages):
+        _log(log, f"{url}: {page['result']}{' ' + page['error'] if page['error'] else ''}, {len(page['links'])} links")
+        for link in page['links']:
+            if fetcher.on_portal(link, domains[portal.id]):
+                links.setdefault(link, url)
+    for link, source in links.items():
+        items.write(json.dumps({'url': link, 'source_url': source, 'portal_domain': portal.domain}) + '\n')
+    queued = seen_filter.insert_unseen_urls('raw', portal.id, links) if links else 0
+    _log(log, f"Items: {len(links)}, raw URLs queued: {queued}")
+    # Scrapy's closing stats line, read by sync_crawler_job_stats
+    _log(log, f"Dumping Scrapy stats:\n{{'item_scraped_count': {len(links)}}}")
+    return len(links)
+
+
+def run_scrapy(job: Dict, log, items) -> int:
+    """
+    Run the job's spider with `scrapy crawl` in SCRAPYD_LOCAL_SCRAPY_DIR
+
+    The crawl writes the log and items itself; cancel() terminates it.
+    """
+    project_dir = _setting('SCRAPYD_LOCAL_SCRAPY_DIR', None)
+    if not project_dir:
+        raise ValueError("SCRAPYD_LOCAL_SCRAPY_DIR is not set")
+    command = [sys.executable, '-m', 'scrapy', 'crawl', job['spider'], '-o', f'{items.name}:jsonlines', '--logfile', log.name]
+    for key, value in job['args'].items():
+        command += ['-a', f'{key}={value}']
+    for value in job['settings'] if isinstance(job['settings'], list) else [job['settings']]:
+        command += ['-s', value]
+    log.close()
+    items.close()
+
+    # Until cancel() can find the crawl, a SIGTERM must not leave it orphaned
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+    try:
+        crawl = subprocess.Popen(command, cwd=project_dir, stdin=subprocess.DEVNULL,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with _locked():
+            state = _read_job(job['id'])
+            state['pid'] = crawl.pid
+            _write_job(state)
+            # Cancelled between the claim and the start of the crawl
+            if state.get('cancelled'):
+                crawl.terminate()
+    finally:
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+    status = crawl.wait()
+    if status:
+        raise RuntimeError(f"scrapy crawl exited with status {status}")
+    return 0
+
+
+RUNNERS = {
+    'extractor': run_extractor,
+    'scrapy': run_scrapy,
+}
+
+
+def run_job(job: Dict) -> str:
+    """Run one claimed job and record its outcome: 'finished', 'failed' or 'cancelled'"""
+    runner = RUNNERS[_setting('SCRAPYD_LOCAL_RUNNER', DEFAULT_RUNNER)]
+    outcome = 'finished'
+    with open(log_path(job['project'], job['spider'], job['id']), 'a') as log, \
+            open(items_path(job['project'], job['spider'], job['id']), 'a') as items:
+        try:
+            runner(job, log, items)
+        except JobCancelled:
+            outcome = 'cancelled'
+        except Exception as e:
+            outcome = 'failed'
+            if not log.closed:
+                _log(log, f"{type(e).__name__}: {e}", 'ERROR')
+    with _locked():
+        state = _read_job(job['id'])
+        if state is None:
+            return outcome
+        if state.get('cancelled'):
+            outcome = 'cancelled'
+        _finish(state, outcome)
+    return outcome
+
+
+def work(forever: bool = False, poll_interval: float = DEFAULT_POLL_INTERVAL) -> Dict:
+    """
+    Worker loop: run pending jobs until the queue is empty (or forever)
+
+    SIGTERM during a job cancels that job only, unless it did not come from
+    cancel(); outside of a job it stops the worker.
+
+    Returns:
+        Count of jobs per outcome
+    """
+    from django.db import close_old_connections
+
+    worker = os.getpid()
+    running = {'job': False}
+
+    def terminate(signum, frame):
+        if running['job']:
+            raise JobCancelled()
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    outcomes = {}
+    while True:
+        job = _claim_next(worker)
+        if job is None:
+            if not forever:
+                return outcomes
+            open(_path('workers', str(worker)), 'w').close()
+            time.sleep(poll_interval)
+            continue
+        running['job'] = True
+        try:
+            outcome = run_job(job)
+        except JobCancelled:
+            # Signal delivered while the outcome was being written
+            outcome = 'cancelled'
+            with _locked():
+                state = _read_job(job['id'])
+                if state and state['state'] == 'running':
+                    _finish(state, outcome)
+        finally:
+            running['job'] = False
+        close_old_connections()
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        # A SIGTERM that was not a cancel() is a request to stop
+        if outcome == 'cancelled' and not (_read_job(job['id']) or {}).get('cancelled'):
+            return outcomes
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.tasks.local_scrapyd import DEFAULT_POLL_INTERVAL, work
+
+
+class Command(BaseCommand):
+    help = "Run the crawl jobs queued on the local execution backend (SCRAPYD_BACKEND = 'local')"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forever', action='store_true', help="Keep polling for jobs instead of exiting on an empty queue")
+        parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL, help="Seconds between polls with --forever")
+
+    def handle(self, *args, **options):
+        outcomes = work(forever=options['forever'], poll_interval=options['poll_interval'])
+        summary = ', '.join(f"{outcome}: {count}" for outcome, count in sorted(outcomes.items())) or 'no jobs'
+        self.stdout.write(f"Local jobs run ({summary})")
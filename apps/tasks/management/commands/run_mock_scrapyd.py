@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from apps.tasks.mock_scrapyd import DEFAULT_ITEMS_PER_JOB, DEFAULT_JOB_SECONDS, DEFAULT_PORT, MockScrapyd
+
+
+class Command(BaseCommand):
+    help = "Serve an in-memory mock Scrapyd API with tunable latency and failure rate"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+        parser.add_argument('--latency-ms', type=float, default=0, help="Latency per request")
+        parser.add_argument('--jitter-ms', type=float, default=0, help="Random extra latency, up to this")
+        parser.add_argument('--failure-rate', type=float, default=0, help="Share of requests failing with a 500")
+        parser.add_argument('--job-seconds', type=float, default=DEFAULT_JOB_SECONDS, help="Time from schedule to finished")
+        parser.add_argument('--items-per-job', type=int, default=DEFAULT_ITEMS_PER_JOB)
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        server = MockScrapyd(
+            host=options['host'], port=options['port'], latency=options['latency_ms'] / 1000,
+            jitter=options['jitter_ms'] / 1000, failure_rate=options['failure_rate'],
+            job_seconds=options['job_seconds'], items_per_job=options['items_per_job'], seed=options['seed'],
+        )
+        self.stdout.write(f"Mock Scrapyd on {server.base_url} (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.httpd.server_close()
+        self.stdout.write(f"Served {server.requests} requests, {server.failures} injected failures")
@@ -0,0 +1,199 @@
+"""
+Mock Scrapyd server
+
+A small threaded HTTP server answering the Scrapyd JSON API (schedule,
+cancel, listjobs, listprojects, ... and the /logs/ and /items/ files) from
+memory, for load tests and local runs without crawling anything. Every
+response waits `latency` seconds plus up to `jitter`, and fails with a 500
+at `failure_rate`, so the views that call Scrapyd can be measured against a
+slow or flaky server.
+
+A scheduled job is pending for `job_seconds` / 4, then running until
+`job_seconds`, then finished with `items_per_job` items. Only the last
+`finished_to_keep` finished jobs are listed, as Scrapyd does.
+
+    server = MockScrapyd(port=6800, latency=0.05, failure_rate=0.01)
+    server.start()   # in a daemon thread; serve_forever() blocks instead
+    ...
+    server.stop()
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+DEFAULT_PORT = 6800
+DEFAULT_JOB_SECONDS = 30
+DEFAULT_ITEMS_PER_JOB = 20
+DEFAULT_FINISHED_TO_KEEP = 100
+PROJECT = 'scrapy_crawler'
+SPIDERS = ['generic']
+
+
+class MockScrapyd:
+    """In-memory Scrapyd with tunable latency and failures (see module docstring)"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT, latency: float = 0.0, jitter: float = 0.0,
+                 failure_rate: float = 0.0, job_seconds: float = DEFAULT_JOB_SECONDS,
+                 items_per_job: int = DEFAULT_ITEMS_PER_JOB, finished_to_keep: int = DEFAULT_FINISHED_TO_KEEP,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.job_seconds = job_seconds
+        self.items_per_job = items_per_job
+        self.finished_to_keep = finished_to_keep
+        self.random = random.Random(seed)
+        self.jobs: Dict[str, Dict] = {}
+        self.requests = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.httpd.server_address[0]}:{self.port}'
+
+    def start(self) -> 'MockScrapyd':
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='mock-scrapyd', daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, status: int, body, content_type: str = 'application/json') -> None:
+                data = (json.dumps(body) if content_type == 'application/json' else body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self, params: Dict[str, str]) -> None:
+                with mock.lock:
+                    mock.requests += 1
+                    failed = mock.random.random() < mock.failure_rate
+                    delay = mock.latency + mock.random.random() * mock.jitter
+                    mock.failures += failed
+                time.sleep(delay)
+                if failed:
+                    self._respond(500, {'status': 'error', 'message': 'Injected failure'})
+                    return
+                status, body, content_type = mock.dispatch(urlparse(self.path).path, params)
+                self._respond(status, body, content_type)
+
+            def do_GET(self):
+                self._handle({key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                params = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+                params.update({key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()})
+                self._handle(params)
+
+        return Handler
+
+    def _state(self, job: Dict, now: float) -> str:
+        age = now - job['created']
+        if job.get('end') is not None or age >= self.job_seconds:
+            return 'finished'
+        return 'running' if age >= self.job_seconds / 4 else 'pending'
+
+    @staticmethod
+    def _time(timestamp: float) -> str:
+        return str(datetime.fromtimestamp(timestamp))
+
+    def listjobs(self, project: str) -> Dict:
+        now = time.time()
+        result = {'status': 'ok', 'node_name': 'mock', 'pending': [], 'running': [], 'finished': []}
+        with self.lock:
+            jobs = [job for job in self.jobs.values() if job['project'] == project]
+        for job in sorted(jobs, key=lambda job: job['created']):
+            state = self._state(job, now)
+            info = {'id': job['id'], 'project': job['project'], 'spider': job['spider']}
+            if state != 'pending':
+                info.update(pid=job['pid'], start_time=self._time(job['created'] + self.job_seconds / 4))
+            if state == 'finished':
+                end = job.get('end') or job['created'] + self.job_seconds
+                info.update(end_time=self._time(end), log_url=f"/logs/{project}/{job['spider']}/{job['id']}.log",
+                            items_url=f"/items/{project}/{job['spider']}/{job['id']}.jl")
+            result[state].append(info)
+        result['finished'] = result['finished'][-self.finished_to_keep:]
+        return result
+
+    def dispatch(self, path: str, params: Dict[str, str]):
+        """(status, body, content type) of a request"""
+        project = params.get('project', PROJECT)
+        if path == '/daemonstatus.json':
+            jobs = self.listjobs(PROJECT)
+            return 200, {'status': 'ok', 'node_name': 'mock', **{
+                state: len(jobs[state]) for state in ('pending', 'running', 'finished')
+            }}, 'application/json'
+        if path == '/listprojects.json':
+            return 200, {'status': 'ok', 'projects': [PROJECT]}, 'application/json'
+        if path == '/listversions.json':
+            return 200, {'status': 'ok', 'versions': ['mock']}, 'application/json'
+        if path == '/listspiders.json':
+            return 200, {'status': 'ok', 'spiders': SPIDERS if project == PROJECT else []}, 'application/json'
+        if path == '/listjobs.json':
+            return 200, self.listjobs(project), 'application/json'
+        if path == '/schedule.json':
+            if params.get('spider') not in SPIDERS:
+                return 200, {'status': 'error', 'message': f"spider '{params.get('spider')}' not found"}, 'application/json'
+            jobid = params.get('jobid') or uuid.uuid4().hex
+            with self.lock:
+                self.jobs[jobid] = {'id': jobid, 'project': project, 'spider': params['spider'],
+                                    'created': time.time(), 'pid': self.random.randint(1000, 60000), 'end': None}
+            return 200, {'status': 'ok', 'jobid': jobid}, 'application/json'
+        if path == '/cancel.json':
+            with self.lock:
+                job = self.jobs.get(params.get('job'))
+                if job is None:
+                    return 200, {'status': 'ok', 'prevstate': None}, 'application/json'
+                prevstate = self._state(job, time.time())
+                if prevstate != 'finished':
+                    job['end'] = time.time()
+            return 200, {'status': 'ok', 'prevstate': prevstate}, 'application/json'
+        if path in ('/addversion.json', '/delversion.json', '/delproject.json'):
+            return 200, {'status': 'ok'}, 'application/json'
+        if path.startswith('/logs/') or path.startswith('/items/'):
+            jobid = path.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+            with self.lock:
+                job = self.jobs.get(jobid)
+            if job is None:
+                return 404, 'Not found', 'text/plain'
+            if path.startswith('/logs/'):
+                log = f"{self._time(job['created'])} [scrapy.core.engine] INFO: Spider opened (mock)\n"
+                if self._state(job, time.time()) == 'finished':
+                    log += (f"{self._time(job.get('end') or job['created'] + self.job_seconds)} [scrapy.statscollectors] "
+                            f"INFO: Dumping Scrapy stats:\n{{'item_scraped_count': {self.items_per_job}}}\n")
+                return 200, log, 'text/plain'
+            lines = ''.join(json.dumps({'url': f'https://mock.test/{jobid}/{index}'}) + '\n'
+                            for index in range(self.items_per_job))
+            return 200, lines, 'text/plain'
+        return 404, {'status': 'error', 'message': f'Unknown endpoint {path}'}, 'application/json'
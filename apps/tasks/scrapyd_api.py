@@ -6,18 +6,91 @@ Based on Scrapyd's official API documentation: https://scrapyd.readthedocs.io/en
 """
 
 import json
+import re
 import requests
+from datetime import datetime
 from typing import Dict, List, Optional, Any
 from django.conf import settings
+from django.utils.module_loading import import_string
+from django.utils import timezone
 from .models import ScrapydServer
 
 
+# Bytes read from the end of a job log, enough for Scrapy's closing stats dump
+LOG_TAIL_BYTES = 16 * 1024
+
+ITEM_COUNT_RE = re.compile(r"'item_scraped_count':\s*(\d+)")
+STATS_DUMP = 'Dumping Scrapy stats'
+
+
 class ScrapydAPIError(Exception):
     """Custom exception for Scrapyd API errors"""
     pass
 
 
-class ScrapydAPI:
+class BaseScrapydAPI:
+    """
+    Execution backend interface, the Scrapyd API surface used by the crawler tasks
+
+    Implementations: ScrapydAPI (a Scrapyd server over HTTP) and
+    apps.tasks.local_scrapyd.LocalScrapydAPI (local worker processes).
+    settings.SCRAPYD_BACKEND picks the one get_scrapyd_api() returns.
+    """
+
+    base_url = ''
+
+    def schedule(self, project: str, spider: str, **kwargs) -> Dict:
+        raise NotImplementedError
+
+    def cancel(self, project: str, job: str) -> Dict:
+        raise NotImplementedError
+
+    def listprojects(self) -> Dict:
+        raise NotImplementedError
+
+    def listspiders(self, project: str, version: Optional[str] = None) -> Dict:
+        raise NotImplementedError
+
+    def listjobs(self, project: str) -> Dict:
+        raise NotImplementedError
+
+    def get_log(self, project: str, spider: str, job: str) -> str:
+        raise NotImplementedError
+
+    def get_items(self, project: str, spider: str, job: str) -> str:
+        raise NotImplementedError
+
+    def get_log_tail(self, project: str, spider: str, job: str, size: int = LOG_TAIL_BYTES) -> str:
+        """The last `size` bytes (about) of a job log"""
+        return self.get_log(project, spider, job)[-size:]
+
+    def get_job_status(self, project: str, job: str) -> Dict:
+        """
+        Get the status of a specific job
+        
+        Args:
+            project: Project name
+            job: Job ID
+            
+        Returns:
+            Dict containing job status information
+        """
+        jobs = self.listjobs(project)
+        
+        # Search for the specific job
+        for status in ['pending', 'running', 'finished']:
+            if status in jobs:
+                for job_info in jobs[status]:
+                    if job_info.get('id') == job:
+                        return {
+                            'status': status,
+                            'job_info': job_info
+                        }
+        
+        return {'status': 'not_found', 'job_info': None}
+
+
+class ScrapydAPI(BaseScrapydAPI):
     """
     Comprehensive Scrapyd API client
     
@@ -238,65 +311,109 @@ class ScrapydAPI:
         except Exception as e:
             raise ScrapydAPIError(f"Error getting log: {str(e)}")
     
-    def get_items(self, project: str, spider: str, job: str) -> str:
+    def get_log_tail(self, project: str, spider: str, job: str, size: int = LOG_TAIL_BYTES) -> str:
         """
-        Get the items of a spider run
+        Get the end of the log of a spider run with a Range request
         
         Args:
             project: Project name
             spider: Spider name
             job: Job ID
+            size: Bytes to read from the end
             
         Returns:
-            String containing the items (JSONL format)
+            String containing the end of the log
         """
-        url = f"{self.base_url}/items/{project}/{spider}/{job}.jl"
+        url = f"{self.base_url}/logs/{project}/{spider}/{job}.log"
         try:
-            response = requests.get(url, timeout=self.timeout)
+            response = requests.get(url, headers={'Range': f'bytes=-{size}'}, timeout=self.timeout)
             response.raise_for_status()
-            return response.text
+            # A server ignoring Range answers 200 with the whole log
+            return response.text[-size:]
         except Exception as e:
-            raise ScrapydAPIError(f"Error getting items: {str(e)}")
+            raise ScrapydAPIError(f"Error getting log: {str(e)}")
     
-    def get_job_status(self, project: str, job: str) -> Dict:
+    def get_items(self, project: str, spider: str, job: str) -> str:
         """
-        Get the status of a specific job
+        Get the items of a spider run
         
         Args:
             project: Project name
+            spider: Spider name
             job: Job ID
             
         Returns:
-            Dict containing job status information
+            String containing the items (JSONL format)
         """
-        jobs = self.listjobs(project)
-        
-        # Search for the specific job
-        for status in ['pending', 'running', 'finished']:
-            if status in jobs:
-                for job_info in jobs[status]:
-                    if job_info.get('id') == job:
-                        return {
-                            'status': status,
-                            'job_info': job_info
-                        }
-        
-        return {'status': 'not_found', 'job_info': None}
+        url = f"{self.base_url}/items/{project}/{spider}/{job}.jl"
+        try:
+            response = requests.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            return response.text
+        except Exception as e:
+            raise ScrapydAPIError(f"Error getting items: {str(e)}")
+
+
+# SCRAPYD_BACKEND aliases; any other value is a dotted path to a BaseScrapydAPI subclass
+BACKENDS = {
+    'local': 'apps.tasks.local_scrapyd.LocalScrapydAPI',
+}
+
+
+def parse_job_time(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse a listjobs start_time / end_time ("2024-05-01 10:00:00.123456")
+
+    Scrapyd reports naive times in its own timezone, assumed to be TIME_ZONE.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
 
 
-def get_scrapyd_api(server_id: Optional[int] = None) -> ScrapydAPI:
+def count_items(items_content: Optional[str]) -> int:
+    """Number of items in a JSON Lines items feed"""
+    return sum(1 for line in (items_content or '').splitlines() if line.strip())
+
+
+def items_from_log(log_content: Optional[str]) -> Optional[int]:
     """
-    Get a ScrapydAPI instance for a server
+    item_scraped_count of the stats Scrapy dumps when a spider closes
+
+    Scrapy leaves the stat out when no item was scraped: a stats dump without
+    it means zero. None when the log has no stats dump.
+    """
+    log_content = log_content or ''
+    match = ITEM_COUNT_RE.search(log_content[log_content.rfind(STATS_DUMP):]) if STATS_DUMP in log_content else None
+    if match:
+        return int(match.group(1))
+    return 0 if STATS_DUMP in log_content else None
+
+
+def get_scrapyd_api(server_id: Optional[int] = None) -> BaseScrapydAPI:
+    """
+    Get the execution backend: a ScrapydAPI instance for a server, or the
+    backend named by settings.SCRAPYD_BACKEND
     
     Args:
-        server_id: Server ID (optional, uses first active server if not provided)
+        server_id: Server ID (optional, uses first active server if not provided;
+            ignored by non-HTTP backends)
         
     Returns:
-        ScrapydAPI instance
+        BaseScrapydAPI instance
         
     Raises:
         ScrapydAPIError: If no active server is found
     """
+    backend = getattr(settings, 'SCRAPYD_BACKEND', 'http')
+    if backend != 'http':
+        backend_class = import_string(BACKENDS.get(backend, backend))
+        return backend_class()
+
     if server_id:
         server = ScrapydServer.objects.get(id=server_id, is_active=True)
     else:
@@ -369,6 +486,9 @@ def fetch_and_save_items(crawler_task_id: int) -> Optional[str]:
         # Save the items locally
         items_file = write_to_log_file(items_content, f"scrapyd_items_{crawler_task.scrapyd_job_id}")
         
+        # The feed is at hand: count it so sync_crawler_job_stats does not have to
+        CrawlerTask.objects.filter(id=crawler_task.id).update(items_scraped=count_items(items_content))
+        
         return items_file
         
     except Exception as e:
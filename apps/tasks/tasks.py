@@ -14,9 +14,16 @@ from django.conf import settings
 from celery.exceptions import Ignore, TaskError
 
 # Import crawler models
-from apps.common.models import CrawlerConfig, CrawlerTask, CrawlerScheduledTask, ItemSelector, ItemChoices, SelectorMethodChoices
+from apps.common.models import (
+    CrawlerConfig, CrawlerTask, CrawlerScheduledTask, ItemSelector, ItemChoices, SelectorMethodChoices, ScheduleModeChoices
+)
 from apps.tasks.models import ScrapydServer
-from apps.tasks.scrapyd_api import get_scrapyd_api, fetch_and_save_logs, fetch_and_save_items, get_job_details
+from apps.tasks.scrapyd_api import (
+    get_scrapyd_api, fetch_and_save_logs, fetch_and_save_items, get_job_details, parse_job_time, items_from_log
+)
+from apps.common.canonicalize import run_canonicalization, DEFAULT_BATCH_SIZE
+from apps.common import archive, conditional, dedup, discovery, fetcher, schedule, search, seen_filter, stats
+from apps.common.selector_bench import benchmark_portal, capture_fixtures, fixtures_dir
 from django.utils import timezone
 
 
@@ -130,6 +137,10 @@ def _build_generic_spider_payload(crawler_config: CrawlerConfig, worker_id: str
     # Ensure allowed_domains is a list
     allowed_domains = [portal.domain] if portal.domain else []
 
+    # Conditional GET: send the headers, skip link extraction on a 304 or an unchanged
+    # content hash and report the responses to /api/validators/
+    validators = conditional.spider_validators(start_urls)
+
     config_dict = {
         'name': f'{portal.name.lower()}_spider',
         'portal_name': portal.name,
@@ -139,6 +150,7 @@ def _build_generic_spider_payload(crawler_config: CrawlerConfig, worker_id: str
         'selectors': selectors_config,
         'headers': headers,
         'proxy_settings': proxy_settings,
+        'validators': validators,
         'custom_settings': custom_settings.get('SCRAPY_SETTINGS_JSON') or json.dumps(custom_settings or {})
     }
 
@@ -350,8 +362,11 @@ def execute_scheduled_crawler_task(self, scheduled_task_id: int):
         # Execute the crawler task
         result = execute_crawler_task.delay(crawler_task.id)
         
-        # Update scheduled task last_run
-        scheduled_task.last_run = timezone.now()
+        # Update scheduled task last_run, adaptive tasks also plan their next run
+        if scheduled_task.schedule_mode == ScheduleModeChoices.ADAPTIVE:
+            schedule.plan([scheduled_task])
+        else:
+            scheduled_task.last_run = timezone.now()
         scheduled_task.save()
         
         logs = f"Scheduled task {scheduled_task_id} executed successfully\n"
@@ -390,4 +405,518 @@ def execute_scheduled_crawler_task(self, scheduled_task_id: int):
             "output": "",
             "status": "FAILURE",
             "log_file": ""
-        }
\ No newline at end of file
+        }
+
+
+@app.task(bind=True, base=AbortableTask)
+def dispatch_adaptive_schedules(self, limit: int = 100):
+    """
+    Start a crawl for every adaptive scheduled task that is due and plan its next run
+    :param limit: Scheduled tasks dispatched per run
+    :rtype: dict
+    """
+    try:
+        scheduled_tasks = schedule.claim_due(limit=limit)
+        crawler_tasks = []
+        for scheduled_task in scheduled_tasks:
+            crawler_task = CrawlerTask.objects.create(crawler_config=scheduled_task.crawler_config, status='pending')
+            execute_crawler_task.delay(crawler_task.id)
+            crawler_tasks.append(crawler_task)
+    except Exception as e:
+        error_msg = f"Error dispatching adaptive schedules: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        return {
+            "logs": error_msg,
+            "input": "dispatch_adaptive_schedules",
+            "error": True,
+            "output": "",
+            "status": "FAILURE",
+            "log_file": ""
+        }
+
+    logs = "".join(
+        f"{scheduled_task.name}: {scheduled_task.estimated_rate:.2f} new URLs/hour, next run {scheduled_task.next_run:%Y-%m-%d %H:%M}\n"
+        for scheduled_task in scheduled_tasks
+    )
+    return {
+        "logs": logs or "No adaptive schedules due\n",
+        "input": "dispatch_adaptive_schedules",
+        "error": False,
+        "output": f"Dispatched {len(crawler_tasks)} crawler tasks",
+        "status": "SUCCESS",
+        "log_file": ""
+    }
+
+
+@app.task(bind=True, base=AbortableTask)
+def canonicalize_raw_urls(self, batch_size: int = DEFAULT_BATCH_SIZE, portal_id: int = None, max_batches: int = None):
+    """
+    Canonicalize pending raw URLs into clean URLs in batches
+    :param batch_size: Raw URLs processed per batch
+    :param portal_id: Restrict processing to one portal (optional)
+    :param max_batches: Stop after this many batches (optional)
+    :rtype: dict
+    """
+    started = time.time()
+    try:
+        stats = run_canonicalization(
+            batch_size=batch_size,
+            portal_id=portal_id,
+            max_batches=max_batches,
+            should_stop=self.is_aborted
+        )
+        # Filters live in this worker process, persist them for the next run
+        seen_filter.snapshot_filters()
+    except Exception as e:
+        error_msg = f"Error canonicalizing raw URLs: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        return {
+            "logs": error_msg,
+            "input": "canonicalize_raw_urls",
+            "error": True,
+            "output": "",
+            "status": "FAILURE",
+            "log_file": ""
+        }
+
+    elapsed = time.time() - started
+    rate = stats['processed'] / elapsed if elapsed else 0
+    logs = (
+        f"Canonicalized {stats['processed']} raw URLs in {stats['batches']} batches ({elapsed:.2f}s, {rate:.0f} URLs/sec)\n"
+        f"Clean URLs created: {stats['created']}\n"
+        f"Duplicates: {stats['duplicates']}\n"
+        f"Failed: {stats['failed']}\n"
+    )
+
+    return {
+        "logs": logs,
+        "input": "canonicalize_raw_urls",
+        "error": False,
+        "output": f"Created {stats['created']} clean URLs",
+        "status": "SUCCESS",
+        "log_file": "",
+        "stats": stats
+    }
+
+
+@app.task(bind=True, base=AbortableTask)
+def fetch_pending_articles(self, batch_size: int = fetcher.DEFAULT_BATCH_SIZE, portal_id: int = None, max_batches: int = None):
+    """
+    Download pending clean URLs concurrently, extract their articles and ingest them
+    :param batch_size: Clean URLs fetched concurrently per batch
+    :param portal_id: Restrict processing to one portal (optional)
+    :param max_batches: Stop after this many batches (optional)
+    :rtype: dict
+    """
+    try:
+        stats = fetcher.run_fetcher(
+            batch_size=batch_size,
+            portal_id=portal_id,
+            max_batches=max_batches,
+            should_stop=self.is_aborted
+        )
+    except Exception as e:
+        error_msg = f"Error fetching articles: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        return {
+            "logs": error_msg,
+            "input": "fetch_pending_articles",
+            "error": True,
+            "output": "",
+            "status": "FAILURE",
+            "log_file": ""
+        }
+
+    rate = stats['processed'] / stats['seconds'] if stats['seconds'] else 0
+    logs = (
+        f"Fetched {stats['processed']} URLs in {stats['batches']} batches ({stats['seconds']:.2f}s, {rate:.0f} pages/sec)\n"
+        f"Completed: {stats['completed']}\n"
+        f"Retried later: {stats['retried']}\n"
+        f"Failed: {stats['failed']}\n"
+        f"Bytes: {stats['bytes']}\n"
+        f"Results: {stats['results']}\n"
+    )
+
+    return {
+        "logs": logs,
+        "input": "fetch_pending_articles",
+        "error": False,
+        "output": f"Ingested {stats['completed']} articles",
+        "status": "SUCCESS",
+        "log_file": "",
+        "stats": stats
+    }
+
+
+@app.task(bind=True, base=AbortableTask)
+def crawl_seed_urls(self, portal_id: int = None):
+    """
+    Fetch seed (listing) pages with conditional requests and queue the new article links as raw URLs
+    :param portal_id: Restrict the crawl to one portal (optional)
+    :rtype: dict
+    """
+    try:
+        stats = fetcher.crawl_seed_urls(portal_id=portal_id)
+        seen_filter.snapshot_filters()
+    except Exception as e:
+        error_msg = f"Error crawling seed URLs: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        return {
+            "logs": error_msg,
+            "input": "crawl_seed_urls",
+            "error": True,
+            "output": "",
+            "status": "FAILURE",
+            "log_file": ""
+        }
+
+    logs = (
+        f"Checked {stats['seeds']} seed URLs in {stats['seconds']:.2f}s\n"
+        f"Results: {stats['results']}\n"
+        f"Links found: {stats['links']}\n"
+        f"Raw URLs queued: {stats['queued']}\n"
+    )
+    return {
+        "logs": logs,
+        "input": "crawl_seed_urls",
+        "error": False,
+        "output": f"Queued {stats['queued']} raw URLs",
+        "status": "SUCCESS",
+        "log_file": "",
+        "stats": stats
+    }
+
+
+@app.task(bind=True, base=AbortableTask)
+def discover_feed_urls(self, portal_id: int = None, detect: bool = True):
+    """
+    Read the sitemaps and RSS/Atom feeds of the portals and queue their new entries as raw URLs
+    :param portal_id: Restrict discovery to one portal (optional)
+    :param detect: First look for the feeds of portals that have none yet
+    :rtype: dict
+    """
+    try:
+        detected = discovery.detect_feeds([portal_id] if portal_id else None) if detect else 0
+        stats = discovery.discover_urls(portal_id=portal_id)
+        seen_filter.snapshot_filters()
+    except Exception as e:
+        error_msg = f"Error discovering feed URLs: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        return {
+            "logs": error_msg,
+            "input": "discover_feed_urls",
+            "error": True,
+            "output": "",
+            "status": "FAILURE",
+            "log_file": ""
+        }
+
+    logs = (
+        f"Feed candidates detected: {detected}\n"
+        f"Read {stats['feeds']} feeds and {stats['sitemaps']} child sitemaps in {stats['seconds']:.2f}s\n"
+        f"Results: {stats['results']}\n"
+        f"New entries: {stats['entries']}\n"
+        f"Raw URLs queued: {stats['queued']}\n"
+    )
+    return {
+        "logs": logs,
+        "input": "discover_feed_urls",
+        "error": False,
+        "output": f"Queued {stats['queued']} raw URLs",
+        "status": "SUCCESS",
+        "log_file": "",
+        "stats": stats
+    }
+
+
+@app.task(bind=True, base=AbortableTask)
+def snapshot_seen_url_filters(self, rebuild: bool = False):
+    """
+    Snapshot the seen-URL filters to disk, optionally rebuilding them from the tables first
+    :param rebuild: Rebuild every portal filter from the database (drops deleted URLs)
+    :rtype: dict
+    """
+    try:
+        paths = seen_filter.rebuild_filters() if rebuild else seen_filter.snapshot_filters()
+    except Exception as e:
+        error_msg = f"Error snapshotting seen-URL filters: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        return {
+            "logs": error_msg,
+            "input": "snapshot_seen_url_filters",
+            "error": True,
+            "output": "",
+            "status": "FAILURE",
+            "log_file": ""
+        }
+
+    logs = f"{'Rebuilt' if rebuild else 'Snapshotted'} {len(paths)} seen-URL filters\n" + "\n".join(paths)
+    return {
+        "logs": logs,
+        "input": "snapshot_seen_url_filters",
+        "error": False,
+        "output": f"{len(paths)} filters written",
+        "status": "SUCCESS",
+        "log_file": ""
+    }
+
+
+@app.task(bind=True, base=AbortableTask)
+def backfill_article_fingerprints(self, batch_size: int = 500):
+    """
+    Compute near-duplicate fingerprints for articles that have none yet
+    :param batch_size: Articles fingerprinted per batch
+    :rtype: dict
+    """
+    try:
+        total = dedup.backfill_fingerprints(batch_size=batch_size, should_stop=self.is_aborted)
+    except Exception as e:
+        error_msg = f"Error fingerprinting articles: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        return {
+            "logs": error_msg,
+            "input": "backfill_article_fingerprints",
+            "error": True,
+            "output": "",
+            "status": "FAILURE",
+            "log_file": ""
+        }
+
+    return {
+        "logs": f"Fingerprinted {total} articles\n",
+        "input": "backfill_article_fingerprints",
+        "error": False,
+        "output": f"Fingerprinted {total} articles",
+        "status": "SUCCESS",
+        "log_file": ""
+    }
+
+
+@app.task(bind=True, base=AbortableTask)
+def rebuild_search_index(self, batch_size: int = 1000):
+    """
+    Rebuild the article full-text search index from scratch
+    :param batch_size: Articles indexed per batch
+    :rtype: dict
+    """
+    try:
+        total = search.rebuild_index(batch_size=batch_size)
+    except Exception as e:
+        error_msg = f"Error rebuilding search index: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        return {
+            "logs": error_msg,
+            "input": "rebuild_search_index",
+            "error": True,
+            "output": "",
+            "status": "FAILURE",
+            "log_file": ""
+        }
+
+    return {
+        "logs": f"Indexed {total} articles\n",
+        "input": "rebuild_search_index",
+        "error": False,
+        "output": f"Indexed {total} articles",
+        "status": "SUCCESS",
+        "log_file": ""
+    }
+
+
+@app.task(bind=True, base=AbortableTask)
+def reconcile_dashboard_stats(self, days: int = None):
+    """
+    Recompute the dashboard counters and rollups from the source tables
+    :param days: Only rebuild the daily rollups of the last N days (optional, totals are always rebuilt;
+        ignored while the rollups were never fully reconciled)
+    :rtype: dict
+    """
+    if days and not stats.is_reconciled():
+        days = None
+    try:
+        result = stats.reconcile(days=days)
+    except Exception as e:
+        error_msg = f"Error reconciling dashboard stats: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        return {
+            "logs": error_msg,
+            "input": "reconcile_dashboard_stats",
+            "error": True,
+            "output": "",
+            "status": "FAILURE",
+            "log_file": ""
+        }
+
+    logs = "\n".join(f"{name}: {value}" for name, value in result['counters'].items())
+    logs += f"\nPortal rows: {result['portals']}\nDaily rows: {result['daily_rows']}\n"
+    return {
+        "logs": logs,
+        "input": "reconcile_dashboard_stats",
+        "error": False,
+        "output": f"Reconciled {result['portals']} portals and {result['daily_rows']} daily rows",
+        "status": "SUCCESS",
+        "log_file": ""
+    }
+
+
+@app.task(bind=True, base=AbortableTask)
+def archive_cold_articles(self, days: int = None, portal_id: int = None, batch_size: int = None):
+    """
+    Move articles published more than ARTICLE_ARCHIVE_AFTER_DAYS ago into the Parquet archive
+    :param days: Archive articles older than this many days (optional, overrides the setting)
+    :param portal_id: Only archive this portal (optional)
+    :param batch_size: Articles per batch (optional)
+    :rtype: dict
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=days) if days else None
+    try:
+        result = archive.archive_articles(
+            cutoff=cutoff, batch_size=batch_size, portal_id=portal_id, should_stop=self.is_aborted
+        )
+    except Exception as e:
+        error_msg = f"Error archiving articles: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        return {
+            "logs": error_msg,
+            "input": "archive_cold_articles",
+            "error": True,
+            "output": "",
+            "status": "FAILURE",
+            "log_file": ""
+        }
+
+    return {
+        "logs": f"Cutoff: {result['cutoff']}\nBatches: {result['batches']}\nFiles: {result['files']}\nMerged files: {result['merged_files']}\n",
+        "input": "archive_cold_articles",
+        "error": False,
+        "output": f"Archived {result['archived']} articles",
+        "status": "SUCCESS",
+        "log_file": ""
+    }
+
+
+@app.task(bind=True, base=AbortableTask)
+def sync_crawler_job_stats(self, days: int = 2):
+    """
+    Copy spider start/end times and item counts of Scrapyd jobs onto their CrawlerTask
+    and record finished jobs in the pipeline rollups (one listjobs call per run, plus
+    the end of the log of each newly finished job for its item count)
+    :param days: Only look at crawler tasks created in the last N days
+    :rtype: dict
+    """
+    since = timezone.now() - datetime.timedelta(days=days)
+    pending = list(
+        CrawlerTask.objects.select_related('crawler_config').filter(
+            scrapyd_job_id__isnull=False, scrapyd_finished_at__isnull=True, created_at__gte=since
+        )
+    )
+    if not pending:
+        return {
+            "logs": "No Scrapyd jobs to sync\n",
+            "input": "sync_crawler_job_stats",
+            "error": False,
+            "output": "Synced 0 jobs",
+            "status": "SUCCESS",
+            "log_file": ""
+        }
+
+    try:
+        api = get_scrapyd_api()
+        jobs = api.listjobs('scrapy_crawler')
+    except Exception as e:
+        error_msg = f"Error listing Scrapyd jobs: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        return {
+            "logs": error_msg,
+            "input": "sync_crawler_job_stats",
+            "error": True,
+            "output": "",
+            "status": "FAILURE",
+            "log_file": ""
+        }
+
+    job_infos = {}
+    for state in ('running', 'finished'):
+        for job_info in jobs.get(state, []):
+            job_infos[job_info.get('id')] = job_info
+
+    updated, finished = [], []
+    for crawler_task in pending:
+        job_info = job_infos.get(crawler_task.scrapyd_job_id)
+        if not job_info:
+            continue
+        crawler_task.scrapyd_started_at = parse_job_time(job_info.get('start_time'))
+        crawler_task.scrapyd_finished_at = parse_job_time(job_info.get('end_time'))
+        if crawler_task.scrapyd_started_at is None:
+            continue
+        if crawler_task.scrapyd_finished_at:
+            # Counted from the stats dump at the end of the log, unless the items feed was fetched already
+            if crawler_task.items_scraped is None:
+                try:
+                    crawler_task.items_scraped = items_from_log(
+                        api.get_log_tail('scrapy_crawler', 'generic', crawler_task.scrapyd_job_id)
+                    )
+                except Exception as log_error:
+                    print(f"WARNING: Could not read the log of job {crawler_task.scrapyd_job_id}: {log_error}")
+            finished.append((
+                crawler_task.crawler_config.portal_id,
+                crawler_task.scrapyd_finished_at,
+                crawler_task.items_scraped,
+                stats.elapsed_seconds(crawler_task.created_at, crawler_task.scrapyd_started_at),
+                stats.elapsed_seconds(crawler_task.scrapyd_started_at, crawler_task.scrapyd_finished_at),
+            ))
+        updated.append(crawler_task)
+
+    CrawlerTask.objects.bulk_update(updated, ['scrapyd_started_at', 'scrapyd_finished_at', 'items_scraped'])
+    stats.record_jobs(finished)
+
+    return {
+        "logs": f"Jobs checked: {len(pending)}\nRunning: {len(updated) - len(finished)}\nFinished: {len(finished)}\n",
+        "input": "sync_crawler_job_stats",
+        "error": False,
+        "output": f"Synced {len(updated)} jobs",
+        "status": "SUCCESS",
+        "log_file": ""
+    }
+
+
+@app.task(bind=True, base=AbortableTask)
+def benchmark_portal_selectors(self, portal_id: int, budget_ms: float = None, capture: int = None):
+    """
+    Time the item selectors of a portal against its saved HTML fixtures and store the runs
+    (SelectorBenchmark), optionally capturing fresh fixtures first
+    :param portal_id: Portal whose selectors are benchmarked
+    :param budget_ms: Per-fixture time budget (optional, overrides SELECTOR_TIME_BUDGET_MS)
+    :param capture: First download this many article and seed pages as fixtures (optional)
+    :rtype: dict
+    """
+    logs = ""
+    try:
+        if capture:
+            paths = capture_fixtures(portal_id, limit=capture)
+            logs += f"Captured {len(paths)} fixtures\n"
+        report = benchmark_portal(portal_id, budget_ms=budget_ms)
+        if not report['fixtures']:
+            raise ValueError(f"no fixtures in {fixtures_dir(report['domain'])}; capture some pages first")
+    except Exception as e:
+        error_msg = f"Error benchmarking selectors: {str(e)}"
+        print(f"ERROR: {error_msg}")
+        return {
+            "logs": logs + error_msg,
+            "input": "benchmark_portal_selectors",
+            "error": True,
+            "output": "",
+            "status": "FAILURE",
+            "log_file": ""
+        }
+
+    for row in report['rows']:
+        logs += f"[{row['benchmark'].status}] {row['selector'].item} {row['benchmark'].max_ms:.2f}ms max {row['selector'].query}\n"
+    return {
+        "logs": logs,
+        "input": "benchmark_portal_selectors",
+        "error": False,
+        "output": f"Benchmarked {len(report['rows'])} selectors on {len(report['fixtures'])} fixtures: {report['flagged']} flagged",
+        "status": "SUCCESS",
+        "log_file": ""
+    }
@@ -18,7 +18,7 @@ from django.conf import settings
 from django.template  import loader
 
 # Import crawler models
-from apps.common.models import CrawlerConfig, CrawlerTask, CrawlerScheduledTask, NewsPortalSeedUrl
+from apps.common.models import CrawlerConfig, CrawlerTask, CrawlerScheduledTask, NewsPortalSeedUrl, ScheduleModeChoices
 
 # Import Scrapyd API
 from apps.tasks.scrapyd_api import get_scrapyd_api, fetch_and_save_logs, fetch_and_save_items, get_job_details, ScrapydAPIError
@@ -248,17 +248,24 @@ def create_scheduled_crawler_task(request):
         crawler_config_id = request.POST.get('crawler_config')
         name = request.POST.get('name')
         description = request.POST.get('description', '')
-        cron_expression = request.POST.get('cron_expression')
+        schedule_mode = request.POST.get('schedule_mode') or ScheduleModeChoices.CRON
+        cron_expression = request.POST.get('cron_expression', '')
         is_active = request.POST.get('is_active') == 'on'
         
         try:
             crawler_config = CrawlerConfig.objects.get(id=crawler_config_id)
+            adaptive = {
+                field: int(request.POST[field])
+                for field in ('min_interval', 'max_interval', 'target_new_urls') if request.POST.get(field)
+            }
             scheduled_task = CrawlerScheduledTask.objects.create(
                 crawler_config=crawler_config,
                 name=name,
                 description=description,
+                schedule_mode=schedule_mode,
                 cron_expression=cron_expression,
-                is_active=is_active
+                is_active=is_active,
+                **adaptive
             )
             
             print(f"Created scheduled crawler task {scheduled_task.id}")
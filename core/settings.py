@@ -57,8 +57,6 @@ INSTALLED_APPS = [
     'drf_spectacular',
     'django_api_gen',
 
-    "debug_toolbar",
-
     # allauth apps
     'allauth',
     'allauth.account',
@@ -71,6 +69,10 @@ INSTALLED_APPS = [
 
 ]
 
+# The toolbar instruments every query and template render: development only
+if DEBUG:
+    INSTALLED_APPS += ["debug_toolbar"]
+
 WEBPACK_LOADER = {
     "DEFAULT": {
         "BUNDLE_DIR_NAME": "frontend/",
@@ -81,6 +83,7 @@ WEBPACK_LOADER = {
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "apps.common.metrics.MetricsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -88,7 +91,6 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
 
     "allauth.account.middleware.AccountMiddleware",
     # "wagtail.contrib.redirects.middleware.RedirectMiddleware",
@@ -97,6 +99,9 @@ MIDDLEWARE = [
 
 ]
 
+if DEBUG:
+    MIDDLEWARE.insert(MIDDLEWARE.index("django.middleware.clickjacking.XFrameOptionsMiddleware") + 1, "debug_toolbar.middleware.DebugToolbarMiddleware")
+
 ROOT_URLCONF = "core.urls"
 
 UI_TEMPLATES = os.path.join(BASE_DIR, 'templates') 
@@ -201,6 +206,26 @@ else:
         }
     }
 
+# Cache: Redis when CACHE_REDIS_URL is set, shared by every process; else per-process memory
+
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', None)
+
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND'   : 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION'  : CACHE_REDIS_URL,
+            'KEY_PREFIX': 'oncs',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND' : 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'oncs',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -305,6 +330,151 @@ CELERY_RESULT_EXPIRES     = 60*60*24*30 # Results expire after 1 month
 CELERY_ACCEPT_CONTENT     = ["json"]
 CELERY_TASK_SERIALIZER    = 'json'
 CELERY_RESULT_SERIALIZER  = 'json'
+CELERY_BEAT_SCHEDULE      = {
+    'reconcile-dashboard-stats': {
+        'task'    : 'apps.tasks.tasks.reconcile_dashboard_stats',
+        'schedule': 60 * 60,
+        'kwargs'  : {'days': 7},
+    },
+    'archive-cold-articles': {
+        'task'    : 'apps.tasks.tasks.archive_cold_articles',
+        'schedule': 60 * 60 * 24,
+    },
+    'sync-crawler-job-stats': {
+        'task'    : 'apps.tasks.tasks.sync_crawler_job_stats',
+        'schedule': 5 * 60,
+    },
+    'dispatch-adaptive-schedules': {
+        'task'    : 'apps.tasks.tasks.dispatch_adaptive_schedules',
+        'schedule': 60,
+    },
+    'discover-feed-urls': {
+        'task'    : 'apps.tasks.tasks.discover_feed_urls',
+        'schedule': 10 * 60,
+    },
+    'fetch-pending-articles': {
+        'task'    : 'apps.tasks.tasks.fetch_pending_articles',
+        'schedule': 60,
+        'kwargs'  : {'max_batches': 10},
+    },
+}
+########################################
+
+# ### Seen-URL filters (apps.common.seen_filter) ###
+
+SEEN_URL_FILTER_ENABLED    = str2bool(os.environ.get('SEEN_URL_FILTER_ENABLED', 'True'))
+SEEN_URL_FILTER_DIR        = os.path.join(BASE_DIR, "seen_filters")
+SEEN_URL_FILTER_CAPACITY   = 100_000  # minimum per-portal capacity
+SEEN_URL_FILTER_ERROR_RATE = 0.0001   # fraction of new URLs wrongly treated as seen
+########################################
+
+# ### Near-duplicate detection (apps.common.dedup) ###
+
+NEAR_DUPLICATE_MAX_DISTANCE = 3  # max SimHash Hamming distance, at most 3 with 4 LSH bands
+########################################
+
+# ### Article search (apps.common.search) ###
+
+ARTICLE_SEARCH_MAX_RESULTS = 1000  # ranked hits fetched per query
+########################################
+
+# ### Pagination (apps.common.pagination) ###
+
+PAGINATION_COUNT_CAP = 10000  # list totals stop counting here and show "10,000+"
+########################################
+
+# ### Cached lookups (apps.common.caching) ###
+
+LOOKUP_CACHE_TIMEOUT       = 10 * 60  # seconds; entries are also dropped on every relevant save/delete
+LOOKUP_CACHE_LOCAL_TIMEOUT = 10       # with the per-process cache, other processes only see edits after this
+LOOKUP_CACHE_MAX_ROWS      = 5000     # larger lookups are not cached
+########################################
+
+# ### Time series (apps.common.timeseries) ###
+
+TIMESERIES_CACHE_TTL              = 60       # ranges reaching today
+TIMESERIES_CLOSED_RANGE_CACHE_TTL = 60 * 60  # ranges that ended before today
+########################################
+
+# ### Article archive (apps.common.archive) ###
+
+ARTICLE_ARCHIVE_DIR           = os.environ.get('ARTICLE_ARCHIVE_DIR', os.path.join(BASE_DIR, "article_archive"))
+ARTICLE_ARCHIVE_AFTER_DAYS    = int(os.environ.get('ARTICLE_ARCHIVE_AFTER_DAYS', 365))  # by publication date
+ARTICLE_ARCHIVE_BATCH_SIZE    = 1000
+ARTICLE_ARCHIVE_FILE_ROWS     = 20000  # rows buffered per portal and month before a file is written
+ARTICLE_ARCHIVE_SEARCH_MONTHS = 12  # newest archive months searched when no portal or dates are given
+########################################
+
+# ### Article ingestion API (apps.common.ingest) ###
+
+ARTICLE_INGEST_MAX_ITEMS = 5000  # articles per request to /api/articles/ingest/
+########################################
+
+# ### Article fetcher (apps.common.fetcher) ###
+
+FETCHER_PORTAL_CONCURRENCY = 8                # requests in flight per portal, NewsPortal.fetch_concurrency overrides
+FETCHER_MAX_CONNECTIONS    = 500              # requests in flight per fetcher process
+FETCHER_MAX_BYTES          = 5 * 1024 * 1024  # larger pages are dropped and the URL marked failed
+FETCHER_TIMEOUT            = 30               # seconds, connect/read/write
+FETCHER_STALE_AFTER        = 15 * 60          # running URLs older than this are fetched again
+FETCHER_MAX_ATTEMPTS       = 5                # fetches of a URL failing with timeouts, connection errors, 429 or 5xx
+FETCHER_RETRY_BACKOFF      = 5 * 60           # seconds before the first retry, doubled on each further one
+FETCHER_HTTP2              = str2bool(os.environ.get('FETCHER_HTTP2', 'False'))
+FETCHER_USER_AGENT         = os.environ.get('FETCHER_USER_AGENT', 'Mozilla/5.0 (compatible; ONCS-Fetcher/1.0)')
+########################################
+
+# ### Selector benchmarks (apps.common.selector_bench) ###
+
+SELECTOR_FIXTURES_DIR     = os.path.join(BASE_DIR, "selector_fixtures")  # <domain>/*.html
+SELECTOR_TIME_BUDGET_MS   = 50  # per selector and fixture, slower selectors are flagged
+SELECTOR_REGEX_TIMEOUT    = 5   # seconds per regex over all fixtures, then it is killed
+SELECTOR_BENCHMARK_REPEAT = 3   # runs per fixture, the fastest counts
+########################################
+
+# ### Sitemap and feed discovery (apps.common.discovery) ###
+
+DISCOVERY_MAX_BYTES    = 50 * 1024 * 1024  # per sitemap or feed, after gunzip
+DISCOVERY_MAX_AGE_DAYS = 2                 # older entries are skipped, also on a feed's first read
+########################################
+
+# ### Adaptive recrawl scheduling (apps.common.schedule) ###
+
+RECRAWL_RATE_WINDOW_HOURS = 7 * 24  # raw URL history the discovery rate is estimated from
+RECRAWL_RATE_SMOOTHING    = 0.5     # weight of the latest rate against the previous estimate
+########################################
+
+# ### Benchmarks (apps.common.benchmark, apps.common.synthetic, apps.common.loadtest) ###
+
+BENCHMARK_REPORT_DIR           = os.path.join(BASE_DIR, "benchmark_reports")  # <timestamp>.json, baseline.json, loadtest-*.json
+BENCHMARK_REGRESSION_TOLERANCE = 0.2  # a median this much slower than the baseline is a regression
+BENCHMARK_MIN_DELTA_MS         = 2    # ... and at least this much slower, below that it is noise
+BENCHMARK_BUDGETS_MS           = {    # median ceilings per case name pattern, first match wins
+    'view:*'        : 500,
+    'ajax:*'        : 200,
+    'search:*'      : 200,
+    'payload:*'     : 50,
+}
+LOADTEST_SLO_MS                = 1000  # p95 per route; a route above it at some concurrency has broken there
+LOADTEST_MAX_ERROR_RATE        = 0.01  # ... or with more errors than this share
+########################################
+
+# ### Local execution backend (apps.tasks.local_scrapyd) ###
+
+SCRAPYD_BACKEND                = os.environ.get('SCRAPYD_BACKEND', 'http')  # 'http' (ScrapydServer), 'local' or a dotted path
+SCRAPYD_LOCAL_DIR              = os.path.join(BASE_DIR, "scrapyd_local")   # job state, logs/ and items/
+SCRAPYD_LOCAL_WORKERS          = 2            # run_local_jobs processes started by schedule()
+SCRAPYD_LOCAL_RUNNER           = os.environ.get('SCRAPYD_LOCAL_RUNNER', 'extractor')  # 'extractor' (in-process) or 'scrapy'
+SCRAPYD_LOCAL_SCRAPY_DIR       = os.environ.get('SCRAPYD_LOCAL_SCRAPY_DIR', '')       # scrapy project run by 'scrapy'
+SCRAPYD_LOCAL_FINISHED_TO_KEEP = 100          # older finished jobs are deleted with their logs and items
+########################################
+
+# ### Metrics (apps.common.metrics) ###
+# Multiple processes: set PROMETHEUS_MULTIPROC_DIR (gunicorn-cfg.py does)
+
+METRICS_ENABLED     = str2bool(os.environ.get('METRICS_ENABLED', 'True'))
+METRICS_TOKEN       = os.environ.get('METRICS_TOKEN')  # "Authorization: Bearer <token>" for /metrics
+METRICS_ALLOWED_IPS = INTERNAL_IPS                   # scrapers allowed without a token
+METRICS_CELERY_PORT = os.environ.get('METRICS_CELERY_PORT')  # /metrics server started by Celery workers
 ########################################
 
 
@@ -20,6 +20,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
+from apps.common.metrics import metrics_view
+
 from django.views.static import serve 
 
 def trigger_error(request):
@@ -36,7 +38,7 @@ urlpatterns = [
     
     path('api/docs/schema', SpectacularAPIView.as_view(), name='schema'),
     path('api/docs/'      , SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path("__debug__/", include("debug_toolbar.urls")),
+    path('metrics', metrics_view, name='metrics'),
 
     path('sentry-debug/', trigger_error),
     path('i18n/', include('django.conf.urls.i18n')),
@@ -48,3 +50,4 @@ urlpatterns = [
 urlpatterns += static(settings.CELERY_LOGS_URL, document_root=settings.CELERY_LOGS_DIR)
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL      , document_root=settings.MEDIA_ROOT     )
+    urlpatterns += [path("__debug__/", include("debug_toolbar.urls"))]
@@ -94,4 +94,36 @@ def log_to_text(path):
     except:
         return 'NO LOGS'
 
-register.filter("log_to_text", log_to_text)
\ No newline at end of file
+register.filter("log_to_text", log_to_text)
+
+def duration(seconds):
+    """
+    Returns a short human duration for a number of seconds
+    Example: `7500|duration` returns `"2h 5m"`
+    :param seconds float: Duration in seconds
+    :rtype: str
+    """
+    if seconds is None:
+        return '-'
+    seconds = int(seconds)
+    for unit, size, sub_unit, sub_size in (('d', 86400, 'h', 3600), ('h', 3600, 'm', 60), ('m', 60, 's', 1)):
+        if seconds >= size:
+            rest = (seconds % size) // sub_size
+            return f"{seconds // size}{unit} {rest}{sub_unit}" if rest else f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+register.filter("duration", duration)
+
+
+def percent(value):
+    """
+    Returns a ratio as a percentage
+    Example: `0.256|percent` returns `"25.6%"`
+    :param value float: Ratio between 0 and 1
+    :rtype: str
+    """
+    if value is None:
+        return '-'
+    return f"{value * 100:.1f}%"
+
+register.filter("percent", percent)
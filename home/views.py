@@ -1,40 +1,27 @@
 from django.shortcuts import render
 from core.decorators import feature_required
 from .models import *
-from apps.common.models import NewsPortal, ItemSelector, NewsPortalSeedUrl, CrawlerConfig, ScraperConfig, NewsArticle
-from django.db.models import Count, Q
-from datetime import datetime, timedelta
+from apps.common.models import NewsArticle
+from apps.common.stats import get_dashboard_stats, get_pipeline_stats, queue_reconcile
 
 def index(request):
-  # Get counts for dashboard
-  news_portals_count = NewsPortal.objects.count()
-  selectors_count = ItemSelector.objects.count()
-  seed_urls_count = NewsPortalSeedUrl.objects.count()
-  crawler_configs_count = CrawlerConfig.objects.count()
-  scraper_configs_count = ScraperConfig.objects.count()
-  news_articles_count = NewsArticle.objects.count()
+  # Counters and per-portal volumes come from the precomputed rollups (apps.common.stats)
+  stats = get_dashboard_stats(top_portals=10, recent_days=30)
+  if stats['stats_pending']:
+    # Never fully reconciled: rebuild in the background, not in this request
+    queue_reconcile()
+  news_portals_count = stats['news_portals_count']
+  selectors_count = stats['selectors_count']
+  seed_urls_count = stats['seed_urls_count']
+  crawler_configs_count = stats['crawler_configs_count']
+  scraper_configs_count = stats['scraper_configs_count']
+  news_articles_count = stats['news_articles_count']
+  recent_articles = stats['recent_articles']
+  articles_by_portal = stats['articles_by_portal']
+  pipeline = get_pipeline_stats(days=7, limit=10)
   
-  # Get recent news articles for the last 30 days
-  thirty_days_ago = datetime.now() - timedelta(days=30)
-  recent_articles = NewsArticle.objects.filter(created_at__gte=thirty_days_ago).count()
-  
-  # Get articles by portal for the chart - using a more robust approach
-  articles_by_portal = []
-  try:
-    articles_by_portal = NewsPortal.objects.annotate(
-      article_count=Count('clean_urls__article_url__article', filter=Q(clean_urls__article_url__article__isnull=False))
-    ).values('name', 'article_count')[:10]
-  except Exception as e:
-    # Fallback if the relationship doesn't work
-    articles_by_portal = NewsPortal.objects.values('name').annotate(article_count=Count('clean_urls'))[:10]
-  
-  # Get recent articles for display
-  latest_articles = []
-  try:
-    latest_articles = NewsArticle.objects.select_related('article_url__portal').order_by('-created_at')[:5]
-  except Exception as e:
-    # Fallback if the relationship doesn't work
-    latest_articles = NewsArticle.objects.order_by('-created_at')[:5]
+  # Get recent articles for display (ids follow ingestion order)
+  latest_articles = NewsArticle.objects.select_related('article_url__portal').order_by('-pk')[:5]
   
   # Get task statistics
   try:
@@ -54,8 +41,10 @@ def index(request):
     'news_articles_count': news_articles_count,
     'recent_articles': recent_articles,
     'articles_by_portal': list(articles_by_portal),
+    'stats_pending': stats['stats_pending'],
     'latest_articles': latest_articles,
     'tasks_count': tasks_count,
+    'pipeline': pipeline,
   }
   return render(request, "dashboard/index.html", context)
 